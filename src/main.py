@@ -27,8 +27,11 @@ from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.etp import etp_bp
-from src.routes.chat import chat_bp
+from src.routes.etp import (
+    etp_bp, requeue_pending_document_analyses, requeue_pending_render_jobs, sync_knowledge_index
+)
+from src.routes.chat import chat_bp, migrate_legacy_chat_histories
+from src.utils.sqlite_engine import configure_sqlite_engine, sqlite_engine_options
 
 # Caminho absoluto da pasta atual
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -52,11 +55,37 @@ os.makedirs(db_folder, exist_ok=True)
 db_path = os.path.join(db_folder, 'app.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool de conexões e timeout de lock para vários workers/threads no mesmo arquivo
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
 
 # Inicializar banco
 db.init_app(app)
 with app.app_context():
+    # WAL, synchronous=NORMAL, mmap e busy_timeout em cada conexão do pool
+    configure_sqlite_engine(db.engine)
     db.create_all()
+    # create_all não altera tabelas já existentes: criar os índices adicionados depois
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+# Atualizar o índice de recuperação da base de conhecimento
+sync_knowledge_index(app)
+
+# Mover os históricos de chat salvos em JSON para a tabela de mensagens
+migrate_legacy_chat_histories(app)
+
+# Reenfileirar análises e gerações de documento interrompidas
+# (no modo debug com reloader, apenas no processo que atende as requisições)
+DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
+if __name__ != '__main__' or not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    requeue_pending_document_analyses(app)
+    requeue_pending_render_jobs(app)
+
+# Abrir o pool de conexões da OpenAI antes da primeira requisição
+if os.getenv('OPENAI_WARMUP', 'true').lower() == 'true':
+    from src.utils.openai_client_registry import warm_up_openai_client
+    warm_up_openai_client(OPENAI_API_KEY)
 
 # Servir arquivos estáticos
 @app.route('/', defaults={'path': ''})
@@ -88,4 +117,4 @@ if __name__ == '__main__':
     print("🚀 Iniciando servidor ETP Sistema...")
     print(f"📍 Acesse: http://localhost:5002")
     print("🔄 Para parar o servidor: Ctrl+C")
-    app.run(host='0.0.0.0', port=5002, debug=os.getenv('DEBUG', 'True').lower() == 'true')
+    app.run(host='0.0.0.0', port=5002, debug=DEBUG)
@@ -54,6 +54,10 @@ class EtpSession(db.Model):
 class DocumentAnalysis(db.Model):
     """Modelo para análise de documentos pré-ETP"""
     __tablename__ = 'document_analysis'
+    __table_args__ = (
+        # Análise mais recente da sessão com um dado status (filter_by + order_by processed_at)
+        db.Index('ix_document_analysis_session_status_processed', 'session_id', 'analysis_status', 'processed_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(100), db.ForeignKey('etp_sessions.session_id'), nullable=False)
@@ -62,7 +66,7 @@ class DocumentAnalysis(db.Model):
     filename = db.Column(db.String(255), nullable=False)
     file_size = db.Column(db.Integer)
     file_type = db.Column(db.String(50))
-    file_hash = db.Column(db.String(64))
+    file_hash = db.Column(db.String(64), index=True)  # SHA-256 do arquivo (deduplicação de uploads)
     
     # Conteúdo extraído
     extracted_content = db.Column(db.Text)
@@ -123,6 +127,66 @@ class DocumentAnalysis(db.Model):
             'processed_at': self.processed_at.isoformat() if self.processed_at else None
         }
 
+class EtpPreviewSection(db.Model):
+    """Modelo para as seções endereçáveis do preview do ETP"""
+    __tablename__ = 'etp_preview_sections'
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'section_number', name='uq_preview_section'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), db.ForeignKey('etp_sessions.session_id'), nullable=False, index=True)
+    
+    # Identificação da seção (1 a 14)
+    section_number = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(255))
+    
+    # Conteúdo e hash das respostas usadas na geração
+    content = db.Column(db.Text)
+    answers_fingerprint = db.Column(db.String(64))
+    
+    # Metadados
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'section_number': self.section_number,
+            'title': self.title,
+            'content': self.content,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class RenderJob(db.Model):
+    """Modelo para a geração do documento Word final em segundo plano"""
+    __tablename__ = 'render_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), db.ForeignKey('etp_sessions.session_id'), nullable=False, index=True)
+    
+    # Andamento da renderização
+    status = db.Column(db.String(50), default='na_fila', index=True)  # na_fila, renderizando, concluido, erro
+    progress = db.Column(db.Integer, default=0)  # 0 a 100
+    file_path = db.Column(db.String(500))
+    error = db.Column(db.Text)
+    
+    # Metadados
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'session_id': self.session_id,
+            'status': self.status,
+            'progress': self.progress or 0,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
 class KnowledgeBase(db.Model):
     """Modelo para base de conhecimento (opcional)"""
     __tablename__ = 'knowledge_base'
@@ -158,8 +222,8 @@ class ChatSession(db.Model):
     session_id = db.Column(db.String(100), unique=True, nullable=False)
     # user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # Removido temporariamente
     
-    # Histórico da conversa
-    conversation_history = db.Column(db.Text)  # JSON com histórico
+    # Histórico legado (JSON); as mensagens ficam em chat_messages
+    conversation_history = db.Column(db.Text)
     
     # Status
     is_active = db.Column(db.Boolean, default=True)
@@ -168,33 +232,131 @@ class ChatSession(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_activity = db.Column(db.DateTime, default=datetime.utcnow)
     
-    def get_conversation_history(self):
-        """Retorna o histórico da conversa como lista"""
-        if self.conversation_history:
-            return json.loads(self.conversation_history)
-        return []
+    def migrate_legacy_history(self):
+        """Move o histórico em JSON para chat_messages (uma única vez por sessão)"""
+        if not self.conversation_history:
+            return 0
+        
+        history = json.loads(self.conversation_history)
+        # Mensagem sem horário herda o da anterior, mantendo a ordem original
+        created_at = self.created_at
+        for msg in history:
+            timestamp = msg.get('timestamp')
+            if timestamp:
+                created_at = datetime.fromisoformat(timestamp)
+            db.session.add(ChatMessage(
+                session_id=self.session_id,
+                role=msg.get('role'),
+                content=msg.get('content'),
+                created_at=created_at
+            ))
+        self.conversation_history = None
+        return len(history)
     
     def add_message(self, role, content):
         """Adiciona uma mensagem ao histórico"""
-        history = self.get_conversation_history()
-        history.append({
-            'role': role,
-            'content': content,
-            'timestamp': datetime.utcnow().isoformat()
-        })
-        self.conversation_history = json.dumps(history, ensure_ascii=False)
+        self.migrate_legacy_history()
+        db.session.add(ChatMessage(session_id=self.session_id, role=role, content=content))
         self.last_activity = datetime.utcnow()
     
+    def get_recent_messages(self, limit=10, after_id=0):
+        """Últimas ``limit`` mensagens (posteriores a ``after_id``) em ordem cronológica"""
+        self.migrate_legacy_history()
+        messages = self._messages_query().filter(ChatMessage.id > after_id).limit(limit).all()
+        return [msg.to_dict() for msg in reversed(messages)]
+    
+    def get_messages_to_summarize(self, after_id=0, keep_recent=10):
+        """Mensagens posteriores a ``after_id`` que ficaram fora das ``keep_recent`` mais recentes"""
+        self.migrate_legacy_history()
+        messages = self._messages_query().filter(ChatMessage.id > after_id).offset(keep_recent).all()
+        return [msg.to_dict() for msg in reversed(messages)]
+    
+    def get_messages_page(self, limit=50, before_id=None):
+        """Página do histórico: até ``limit`` mensagens anteriores a ``before_id``"""
+        self.migrate_legacy_history()
+        query = self._messages_query()
+        if before_id:
+            before = ChatMessage.query.filter_by(id=before_id, session_id=self.session_id).first()
+            if before:
+                query = query.filter(db.or_(
+                    ChatMessage.created_at < before.created_at,
+                    db.and_(ChatMessage.created_at == before.created_at, ChatMessage.id < before.id)
+                ))
+        messages = query.limit(limit + 1).all()
+        has_more = len(messages) > limit
+        return [msg.to_dict() for msg in reversed(messages[:limit])], has_more
+    
+    def has_user_messages(self):
+        """Indica se o usuário já fez alguma pergunta nesta sessão"""
+        self.migrate_legacy_history()
+        return ChatMessage.query.filter_by(session_id=self.session_id, role='user').first() is not None
+    
+    def get_conversation_history(self):
+        """Retorna o histórico completo da conversa como lista"""
+        self.migrate_legacy_history()
+        return [msg.to_dict() for msg in reversed(self._messages_query().all())]
+    
+    def clear_messages(self):
+        """Remove todas as mensagens da sessão e o resumo acumulado"""
+        self.conversation_history = None
+        ChatMessage.query.filter_by(session_id=self.session_id).delete(synchronize_session=False)
+        ChatSummary.query.filter_by(session_id=self.session_id).delete(synchronize_session=False)
+    
+    def _messages_query(self):
+        return ChatMessage.query.filter_by(session_id=self.session_id).order_by(
+            ChatMessage.created_at.desc(), ChatMessage.id.desc()
+        )
+    
     def to_dict(self):
         return {
             'id': self.id,
             'session_id': self.session_id,
-            'conversation_history': self.get_conversation_history(),
+            'message_count': ChatMessage.query.filter_by(session_id=self.session_id).count(),
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'last_activity': self.last_activity.isoformat() if self.last_activity else None
         }
 
+class ChatMessage(db.Model):
+    """Modelo para as mensagens do chat (uma linha por mensagem, só inserções)"""
+    __tablename__ = 'chat_messages'
+    __table_args__ = (
+        db.Index('ix_chat_messages_session_created', 'session_id', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), db.ForeignKey('chat_sessions.session_id'), nullable=False)
+    
+    # Conteúdo da mensagem
+    role = db.Column(db.String(20), nullable=False)  # user, assistant
+    content = db.Column(db.Text)
+    
+    # Metadados
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'role': self.role,
+            'content': self.content,
+            'timestamp': self.created_at.isoformat() if self.created_at else None
+        }
+
+class ChatSummary(db.Model):
+    """Modelo para o resumo acumulado das mensagens antigas de uma sessão de chat"""
+    __tablename__ = 'chat_summaries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), db.ForeignKey('chat_sessions.session_id'), unique=True, nullable=False)
+    
+    # Resumo e última mensagem já incorporada a ele
+    content = db.Column(db.Text)
+    last_message_id = db.Column(db.Integer, default=0)
+    token_count = db.Column(db.Integer, default=0)
+    
+    # Metadados
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class EtpTemplate(db.Model):
     """Modelo para templates de ETP"""
     __tablename__ = 'etp_templates'
@@ -1,15 +1,42 @@
 import os
 import uuid
+import threading
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flask_cors import cross_origin
 import openai
 
 from src.models.user import db
-from src.models.etp import ChatSession
+from src.models.etp import ChatSession, ChatSummary
+from src.utils.openai_client_registry import get_openai_client
+from src.utils.streaming import sse_event, streaming_response
+from src.utils.job_queue import BackgroundJobQueue
+from src.utils.prompt_budget import count_tokens, truncate_to_tokens
+from src.utils.chat_answer_cache import get_chat_answer_cache, is_follow_up
+from src.utils.topic_classifier import TopicClassifier
 
 chat_bp = Blueprint('chat', __name__)
 
+CHAT_MODEL = "gpt-4o-mini"
+
+# Mensagens anteriores enviadas como contexto e tamanho das páginas do histórico
+CHAT_CONTEXT_MESSAGES = 10
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+# Resumo contínuo: orçamento fixo de tokens para resumo + mensagens recentes no prompt
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', '1500'))
+# Tokens fora da janela recente que disparam a atualização do resumo
+CHAT_SUMMARY_TRIGGER_TOKENS = int(os.getenv('CHAT_SUMMARY_TRIGGER_TOKENS', '1200'))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv('CHAT_SUMMARY_MAX_TOKENS', '400'))
+# Mensagens antigas enviadas por chamada de resumo (lotes, das mais antigas às mais novas)
+CHAT_SUMMARY_BATCH_TOKENS = int(os.getenv('CHAT_SUMMARY_BATCH_TOKENS', '3000'))
+
+# Resumos gerados em segundo plano (no máximo um por sessão ao mesmo tempo)
+chat_summary_queue = BackgroundJobQueue('chat-summary', max_workers=1)
+_summaries_in_progress = set()
+_summaries_lock = threading.Lock()
+
 # Configurar a API key da OpenAI
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
@@ -88,6 +115,19 @@ FORBIDDEN_KEYWORDS = [
     'deep learning'
 ]
 
+# Palavras que podem indicar contexto de compras públicas (radicais, casam no início da palavra)
+CONTEXT_WORDS = [
+    'contrat', 'licit', 'compra', 'aquisi', 'fornec', 'serviç',
+    'obra', 'público', 'administra', 'governo', 'estado', 'município',
+    'edital', 'proposta', 'orçamento', 'preço', 'valor', 'custo',
+    'fiscal', 'controle', 'auditoria', 'tribunal', 'tcu', 'cgu',
+    'transparência', 'portal', 'sistema', 'registro', 'ata',
+    'penalidade', 'sanção', 'multa', 'rescisão', 'aditivo'
+]
+
+# Vocabulários compilados uma única vez (sem acentos, por palavra inteira)
+topic_classifier = TopicClassifier(FORBIDDEN_KEYWORDS, ALLOWED_TOPICS, CONTEXT_WORDS)
+
 @chat_bp.route('/start-chat', methods=['POST'])
 @cross_origin()
 def start_chat():
@@ -168,36 +208,12 @@ def message():
             }), 400
         
         # Se não há session_id, criar uma nova sessão
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            chat_session = ChatSession(
-                session_id=session_id,
-                is_active=True
-            )
-            db.session.add(chat_session)
-        else:
-            chat_session = ChatSession.query.filter_by(session_id=session_id, is_active=True).first()
-            if not chat_session:
-                # Criar nova sessão se não encontrar
-                chat_session = ChatSession(
-                    session_id=session_id,
-                    is_active=True
-                )
-                db.session.add(chat_session)
+        session_id, chat_session = get_or_create_chat_session(session_id)
         
         # Verificar se o tópico é permitido
         topic_check = check_topic_allowed(user_message)
         if not topic_check['allowed']:
-            response_message = f"""Desculpe, mas só posso responder perguntas relacionadas a compras públicas e licitações.
-
-{topic_check['reason']}
-
-Que tal me perguntar sobre:
-• Como elaborar um Termo de Referência?
-• Quais são as modalidades de licitação da Lei 14.133/21?
-• Como funciona o pregão eletrônico?
-• Critérios de sustentabilidade em compras públicas?
-• Procedimentos de fiscalização contratual?"""
+            response_message = build_topic_denied_message(topic_check)
         else:
             # Gerar resposta usando IA
             try:
@@ -210,6 +226,7 @@ Que tal me perguntar sobre:
             chat_session.add_message('user', user_message)
             chat_session.add_message('assistant', response_message)
             db.session.commit()
+            schedule_chat_summary(chat_session)
         except Exception as e:
             db.session.rollback()
             return jsonify({
@@ -231,6 +248,83 @@ Que tal me perguntar sobre:
             'error': f'Erro interno do servidor: {str(e)}'
         }), 500
 
+@chat_bp.route('/message-stream', methods=['POST'])
+@cross_origin()
+def message_stream():
+    """Versão em Server-Sent Events de /message: envia a resposta token a token"""
+    if not request.is_json:
+        return jsonify({
+            'success': False,
+            'error': 'Content-Type deve ser application/json'
+        }), 400
+    
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({
+            'success': False,
+            'error': 'Dados JSON não fornecidos'
+        }), 400
+    
+    user_message = data.get('message', '').strip()
+    if not user_message:
+        return jsonify({
+            'success': False,
+            'error': 'Mensagem é obrigatória'
+        }), 400
+    
+    try:
+        session_id, chat_session = get_or_create_chat_session(data.get('session_id'))
+        topic_check = check_topic_allowed(user_message)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': f'Erro interno do servidor: {str(e)}'
+        }), 500
+    
+    def event_stream():
+        yield sse_event('start', {
+            'session_id': session_id,
+            'topic_allowed': topic_check['allowed']
+        })
+        
+        parts = []
+        if not topic_check['allowed']:
+            parts.append(build_topic_denied_message(topic_check))
+            yield sse_event('token', {'text': parts[0]})
+        else:
+            try:
+                for token in stream_chat_response(chat_session, user_message):
+                    parts.append(token)
+                    yield sse_event('token', {'text': token})
+            except Exception as e:
+                error_text = f"\n\nDesculpe, ocorreu um erro ao processar sua pergunta. Tente novamente.\n\nDetalhes técnicos: {str(e)}"
+                parts.append(error_text)
+                yield sse_event('token', {'text': error_text})
+        
+        # Salvar mensagens com a resposta completa
+        response_message = ''.join(parts)
+        try:
+            chat_session.add_message('user', user_message)
+            chat_session.add_message('assistant', response_message)
+            db.session.commit()
+            schedule_chat_summary(chat_session)
+        except Exception as e:
+            db.session.rollback()
+            yield sse_event('error', {
+                'success': False,
+                'error': f'Erro ao salvar mensagens: {str(e)}'
+            })
+            return
+        
+        yield sse_event('done', {
+            'success': True,
+            'session_id': session_id,
+            'topic_allowed': topic_check['allowed']
+        })
+    
+    return streaming_response(event_stream())
+
 @chat_bp.route('/send-message', methods=['POST'])
 @cross_origin()
 def send_message():
@@ -251,16 +345,7 @@ def send_message():
         # Verificar se o tópico é permitido
         topic_check = check_topic_allowed(message)
         if not topic_check['allowed']:
-            response_message = f"""Desculpe, mas só posso responder perguntas relacionadas a compras públicas e licitações.
-
-{topic_check['reason']}
-
-Que tal me perguntar sobre:
-• Como elaborar um Termo de Referência?
-• Quais são as modalidades de licitação da Lei 14.133/21?
-• Como funciona o pregão eletrônico?
-• Critérios de sustentabilidade em compras públicas?
-• Procedimentos de fiscalização contratual?"""
+            response_message = build_topic_denied_message(topic_check)
             
             # Salvar mensagens
             chat_session.add_message('user', message)
@@ -281,6 +366,7 @@ Que tal me perguntar sobre:
         chat_session.add_message('assistant', ai_response)
         
         db.session.commit()
+        schedule_chat_summary(chat_session)
         
         return jsonify({
             'response': ai_response,
@@ -301,8 +387,16 @@ def get_chat_history(session_id):
         if not chat_session:
             return jsonify({'error': 'Sessão de chat não encontrada'}), 404
         
+        # Paginação do mais recente para o mais antigo (before_id = primeira mensagem já recebida)
+        limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), MAX_HISTORY_PAGE_SIZE)
+        before_id = request.args.get('before_id', type=int)
+        history, has_more = chat_session.get_messages_page(limit, before_id)
+        db.session.commit()
+        
         return jsonify({
-            'history': chat_session.get_conversation_history(),
+            'history': history,
+            'has_more': has_more,
+            'next_before_id': history[0]['id'] if has_more and history else None,
             'session_info': chat_session.to_dict(),
             'status': 'success'
         })
@@ -368,7 +462,7 @@ Posso ajudá-lo com dúvidas sobre:
 
 Como posso ajudá-lo hoje?"""
         
-        chat_session.conversation_history = None
+        chat_session.clear_messages()
         chat_session.add_message('assistant', welcome_message)
         chat_session.last_activity = datetime.utcnow()
         
@@ -388,61 +482,66 @@ Como posso ajudá-lo hoje?"""
 
 def check_topic_allowed(message):
     """Verifica se o tópico da mensagem é permitido"""
-    message_lower = message.lower()
-    
-    # Verificar palavras-chave proibidas
-    for forbidden in FORBIDDEN_KEYWORDS:
-        if forbidden in message_lower:
-            return {
-                'allowed': False,
-                'reason': 'Sua pergunta parece estar fora do escopo de compras públicas e licitações.'
-            }
-    
-    # Verificar se contém tópicos permitidos
-    has_allowed_topic = False
-    for topic in ALLOWED_TOPICS:
-        if topic in message_lower:
-            has_allowed_topic = True
-            break
-    
-    # Se não encontrou tópicos específicos, usar análise mais flexível
-    if not has_allowed_topic:
-        # Palavras que podem indicar contexto de compras públicas
-        context_words = [
-            'contrat', 'licit', 'compra', 'aquisi', 'fornec', 'serviç',
-            'obra', 'público', 'administra', 'governo', 'estado', 'município',
-            'edital', 'proposta', 'orçamento', 'preço', 'valor', 'custo',
-            'fiscal', 'controle', 'auditoria', 'tribunal', 'tcu', 'cgu',
-            'transparência', 'portal', 'sistema', 'registro', 'ata',
-            'penalidade', 'sanção', 'multa', 'rescisão', 'aditivo'
-        ]
-        
-        for word in context_words:
-            if word in message_lower:
-                has_allowed_topic = True
-                break
-    
-    if has_allowed_topic:
-        return {'allowed': True, 'reason': ''}
+    return topic_classifier.classify(message)
+
+def get_or_create_chat_session(session_id):
+    """Retorna a sessão de chat ativa, criando uma nova quando necessário"""
+    if not session_id:
+        session_id = str(uuid.uuid4())
+        chat_session = ChatSession(
+            session_id=session_id,
+            is_active=True
+        )
+        db.session.add(chat_session)
     else:
-        return {
-            'allowed': False,
-            'reason': 'Não identifiquei sua pergunta como relacionada a compras públicas ou licitações.'
-        }
+        chat_session = ChatSession.query.filter_by(session_id=session_id, is_active=True).first()
+        if not chat_session:
+            # Criar nova sessão se não encontrar
+            chat_session = ChatSession(
+                session_id=session_id,
+                is_active=True
+            )
+            db.session.add(chat_session)
+    return session_id, chat_session
 
-def generate_chat_response(chat_session, user_message):
-    """Gera resposta do chat usando IA"""
-    try:
-        client = openai.OpenAI(api_key=openai.api_key)
-        
-        # Construir histórico da conversa
-        conversation_history = chat_session.get_conversation_history()
-        
-        # Preparar mensagens para a IA
-        messages = [
-            {
-                "role": "system",
-                "content": """Você é um assistente especializado em compras públicas e licitações no Brasil.
+def migrate_legacy_chat_histories(app, batch_size=100):
+    """Move os históricos em JSON das sessões antigas para chat_messages"""
+    migrated = 0
+    with app.app_context():
+        try:
+            while True:
+                sessions = ChatSession.query.filter(
+                    ChatSession.conversation_history.isnot(None)
+                ).limit(batch_size).all()
+                if not sessions:
+                    break
+                for chat_session in sessions:
+                    migrated += chat_session.migrate_legacy_history()
+                    # Blob vazio ("") também sai da consulta
+                    chat_session.conversation_history = None
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Erro ao migrar históricos de chat: {e}")
+    if migrated:
+        print(f"💬 {migrated} mensagens de chat migradas para chat_messages")
+    return migrated
+
+def build_topic_denied_message(topic_check):
+    """Resposta padrão para perguntas fora do escopo"""
+    return f"""Desculpe, mas só posso responder perguntas relacionadas a compras públicas e licitações.
+
+{topic_check['reason']}
+
+Que tal me perguntar sobre:
+• Como elaborar um Termo de Referência?
+• Quais são as modalidades de licitação da Lei 14.133/21?
+• Como funciona o pregão eletrônico?
+• Critérios de sustentabilidade em compras públicas?
+• Procedimentos de fiscalização contratual?"""
+
+# Prefixo fixo das conversas (idêntico entre requisições para o cache de prompt do provedor)
+CHAT_SYSTEM_PROMPT = """Você é um assistente especializado em compras públicas e licitações no Brasil.
 
 INSTRUÇÕES IMPORTANTES:
 1. Responda APENAS sobre tópicos relacionados a compras públicas, licitações e administração pública
@@ -469,35 +568,219 @@ TÓPICOS QUE VOCÊ PODE ABORDAR:
 - Critérios de julgamento
 
 Seja sempre útil e educativo em suas respostas."""
-            }
-        ]
-        
-        # Adicionar histórico recente (últimas 10 mensagens)
-        recent_history = conversation_history[-10:] if len(conversation_history) > 10 else conversation_history
-        for msg in recent_history[:-1]:  # Excluir a última (que é a atual)
-            messages.append({
-                "role": msg['role'],
-                "content": msg['content']
-            })
-        
-        # Adicionar mensagem atual
+
+CHAT_SUMMARY_PROMPT = """Você mantém o resumo de uma conversa sobre compras públicas e licitações.
+
+Atualize o RESUMO ATUAL incorporando as NOVAS MENSAGENS:
+- Preserve fatos, números, artigos de lei, decisões e dúvidas ainda em aberto do usuário
+- Descarte cumprimentos e repetições
+- Escreva em português, em tópicos curtos, no máximo 250 palavras
+- Responda apenas com o resumo atualizado"""
+
+def build_chat_messages(chat_session, user_message):
+    """Monta as mensagens enviadas à IA (instruções, histórico recente e pergunta atual)"""
+    # Preparar mensagens para a IA
+    messages = [
+        {
+            "role": "system",
+            "content": CHAT_SYSTEM_PROMPT
+        }
+    ]
+    
+    # Resumo das mensagens antigas logo após as instruções fixas
+    summary = ChatSummary.query.filter_by(session_id=chat_session.session_id).first()
+    budget = CHAT_HISTORY_TOKEN_BUDGET
+    if summary and summary.content:
         messages.append({
-            "role": "user",
-            "content": user_message
+            "role": "system",
+            "content": f"RESUMO DA CONVERSA ATÉ AQUI:\n{summary.content}"
         })
+        budget -= summary.token_count or count_tokens(summary.content, CHAT_MODEL)
+    
+    # Mensagens recentes ainda não resumidas, da mais nova para a mais antiga, dentro do orçamento
+    recent_history = chat_session.get_recent_messages(
+        CHAT_CONTEXT_MESSAGES, after_id=summary.last_message_id if summary else 0
+    )
+    selected = []
+    for msg in reversed(recent_history):
+        if budget <= 0:
+            break
+        content = truncate_to_tokens(msg['content'] or '', budget, CHAT_MODEL)
+        budget -= count_tokens(content, CHAT_MODEL)
+        selected.append({
+            "role": msg['role'],
+            "content": content
+        })
+    messages.extend(reversed(selected))
+    
+    # Adicionar mensagem atual
+    messages.append({
+        "role": "user",
+        "content": user_message
+    })
+    
+    return messages
+
+def schedule_chat_summary(chat_session):
+    """Agenda a atualização do resumo quando as mensagens fora da janela recente passam do limite"""
+    try:
+        summary = ChatSummary.query.filter_by(session_id=chat_session.session_id).first()
+        pending = chat_session.get_messages_to_summarize(
+            summary.last_message_id if summary else 0, CHAT_CONTEXT_MESSAGES
+        )
+        pending_tokens = sum(count_tokens(msg['content'] or '', CHAT_MODEL) for msg in pending)
+        if pending_tokens < CHAT_SUMMARY_TRIGGER_TOKENS:
+            return False
+        
+        with _summaries_lock:
+            if chat_session.session_id in _summaries_in_progress:
+                return False
+            _summaries_in_progress.add(chat_session.session_id)
+        chat_summary_queue.submit(summarize_chat_history, chat_session.session_id)
+        return True
+    except Exception as e:
+        # O resumo é uma otimização: falhas aqui não afetam a resposta do chat
+        with _summaries_lock:
+            _summaries_in_progress.discard(chat_session.session_id)
+        print(f"⚠️ Erro ao agendar resumo do chat: {e}")
+        return False
+
+def summary_batches(messages):
+    """Divide as mensagens a resumir em lotes de até CHAT_SUMMARY_BATCH_TOKENS, mantendo a ordem"""
+    message_tokens = min(CHAT_SUMMARY_TRIGGER_TOKENS, CHAT_SUMMARY_BATCH_TOKENS)
+    batch, batch_tokens = [], 0
+    for msg in messages:
+        content = truncate_to_tokens(msg['content'] or '', message_tokens, CHAT_MODEL)
+        tokens = count_tokens(content, CHAT_MODEL)
+        if batch and batch_tokens + tokens > CHAT_SUMMARY_BATCH_TOKENS:
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(dict(msg, content=content))
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+def summarize_chat_history(session_id):
+    """Incorpora ao resumo as mensagens que saíram da janela recente (executado em segundo plano)
+
+    Sessões longas (ex.: histórico migrado) são resumidas em lotes, das mensagens
+    mais antigas às mais novas; cada lote concluído já avança o resumo, então uma
+    falha no meio não desfaz o que foi incorporado.
+    """
+    try:
+        chat_session = ChatSession.query.filter_by(session_id=session_id).first()
+        if not chat_session:
+            return
+        
+        summary = ChatSummary.query.filter_by(session_id=session_id).first()
+        pending = chat_session.get_messages_to_summarize(
+            summary.last_message_id if summary else 0, CHAT_CONTEXT_MESSAGES
+        )
+        
+        client = get_openai_client(openai.api_key)
+        for batch in summary_batches(pending):
+            transcript = '\n\n'.join(
+                f"{'USUÁRIO' if msg['role'] == 'user' else 'ASSISTENTE'}: {msg['content']}"
+                for msg in batch
+            )
+            previous = summary.content if summary and summary.content else '(sem resumo anterior)'
+            
+            response = client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=[
+                    {"role": "system", "content": CHAT_SUMMARY_PROMPT},
+                    {"role": "user", "content": f"RESUMO ATUAL:\n{previous}\n\nNOVAS MENSAGENS:\n{transcript}"}
+                ],
+                max_tokens=CHAT_SUMMARY_MAX_TOKENS,
+                temperature=0.1
+            )
+            content = response.choices[0].message.content.strip()
+            
+            if not summary:
+                summary = ChatSummary(session_id=session_id)
+                db.session.add(summary)
+            summary.content = content
+            summary.last_message_id = batch[-1]['id']
+            summary.token_count = count_tokens(content, CHAT_MODEL)
+            db.session.commit()
+    finally:
+        with _summaries_lock:
+            _summaries_in_progress.discard(session_id)
+
+def is_standalone_question(chat_session, user_message):
+    """Pergunta que não depende do histórico da sessão (pode usar o cache de respostas)"""
+    if is_follow_up(user_message) and chat_session.has_user_messages():
+        get_chat_answer_cache().record_bypass()
+        return False
+    return True
+
+def generate_chat_response(chat_session, user_message):
+    """Gera resposta do chat usando IA"""
+    try:
+        # Perguntas repetidas (mesmos termos ou muito parecidas) respondidas pelo cache local
+        use_cache = is_standalone_question(chat_session, user_message)
+        if use_cache:
+            cached = get_chat_answer_cache().get(user_message, CHAT_MODEL)
+            if cached:
+                return cached['answer']
+        
+        client = get_openai_client(openai.api_key)
+        messages = build_chat_messages(chat_session, user_message)
         
         response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Modelo mais estável
+            model=CHAT_MODEL,  # Modelo mais estável
             messages=messages,
             max_tokens=800,  # Reduzido para resposta mais rápida
             temperature=0.1  # Reduzido para resposta mais focada e rápida
         )
         
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+        if use_cache:
+            get_chat_answer_cache().set(user_message, content, CHAT_MODEL)
+        return content
         
     except Exception as e:
         return f"Desculpe, ocorreu um erro ao processar sua pergunta. Tente novamente em alguns instantes.\n\nErro técnico: {str(e)}"
 
+def stream_chat_response(chat_session, user_message):
+    """Gera resposta do chat emitindo os tokens à medida que a IA os produz"""
+    use_cache = is_standalone_question(chat_session, user_message)
+    if use_cache:
+        cached = get_chat_answer_cache().get(user_message, CHAT_MODEL)
+        if cached:
+            yield cached['answer']
+            return
+    
+    client = get_openai_client(openai.api_key)
+    messages = build_chat_messages(chat_session, user_message)
+    
+    stream = client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=messages,
+        max_tokens=800,
+        temperature=0.1,
+        stream=True
+    )
+    
+    parts = []
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+    
+    # Somente respostas completas vão para o cache
+    if use_cache:
+        get_chat_answer_cache().set(user_message, ''.join(parts), CHAT_MODEL)
+
+@chat_bp.route('/cache-stats', methods=['GET'])
+@cross_origin()
+def chat_cache_stats():
+    """Taxa de acerto e tamanho do cache de respostas do chat"""
+    return jsonify({
+        'success': True,
+        'answer_cache': get_chat_answer_cache().stats()
+    })
+
 @chat_bp.route('/get-topics', methods=['GET'])
 @cross_origin()
 def get_allowed_topics():
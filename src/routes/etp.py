@@ -3,14 +3,35 @@ import json
 import hashlib
 import uuid
 import tempfile
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify, send_file
 from flask_cors import cross_origin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 from src.models.user import db
-from src.models.etp import EtpSession, DocumentAnalysis, KnowledgeBase, ChatSession, EtpTemplate
+from src.models.etp import (
+    EtpSession, DocumentAnalysis, KnowledgeBase, ChatSession, EtpTemplate, EtpPreviewSection, RenderJob
+)
 from src.utils.document_analyzer import AdvancedDocumentAnalyzer
 from src.utils.etp_generator import AdvancedEtpGenerator
+from src.utils.etp_generator_optimized import OptimizedEtpGenerator
+from src.utils.etp_generator_ultra_fast import UltraFastEtpGenerator
+from src.utils.generator_router import GeneratorRouter, RoutedEngine
+from src.utils.hedged_requests import get_hedging_stats
+from src.utils.openai_client_registry import get_openai_client
+from src.utils.streaming import sse_event, streaming_response, attachment_response
+from src.utils.text_extraction import extract_document_text
+from src.utils.knowledge_index import get_knowledge_index
+from src.utils.prompt_budget import context_budget, fit_context, max_tokens_for_sections
+from src.utils.job_queue import BackgroundJobQueue
+from src.utils.render_cache import get_render_cache
+from src.utils.etp_content_parser import parse_etp_content, get_parser_cache_stats
+from src.utils.preview_sections import (
+    split_preview_sections, join_preview_sections, section_answers_fingerprint,
+    changed_answer_ids, detect_feedback_sections
+)
 from ..utils.word_formatter import ProfessionalWordFormatter
 from ..utils.word_formatter_with_borders import WordFormatterWithBorders
 
@@ -21,6 +42,34 @@ openai_api_key = os.getenv('OPENAI_API_KEY')
 document_analyzer = AdvancedDocumentAnalyzer(openai_api_key) if openai_api_key else None
 etp_generator = AdvancedEtpGenerator(openai_api_key) if openai_api_key else None
 
+# Fila de análise de documentos em segundo plano
+document_job_queue = BackgroundJobQueue('document-analysis')
+# Tarefa em execução há mais tempo que isso é considerada órfã (processo encerrado) e volta para a fila
+JOB_STALE_SECONDS = float(os.getenv('ETP_JOB_STALE_SECONDS', '900'))
+
+# Fila de geração do documento Word final
+render_job_queue = BackgroundJobQueue('document-render')
+RENDER_ACTIVE_STATUSES = ('na_fila', 'renderizando')
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# Roteador do preview entre os motores de geração (do mais completo ao mais barato)
+preview_router = GeneratorRouter([
+    RoutedEngine('advanced', lambda: etp_generator, 'generate_quick_preview',
+                 AdvancedEtpGenerator.QUICK_PREVIEW_MODEL, prior_latency=45,
+                 options={'fallback_on_error': False}, stream_method='stream_quick_preview'),
+    RoutedEngine('optimized', lambda: OptimizedEtpGenerator(openai_api_key), 'generate_ultra_fast_preview',
+                 OptimizedEtpGenerator.MODEL, prior_latency=25,
+                 options={'fallback_on_error': False}),
+    RoutedEngine('ultra_fast', lambda: UltraFastEtpGenerator(openai_api_key), 'generate_parallel_etp',
+                 UltraFastEtpGenerator.MODEL, prior_latency=12),
+]) if etp_generator else None
+
+# Modelo da geração em chamada única (generate_etp_content_with_ai)
+LEGACY_GENERATION_MODEL = "gpt-4o"
+
+# Índice de recuperação sobre a base de conhecimento
+knowledge_index = get_knowledge_index()
+
 # Perguntas do ETP conforme especificado
 ETP_QUESTIONS = [
     {
@@ -368,71 +417,67 @@ def upload_document():
                 'error': f'Tipo de arquivo não suportado. Use: {", ".join(allowed_extensions)}'
             }), 400
         
-        # Salvar arquivo temporariamente e ler conteúdo
-        upload_dir = os.path.join(os.path.dirname(__file__), '..', 'uploads')
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        filename = f"{session_id}_{file.filename}"
-        filepath = os.path.join(upload_dir, filename)
-        file.save(filepath)
-        
-        # Ler conteúdo do arquivo salvo
-        with open(filepath, 'rb') as f:
-            file_content = f.read()
-        
-        # Analisar documento
-        try:
-            if document_analyzer:
-                # Primeiro extrair o texto do arquivo
-                file_extension = os.path.splitext(file.filename)[1].lower()
-                document_text = document_analyzer.extract_text_from_file(file_content, file_extension)
-                
-                # Depois analisar o texto extraído
-                analysis_result = document_analyzer.analyze_document(document_text)
-                
-                # Extrair respostas automaticamente do documento
-                extracted_answers = document_analyzer.extract_etp_answers(analysis_result)
-                
-                # Salvar análise no banco
-                doc_analysis = DocumentAnalysis(
-                    session_id=session_id,
-                    filename=file.filename,
-                    file_size=len(file_content),
-                    file_type=file.filename.split('.')[-1].lower(),
-                    extracted_content=document_text,
-                    analysis_status='concluida'
-                )
-                doc_analysis.set_analysis_result(analysis_result)
-                
-                db.session.add(doc_analysis)
-                
-                # Se conseguiu extrair respostas, salvar na sessão
-                if extracted_answers:
-                    etp_session.set_answers(extracted_answers)
-                    etp_session.answers_validated = True
-                    etp_session.status = 'analisado'
-                
-                db.session.commit()
-                
-                return jsonify({
-                    'success': True,
-                    'message': 'Documento analisado com sucesso',
-                    'analysis': analysis_result,
-                    'extracted_answers': extracted_answers,
-                    'auto_filled': bool(extracted_answers)
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'Analisador de documentos não disponível'
-                }), 500
-                
-        except Exception as e:
+        if not document_analyzer:
             return jsonify({
                 'success': False,
-                'error': f'Erro na análise do documento: {str(e)}'
+                'error': 'Analisador de documentos não disponível'
             }), 500
         
+        # Salvar arquivo para processamento em segundo plano (calculando o hash durante a gravação)
+        filepath = get_upload_path(session_id, file.filename)
+        file_hash, file_size = save_upload_with_hash(file, filepath)
+        
+        # Documento já analisado antes (mesmo conteúdo): reaproveitar a análise sem reprocessar
+        previous_analysis = find_reusable_analysis(file_hash)
+        if previous_analysis:
+            doc_analysis = DocumentAnalysis(
+                session_id=session_id,
+                filename=file.filename,
+                file_size=file_size,
+                file_type=file.filename.split('.')[-1].lower(),
+                file_hash=file_hash,
+                extracted_content=previous_analysis.extracted_content,
+                analysis_result=previous_analysis.analysis_result,
+                extracted_answers=previous_analysis.extracted_answers,
+                missing_info=previous_analysis.missing_info,
+                analysis_status='concluida',
+                processed_at=datetime.utcnow()
+            )
+            db.session.add(doc_analysis)
+            apply_extracted_answers(session_id, doc_analysis.get_extracted_answers())
+            db.session.commit()
+            
+            status = build_upload_status(doc_analysis)
+            status.update({
+                'message': 'Documento já analisado anteriormente. Análise reaproveitada.',
+                'reused': True,
+                'status_url': f'/api/etp/upload-status/{doc_analysis.id}'
+            })
+            return jsonify(status)
+        
+        # Registrar a tarefa de análise (estado persistido no SQLite)
+        doc_analysis = DocumentAnalysis(
+            session_id=session_id,
+            filename=file.filename,
+            file_size=file_size,
+            file_type=file.filename.split('.')[-1].lower(),
+            file_hash=file_hash,
+            analysis_status='pendente'
+        )
+        db.session.add(doc_analysis)
+        db.session.commit()
+        
+        document_job_queue.submit(process_document_analysis, doc_analysis.id)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Documento recebido. A análise está em andamento.',
+            'job_id': doc_analysis.id,
+            'status': doc_analysis.analysis_status,
+            'status_url': f'/api/etp/upload-status/{doc_analysis.id}',
+            'stream_url': f'/api/etp/upload-status/{doc_analysis.id}/stream'
+        }), 202
+        
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -440,6 +485,63 @@ def upload_document():
             'error': f'Erro no upload: {str(e)}'
         }), 500
 
+@etp_bp.route('/upload-status/<int:job_id>', methods=['GET'])
+@cross_origin()
+def upload_status(job_id):
+    """Retorna o andamento da análise de um documento enviado"""
+    try:
+        doc_analysis = DocumentAnalysis.query.get(job_id)
+        if not doc_analysis:
+            return jsonify({
+                'success': False,
+                'error': 'Análise não encontrada'
+            }), 404
+        
+        return jsonify(build_upload_status(doc_analysis))
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erro ao obter status da análise: {str(e)}'
+        }), 500
+
+@etp_bp.route('/upload-status/<int:job_id>/stream', methods=['GET'])
+@cross_origin()
+def upload_status_stream(job_id):
+    """Envia o andamento da análise via Server-Sent Events até a conclusão"""
+    if not DocumentAnalysis.query.get(job_id):
+        return jsonify({
+            'success': False,
+            'error': 'Análise não encontrada'
+        }), 404
+    
+    poll_interval = float(os.getenv('ETP_JOB_POLL_INTERVAL', '1.0'))
+    max_wait = float(os.getenv('ETP_JOB_STREAM_TIMEOUT', '300'))
+    
+    def event_stream():
+        last_status = None
+        waited = 0.0
+        while True:
+            # Descartar o estado em cache para ler o valor gravado pela thread de análise
+            db.session.expire_all()
+            doc_analysis = DocumentAnalysis.query.get(job_id)
+            status = build_upload_status(doc_analysis)
+            
+            if status['status'] != last_status:
+                last_status = status['status']
+                yield sse_event('status', status)
+            
+            if status['status'] in ('concluida', 'erro'):
+                return
+            if waited >= max_wait:
+                yield sse_event('timeout', {'success': False, 'job_id': job_id, 'status': status['status']})
+                return
+            
+            time.sleep(poll_interval)
+            waited += poll_interval
+    
+    return streaming_response(event_stream())
+
 @etp_bp.route('/validate-answers', methods=['POST'])
 @cross_origin()
 def validate_answers():
@@ -525,69 +627,34 @@ def generate_preview():
                 'error': 'Respostas devem ser validadas primeiro'
             }), 400
         
-        # Preparar dados da sessão
-        session_data = {
-            'answers': etp_session.get_answers(),
-            'session_id': session_id
-        }
-        
-        # Preparar dados de contexto
-        context_data = {}
-        
-        # Adicionar análise de documento se disponível
-        try:
-            doc_analysis = DocumentAnalysis.query.filter_by(
-                session_id=session_id,
-                analysis_status='concluida'
-            ).order_by(DocumentAnalysis.processed_at.desc()).first()
-            
-            if doc_analysis:
-                context_data['document_analysis'] = {
-                    'filename': doc_analysis.filename,
-                    'extracted_content': doc_analysis.extracted_content,
-                    'analysis_result': doc_analysis.get_analysis_result()
-                }
-        except Exception as e:
-            print(f"Erro ao buscar análise de documento: {e}")
+        # Preparar dados da sessão e de contexto
+        session_data, context_data = build_preview_inputs(etp_session)
         
-        # Gerar preview usando gerador avançado
+        # Gerar preview com o motor escolhido pelo roteador (SLO, fila e histórico de latência)
+        routing = None
         try:
-            if etp_generator:
-                # Versão otimizada para preview rápido
-                preview_content = etp_generator.generate_quick_preview(
-                    session_data, 
-                    context_data
+            if preview_router:
+                result = preview_router.generate(
+                    session_data,
+                    context_data,
+                    slo_seconds=data.get('latency_slo'),
+                    queue_depth=document_job_queue.depth()
                 )
+                preview_content = result['content']
+                routing = result['decision']
             else:
                 # Fallback simples e rápido
-                answers = session_data['answers']
-                preview_content = f"""ESTUDO TÉCNICO PRELIMINAR
-
-1. DESCRIÇÃO DA NECESSIDADE DA CONTRATAÇÃO:
-{answers.get('1', 'Não informado')}
-
-2. DEMONSTRATIVO DE PREVISÃO NO PCA:
-{answers.get('2', 'Não informado')}
-
-3. NORMAS LEGAIS APLICÁVEIS:
-{answers.get('3', 'Não informado')}
-
-4. QUANTITATIVO E VALOR ESTIMADO:
-{answers.get('4', 'Não informado')}
-
-5. PARCELAMENTO DA CONTRATAÇÃO:
-{answers.get('5', 'Não informado')}
-
-Este é um preview simplificado. O documento final conterá formatação profissional e seções detalhadas conforme Lei 14.133/21."""
+                preview_content = build_simple_preview(session_data['answers'])
         except Exception as e:
             return jsonify({
                 'success': False,
                 'error': f'Erro na geração do preview: {str(e)}'
             }), 500
         
-        # Salvar preview
+        # Salvar preview e suas seções endereçáveis
         etp_session.preview_content = preview_content
         etp_session.status = 'preview_gerado'
+        store_preview_sections(etp_session, preview_content)
         
         db.session.commit()
         
@@ -595,6 +662,8 @@ Este é um preview simplificado. O documento final conterá formatação profiss
             'success': True,
             'preview': preview_content,
             'status': 'generated',
+            'engine': routing['engine'] if routing else None,
+            'model': routing['model'] if routing else None,
             'message': 'Preview gerado com sucesso'
         })
         
@@ -605,6 +674,99 @@ Este é um preview simplificado. O documento final conterá formatação profiss
             'error': f'Erro ao gerar preview: {str(e)}'
         }), 500
 
+@etp_bp.route('/router-stats', methods=['GET'])
+@cross_origin()
+def router_stats():
+    """Decisões recentes e métricas do roteador de geração e dos hedges"""
+    return jsonify({
+        'success': True,
+        'router': preview_router.stats() if preview_router else None,
+        'hedging': get_hedging_stats(),
+        'document_queue': document_job_queue.stats(),
+        'render_queue': render_job_queue.stats(),
+        'render_cache': get_render_cache().stats(),
+        'content_parser': get_parser_cache_stats()
+    })
+
+@etp_bp.route('/generate-preview-stream', methods=['POST'])
+@cross_origin()
+def generate_preview_stream():
+    """Gera preview do ETP enviando o texto via Server-Sent Events à medida que é produzido"""
+    try:
+        data = request.get_json()
+        session_id = data.get('session_id')
+        
+        if not session_id:
+            return jsonify({
+                'success': False,
+                'error': 'session_id é obrigatório'
+            }), 400
+        
+        etp_session = EtpSession.query.filter_by(session_id=session_id).first()
+        if not etp_session:
+            return jsonify({
+                'success': False,
+                'error': 'Sessão não encontrada'
+            }), 404
+        
+        if not etp_session.answers_validated:
+            return jsonify({
+                'success': False,
+                'error': 'Respostas devem ser validadas primeiro'
+            }), 400
+        
+        session_data, context_data = build_preview_inputs(etp_session)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erro ao gerar preview: {str(e)}'
+        }), 500
+    
+    def event_stream():
+        parts = []
+        routing = {}
+        try:
+            # Mesmo roteamento do /generate-preview (SLO, fila e histórico de latência)
+            if preview_router:
+                chunks = preview_router.stream(
+                    session_data,
+                    context_data,
+                    slo_seconds=data.get('latency_slo'),
+                    queue_depth=document_job_queue.depth(),
+                    decision=routing
+                )
+            else:
+                chunks = [build_simple_preview(session_data['answers'])]
+            
+            for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event('token', {'text': chunk})
+            
+            # Salvar preview montado ao final do stream
+            preview_content = ''.join(parts)
+            stream_session = EtpSession.query.filter_by(session_id=session_id).first()
+            stream_session.preview_content = preview_content
+            stream_session.status = 'preview_gerado'
+            store_preview_sections(stream_session, preview_content)
+            db.session.commit()
+            
+            yield sse_event('done', {
+                'success': True,
+                'status': 'generated',
+                'engine': routing.get('engine'),
+                'model': routing.get('model'),
+                'message': 'Preview gerado com sucesso'
+            })
+        except Exception as e:
+            db.session.rollback()
+            yield sse_event('error', {
+                'success': False,
+                'error': f'Erro na geração do preview: {str(e)}'
+            })
+    
+    return streaming_response(event_stream())
+
 @etp_bp.route('/download-document/<filename>', methods=['GET'])
 @cross_origin()
 def download_document_by_filename(filename):
@@ -637,39 +799,447 @@ def get_session_status(session_id):
 
 # Funções auxiliares
 
-def extract_text_from_file(file_content, file_ext):
-    """Extrai texto de diferentes tipos de arquivo"""
+def get_upload_path(session_id, filename):
+    """Caminho do arquivo enviado (determinístico para permitir reprocessamento)"""
+    upload_dir = os.path.join(os.path.dirname(__file__), '..', 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    return os.path.join(upload_dir, f"{session_id}_{filename}")
+
+def save_upload_with_hash(file, filepath, chunk_size=64 * 1024):
+    """Grava o arquivo enviado em blocos e calcula o SHA-256 no mesmo passo"""
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(filepath, 'wb') as output:
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            output.write(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+def is_reusable_analysis(doc_analysis):
+    """Análise que pode ser reaproveitada: sem erro e com respostas extraídas
+
+    Resposta vazia costuma ser falha transitória da IA; reaproveitá-la prenderia
+    o arquivo a um resultado ruim para sempre.
+    """
+    return not doc_analysis.get_analysis_result().get('error') and bool(doc_analysis.get_extracted_answers())
+
+def find_reusable_analysis(file_hash, max_candidates=5):
+    """Análise concluída mais recente e reaproveitável de um arquivo com o mesmo conteúdo"""
+    if not file_hash:
+        return None
+    candidates = DocumentAnalysis.query.filter_by(
+        file_hash=file_hash, analysis_status='concluida'
+    ).order_by(DocumentAnalysis.processed_at.desc()).limit(max_candidates).all()
+    return next((candidate for candidate in candidates if is_reusable_analysis(candidate)), None)
+
+def apply_extracted_answers(session_id, extracted_answers):
+    """Preenche as respostas da sessão com as respostas extraídas do documento"""
+    if not extracted_answers:
+        return
+    etp_session = EtpSession.query.filter_by(session_id=session_id).first()
+    if etp_session:
+        etp_session.set_answers(extracted_answers)
+        etp_session.answers_validated = True
+        etp_session.status = 'analisado'
+
+def build_upload_status(doc_analysis):
+    """Resposta de status de uma análise de documento"""
+    extracted_answers = doc_analysis.get_extracted_answers()
+    status = {
+        'success': doc_analysis.analysis_status != 'erro',
+        'job_id': doc_analysis.id,
+        'session_id': doc_analysis.session_id,
+        'filename': doc_analysis.filename,
+        'status': doc_analysis.analysis_status,
+        'processed_at': (
+            doc_analysis.processed_at.isoformat()
+            if doc_analysis.processed_at and doc_analysis.analysis_status in ('concluida', 'erro') else None
+        )
+    }
+    
+    if doc_analysis.analysis_status == 'concluida':
+        status['analysis'] = doc_analysis.get_analysis_result()
+        status['extracted_answers'] = extracted_answers
+        status['auto_filled'] = bool(extracted_answers)
+    elif doc_analysis.analysis_status == 'erro':
+        status['error'] = doc_analysis.get_analysis_result().get('error', 'Erro desconhecido')
+    
+    return status
+
+def process_document_analysis(analysis_id):
+    """Extrai texto, analisa o documento e preenche as respostas (executado em segundo plano)"""
+    # Reservar a tarefa de forma atômica (evita processamento duplicado entre workers);
+    # enquanto processando, processed_at marca o início (usado para detectar tarefas órfãs)
+    claimed = DocumentAnalysis.query.filter_by(
+        id=analysis_id, analysis_status='pendente'
+    ).update({'analysis_status': 'processando', 'processed_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return
+    
+    doc_analysis = DocumentAnalysis.query.get(analysis_id)
+    
     try:
-        if file_ext == '.pdf':
-            # Usar PyPDF2 para PDFs
-            import io
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PdfReader(pdf_file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-        
-        elif file_ext in ['.doc', '.docx']:
-            # Usar python-docx para documentos Word
-            import io
-            doc_file = io.BytesIO(file_content)
-            doc = Document(doc_file)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
+        with open(get_upload_path(doc_analysis.session_id, doc_analysis.filename), 'rb') as f:
+            file_content = f.read()
+        
+        # Primeiro extrair o texto do arquivo
+        file_extension = os.path.splitext(doc_analysis.filename)[1].lower()
+        document_text = document_analyzer.extract_text_from_file(file_content, file_extension)
+        
+        # Depois analisar o texto extraído
+        analysis_result = document_analyzer.analyze_document(document_text)
+        
+        # Extrair respostas automaticamente do documento
+        extracted_answers = document_analyzer.extract_etp_answers(analysis_result)
+        
+        doc_analysis.extracted_content = document_text
+        doc_analysis.set_analysis_result(analysis_result)
+        doc_analysis.set_extracted_answers(extracted_answers)
         
+        # Se conseguiu extrair respostas, salvar na sessão
+        apply_extracted_answers(doc_analysis.session_id, extracted_answers)
+        
+        # Erro capturado pelo analisador não pode virar análise concluída (nem ser reaproveitado)
+        doc_analysis.analysis_status = 'erro' if analysis_result.get('error') else 'concluida'
+        
+    except Exception as e:
+        db.session.rollback()
+        doc_analysis = DocumentAnalysis.query.get(analysis_id)
+        doc_analysis.set_analysis_result({'error': f'Erro na análise do documento: {str(e)}'})
+        doc_analysis.analysis_status = 'erro'
+    
+    doc_analysis.processed_at = datetime.utcnow()
+    db.session.commit()
+
+def requeue_pending_document_analyses(app, stale_seconds=None):
+    """Reenfileira análises pendentes e as órfãs (em processamento há mais de ``stale_seconds``)
+
+    Roda na inicialização de cada worker: análises que outro worker vivo está
+    processando não são tocadas, e a reserva atômica em process_document_analysis
+    garante que uma análise pendente enviada por vários workers rode uma vez só.
+    """
+    if not document_analyzer:
+        return 0
+    
+    stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS if stale_seconds is None else stale_seconds)
+    with app.app_context():
+        # Só tarefas antigas demais foram interrompidas com um processo que não existe mais
+        DocumentAnalysis.query.filter(
+            DocumentAnalysis.analysis_status == 'processando',
+            db.or_(DocumentAnalysis.processed_at.is_(None), DocumentAnalysis.processed_at < stale_before)
+        ).update({'analysis_status': 'pendente'}, synchronize_session=False)
+        db.session.commit()
+        
+        pending = DocumentAnalysis.query.filter_by(analysis_status='pendente').all()
+        for doc_analysis in pending:
+            document_job_queue.submit(process_document_analysis, doc_analysis.id, app=app)
+    
+    if pending:
+        print(f"🔁 {len(pending)} análise(s) de documento reenfileirada(s)")
+    return len(pending)
+
+def build_render_status(render_job, message=None):
+    """Resposta de status de uma geração de documento final"""
+    status = dict(render_job.to_dict(), success=render_job.status != 'erro')
+    status['status_url'] = f'/api/etp/render-status/{render_job.id}'
+    if render_job.status == 'concluido':
+        status['download_url'] = f'/api/etp/download/{render_job.session_id}'
+    if message:
+        status['message'] = message
+    return status
+
+def final_document_cache_key(etp_session):
+    """Chave do documento Word final no cache de renderização"""
+    return get_render_cache().make_key(
+        etp_session.preview_content,
+        'word_borders',
+        WordFormatterWithBorders.FORMATTER_VERSION,
+        {'answers': etp_session.get_answers(), 'date': datetime.now().strftime('%d/%m/%Y')}
+    )
+
+def stream_final_document(etp_session):
+    """Gera o documento Word final em blocos para o download e guarda a cópia no cache ao terminar"""
+    cache_key = final_document_cache_key(etp_session)
+    chunks = WordFormatterWithBorders().stream_document_with_borders(
+        etp_session.preview_content, {'answers': etp_session.get_answers()}
+    )
+    
+    def generate():
+        fd, tmp_path = tempfile.mkstemp(suffix='.docx', prefix='etp_')
+        try:
+            with os.fdopen(fd, 'wb') as copy:
+                for chunk in chunks:
+                    copy.write(chunk)
+                    yield chunk
+            get_render_cache().put_file(cache_key, 'docx', tmp_path)
+        finally:
+            # Download interrompido: descartar o arquivo parcial
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    return generate()
+
+def process_render_job(job_id):
+    """Gera o documento Word final a partir do preview aprovado (executado em segundo plano)"""
+    # Reservar a tarefa de forma atômica (evita renderização duplicada entre workers)
+    claimed = RenderJob.query.filter_by(id=job_id, status='na_fila').update(
+        {'status': 'renderizando', 'started_at': datetime.utcnow(), 'progress': 5},
+        synchronize_session=False
+    )
+    db.session.commit()
+    if not claimed:
+        return
+    
+    render_job = RenderJob.query.get(job_id)
+    etp_session = EtpSession.query.filter_by(session_id=render_job.session_id).first()
+    
+    def report_progress(percent):
+        render_job.progress = percent
+        db.session.commit()
+    
+    try:
+        if not etp_session:
+            raise ValueError(f'Sessão {render_job.session_id} não encontrada')
+        
+        # Usar formatador com bordas baseado no modelo da concorrência
+        word_formatter = WordFormatterWithBorders()
+        
+        # Preparar dados para o documento
+        document_data = {
+            'title': 'Estudo Técnico Preliminar',
+            'content': etp_session.preview_content,
+            'answers': etp_session.get_answers(),
+            'session_id': etp_session.session_id,
+            'generated_at': datetime.utcnow().strftime('%d/%m/%Y %H:%M')
+        }
+        
+        # Gerar arquivo Word com bordas (ou reaproveitar o já renderizado para o mesmo conteúdo)
+        word_file_path = get_render_cache().get_or_render(
+            final_document_cache_key(etp_session),
+            'docx',
+            lambda: word_formatter.create_etp_with_borders(
+                etp_session.preview_content,
+                document_data,
+                progress_callback=report_progress
+            )
+        )
+        
+        # Salvar caminho do arquivo na sessão
+        etp_session.final_document_path = word_file_path
+        etp_session.status = 'concluido'
+        render_job.file_path = word_file_path
+        render_job.status = 'concluido'
+        render_job.progress = 100
+        
+    except Exception as e:
+        db.session.rollback()
+        render_job = RenderJob.query.get(job_id)
+        render_job.status = 'erro'
+        render_job.error = f'Erro na geração do documento: {str(e)}'
+        # Permitir nova tentativa a partir do preview aprovado
+        etp_session = EtpSession.query.filter_by(session_id=render_job.session_id).first()
+        if etp_session:
+            etp_session.status = 'aprovado'
+    
+    render_job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+def requeue_pending_render_jobs(app, stale_seconds=None):
+    """Reenfileira gerações na fila e as órfãs (renderizando há mais de ``stale_seconds``)
+
+    Roda na inicialização de cada worker: gerações que outro worker vivo está
+    renderizando não são tocadas, e a reserva atômica em process_render_job
+    garante que uma geração na fila enviada por vários workers rode uma vez só.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS if stale_seconds is None else stale_seconds)
+    with app.app_context():
+        RenderJob.query.filter(
+            RenderJob.status == 'renderizando',
+            db.or_(RenderJob.started_at.is_(None), RenderJob.started_at < stale_before)
+        ).update({'status': 'na_fila', 'progress': 0}, synchronize_session=False)
+        db.session.commit()
+        
+        pending = RenderJob.query.filter_by(status='na_fila').all()
+        for render_job in pending:
+            render_job_queue.submit(process_render_job, render_job.id, app=app)
+    
+    if pending:
+        print(f"🔁 {len(pending)} geração(ões) de documento reenfileirada(s)")
+    return len(pending)
+
+# Alterações da base de conhecimento pendentes na sessão: id -> (nome, conteúdo) ou None para remover
+KNOWLEDGE_INDEX_PENDING = 'knowledge_index_pending'
+
+@event.listens_for(Session, 'after_flush')
+def collect_knowledge_base_changes(session, flush_context):
+    """Guarda as alterações da base de conhecimento para indexar só depois do commit"""
+    pending = None
+    for target in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(target, KnowledgeBase):
+            continue
+        if pending is None:
+            pending = session.info.setdefault(KNOWLEDGE_INDEX_PENDING, {})
+        if target in session.deleted or not (target.is_active and target.content):
+            pending[target.id] = None
         else:
-            return "Tipo de arquivo não suportado para extração de texto"
-            
+            pending[target.id] = (target.filename, target.content)
+
+@event.listens_for(Session, 'after_commit')
+def index_knowledge_base_changes(session):
+    """Atualiza o índice de recuperação com as alterações confirmadas no banco"""
+    for doc_id, document in session.info.pop(KNOWLEDGE_INDEX_PENDING, {}).items():
+        if document is None:
+            knowledge_index.remove_document(doc_id)
+        else:
+            knowledge_index.add_document(doc_id, *document)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_knowledge_base_changes(session):
+    """Alterações desfeitas no banco não chegam ao índice"""
+    session.info.pop(KNOWLEDGE_INDEX_PENDING, None)
+
+def sync_knowledge_index(app):
+    """Sincroniza o índice com a base de conhecimento (alterações feitas fora da aplicação)"""
+    with app.app_context():
+        files = db.session.query(
+            KnowledgeBase.id, KnowledgeBase.filename, KnowledgeBase.content
+        ).filter(KnowledgeBase.is_active.is_(True), KnowledgeBase.content.isnot(None)).all()
+        result = knowledge_index.sync(files)
+    
+    if result['updated'] or result['removed']:
+        print(f"📚 Índice da base de conhecimento: {result['updated']} atualizado(s), {result['removed']} removido(s)")
+    return result
+
+def build_preview_inputs(etp_session):
+    """Monta os dados de sessão e de contexto usados na geração do preview"""
+    session_data = {
+        'answers': etp_session.get_answers(),
+        'session_id': etp_session.session_id
+    }
+    
+    context_data = {}
+    
+    # Adicionar análise de documento se disponível
+    try:
+        doc_analysis = DocumentAnalysis.query.filter_by(
+            session_id=etp_session.session_id,
+            analysis_status='concluida'
+        ).order_by(DocumentAnalysis.processed_at.desc()).first()
+        
+        if doc_analysis:
+            context_data['document_analysis'] = {
+                'filename': doc_analysis.filename,
+                'extracted_content': doc_analysis.extracted_content,
+                'analysis_result': doc_analysis.get_analysis_result()
+            }
+    except Exception as e:
+        print(f"Erro ao buscar análise de documento: {e}")
+    
+    return session_data, context_data
+
+def store_preview_sections(etp_session, preview_content, sections=None, preamble=None, trailer=None,
+                           keep_fingerprint_for=None):
+    """Persiste o preview como seções endereçáveis (uma linha por seção)
+
+    Seções em ``keep_fingerprint_for`` (ex.: falharam ao regenerar) mantêm o
+    hash de respostas anterior e continuam marcadas como desatualizadas.
+    """
+    keep_fingerprint_for = set(keep_fingerprint_for or [])
+    if sections is None:
+        preamble, sections, trailer = split_preview_sections(preview_content)
+    
+    answers = etp_session.get_answers()
+    existing = {
+        row.section_number: row
+        for row in EtpPreviewSection.query.filter_by(session_id=etp_session.session_id).all()
+    }
+    
+    # Preâmbulo e rodapé ficam nas posições 0 e 99
+    stored = [{'number': 0, 'title': 'PREÂMBULO', 'content': preamble or ''}]
+    stored.extend(sections)
+    stored.append({'number': 99, 'title': 'RODAPÉ', 'content': trailer or ''})
+    
+    for section in stored:
+        row = existing.pop(section['number'], None)
+        if row is None:
+            row = EtpPreviewSection(session_id=etp_session.session_id, section_number=section['number'])
+            db.session.add(row)
+        row.title = section['title']
+        row.content = section['content']
+        if section['number'] not in keep_fingerprint_for or not row.answers_fingerprint:
+            row.answers_fingerprint = section_answers_fingerprint(section['number'], answers)
+    
+    for row in existing.values():
+        db.session.delete(row)
+
+def load_preview_sections(etp_session):
+    """Carrega (preâmbulo, seções, rodapé) do preview, dividindo-o se ainda não estiver salvo"""
+    rows = EtpPreviewSection.query.filter_by(
+        session_id=etp_session.session_id
+    ).order_by(EtpPreviewSection.section_number).all()
+    
+    if not rows:
+        preamble, sections, trailer = split_preview_sections(etp_session.preview_content)
+        store_preview_sections(etp_session, etp_session.preview_content, sections, preamble, trailer)
+        answers = etp_session.get_answers()
+        for section in sections:
+            section['answers_fingerprint'] = section_answers_fingerprint(section['number'], answers)
+        return preamble, sections, trailer
+    
+    preamble, trailer, sections = '', '', []
+    for row in rows:
+        if row.section_number == 0:
+            preamble = row.content or ''
+        elif row.section_number == 99:
+            trailer = row.content or ''
+        else:
+            sections.append({
+                'number': row.section_number,
+                'title': row.title,
+                'content': row.content or '',
+                'answers_fingerprint': row.answers_fingerprint
+            })
+    return preamble, sections, trailer
+
+def build_simple_preview(answers):
+    """Preview simplificado usado quando a IA não está configurada"""
+    return f"""ESTUDO TÉCNICO PRELIMINAR
+
+1. DESCRIÇÃO DA NECESSIDADE DA CONTRATAÇÃO:
+{answers.get('1', 'Não informado')}
+
+2. DEMONSTRATIVO DE PREVISÃO NO PCA:
+{answers.get('2', 'Não informado')}
+
+3. NORMAS LEGAIS APLICÁVEIS:
+{answers.get('3', 'Não informado')}
+
+4. QUANTITATIVO E VALOR ESTIMADO:
+{answers.get('4', 'Não informado')}
+
+5. PARCELAMENTO DA CONTRATAÇÃO:
+{answers.get('5', 'Não informado')}
+
+Este é um preview simplificado. O documento final conterá formatação profissional e seções detalhadas conforme Lei 14.133/21."""
+
+def extract_text_from_file(file_content, file_ext):
+    """Extrai texto de diferentes tipos de arquivo"""
+    try:
+        return extract_document_text(file_content, file_ext)
+    except ValueError:
+        return "Tipo de arquivo não suportado para extração de texto"
     except Exception as e:
         return f"Erro ao extrair texto: {str(e)}"
 
 def analyze_document_with_ai(document_text):
     """Analisa documento usando IA para extrair respostas"""
     try:
-        client = openai.OpenAI(api_key=openai.api_key)
+        client = get_openai_client(openai_api_key)
         
         prompt = f"""
         Analise o documento fornecido e tente extrair informações que respondam às seguintes perguntas do ETP:
@@ -726,7 +1296,7 @@ def analyze_document_with_ai(document_text):
 def generate_etp_content_with_ai(etp_session, is_preview=False):
     """Gera conteúdo do ETP usando IA"""
     try:
-        client = openai.OpenAI(api_key=openai.api_key)
+        client = get_openai_client(openai_api_key)
         
         answers = etp_session.get_answers()
         
@@ -756,12 +1326,14 @@ def generate_etp_content_with_ai(etp_session, is_preview=False):
         """
         
         response = client.chat.completions.create(
-            model="gpt-4o",
+            model=LEGACY_GENERATION_MODEL,
             messages=[
                 {"role": "system", "content": "Você é um especialista em licitações públicas e elaboração de Estudos Técnicos Preliminares conforme a Lei 14.133/21. Gere documentos técnicos completos, detalhados e em conformidade legal."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=4000,
+            max_tokens=max_tokens_for_sections(
+                LEGACY_GENERATION_MODEL, [{}] * len(ETP_STRUCTURE), paragraphs=8, prompt=prompt
+            ),
             temperature=0.2
         )
         
@@ -771,16 +1343,15 @@ def generate_etp_content_with_ai(etp_session, is_preview=False):
         raise Exception(f"Erro na geração de conteúdo: {str(e)}")
 
 def build_context_for_generation(etp_session):
-    """Constrói contexto para geração do ETP"""
-    context = "INFORMAÇÕES PARA GERAÇÃO DO ETP:\n\n"
+    """Constrói contexto para geração do ETP (respostas, documento e base de conhecimento, por prioridade)"""
+    blocks = []
     
-    # Adicionar respostas do usuário
+    # Adicionar respostas do usuário (sempre inteiras, fora do orçamento)
     answers = etp_session.get_answers()
-    context += "RESPOSTAS DO USUÁRIO:\n"
-    for i, question in enumerate(ETP_QUESTIONS, 1):
-        answer = answers.get(str(i), "Não informado")
-        context += f"{i}. {question['question']}\n"
-        context += f"Resposta: {answer}\n\n"
+    answers_block = "RESPOSTAS DO USUÁRIO:\n" + "\n\n".join(
+        f"{i}. {question['question']}\nResposta: {answers.get(str(i), 'Não informado')}"
+        for i, question in enumerate(ETP_QUESTIONS, 1)
+    )
     
     # Adicionar análise de documento se disponível
     doc_analysis = DocumentAnalysis.query.filter_by(
@@ -789,25 +1360,22 @@ def build_context_for_generation(etp_session):
     ).order_by(DocumentAnalysis.processed_at.desc()).first()
     
     if doc_analysis and doc_analysis.extracted_content:
-        context += "DOCUMENTO DE REFERÊNCIA ANALISADO:\n"
-        context += doc_analysis.extracted_content[:2000]  # Limitar tamanho
-        context += "\n\n"
+        blocks.append(("DOCUMENTO DE REFERÊNCIA ANALISADO:", doc_analysis.extracted_content))
     
-    # Adicionar base de conhecimento se disponível
-    kb_files = KnowledgeBase.query.filter_by(is_active=True).limit(3).all()
-    if kb_files:
-        context += "BASE DE CONHECIMENTO (Modelos de referência):\n"
-        for kb_file in kb_files:
-            context += f"--- {kb_file.filename} ---\n"
-            context += kb_file.content[:1500]  # Limitar para não exceder tokens
-            context += "\n\n"
+    # Adicionar trechos relevantes da base de conhecimento
+    knowledge_context = knowledge_index.build_context(' '.join(str(answer) for answer in answers.values()))
+    if knowledge_context:
+        blocks.append(("BASE DE CONHECIMENTO (Modelos de referência):", knowledge_context))
     
-    return context
+    # Documento e base de conhecimento dividem o orçamento do contexto suplementar
+    supplementary = fit_context(blocks, context_budget(LEGACY_GENERATION_MODEL), LEGACY_GENERATION_MODEL)
+    context = f"{answers_block}\n\n{supplementary}" if supplementary else answers_block
+    return f"INFORMAÇÕES PARA GERAÇÃO DO ETP:\n\n{context}\n"
 
 def adjust_preview_with_feedback(etp_session, feedback):
     """Ajusta o preview com base no feedback do usuário"""
     try:
-        client = openai.OpenAI(api_key=openai.api_key)
+        client = get_openai_client(openai_api_key)
         
         current_preview = etp_session.preview_content
         
@@ -964,27 +1532,21 @@ def add_footer(doc):
 
 def process_content_with_formatting(doc, content):
     """Processa o conteúdo aplicando formatação adequada"""
-    lines = content.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        # Identificar tipo de linha e aplicar formatação
-        if line.upper().startswith(tuple([f"{i}." for i in range(1, 15)])) and line.isupper():
-            # Título principal
-            para = doc.add_paragraph(line, style='Titulo Principal')
-            # Adicionar fundo azul escuro
+    for node in parse_etp_content(content):
+        if node.kind == 'section':
+            # Título principal com fundo azul escuro
+            para = doc.add_paragraph(node.text.upper(), style='Titulo Principal')
             add_blue_background(para)
-        
-        elif any(line.startswith(f"{i}.{j}") for i in range(1, 15) for j in range(1, 10)):
-            # Subtítulo
-            doc.add_paragraph(line, style='Subtitulo')
-        
+        elif node.kind == 'subsection':
+            doc.add_paragraph(node.text, style='Subtitulo')
+        elif node.kind == 'table':
+            for cells in node.rows:
+                doc.add_paragraph(' | '.join(cells), style='Corpo Texto')
+        elif node.kind == 'bullet':
+            doc.add_paragraph(f"• {node.text}", style='Corpo Texto')
         else:
             # Corpo do texto
-            doc.add_paragraph(line, style='Corpo Texto')
+            doc.add_paragraph(node.text, style='Corpo Texto')
 
 def add_blue_background(paragraph):
     """Adiciona fundo azul escuro ao parágrafo"""
@@ -1039,6 +1601,124 @@ def get_preview():
             'error': f'Erro ao buscar preview: {str(e)}'
         }), 500
 
+@etp_bp.route('/adjust-preview', methods=['POST'])
+@cross_origin()
+def adjust_preview():
+    """Ajusta o preview regenerando apenas as seções afetadas por feedback ou respostas alteradas"""
+    try:
+        data = request.get_json()
+        session_id = data.get('session_id')
+        feedback = (data.get('feedback') or '').strip()
+        new_answers = data.get('answers')
+        requested_sections = [int(n) for n in data.get('sections', [])]
+        
+        if not session_id:
+            return jsonify({
+                'success': False,
+                'error': 'session_id é obrigatório'
+            }), 400
+        
+        if not feedback and not new_answers:
+            return jsonify({
+                'success': False,
+                'error': 'Informe feedback ou respostas alteradas'
+            }), 400
+        
+        etp_session = EtpSession.query.filter_by(session_id=session_id).first()
+        if not etp_session:
+            return jsonify({
+                'success': False,
+                'error': 'Sessão não encontrada'
+            }), 404
+        
+        if not etp_session.preview_content:
+            return jsonify({
+                'success': False,
+                'error': 'Preview deve ser gerado primeiro'
+            }), 400
+        
+        preamble, sections, trailer = load_preview_sections(etp_session)
+        section_numbers = {section['number'] for section in sections}
+        
+        # Respostas alteradas: seções cujas respostas dependentes mudaram desde a geração
+        answers = etp_session.get_answers()
+        changed_answers = set()
+        if new_answers:
+            updated_answers = dict(answers, **{str(k): v for k, v in new_answers.items()})
+            changed_answers = changed_answer_ids(answers, updated_answers)
+            answers = updated_answers
+            etp_session.set_answers(answers)
+        stale_sections = {
+            section['number'] for section in sections
+            if section.get('answers_fingerprint') != section_answers_fingerprint(section['number'], answers)
+        }
+        
+        # Feedback: seções indicadas explicitamente ou identificadas no texto
+        feedback_sections = set()
+        if feedback:
+            feedback_sections = set(requested_sections) & section_numbers or detect_feedback_sections(feedback, sections)
+        
+        # Feedback sem seção identificável: ajuste do documento inteiro
+        if feedback and not feedback_sections and not stale_sections:
+            preview_content = adjust_preview_with_feedback(etp_session, feedback)
+            etp_session.preview_content = preview_content
+            store_preview_sections(etp_session, preview_content)
+            db.session.commit()
+            return jsonify({
+                'success': True,
+                'preview': preview_content,
+                'mode': 'documento_completo',
+                'reused_sections': [],
+                'regenerated_sections': sorted(section_numbers),
+                'failed_sections': []
+            })
+        
+        if not etp_generator:
+            return jsonify({
+                'success': False,
+                'error': 'Gerador de ETP não configurado'
+            }), 500
+        
+        session_data, context_data = build_preview_inputs(etp_session)
+        result = etp_generator.regenerate_preview_sections(
+            session_data,
+            {section['number']: section['content'] for section in sections},
+            regenerate=sorted(stale_sections),
+            adjust=sorted(feedback_sections),
+            feedback=feedback,
+            context_data=context_data
+        )
+        
+        # Encaixar as seções regeneradas no documento em cache
+        for section in sections:
+            if section['number'] in result['sections']:
+                section['content'] = result['sections'][section['number']]
+        preview_content = join_preview_sections(preamble, sections, trailer)
+        
+        etp_session.preview_content = preview_content
+        etp_session.status = 'preview_gerado'
+        store_preview_sections(etp_session, preview_content, sections, preamble, trailer,
+                               keep_fingerprint_for=result['failed'])
+        db.session.commit()
+        
+        regenerated = sorted(set(result['sections']) - set(result['failed']))
+        return jsonify({
+            'success': True,
+            'preview': preview_content,
+            'mode': 'secoes',
+            'changed_answers': sorted(changed_answers),
+            'reused_sections': sorted(section_numbers - set(result['sections'])),
+            'regenerated_sections': regenerated,
+            'failed_sections': result['failed']
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': f'Erro ao ajustar preview: {str(e)}'
+        }), 500
+
 @etp_bp.route('/approve-preview', methods=['POST'])
 @cross_origin()
 def approve_preview():
@@ -1088,7 +1768,7 @@ def approve_preview():
 @etp_bp.route('/generate-final', methods=['POST'])
 @cross_origin()
 def generate_final():
-    """Gera documento Word final"""
+    """Agenda a geração do documento Word final e retorna a tarefa para acompanhamento"""
     try:
         data = request.get_json()
         session_id = data.get('session_id')
@@ -1107,49 +1787,39 @@ def generate_final():
                 'error': 'Sessão não encontrada'
             }), 404
         
-        if etp_session.status != 'aprovado':
+        # Geração já em andamento: devolver a tarefa existente
+        active_job = RenderJob.query.filter(
+            RenderJob.session_id == session_id, RenderJob.status.in_(RENDER_ACTIVE_STATUSES)
+        ).order_by(RenderJob.id.desc()).first()
+        if active_job:
+            return jsonify(build_render_status(active_job, message='Geração do documento em andamento')), 202
+        
+        if etp_session.status not in ('aprovado', 'concluido'):
             return jsonify({
                 'success': False,
                 'error': 'Preview deve ser aprovado primeiro'
             }), 400
         
-        # Gerar documento Word usando o preview aprovado
-        try:
-            # Usar formatador com bordas baseado no modelo da concorrência
-            word_formatter = WordFormatterWithBorders()
-            
-            # Preparar dados para o documento
-            document_data = {
-                'title': 'Estudo Técnico Preliminar',
-                'content': etp_session.preview_content,
-                'answers': etp_session.get_answers(),
-                'session_id': session_id,
-                'generated_at': datetime.utcnow().strftime('%d/%m/%Y %H:%M')
-            }
-            
-            # Gerar arquivo Word com bordas e formatação profissional
-            word_file_path = word_formatter.create_etp_with_borders(
-                etp_session.preview_content, 
-                document_data
-            )       
-            # Salvar caminho do arquivo na sessão
-            etp_session.final_document_path = word_file_path
+        # Preview já renderizado com o mesmo conteúdo: reaproveitar o arquivo do cache
+        cached_path = get_render_cache().get(final_document_cache_key(etp_session), 'docx')
+        if cached_path:
+            render_job = RenderJob(session_id=session_id, status='concluido', progress=100, file_path=cached_path,
+                                   started_at=datetime.utcnow(), finished_at=datetime.utcnow())
+            db.session.add(render_job)
+            etp_session.final_document_path = cached_path
             etp_session.status = 'concluido'
-            etp_session.completed_at = datetime.utcnow()
-            
             db.session.commit()
-            
-            return jsonify({
-                'success': True,
-                'message': 'Documento Word gerado com sucesso',
-                'download_url': f'/api/etp/download/{session_id}'
-            })
-            
-        except Exception as e:
-            return jsonify({
-                'success': False,
-                'error': f'Erro na geração do documento: {str(e)}'
-            }), 500
+            return jsonify(build_render_status(render_job, message='Documento Word gerado com sucesso'))
+        
+        # Renderizar o documento em segundo plano; o cliente acompanha pelo status
+        render_job = RenderJob(session_id=session_id, status='na_fila', progress=0)
+        db.session.add(render_job)
+        etp_session.status = 'gerando_documento'
+        db.session.commit()
+        
+        render_job_queue.submit(process_render_job, render_job.id)
+        
+        return jsonify(build_render_status(render_job, message='Geração do documento iniciada')), 202
         
     except Exception as e:
         db.session.rollback()
@@ -1158,6 +1828,26 @@ def generate_final():
             'error': f'Erro ao gerar documento final: {str(e)}'
         }), 500
 
+@etp_bp.route('/render-status/<int:job_id>', methods=['GET'])
+@cross_origin()
+def render_status(job_id):
+    """Retorna o andamento da geração do documento Word final"""
+    try:
+        render_job = RenderJob.query.get(job_id)
+        if not render_job:
+            return jsonify({
+                'success': False,
+                'error': 'Geração de documento não encontrada'
+            }), 404
+        
+        return jsonify(build_render_status(render_job))
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Erro ao obter status do documento: {str(e)}'
+        }), 500
+
 @etp_bp.route('/download/<session_id>', methods=['GET'])
 @cross_origin()
 def download_document(session_id):
@@ -1168,20 +1858,36 @@ def download_document(session_id):
         if not etp_session:
             return jsonify({'error': 'Sessão não encontrada'}), 404
         
-        if not etp_session.final_document_path:
+        download_name = f'ETP_{session_id[:8]}.docx'
+        
+        # Documento já renderizado: enviar o arquivo (em blocos, com suporte a requisições parciais)
+        candidate_paths = [get_render_cache().get(final_document_cache_key(etp_session), 'docx'),
+                           etp_session.final_document_path]
+        for document_path in filter(None, candidate_paths):
+            try:
+                return send_file(
+                    document_path,
+                    as_attachment=True,
+                    download_name=download_name,
+                    mimetype=DOCX_MIMETYPE,
+                    conditional=True
+                )
+            except FileNotFoundError:
+                # Arquivo removido pela limpeza do cache: tentar o próximo ou gerar de novo
+                continue
+        
+        # Geração em andamento: acompanhar a tarefa existente em vez de renderizar de novo
+        active_job = RenderJob.query.filter(
+            RenderJob.session_id == session_id, RenderJob.status.in_(RENDER_ACTIVE_STATUSES)
+        ).order_by(RenderJob.id.desc()).first()
+        if active_job:
+            return jsonify(build_render_status(active_job, message='Geração do documento em andamento')), 202
+        
+        if etp_session.status not in ('aprovado', 'gerando_documento', 'concluido') or not etp_session.preview_content:
             return jsonify({'error': 'Documento não encontrado'}), 404
         
-        # Verificar se arquivo existe
-        if not os.path.exists(etp_session.final_document_path):
-            return jsonify({'error': 'Arquivo não encontrado no servidor'}), 404
-        
-        # Enviar arquivo
-        return send_file(
-            etp_session.final_document_path,
-            as_attachment=True,
-            download_name=f'ETP_{session_id[:8]}.docx',
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        )
+        # Ainda não renderizado: gerar e enviar ao mesmo tempo
+        return attachment_response(stream_final_document(etp_session), DOCX_MIMETYPE, download_name)
         
     except Exception as e:
         return jsonify({'error': f'Erro no download: {str(e)}'}), 500
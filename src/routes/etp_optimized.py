@@ -4,22 +4,38 @@ import json
 from datetime import datetime
 from ..utils.etp_generator_optimized import OptimizedEtpGenerator
 from ..utils.etp_generator import AdvancedEtpGenerator
+from ..utils.openai_client_registry import get_registry_stats, get_token_usage_stats
+from ..utils.generation_cache import get_generation_cache
+from ..utils.knowledge_index import get_knowledge_index
+from ..utils.parallel_section_engine import ParallelSectionEngine
 import os
 
 etp_optimized_bp = Blueprint('etp_optimized', __name__)
 
+# Instâncias de gerador reaproveitadas entre requisições (por tipo e API key)
+_generators = {}
+
+def _get_cached_generator(generator_class, api_key):
+    """Retorna a instância compartilhada do gerador, criando-a na primeira chamada"""
+    key = (generator_class.__name__, api_key)
+    generator = _generators.get(key)
+    if generator is None:
+        generator = generator_class(api_key)
+        _generators[key] = generator
+    return generator
+
 def get_etp_generator(use_optimized=True):
     """Retorna gerador otimizado ou original baseado na configuração"""
     api_key = os.getenv('OPENAI_API_KEY')
     
     if use_optimized:
         try:
-            return OptimizedEtpGenerator(api_key)
+            return _get_cached_generator(OptimizedEtpGenerator, api_key)
         except Exception as e:
             print(f"Fallback para gerador original: {e}")
-            return AdvancedEtpGenerator(api_key)
+            return _get_cached_generator(AdvancedEtpGenerator, api_key)
     else:
-        return AdvancedEtpGenerator(api_key)
+        return _get_cached_generator(AdvancedEtpGenerator, api_key)
 
 @etp_optimized_bp.route('/generate-preview-fast', methods=['POST'])
 def generate_preview_fast():
@@ -87,6 +103,11 @@ def generate_complete_fast():
         data = request.get_json()
         session_id = data.get('session_id')
         use_optimized = data.get('use_optimized', True)
+        # Configuração do motor paralelo de seções (max_workers, section_timeout, max_retries, retry_backoff)
+        try:
+            engine_config = ParallelSectionEngine.validate_config(data.get('engine_config'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         if not session_id:
             return jsonify({'error': 'Session ID é obrigatório'}), 400
@@ -102,12 +123,15 @@ def generate_complete_fast():
         
         # Usar gerador apropriado
         generator = get_etp_generator(use_optimized)
+        engine_stats = None
         
         if use_optimized and hasattr(generator, 'generate_complete_etp_optimized'):
             etp_content = generator.generate_complete_etp_optimized(session_data, is_preview=False)
             generator_used = "optimized"
         else:
-            etp_content = generator.generate_complete_etp(session_data, is_preview=False)
+            etp_content, engine_stats = generator.generate_complete_etp(
+                session_data, is_preview=False, engine_config=engine_config, return_stats=True
+            )
             generator_used = "original"
         
         generation_time = time.time() - start_time
@@ -125,6 +149,7 @@ def generate_complete_fast():
                 'generation_time': round(generation_time, 2),
                 'content_size': len(etp_content),
                 'validation': validation,
+                'engine_stats': engine_stats,
                 'timestamp': datetime.now().isoformat()
             }
         })
@@ -141,6 +166,10 @@ def performance_test():
     try:
         data = request.get_json()
         test_type = data.get('test_type', 'preview')  # 'preview' ou 'complete'
+        try:
+            engine_config = ParallelSectionEngine.validate_config(data.get('engine_config'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         # Dados de teste
         test_session_data = {
@@ -158,13 +187,13 @@ def performance_test():
         
         # Teste com gerador original
         try:
-            original_generator = AdvancedEtpGenerator(os.getenv('OPENAI_API_KEY'))
+            original_generator = get_etp_generator(use_optimized=False)
             
             start_time = time.time()
             if test_type == 'preview':
                 original_content = original_generator.generate_quick_preview(test_session_data)
             else:
-                original_content = original_generator.generate_complete_etp(test_session_data)
+                original_content = original_generator.generate_complete_etp(test_session_data, engine_config=engine_config)
             original_time = time.time() - start_time
             
             results['original'] = {
@@ -182,7 +211,7 @@ def performance_test():
         
         # Teste com gerador otimizado
         try:
-            optimized_generator = OptimizedEtpGenerator(os.getenv('OPENAI_API_KEY'))
+            optimized_generator = get_etp_generator(use_optimized=True)
             
             start_time = time.time()
             if test_type == 'preview':
@@ -217,6 +246,9 @@ def performance_test():
             'test_type': test_type,
             'results': results,
             'improvement_percent': improvement_percent,
+            'generation_cache': get_generation_cache().stats(),
+            'knowledge_index': get_knowledge_index().stats(),
+            'openai_token_usage': get_token_usage_stats(),
             'timestamp': datetime.now().isoformat()
         })
         
@@ -256,6 +288,10 @@ def health_check():
             'status': 'healthy',
             'api_configured': api_configured,
             'generators_available': generators_available,
+            'openai_client_pool': get_registry_stats(),
+            'generation_cache': get_generation_cache().stats(),
+            'knowledge_index': get_knowledge_index().stats(),
+            'openai_token_usage': get_token_usage_stats(),
             'timestamp': datetime.now().isoformat()
         })
         
@@ -2,17 +2,38 @@ from flask import Blueprint, request, jsonify, session, send_file, make_response
 import time
 import json
 import os
+import subprocess
 from datetime import datetime
 from ..utils.etp_generator_ultra_fast import UltraFastEtpGenerator
 from ..utils.etp_visual_formatter import EtpVisualFormatter
+from ..utils.render_cache import get_render_cache
 import tempfile
 
 etp_visual_bp = Blueprint('etp_visual', __name__)
 
+# Instâncias de gerador reaproveitadas entre requisições (por API key)
+_ultra_fast_generators = {}
+
+def visual_ref(session_id):
+    """Referência do último ETP visual renderizado para a sessão"""
+    return f'visual:{session_id}'
+
+def get_visual_artifact(session_id, extension):
+    """Caminho do artefato (html, pdf) do último ETP visual da sessão, se existir no cache"""
+    render_cache = get_render_cache()
+    cache_key = render_cache.get_ref(visual_ref(session_id))
+    if not cache_key:
+        return None, None
+    return cache_key, render_cache.get(cache_key, extension)
+
 def get_ultra_fast_generator():
     """Retorna gerador ultra-rápido"""
     api_key = os.getenv('OPENAI_API_KEY')
-    return UltraFastEtpGenerator(api_key)
+    generator = _ultra_fast_generators.get(api_key)
+    if generator is None:
+        generator = UltraFastEtpGenerator(api_key)
+        _ultra_fast_generators[api_key] = generator
+    return generator
 
 @etp_visual_bp.route('/generate-visual-etp', methods=['POST'])
 def generate_visual_etp():
@@ -44,18 +65,27 @@ def generate_visual_etp():
         
         content_generation_time = time.time() - start_time
         
-        # Aplicar formatação visual
+        # Aplicar formatação visual (reaproveitando o HTML já renderizado para o mesmo conteúdo)
         format_start = time.time()
-        formatter = EtpVisualFormatter()
-        formatted_html = formatter.format_etp_with_borders(etp_content, session_data)
+        render_cache = get_render_cache()
+        cache_key = render_cache.make_key(
+            etp_content,
+            'visual',
+            EtpVisualFormatter.FORMATTER_VERSION,
+            {'answers': session_data.get('answers', {}), 'date': datetime.now().strftime('%d/%m/%Y')}
+        )
+        filepath = render_cache.get(cache_key, 'html')
+        if filepath:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                formatted_html = f.read()
+        else:
+            formatted_html = EtpVisualFormatter().format_etp_with_borders(etp_content, session_data)
+            filepath = render_cache.put_bytes(cache_key, 'html', formatted_html)
+        render_cache.set_ref(visual_ref(session_id), cache_key)
         formatting_time = time.time() - format_start
         
         total_time = time.time() - start_time
         
-        # Salvar arquivo formatado
-        filename = f'etp_visual_{session_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.html'
-        filepath = formatter.save_formatted_etp(formatted_html, filename)
-        
         # Validação rápida
         validation = generator.validate_etp_speed(etp_content)
         
@@ -88,22 +118,18 @@ def generate_visual_etp():
 def download_visual_etp(session_id):
     """Download do ETP formatado em HTML"""
     try:
-        # Buscar arquivo mais recente para a sessão
-        files = [f for f in os.listdir('/home/ubuntu/etp_ultra_otimizado') 
-                if f.startswith(f'etp_visual_{session_id}') and f.endswith('.html')]
+        # Último HTML renderizado para a sessão
+        _, filepath = get_visual_artifact(session_id, 'html')
         
-        if not files:
+        if not filepath:
             return jsonify({'error': 'Arquivo não encontrado'}), 404
         
-        # Pegar o arquivo mais recente
-        latest_file = sorted(files)[-1]
-        filepath = os.path.join('/home/ubuntu/etp_ultra_otimizado', latest_file)
-        
         return send_file(
             filepath,
             as_attachment=True,
             download_name=f'ETP_Formatado_{session_id}.html',
-            mimetype='text/html'
+            mimetype='text/html',
+            conditional=True
         )
         
     except Exception as e:
@@ -113,17 +139,12 @@ def download_visual_etp(session_id):
 def preview_visual_etp(session_id):
     """Preview do ETP formatado no navegador"""
     try:
-        # Buscar arquivo mais recente para a sessão
-        files = [f for f in os.listdir('/home/ubuntu/etp_ultra_otimizado') 
-                if f.startswith(f'etp_visual_{session_id}') and f.endswith('.html')]
+        # Último HTML renderizado para a sessão
+        _, filepath = get_visual_artifact(session_id, 'html')
         
-        if not files:
+        if not filepath:
             return jsonify({'error': 'Arquivo não encontrado'}), 404
         
-        # Pegar o arquivo mais recente
-        latest_file = sorted(files)[-1]
-        filepath = os.path.join('/home/ubuntu/etp_ultra_otimizado', latest_file)
-        
         with open(filepath, 'r', encoding='utf-8') as f:
             html_content = f.read()
         
@@ -134,6 +155,47 @@ def preview_visual_etp(session_id):
     except Exception as e:
         return jsonify({'error': f'Erro no preview: {str(e)}'}), 500
 
+def render_pdf(html_filepath):
+    """Converte o HTML (versão para impressão) em PDF; retorna o caminho do arquivo temporário"""
+    formatter = EtpVisualFormatter()
+    with open(html_filepath, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+    
+    # Preparar HTML para PDF
+    fd, pdf_html_path = tempfile.mkstemp(suffix='_pdf_ready.html')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(formatter.convert_to_pdf_ready(html_content))
+    
+    fd, pdf_filepath = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
+    try:
+        # Converter para PDF usando weasyprint ou similar
+        try:
+            import weasyprint
+            weasyprint.HTML(filename=pdf_html_path).write_pdf(pdf_filepath)
+        except ImportError:
+            # Fallback: usar comando do sistema se weasyprint não estiver disponível
+            subprocess.run([
+                'wkhtmltopdf', 
+                '--page-size', 'A4',
+                '--margin-top', '20mm',
+                '--margin-bottom', '20mm',
+                '--margin-left', '20mm',
+                '--margin-right', '20mm',
+                pdf_html_path, 
+                pdf_filepath
+            ], check=True)
+        
+        if not os.path.getsize(pdf_filepath):
+            raise FileNotFoundError('PDF não foi gerado')
+    except Exception:
+        os.remove(pdf_filepath)
+        raise
+    finally:
+        os.remove(pdf_html_path)
+    
+    return pdf_filepath
+
 @etp_visual_bp.route('/convert-to-pdf', methods=['POST'])
 def convert_to_pdf():
     """Converte ETP formatado para PDF"""
@@ -144,68 +206,29 @@ def convert_to_pdf():
         if not session_id:
             return jsonify({'error': 'Session ID é obrigatório'}), 400
         
-        # Buscar arquivo HTML mais recente
-        files = [f for f in os.listdir('/home/ubuntu/etp_ultra_otimizado') 
-                if f.startswith(f'etp_visual_{session_id}') and f.endswith('.html')]
+        # Último HTML renderizado para a sessão
+        cache_key, html_filepath = get_visual_artifact(session_id, 'html')
         
-        if not files:
+        if not html_filepath:
             return jsonify({'error': 'Arquivo HTML não encontrado'}), 404
         
-        latest_file = sorted(files)[-1]
-        html_filepath = os.path.join('/home/ubuntu/etp_ultra_otimizado', latest_file)
-        
-        # Preparar HTML para PDF
-        formatter = EtpVisualFormatter()
-        with open(html_filepath, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        
-        pdf_ready_html = formatter.convert_to_pdf_ready(html_content)
-        
-        # Salvar versão PDF-ready
-        pdf_html_path = html_filepath.replace('.html', '_pdf_ready.html')
-        with open(pdf_html_path, 'w', encoding='utf-8') as f:
-            f.write(pdf_ready_html)
-        
-        # Converter para PDF usando weasyprint ou similar
-        pdf_filename = f'etp_visual_{session_id}.pdf'
-        pdf_filepath = os.path.join('/home/ubuntu/etp_ultra_otimizado', pdf_filename)
-        
+        # O PDF fica no cache com a mesma chave do HTML de origem
         try:
-            import weasyprint
-            weasyprint.HTML(filename=pdf_html_path).write_pdf(pdf_filepath)
-            conversion_success = True
-        except ImportError:
-            # Fallback: usar comando do sistema se weasyprint não estiver disponível
-            import subprocess
-            try:
-                subprocess.run([
-                    'wkhtmltopdf', 
-                    '--page-size', 'A4',
-                    '--margin-top', '20mm',
-                    '--margin-bottom', '20mm',
-                    '--margin-left', '20mm',
-                    '--margin-right', '20mm',
-                    pdf_html_path, 
-                    pdf_filepath
-                ], check=True)
-                conversion_success = True
-            except (subprocess.CalledProcessError, FileNotFoundError):
-                conversion_success = False
-        
-        if conversion_success and os.path.exists(pdf_filepath):
-            return jsonify({
-                'success': True,
-                'pdf_path': pdf_filepath,
-                'download_url': f'/api/etp-visual/download-pdf/{session_id}',
-                'message': 'PDF gerado com sucesso'
-            })
-        else:
+            pdf_filepath = get_render_cache().get_or_render(cache_key, 'pdf', lambda: render_pdf(html_filepath))
+        except (subprocess.CalledProcessError, FileNotFoundError):
             return jsonify({
                 'success': False,
                 'error': 'Conversão para PDF não disponível. Use o HTML formatado.',
-                'html_path': pdf_html_path
+                'html_path': html_filepath
             }), 500
         
+        return jsonify({
+            'success': True,
+            'pdf_path': pdf_filepath,
+            'download_url': f'/api/etp-visual/download-pdf/{session_id}',
+            'message': 'PDF gerado com sucesso'
+        })
+        
     except Exception as e:
         return jsonify({
             'success': False,
@@ -216,17 +239,17 @@ def convert_to_pdf():
 def download_pdf(session_id):
     """Download do ETP em formato PDF"""
     try:
-        pdf_filename = f'etp_visual_{session_id}.pdf'
-        pdf_filepath = os.path.join('/home/ubuntu/etp_ultra_otimizado', pdf_filename)
+        _, pdf_filepath = get_visual_artifact(session_id, 'pdf')
         
-        if not os.path.exists(pdf_filepath):
+        if not pdf_filepath:
             return jsonify({'error': 'Arquivo PDF não encontrado'}), 404
         
         return send_file(
             pdf_filepath,
             as_attachment=True,
             download_name=f'ETP_Formatado_{session_id}.pdf',
-            mimetype='application/pdf'
+            mimetype='application/pdf',
+            conditional=True
         )
         
     except Exception as e:
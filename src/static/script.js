@@ -232,6 +232,20 @@ function handleFileUpload(input) {
         body: formData
     })
     .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error || 'Erro desconhecido');
+        }
+        
+        // Documento já analisado anteriormente: resultado disponível imediatamente
+        if (data.status === 'concluida') {
+            return data;
+        }
+        
+        // Análise roda em segundo plano: acompanhar o status até a conclusão
+        showLoading('Documento recebido. Analisando...');
+        return waitForUploadAnalysis(data.job_id);
+    })
     .then(data => {
         hideLoading();
         
@@ -280,6 +294,59 @@ function handleFileUpload(input) {
     });
 }
 
+// SSE de status prende um worker síncrono do servidor durante toda a análise: só usar
+// quando o servidor roda com workers assíncronos (gevent/eventlet)
+const UPLOAD_STATUS_USE_STREAM = false;
+
+// Acompanha a análise do documento (polling por padrão, SSE opcional); resolve com o status final
+function waitForUploadAnalysis(jobId) {
+    const statusUrl = `/api/etp/upload-status/${jobId}`;
+    const isFinished = status => status === 'concluida' || status === 'erro';
+    
+    function poll(resolve, reject) {
+        fetch(statusUrl)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'processando') {
+                    showLoading('Extraindo informações do documento...');
+                }
+                if (isFinished(data.status)) {
+                    resolve(data);
+                } else {
+                    setTimeout(() => poll(resolve, reject), 2000);
+                }
+            })
+            .catch(reject);
+    }
+    
+    return new Promise((resolve, reject) => {
+        if (!UPLOAD_STATUS_USE_STREAM || !window.EventSource) {
+            poll(resolve, reject);
+            return;
+        }
+        
+        const source = new EventSource(`${statusUrl}/stream`);
+        source.addEventListener('status', event => {
+            const data = JSON.parse(event.data);
+            if (data.status === 'processando') {
+                showLoading('Extraindo informações do documento...');
+            }
+            if (isFinished(data.status)) {
+                source.close();
+                resolve(data);
+            }
+        });
+        source.addEventListener('timeout', () => {
+            source.close();
+            poll(resolve, reject);
+        });
+        source.onerror = () => {
+            source.close();
+            poll(resolve, reject);
+        };
+    });
+}
+
 let currentETPQuestion = 0;
 let etpAnswers = {};
 
@@ -427,52 +494,116 @@ function validateAnswersWithSession() {
 }
 
 function generateETPPreview() {
-    showLoading('Gerando preview do ETP...');
+    addChatMessage('assistant', 'Gerando preview do ETP...');
+    
+    // Preview renderizado incrementalmente conforme o texto chega
+    const previewDiv = document.createElement('div');
+    previewDiv.className = 'etp-preview';
+    previewDiv.innerHTML = `
+        <div class="preview-header">
+            <h3>📋 Preview do Estudo Técnico Preliminar</h3>
+        </div>
+        <div class="preview-content" style="white-space: pre-wrap;"></div>
+    `;
+    elements.chatMessages.appendChild(previewDiv);
+    const previewContent = previewDiv.querySelector('.preview-content');
     
-    fetch('/api/etp/generate-preview', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-            session_id: etpSession
-        })
+    streamETPPreview(token => {
+        previewContent.appendChild(document.createTextNode(token));
+        elements.chatMessages.scrollTop = elements.chatMessages.scrollHeight;
     })
-    .then(response => response.json())
-    .then(data => {
-        hideLoading();
+    .then(() => {
+        addChatMessage('assistant', 'Preview gerado com sucesso! Você pode visualizar e aprovar o documento.');
         
-        if (data.success) {
-            addChatMessage('assistant', 'Preview gerado com sucesso! Você pode visualizar e aprovar o documento.');
-            
-            // Mostrar preview do conteúdo
-            if (data.preview) {
-                const previewDiv = document.createElement('div');
-                previewDiv.className = 'etp-preview';
-                previewDiv.innerHTML = `
-                    <div class="preview-header">
-                        <h3>📋 Preview do Estudo Técnico Preliminar</h3>
-                    </div>
-                    <div class="preview-content">
-                        ${data.preview.replace(/\n/g, '<br>')}
-                    </div>
-                `;
-                elements.chatMessages.appendChild(previewDiv);
-            }
-            
-            // Adicionar botões de ação
-            setTimeout(() => {
-                addETPActionButtons();
-            }, 500);
-        } else {
-            addChatMessage('assistant', 'Erro ao gerar preview: ' + (data.error || 'Erro desconhecido'));
-        }
+        // Adicionar botões de ação
+        setTimeout(() => {
+            addETPActionButtons();
+        }, 500);
     })
     .catch(error => {
-        hideLoading();
-        addChatMessage('assistant', 'Erro na geração: ' + error.message);
+        addChatMessage('assistant', 'Erro ao gerar preview: ' + error.message);
         console.error('Erro detalhado:', error);
     });
 }
 
+// Lê uma resposta text/event-stream chamando onEvent(evento, dados) a cada evento recebido
+function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    function dispatch(rawEvent) {
+        let eventName = 'message';
+        const dataLines = [];
+        rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                eventName = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        if (dataLines.length) {
+            onEvent(eventName, JSON.parse(dataLines.join('\n')));
+        }
+    }
+    
+    function pump() {
+        return reader.read().then(({ done, value }) => {
+            if (done) {
+                if (buffer.trim()) dispatch(buffer);
+                return;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            let boundary = buffer.indexOf('\n\n');
+            while (boundary !== -1) {
+                dispatch(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                boundary = buffer.indexOf('\n\n');
+            }
+            return pump();
+        });
+    }
+    
+    return pump();
+}
+
+// Faz POST em uma rota SSE; erros de validação chegam como JSON comum
+function postEventStream(url, payload, onEvent) {
+    return fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
+    })
+    .then(response => {
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!contentType.includes('text/event-stream')) {
+            return response.json().then(data => {
+                throw new Error(data.error || 'Erro desconhecido');
+            });
+        }
+        return readEventStream(response, onEvent);
+    });
+}
+
+// Gera o preview via streaming; resolve com o texto completo
+function streamETPPreview(onToken) {
+    let previewText = '';
+    let streamError = null;
+    
+    return postEventStream('/api/etp/generate-preview-stream', { session_id: etpSession }, (event, data) => {
+        if (event === 'token') {
+            previewText += data.text;
+            onToken(data.text, previewText);
+        } else if (event === 'error') {
+            streamError = new Error(data.error || 'Erro desconhecido');
+        }
+    })
+    .then(() => {
+        if (streamError) throw streamError;
+        return previewText;
+    });
+}
+
 function addETPActionButtons() {
     const buttonContainer = document.createElement('div');
     buttonContainer.className = 'etp-action-buttons';
@@ -612,31 +743,44 @@ function sendMessage() {
 
 function sendChatMessage(message) {
     isProcessing = true;
-    showLoading('Processando sua pergunta...');
     
-    fetch('/api/chat/message', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ 
-            message: message,
-            session_id: etpSession 
-        })
+    // Balão da resposta preenchido token a token
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'chat-message assistant';
+    messageDiv.innerHTML = `
+        <div class="message-avatar assistant"><i class="fas fa-robot"></i></div>
+        <div class="message-content formatted" style="white-space: pre-wrap;"></div>
+    `;
+    elements.chatMessages.appendChild(messageDiv);
+    const messageContent = messageDiv.querySelector('.message-content');
+    
+    let responseText = '';
+    let streamError = null;
+    
+    postEventStream('/api/chat/message-stream', { message: message, session_id: etpSession }, (event, data) => {
+        if (event === 'token') {
+            responseText += data.text;
+            messageContent.appendChild(document.createTextNode(data.text));
+            elements.chatMessages.scrollTop = elements.chatMessages.scrollHeight;
+        } else if (event === 'error') {
+            streamError = new Error(data.error || 'Erro desconhecido');
+        }
     })
-    .then(response => response.json())
-    .then(data => {
-        hideLoading();
+    .then(() => {
         isProcessing = false;
+        if (streamError) throw streamError;
         
-        if (data.success) {
-            addFormattedChatMessage('assistant', data.response);
-        } else {
-            addChatMessage('assistant', 'Desculpe, ocorreu um erro ao processar sua pergunta. Tente novamente.');
-        }
+        // Resposta completa: aplicar a formatação final
+        messageContent.style.whiteSpace = '';
+        messageContent.innerHTML = formatChatResponse(responseText);
+        chatHistory.push({ sender: 'assistant', content: responseText, timestamp: Date.now() });
+        updateChatHistory();
     })
     .catch(error => {
-        hideLoading();
         isProcessing = false;
-        addChatMessage('assistant', 'Erro de conexão. Verifique sua internet e tente novamente.');
+        messageDiv.remove();
+        addChatMessage('assistant', 'Desculpe, ocorreu um erro ao processar sua pergunta. Tente novamente.');
+        console.error('Erro no chat:', error);
     });
 }
 
@@ -1144,15 +1288,6 @@ function generateFinalETPWithProgress() {
     elements.chatMessages.appendChild(progressContainer);
     elements.chatMessages.scrollTop = elements.chatMessages.scrollHeight;
     
-    // Simular progresso enquanto gera
-    let progress = 0;
-    const progressInterval = setInterval(() => {
-        progress += Math.random() * 15;
-        if (progress > 90) progress = 90;
-        
-        updateProgress(progress);
-    }, 500);
-    
     // Aprovar preview primeiro
     fetch('/api/etp/approve-preview', {
         method: 'POST',
@@ -1180,9 +1315,19 @@ function generateFinalETPWithProgress() {
     })
     .then(response => response.json())
     .then(data => {
-        clearInterval(progressInterval);
-        updateProgress(100);
-        updateProgressStatus('Documento gerado com sucesso!');
+        if (!data.success) {
+            return data;
+        }
+        
+        // Documento é renderizado em segundo plano: acompanhar o andamento
+        updateProgressStatus('Formatando documento...');
+        return waitForRenderJob(data.status_url);
+    })
+    .then(data => {
+        if (data.success) {
+            updateProgress(100);
+            updateProgressStatus('Documento gerado com sucesso!');
+        }
         
         setTimeout(() => {
             progressContainer.remove();
@@ -1205,12 +1350,31 @@ function generateFinalETPWithProgress() {
         }, 1000);
     })
     .catch(error => {
-        clearInterval(progressInterval);
         progressContainer.remove();
         addChatMessage('assistant', 'Erro na geração: ' + error.message);
     });
 }
 
+// Acompanha a geração do documento Word final; resolve com o status final
+function waitForRenderJob(statusUrl) {
+    return new Promise((resolve, reject) => {
+        function poll() {
+            fetch(statusUrl)
+                .then(response => response.json())
+                .then(data => {
+                    updateProgress(data.progress || 0);
+                    if (data.status === 'concluido' || data.status === 'erro') {
+                        resolve(data);
+                    } else {
+                        setTimeout(poll, 1000);
+                    }
+                })
+                .catch(reject);
+        }
+        poll();
+    });
+}
+
 function updateProgress(percentage) {
     const progressFill = document.querySelector('.progress-fill');
     const progressPercentage = document.querySelector('.progress-percentage');
@@ -1248,61 +1412,51 @@ function generateETPPreviewWithProgress() {
     elements.chatMessages.appendChild(progressContainer);
     elements.chatMessages.scrollTop = elements.chatMessages.scrollHeight;
     
-    // Simular progresso
-    let progress = 0;
-    const progressInterval = setInterval(() => {
-        progress += Math.random() * 20;
-        if (progress > 85) progress = 85;
-        updateProgress(progress);
-    }, 300);
-    
-    fetch('/api/etp/generate-preview', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-            session_id: etpSession
-        })
+    // Progresso real: seções numeradas recebidas sobre as 14 do ETP
+    const totalSections = 14;
+    let sectionsSeen = 0;
+    
+    streamETPPreview((token, previewText) => {
+        const matches = previewText.match(/^\s*\d{1,2}\.\s+[A-ZÁÉÍÓÚÂÊÔÃÕÇ]/gm);
+        const count = matches ? Math.min(matches.length, totalSections) : 0;
+        if (count !== sectionsSeen) {
+            sectionsSeen = count;
+            updateProgress((sectionsSeen / totalSections) * 95);
+            updateProgressStatus(`Gerando seção ${sectionsSeen} de ${totalSections}...`);
+        }
     })
-    .then(response => response.json())
-    .then(data => {
-        clearInterval(progressInterval);
+    .then(preview => {
         updateProgress(100);
         updateProgressStatus('Preview gerado!');
         
         setTimeout(() => {
             progressContainer.remove();
+            addChatMessage('assistant', 'Preview gerado com sucesso! Você pode visualizar e aprovar o documento.');
             
-            if (data.success) {
-                addChatMessage('assistant', 'Preview gerado com sucesso! Você pode visualizar e aprovar o documento.');
-                
-                // Mostrar preview inline se disponível
-                if (data.preview) {
-                    const previewDiv = document.createElement('div');
-                    previewDiv.className = 'etp-preview-inline';
-                    previewDiv.innerHTML = `
-                        <div class="preview-header">
-                            <h4>📋 Preview Rápido</h4>
-                        </div>
-                        <div class="preview-content-short">
-                            ${data.preview.substring(0, 500).replace(/\n/g, '<br>')}...
-                        </div>
-                    `;
-                    elements.chatMessages.appendChild(previewDiv);
-                }
-                
-                // Adicionar botões de ação
-                setTimeout(() => {
-                    addETPActionButtons();
-                }, 500);
-            } else {
-                addChatMessage('assistant', 'Erro ao gerar preview: ' + (data.error || 'Erro desconhecido'));
+            // Mostrar preview inline se disponível
+            if (preview) {
+                const previewDiv = document.createElement('div');
+                previewDiv.className = 'etp-preview-inline';
+                previewDiv.innerHTML = `
+                    <div class="preview-header">
+                        <h4>📋 Preview Rápido</h4>
+                    </div>
+                    <div class="preview-content-short">
+                        ${preview.substring(0, 500).replace(/\n/g, '<br>')}...
+                    </div>
+                `;
+                elements.chatMessages.appendChild(previewDiv);
             }
+            
+            // Adicionar botões de ação
+            setTimeout(() => {
+                addETPActionButtons();
+            }, 500);
         }, 800);
     })
     .catch(error => {
-        clearInterval(progressInterval);
         progressContainer.remove();
-        addChatMessage('assistant', 'Erro na geração: ' + error.message);
+        addChatMessage('assistant', 'Erro ao gerar preview: ' + error.message);
     });
 }
 
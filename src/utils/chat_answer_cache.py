@@ -0,0 +1,331 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from .generation_cache import DATABASE_DIR
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# Palavras sem conteúdo nas perguntas ("qual a diferença entre..." ~ "diferença ... ?")
+_STOPWORDS = {
+    'a', 'o', 'as', 'os', 'um', 'uma', 'uns', 'umas', 'de', 'da', 'do', 'das', 'dos', 'em', 'no', 'na',
+    'nos', 'nas', 'ao', 'aos', 'por', 'pelo', 'pela', 'pelos', 'pelas', 'para', 'pra', 'com', 'e', 'ou',
+    'que', 'sao', 'ser', 'me', 'eu', 'voce', 'se',
+    'poderia', 'pode', 'explique', 'explicar', 'diga', 'sobre', 'entre', 'existe', 'ha', 'tem'
+}
+
+# Referências à conversa anterior: a resposta depende do histórico da sessão
+_FOLLOW_UP_TERMS = {
+    'isso', 'isto', 'esse', 'essa', 'esses', 'essas', 'este', 'esta', 'estes', 'estas', 'ele', 'ela',
+    'eles', 'elas', 'dele', 'dela', 'deles', 'delas', 'disso', 'nisso', 'desse', 'dessa', 'deste',
+    'desta', 'nesse', 'nessa', 'neste', 'nesta', 'anterior', 'acima', 'mencionado', 'mencionada',
+    'exemplo', 'exemplos', 'detalhe', 'detalhes'
+}
+_FOLLOW_UP_START = ('e ', 'mas ', 'entao ', 'tambem ')
+
+# Perguntas com menos termos que isso só casam pela chave exata
+MIN_SIMILARITY_TERMS = 3
+
+# Termos que mudam o sentido da pergunta e precisam ser iguais na busca por semelhança:
+# negações, números (incluindo os de leis e artigos) e o tipo de norma citada
+_NEGATION_TERMS = {'nao', 'sem', 'nunca', 'nem', 'nenhum', 'nenhuma', 'jamais'}
+_CITATION_TERMS = {
+    'lei', 'decreto', 'art', 'artigo', 'inciso', 'paragrafo', 'alinea', 'caput', 'instrucao',
+    'normativa', 'portaria', 'resolucao', 'sumula', 'acordao', 'constituicao'
+}
+_ROMAN_NUMERAL_RE = re.compile(r'^[ivxlcdm]{1,4}$')
+# Palavras interrogativas: "Quem pode participar?" e "Quando pode participar?" são perguntas
+# diferentes. Entram nos termos (plural e gênero unificados) e também precisam ser iguais
+_QUESTION_WORDS = {
+    'qual': 'qual', 'quais': 'qual', 'quem': 'quem', 'onde': 'onde', 'quando': 'quando', 'como': 'como',
+    'quanto': 'quanto', 'quanta': 'quanto', 'quantos': 'quanto', 'quantas': 'quanto', 'porque': 'porque'
+}
+
+
+def _fold(text: str) -> str:
+    """Minúsculas e sem acentos"""
+    text = unicodedata.normalize('NFD', (text or '').casefold())
+    return ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+
+
+def question_terms(question: str) -> FrozenSet[str]:
+    """Termos normalizados da pergunta (sem acentos, caixa, stopwords e plural simples)"""
+    terms = set()
+    for token in _TOKEN_RE.findall(_fold(question)):
+        if token in _STOPWORDS:
+            continue
+        if token in _QUESTION_WORDS:
+            terms.add(_QUESTION_WORDS[token])
+            continue
+        if len(token) > 4 and token.endswith('s'):
+            token = token[:-1]
+        terms.add(token)
+    return frozenset(terms)
+
+
+def key_terms(terms: FrozenSet[str]) -> FrozenSet[str]:
+    """Negações, palavras interrogativas, números e citações legais entre os termos da pergunta"""
+    return frozenset(
+        term for term in terms
+        if term in _NEGATION_TERMS or term in _CITATION_TERMS or term in _QUESTION_WORDS
+        or any(c.isdigit() for c in term) or _ROMAN_NUMERAL_RE.match(term)
+    )
+
+
+def is_follow_up(question: str) -> bool:
+    """Pergunta que se apoia na conversa anterior ("e no caso dele?", "explique isso")"""
+    folded = _fold(question).strip()
+    if folded.startswith(_FOLLOW_UP_START):
+        return True
+    return any(token in _FOLLOW_UP_TERMS for token in _TOKEN_RE.findall(folded))
+
+
+class ChatAnswerCache:
+    """Cache local (SQLite) de respostas do chat para perguntas repetidas
+
+    A pergunta é reduzida a um conjunto de termos normalizados: a chave exata é
+    o hash desse conjunto e, sem ela, vale a pergunta em cache mais parecida.
+    Na busca por semelhança as negações, as palavras interrogativas, os
+    números e as citações legais têm de ser os mesmos, e no máximo ``max_differing_terms`` dos demais termos
+    podem diferir ("Não é obrigatório..." não reaproveita "É obrigatório...").
+    Os termos ficam em memória para essa busca; entradas expiram por TTL e o
+    total é limitado por ``max_entries`` com descarte LRU.
+    """
+
+    def __init__(self, db_path: str = None, max_entries: int = None, ttl_seconds: float = None,
+                 max_differing_terms: int = None, enabled: bool = None):
+        if db_path is None:
+            db_path = os.getenv('CHAT_CACHE_PATH', os.path.join(DATABASE_DIR, 'chat_answer_cache.db'))
+        if max_entries is None:
+            max_entries = int(os.getenv('CHAT_CACHE_MAX_ENTRIES', '1000'))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('CHAT_CACHE_TTL_HOURS', '72')) * 3600
+        if max_differing_terms is None:
+            max_differing_terms = int(os.getenv('CHAT_CACHE_MAX_DIFFERING_TERMS', '1'))
+        if enabled is None:
+            enabled = os.getenv('CHAT_CACHE_ENABLED', 'true').lower() == 'true'
+
+        self.db_path = db_path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self.max_differing_terms = max(0, int(max_differing_terms))
+        self.enabled = enabled
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._terms: Dict[str, Tuple[str, FrozenSet[str], FrozenSet[str]]] = {}
+
+        if self.enabled:
+            self._connect()
+
+    def _connect(self):
+        """Abre a conexão, cria a tabela e carrega os termos das perguntas em memória"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_answer_cache (
+                cache_key TEXT PRIMARY KEY,
+                terms TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                model TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_chat_answer_cache_last_access ON chat_answer_cache (last_access)"
+        )
+        self._conn.commit()
+
+        min_created = time.time() - self.ttl_seconds if self.ttl_seconds else 0
+        for cache_key, model, terms in self._conn.execute(
+            "SELECT cache_key, model, terms FROM chat_answer_cache WHERE created_at >= ?", (min_created,)
+        ):
+            self._remember(cache_key, model, frozenset(terms.split()))
+
+    @staticmethod
+    def make_key(terms: FrozenSet[str], model: str) -> str:
+        raw = f"{model}|{' '.join(sorted(terms))}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _remember(self, cache_key: str, model: str, terms: FrozenSet[str]):
+        self._terms[cache_key] = (model, terms, key_terms(terms))
+
+    def _best_match(self, terms: FrozenSet[str], model: str) -> Optional[str]:
+        """Chave da pergunta em cache com os mesmos termos-chave e menos termos diferentes"""
+        if len(terms) < MIN_SIMILARITY_TERMS:
+            return None
+        required = key_terms(terms)
+        best_key, best_difference = None, self.max_differing_terms + 1
+        for cache_key, (cached_model, cached_terms, cached_required) in self._terms.items():
+            if cached_model != model or cached_required != required:
+                continue
+            if abs(len(terms) - len(cached_terms)) >= best_difference:
+                continue
+            difference = len(terms ^ cached_terms)
+            if difference < best_difference:
+                best_key, best_difference = cache_key, difference
+        return best_key
+
+    def get(self, question: str, model: str) -> Optional[Dict]:
+        """Resposta em cache para a pergunta (exata ou semelhante) ou None"""
+        if not self.enabled:
+            return None
+
+        terms = question_terms(question)
+        if not terms:
+            return None
+
+        now = time.time()
+        try:
+            with self._lock:
+                # Chave exata direto no SQLite (vale também para entradas gravadas por outro processo)
+                match = 'exact'
+                cache_key = self.make_key(terms, model)
+                row = self._fetch(cache_key)
+                if row is None:
+                    match = 'similar'
+                    cache_key = self._best_match(terms, model)
+                    row = self._fetch(cache_key) if cache_key else None
+
+                if row is not None and self.ttl_seconds and now - row[2] > self.ttl_seconds:
+                    self._delete(cache_key)
+                    row = None
+                elif row is None and cache_key:
+                    self._terms.pop(cache_key, None)
+                elif row is not None and cache_key not in self._terms:
+                    self._remember(cache_key, model, terms)
+
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                self._conn.execute(
+                    "UPDATE chat_answer_cache SET last_access = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                    (now, cache_key)
+                )
+                self._conn.commit()
+                if match == 'exact':
+                    self.exact_hits += 1
+                else:
+                    self.similar_hits += 1
+                return {'answer': row[0], 'question': row[1], 'match': match}
+        except sqlite3.Error as e:
+            print(f"⚠️ Erro ao ler cache de respostas do chat: {e}")
+            return None
+
+    def set(self, question: str, answer: str, model: str):
+        """Armazena a resposta de uma pergunta independente da conversa"""
+        if not self.enabled or not answer:
+            return
+
+        terms = question_terms(question)
+        if not terms:
+            return
+
+        now = time.time()
+        cache_key = self.make_key(terms, model)
+        try:
+            with self._lock:
+                self._conn.execute(
+                    """INSERT OR REPLACE INTO chat_answer_cache
+                       (cache_key, terms, question, answer, model, created_at, last_access, hit_count)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, 0)""",
+                    (cache_key, ' '.join(sorted(terms)), question, answer, model, now, now)
+                )
+                self._remember(cache_key, model, terms)
+                self._evict(now)
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Erro ao gravar cache de respostas do chat: {e}")
+
+    def record_bypass(self):
+        """Pergunta que dependia da conversa e não consultou o cache"""
+        with self._lock:
+            self.bypassed += 1
+
+    def _fetch(self, cache_key: str):
+        return self._conn.execute(
+            "SELECT answer, question, created_at FROM chat_answer_cache WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+
+    def _delete(self, cache_key: str):
+        self._conn.execute("DELETE FROM chat_answer_cache WHERE cache_key = ?", (cache_key,))
+        self._conn.commit()
+        self._terms.pop(cache_key, None)
+
+    def _evict(self, now: float):
+        """Remove entradas expiradas e as menos usadas recentemente acima do limite"""
+        removed: List[str] = []
+        if self.ttl_seconds:
+            removed += [row[0] for row in self._conn.execute(
+                "SELECT cache_key FROM chat_answer_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            )]
+
+        total = self._conn.execute("SELECT COUNT(*) FROM chat_answer_cache").fetchone()[0] - len(removed)
+        excess = total - self.max_entries
+        if excess > 0:
+            removed += [row[0] for row in self._conn.execute(
+                "SELECT cache_key FROM chat_answer_cache WHERE created_at >= ? ORDER BY last_access ASC LIMIT ?",
+                (now - self.ttl_seconds if self.ttl_seconds else 0, excess)
+            )]
+
+        for cache_key in removed:
+            self._conn.execute("DELETE FROM chat_answer_cache WHERE cache_key = ?", (cache_key,))
+            self._terms.pop(cache_key, None)
+
+    def clear(self):
+        """Remove todas as entradas do cache"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM chat_answer_cache")
+            self._conn.commit()
+            self._terms.clear()
+
+    def stats(self) -> Dict:
+        """Estatísticas de uso do cache"""
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            lookups = hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._terms),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'max_differing_terms': self.max_differing_terms,
+                'exact_hits': self.exact_hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'hit_rate': round(hits / lookups, 3) if lookups else 0.0
+            }
+
+
+_chat_answer_cache: Optional[ChatAnswerCache] = None
+_chat_answer_cache_lock = threading.Lock()
+
+
+def get_chat_answer_cache() -> ChatAnswerCache:
+    """Retorna a instância do cache de respostas compartilhada pelo processo"""
+    global _chat_answer_cache
+    if _chat_answer_cache is None:
+        with _chat_answer_cache_lock:
+            if _chat_answer_cache is None:
+                _chat_answer_cache = ChatAnswerCache()
+    return _chat_answer_cache
@@ -3,18 +3,24 @@ import re
 import json
 from typing import Dict, List, Tuple, Optional, Any
 import openai
-from PyPDF2 import PdfReader
-from docx import Document
-import io
+
+from .openai_client_registry import get_openai_client
+from .text_extraction import extract_document_text
+from .pattern_scanner import PatternScanner
+from .prompt_budget import truncate_to_tokens
 
 class AdvancedDocumentAnalyzer:
     """Analisador avançado de documentos para extração de informações de ETP"""
     
+    AI_MODEL = "gpt-4-turbo"
+    # Tokens do documento enviados na extração estruturada (~8000 caracteres)
+    AI_TEXT_TOKEN_BUDGET = int(os.getenv('ETP_ANALYSIS_TOKEN_BUDGET', '2300'))
+    
     def __init__(self, openai_api_key: str):
         # Configurar cliente OpenAI de forma robusta
         try:
-            # Tentar inicialização moderna
-            self.client = openai.OpenAI(api_key=openai_api_key)
+            # Tentar inicialização moderna (cliente compartilhado com pool de conexões)
+            self.client = get_openai_client(openai_api_key)
         except Exception as e:
             try:
                 # Fallback para configuração legacy
@@ -90,73 +96,44 @@ class AdvancedDocumentAnalyzer:
             }
         }
     
-    def extract_text_from_file(self, file_content: bytes, file_extension: str) -> str:
-        """Extrai texto de diferentes tipos de arquivo"""
+        # Matcher pré-compilado com todos os padrões de seção e palavras-chave
+        labeled_patterns = [
+            (f'section:{section_name}', pattern)
+            for section_name, patterns in self.section_patterns.items()
+            for pattern in patterns
+        ]
+        keywords = dict.fromkeys(
+            keyword.lower() for question_info in self.etp_questions.values() for keyword in question_info['keywords']
+        )
+        labeled_patterns.extend((f'keyword:{keyword}', re.escape(keyword)) for keyword in keywords)
+        self.pattern_scanner = PatternScanner(labeled_patterns)
+    
+    def extract_text_from_file(self, file_content: bytes, file_extension: str, max_pages: Optional[int] = None,
+                               max_chars: Optional[int] = None) -> str:
+        """Extrai texto de diferentes tipos de arquivo (limitado por páginas/caracteres)"""
         try:
-            if file_extension.lower() == '.pdf':
-                return self._extract_from_pdf(file_content)
-            elif file_extension.lower() in ['.doc', '.docx']:
-                return self._extract_from_docx(file_content)
-            else:
-                raise ValueError(f"Tipo de arquivo não suportado: {file_extension}")
+            return extract_document_text(file_content, file_extension, max_pages=max_pages, max_chars=max_chars)
         except Exception as e:
             raise Exception(f"Erro ao extrair texto do arquivo: {str(e)}")
     
-    def _extract_from_pdf(self, file_content: bytes) -> str:
-        """Extrai texto de arquivo PDF"""
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PdfReader(pdf_file)
-        text = ""
-        
-        for page_num, page in enumerate(pdf_reader.pages):
-            try:
-                page_text = page.extract_text()
-                if page_text:
-                    text += f"\n--- Página {page_num + 1} ---\n"
-                    text += page_text + "\n"
-            except Exception as e:
-                text += f"\n--- Erro na página {page_num + 1}: {str(e)} ---\n"
-        
-        return text
-    
-    def _extract_from_docx(self, file_content: bytes) -> str:
-        """Extrai texto de arquivo DOCX"""
-        doc_file = io.BytesIO(file_content)
-        doc = Document(doc_file)
-        text = ""
-        
-        # Extrair texto dos parágrafos
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text += paragraph.text + "\n"
-        
-        # Extrair texto das tabelas
-        for table in doc.tables:
-            text += "\n--- Tabela ---\n"
-            for row in table.rows:
-                row_text = []
-                for cell in row.cells:
-                    if cell.text.strip():
-                        row_text.append(cell.text.strip())
-                if row_text:
-                    text += " | ".join(row_text) + "\n"
-        
-        return text
-    
     def analyze_document(self, document_text: str) -> Dict:
         """Analisa documento completo e extrai informações relevantes"""
         try:
             # Pré-processamento do texto
             processed_text = self._preprocess_text(document_text)
             
+            # Localizar seções e palavras-chave (varredura única)
+            hits = self._scan_document(processed_text)
+            
             # Identificar seções relevantes
-            sections = self._identify_sections(processed_text)
+            sections = self._identify_sections(processed_text, hits)
             
             # Extrair respostas usando análise de padrões
-            pattern_answers = self._extract_answers_by_patterns(processed_text, sections)
+            pattern_answers = self._extract_answers_by_patterns(processed_text, sections, hits)
             
-            # Extrair respostas usando IA
-            ai_answers = self._extract_answers_with_ai(processed_text)
+            # Extração estruturada com IA (uma única chamada: respostas, confiança e evidências)
+            ai_extraction = self._extract_answers_with_ai(processed_text)
+            ai_answers = {question_id: item['answer'] for question_id, item in ai_extraction.items()}
             
             # Combinar resultados
             combined_answers = self._combine_extraction_results(pattern_answers, ai_answers)
@@ -164,13 +141,18 @@ class AdvancedDocumentAnalyzer:
             # Identificar informações faltantes
             missing_info = self._identify_missing_information(combined_answers)
             
-            # Calcular confiança
+            # Calcular confiança (a confiança informada pela IA prevalece quando a resposta veio dela)
             confidence_scores = self._calculate_confidence_scores(combined_answers, sections)
+            for question_id, item in ai_extraction.items():
+                if combined_answers.get(question_id) == item['answer']:
+                    confidence_scores[question_id] = item['confidence']
             
             return {
                 'extracted_answers': combined_answers,
                 'missing_info': missing_info,
                 'confidence': confidence_scores,
+                'evidence': {question_id: item['evidence'] for question_id, item in ai_extraction.items()},
+                'etp_answers': self._build_etp_answers(ai_extraction),
                 'sections_found': sections,
                 'analysis_method': 'advanced_hybrid',
                 'document_length': len(document_text),
@@ -199,26 +181,58 @@ class AdvancedDocumentAnalyzer:
         
         return text
     
-    def _identify_sections(self, text: str) -> Dict[str, List[str]]:
+    def _scan_document(self, text: str) -> Dict[str, List[Tuple[int, int]]]:
+        """Localiza seções e palavras-chave em uma única varredura (intervalos por rótulo)"""
+        return self.pattern_scanner.scan(text)
+    
+    def _identify_sections(self, text: str, hits: Optional[Dict[str, List[Tuple[int, int]]]] = None) -> Dict[str, List[str]]:
         """Identifica seções relevantes no documento"""
-        sections = {}
+        if hits is None:
+            hits = self._scan_document(text)
         
-        for section_name, patterns in self.section_patterns.items():
-            sections[section_name] = []
-            
-            for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE)
-                for match in matches:
-                    # Extrair contexto ao redor da correspondência
-                    start = max(0, match.start() - 200)
-                    end = min(len(text), match.end() + 500)
-                    context = text[start:end]
-                    sections[section_name].append(context)
+        sections = {}
+        for section_name in self.section_patterns:
+            # Extrair contexto ao redor de cada correspondência
+            sections[section_name] = [
+                text[max(0, start - 200):min(len(text), end + 500)]
+                for start, end in hits.get(f'section:{section_name}', [])
+            ]
         
         return sections
     
-    def _extract_answers_by_patterns(self, text: str, sections: Dict) -> Dict[int, str]:
+    @staticmethod
+    def _keyword_windows(text: str, occurrences: List[Tuple[int, int]]) -> List[str]:
+        """Trechos em volta das ocorrências de uma palavra-chave
+
+        Reproduz ``re.findall(r'.{0,100}palavra.{0,300}')``: cada trecho começa até
+        100 caracteres antes da primeira ocorrência ainda não coberta, vai até 300
+        caracteres depois da última ocorrência que cabe nesses 100 caracteres, e o
+        próximo trecho só começa onde o anterior terminou.
+        """
+        windows = []
+        window_end = 0
+        index = 0
+        while index < len(occurrences):
+            start, end = occurrences[index]
+            if start < window_end:
+                index += 1
+                continue
+            window_start = max(window_end, start - 100)
+            # O prefixo guloso de até 100 caracteres fica com a última ocorrência alcançável
+            while index + 1 < len(occurrences) and occurrences[index + 1][0] <= window_start + 100:
+                index += 1
+                start, end = occurrences[index]
+            window_end = min(len(text), end + 300)
+            windows.append(text[window_start:window_end])
+            index += 1
+        return windows
+    
+    def _extract_answers_by_patterns(self, text: str, sections: Dict,
+                                     hits: Optional[Dict[str, List[Tuple[int, int]]]] = None) -> Dict[int, str]:
         """Extrai respostas usando análise de padrões"""
+        if hits is None:
+            hits = self._scan_document(text)
+        
         answers = {}
         
         for question_id, question_info in self.etp_questions.items():
@@ -229,11 +243,9 @@ class AdvancedDocumentAnalyzer:
                 if section_name in sections:
                     relevant_sections.extend(sections[section_name])
             
-            # Buscar por palavras-chave no texto completo
+            # Contexto das palavras-chave no texto completo (até 100 caracteres antes e 300 depois)
             for keyword in question_info['keywords']:
-                pattern = rf'.{{0,100}}{keyword}.{{0,300}}'
-                matches = re.findall(pattern, text, re.IGNORECASE)
-                relevant_sections.extend(matches)
+                relevant_sections.extend(self._keyword_windows(text, hits.get(f'keyword:{keyword}', [])))
             
             # Processar seções relevantes
             if relevant_sections:
@@ -250,90 +262,126 @@ class AdvancedDocumentAnalyzer:
         
         return answers
     
-    def _extract_answers_with_ai(self, text: str) -> Dict[int, str]:
-        """Extrai respostas usando IA"""
+    def _extract_answers_with_ai(self, text: str) -> Dict[int, Dict[str, Any]]:
+        """Extrai respostas, confiança e evidências com uma única chamada estruturada à IA"""
         try:
-            # Limitar texto para não exceder tokens
-            if len(text) > 8000:
-                text = text[:8000] + "..."
+            # Limitar texto ao orçamento de tokens da extração
+            text = truncate_to_tokens(text, self.AI_TEXT_TOKEN_BUDGET, self.AI_MODEL)
             
             prompt = f"""
-            Analise o documento fornecido e extraia informações específicas para responder às seguintes perguntas de um Estudo Técnico Preliminar (ETP):
+            Analise o documento fornecido e extraia informações específicas para responder às seguintes perguntas de um Estudo Técnico Preliminar (ETP) conforme Lei 14.133/21:
 
             1. Qual a descrição da necessidade da contratação?
-            2. Possui demonstrativo de previsão no PCA?
+            2. Possui demonstrativo de previsão no PCA? (responda apenas "sim" ou "não")
             3. Quais normas legais pretende utilizar?
             4. Qual o quantitativo e valor estimado?
-            5. Haverá parcelamento da contratação?
-
-            DOCUMENTO:
-            {text}
+            5. Haverá parcelamento da contratação? (responda apenas "sim" ou "não")
 
             INSTRUÇÕES:
             - Para cada pergunta, extraia a informação mais relevante encontrada no documento
             - Se não encontrar informação para uma pergunta, não inclua no resultado
-            - Seja preciso e cite trechos específicos quando possível
+            - "confidence" é um número entre 0 e 1 indicando o quanto o documento sustenta a resposta
+            - "evidence" são trechos copiados literalmente do documento que sustentam a resposta
             - Mantenha as respostas concisas mas informativas
 
-            Retorne um JSON no formato:
+            Retorne APENAS um JSON válido no formato:
             {{
-                "1": "resposta para pergunta 1",
-                "2": "resposta para pergunta 2",
+                "1": {{"answer": "resposta para pergunta 1", "confidence": 0.9, "evidence": ["trecho do documento"]}},
+                "2": {{"answer": "sim", "confidence": 0.8, "evidence": ["trecho do documento"]}},
                 ...
             }}
+
+            DOCUMENTO:
+            {text}
             """
             
+            messages = [
+                {
+                    "role": "system",
+                    "content": "Você é um especialista em análise de documentos de licitação e ETP. Extraia informações específicas de forma precisa e retorne apenas JSON válido."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+            
             # Fazer chamada à API de forma compatível
             try:
                 if self.client:
-                    # Usar cliente moderno
+                    # Usar cliente moderno com saída JSON garantida
                     response = self.client.chat.completions.create(
-                        model="gpt-4-turbo",  # Modelo mais poderoso para análise de documentos
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "Você é um especialista em análise de documentos de licitação e ETP. Extraia informações específicas de forma precisa e estruturada."
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
+                        model=self.AI_MODEL,  # Modelo mais poderoso para análise de documentos
+                        messages=messages,
+                        response_format={"type": "json_object"},
                         max_tokens=1500,
                         temperature=0.1
                     )
                 else:
                     # Usar API legacy
                     response = openai.ChatCompletion.create(
-                        model="gpt-4-turbo",
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "Você é um especialista em análise de documentos de licitação e ETP. Extraia informações específicas de forma precisa e estruturada."
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
+                        model=self.AI_MODEL,
+                        messages=messages,
                         max_tokens=1500,
                         temperature=0.1
                     )
             except Exception as e:
+                print(f"Erro na API OpenAI: {e}")
                 return {}
             
+            response_text = response.choices[0].message.content.strip()
+            if response_text.startswith('```'):
+                response_text = re.sub(r'^```(?:json)?|```$', '', response_text).strip()
+            
             # Tentar parsear resposta como JSON
             try:
-                result = json.loads(response.choices[0].message.content)
-                # Converter chaves para int
-                return {int(k): v for k, v in result.items() if k.isdigit()}
-            except json.JSONDecodeError:
+                return self._parse_structured_extraction(json.loads(response_text), text)
+            except (json.JSONDecodeError, AttributeError):
                 # Se não conseguir parsear, tentar extrair informações da resposta
-                return self._parse_ai_response_fallback(response.choices[0].message.content)
+                return {
+                    question_id: {'answer': answer, 'confidence': 0.4, 'evidence': []}
+                    for question_id, answer in self._parse_ai_response_fallback(response_text).items()
+                }
                 
         except Exception as e:
             return {}
     
+    def _parse_structured_extraction(self, result: Dict, text: str) -> Dict[int, Dict[str, Any]]:
+        """Valida o JSON da extração estruturada (respostas, confiança e evidências)"""
+        extraction = {}
+        
+        for key, item in result.items():
+            if not str(key).isdigit() or int(key) not in self.etp_questions:
+                continue
+            
+            # Aceitar também o formato simples {"1": "resposta"}
+            if isinstance(item, str):
+                item = {'answer': item}
+            if not isinstance(item, dict):
+                continue
+            
+            answer = str(item.get('answer') or '').strip()
+            if not answer:
+                continue
+            
+            try:
+                confidence = min(1.0, max(0.0, float(item.get('confidence', 0.5))))
+            except (TypeError, ValueError):
+                confidence = 0.5
+            
+            evidence = item.get('evidence') or []
+            if isinstance(evidence, str):
+                evidence = [evidence]
+            evidence = [str(span).strip() for span in evidence if str(span).strip()]
+            
+            # Evidências que não aparecem no documento reduzem a confiança
+            if evidence and not any(span.lower() in text.lower() for span in evidence):
+                confidence = round(confidence * 0.5, 2)
+            
+            extraction[int(key)] = {'answer': answer, 'confidence': confidence, 'evidence': evidence}
+        
+        return extraction
+    
     def _parse_ai_response_fallback(self, response_text: str) -> Dict[int, str]:
         """Fallback para parsear resposta da IA quando JSON falha"""
         answers = {}
@@ -356,6 +404,24 @@ class AdvancedDocumentAnalyzer:
         
         return answers
     
+    def _build_etp_answers(self, ai_extraction: Dict[int, Dict[str, Any]]) -> Dict[str, str]:
+        """Monta as respostas das 5 perguntas do ETP a partir da extração estruturada"""
+        if not ai_extraction:
+            return {}
+        
+        answers = {}
+        for question_id in range(1, 6):
+            item = ai_extraction.get(question_id)
+            if not item:
+                answers[str(question_id)] = "Informação não encontrada no documento"
+            elif question_id in (2, 5):
+                # Perguntas de sim/não
+                answers[str(question_id)] = 'não' if re.match(r'^\W*n[ãa]o\b', item['answer'], re.IGNORECASE) else 'sim'
+            else:
+                answers[str(question_id)] = item['answer']
+        
+        return answers
+    
     def _combine_extraction_results(self, pattern_answers: Dict, ai_answers: Dict) -> Dict[int, str]:
         """Combina resultados da análise de padrões e IA"""
         combined = {}
@@ -456,104 +522,8 @@ class AdvancedDocumentAnalyzer:
 
 
     def extract_etp_answers(self, analysis_result: Dict[str, Any]) -> Dict[str, str]:
-        """Extrai respostas específicas para as perguntas do ETP"""
-        try:
-            if not analysis_result or not analysis_result.get('success'):
-                return {}
-            
-            content = analysis_result.get('content', '')
-            if not content:
-                return {}
-            
-            # Prompt para extrair respostas específicas das 5 perguntas ETP
-            prompt = f"""
-            Analise o seguinte documento e extraia respostas específicas para as 5 perguntas obrigatórias do ETP conforme Lei 14.133/21:
-
-            DOCUMENTO:
-            {content[:3000]}
-
-            PERGUNTAS:
-            1. Qual a descrição da necessidade da contratação?
-            2. Possui demonstrativo de previsão no PCA? (responda apenas "sim" ou "não")
-            3. Quais normas legais pretende utilizar?
-            4. Qual o quantitativo e valor estimado?
-            5. Haverá parcelamento da contratação? (responda apenas "sim" ou "não")
-
-            Retorne APENAS um JSON válido no formato:
-            {{
-                "1": "resposta detalhada para pergunta 1",
-                "2": "sim" ou "não",
-                "3": "resposta detalhada para pergunta 3",
-                "4": "resposta detalhada para pergunta 4",
-                "5": "sim" ou "não"
-            }}
-
-            Se não encontrar informação para alguma pergunta, use "Informação não encontrada no documento".
-            """
-            
-            # Fazer chamada à API
-            try:
-                if self.client:
-                    response = self.client.chat.completions.create(
-                        model="gpt-4-turbo",
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "Você é um especialista em análise de documentos de licitação. Extraia informações precisas e retorne apenas JSON válido."
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
-                        max_tokens=1000,
-                        temperature=0.1
-                    )
-                else:
-                    response = openai.ChatCompletion.create(
-                        model="gpt-4-turbo",
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "Você é um especialista em análise de documentos de licitação. Extraia informações precisas e retorne apenas JSON válido."
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
-                        max_tokens=1000,
-                        temperature=0.1
-                    )
-                
-                # Extrair resposta
-                response_text = response.choices[0].message.content.strip()
-                
-                # Tentar parsear como JSON
-                try:
-                    # Limpar resposta se necessário
-                    if response_text.startswith('```json'):
-                        response_text = response_text.replace('```json', '').replace('```', '').strip()
-                    
-                    answers = json.loads(response_text)
-                    
-                    # Validar que temos as 5 respostas
-                    expected_keys = ['1', '2', '3', '4', '5']
-                    for key in expected_keys:
-                        if key not in answers:
-                            answers[key] = "Informação não encontrada no documento"
-                    
-                    return answers
-                    
-                except json.JSONDecodeError:
-                    # Se não conseguir parsear, retornar vazio
-                    return {}
-                    
-            except Exception as e:
-                print(f"Erro na API OpenAI: {e}")
-                return {}
-                
-        except Exception as e:
-            print(f"Erro geral em extract_etp_answers: {e}")
+        """Extrai respostas específicas para as perguntas do ETP (reaproveita a extração de analyze_document)"""
+        if not analysis_result or analysis_result.get('error'):
             return {}
-
+        
+        return dict(analysis_result.get('etp_answers') or {})
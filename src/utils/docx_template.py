@@ -0,0 +1,157 @@
+import io
+import re
+import zipfile
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+from xml.sax.saxutils import escape
+
+# Caracteres de controle não aceitos em XML (o python-docx também os rejeita)
+_INVALID_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+DOCUMENT_PART = 'word/document.xml'
+# Tamanho mínimo dos blocos entregues pelo stream do documento
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def xml_text(text: str) -> str:
+    """Texto escapado para uso dentro de ``<w:t>``"""
+    return escape(_INVALID_XML_CHARS.sub('', text or ''))
+
+
+def run_xml(text: str, run_properties: str = '') -> str:
+    """Run com o texto, convertendo quebras de linha e tabulações como o python-docx"""
+    pieces = []
+    for line_index, line in enumerate((text or '').split('\n')):
+        if line_index:
+            pieces.append('<w:br/>')
+        for tab_index, chunk in enumerate(line.split('\t')):
+            if tab_index:
+                pieces.append('<w:tab/>')
+            if chunk:
+                pieces.append(f'<w:t xml:space="preserve">{xml_text(chunk)}</w:t>')
+    properties = f'<w:rPr>{run_properties}</w:rPr>' if run_properties else ''
+    return f'<w:r>{properties}{"".join(pieces)}</w:r>'
+
+
+def paragraph_xml(text: str = '', style_id: str = None, paragraph_properties: str = '',
+                  run_properties: str = '') -> str:
+    """Parágrafo com estilo e propriedades opcionais"""
+    style = f'<w:pStyle w:val="{style_id}"/>' if style_id else ''
+    properties = f'<w:pPr>{style}{paragraph_properties}</w:pPr>' if style or paragraph_properties else ''
+    run = run_xml(text, run_properties) if text else ''
+    return f'<w:p>{properties}{run}</w:p>'
+
+
+class DocxSkeleton:
+    """Documento .docx pré-montado usado como molde de renderização
+
+    O esqueleto (estilos, cabeçalho, rodapé, bordas de página) é montado uma
+    vez e guardado como as partes do pacote em memória. O ``document.xml`` é
+    dividido no parágrafo marcador: cada documento é o prefixo, o XML do corpo
+    gerado em bloco e o sufixo. Marcadores de texto nas demais partes (ex.: a
+    data do rodapé) são substituídos na gravação.
+    """
+
+    def __init__(self, docx_bytes: bytes, body_marker: str, text_markers: Iterable[str] = ()):
+        with zipfile.ZipFile(io.BytesIO(docx_bytes)) as package:
+            self._parts = [(info, package.read(info.filename)) for info in package.infolist()]
+
+        document_xml = dict((info.filename, data) for info, data in self._parts)[DOCUMENT_PART].decode('utf-8')
+        marker_at = document_xml.index(body_marker)
+        paragraph_start = max(document_xml.rfind('<w:p>', 0, marker_at), document_xml.rfind('<w:p ', 0, marker_at))
+        paragraph_end = document_xml.index('</w:p>', marker_at) + len('</w:p>')
+        self._document_prefix = document_xml[:paragraph_start].encode('utf-8')
+        self._document_suffix = document_xml[paragraph_end:].encode('utf-8')
+
+        # Partes que contêm marcadores de texto a substituir em cada documento
+        markers = [marker.encode('utf-8') for marker in text_markers]
+        self._templated_parts = {
+            info.filename for info, data in self._parts
+            if info.filename != DOCUMENT_PART and any(marker in data for marker in markers)
+        }
+
+    @classmethod
+    def from_document(cls, document, body_marker: str, text_markers: Iterable[str] = ()) -> 'DocxSkeleton':
+        """Cria o esqueleto a partir de um ``docx.Document`` montado com o parágrafo marcador"""
+        buffer = io.BytesIO()
+        document.save(buffer)
+        return cls(buffer.getvalue(), body_marker, text_markers)
+
+    def render(self, body_xml: Union[str, Iterable[str]], target, replacements: Optional[Dict[str, str]] = None):
+        """Grava o documento com ``body_xml`` no lugar do marcador (``target``: caminho ou arquivo)
+
+        ``body_xml`` pode ser o XML completo ou um iterável de trechos gerados sob demanda.
+        """
+        for _ in self._write_package(target, body_xml, replacements):
+            pass
+
+    def stream(self, body_xml: Union[str, Iterable[str]], replacements: Optional[Dict[str, str]] = None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """Gera os bytes do .docx à medida que o corpo é produzido
+
+        O zip é escrito num destino não posicionável (descritores de dados no
+        lugar dos tamanhos no cabeçalho), então nada além do trecho atual e do
+        buffer de compressão fica em memória.
+        """
+        output = _ZipOutputBuffer()
+        for _ in self._write_package(output, body_xml, replacements):
+            if output.pending >= chunk_size:
+                yield output.drain()
+        data = output.drain()
+        if data:
+            yield data
+
+    def _write_package(self, target, body_xml, replacements):
+        """Escreve o pacote parte a parte; cede o controle após cada trecho do corpo"""
+        replacements = {key.encode('utf-8'): xml_text(value).encode('utf-8')
+                        for key, value in (replacements or {}).items()}
+        body_chunks = [body_xml] if isinstance(body_xml, str) else body_xml
+
+        with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as package:
+            for info, data in self._parts:
+                if info.filename == DOCUMENT_PART:
+                    part_info = zipfile.ZipInfo(info.filename, info.date_time)
+                    part_info.compress_type = zipfile.ZIP_DEFLATED
+                    with package.open(part_info, 'w') as part:
+                        part.write(self._document_prefix)
+                        for chunk in body_chunks:
+                            part.write(chunk.encode('utf-8'))
+                            yield
+                        part.write(self._document_suffix)
+                else:
+                    if info.filename in self._templated_parts:
+                        for marker, value in replacements.items():
+                            data = data.replace(marker, value)
+                    package.writestr(info, data, compress_type=zipfile.ZIP_DEFLATED)
+                yield
+
+    def part_names(self) -> List[str]:
+        return [info.filename for info, _ in self._parts]
+
+
+class _ZipOutputBuffer:
+    """Destino do zip sem ``seek``: acumula os bytes escritos até serem drenados"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.pending = 0
+
+    def write(self, data) -> int:
+        size = len(data)
+        if size:
+            self._chunks.append(bytes(data))
+            self._position += size
+            self.pending += size
+        return size
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self.pending = 0
+        return data
@@ -0,0 +1,208 @@
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# Letra (qualquer alfabeto, com acentos), sem dígitos nem sublinhado
+_LETTER = r'[^\W\d_]'
+
+# Marcação markdown que o modelo às vezes coloca em volta dos títulos
+_HEADING_DECORATION = re.compile(r'^#+\s*(?:\*\*)?|^\*\*|\*\*$')
+# "1. INTRODUÇÃO", "1.INTRODUÇÃO", "1 - INTRODUÇÃO", "1. INTRODUÇÃO (Lei nº 14.133/2021)":
+# número, "." ou "-" e um título que não termina em pontuação de frase (ponto final).
+# Só vira seção com título em maiúsculas ou com o número da próxima seção esperada;
+# itens numerados de listas ("1. Consulta ao Painel de Preços") continuam parágrafos
+SECTION_TITLE = re.compile(
+    rf'^(\d{{1,2}})(?:\.\s*|\s*[-–]\s*)({_LETTER}(?:[\w \t\-–/(),;.§°]*[\w)])?)\s*:?$'
+)
+# Referência entre parênteses, ignorada ao conferir se o título está em maiúsculas
+_PARENTHESIZED = re.compile(r'\([^)]*\)')
+# "2.1 Localização da execução" ou "2.1. Localização"
+SUBSECTION_TITLE = re.compile(rf'^(\d{{1,2}}\.\d{{1,2}})\.?\s+{_LETTER}')
+BULLET_ITEM = re.compile(r'^(?:•\s*|[-*]\s+)(\S.*)$')
+# Separadores: "---" isolado ou linha de alinhamento de tabela markdown ("|---|:---:|")
+SEPARATOR_LINE = re.compile(r'^(?:-{3,}|\|?(?:\s*:?-{3,}:?\s*\|)+\s*:?-*:?\s*)$')
+# Número de seção no início da linha, com ou sem markdown: "4. ESTIMATIVA", "**4.ESTIMATIVA", "## 4 -"
+SECTION_NUMBER_LINE = re.compile(r'^[#*\s]*(\d{1,2})\s*[.\-)]', re.MULTILINE)
+
+
+class ContentNode(NamedTuple):
+    """Nó do documento: section, subsection, paragraph, bullet ou table"""
+    kind: str
+    text: str = ''
+    number: str = ''
+    rows: Tuple[Tuple[str, ...], ...] = ()
+
+
+class EtpDocument:
+    """Conteúdo do ETP já analisado, compartilhado por renderizadores e validadores
+
+    Os nós são imutáveis, então a mesma instância pode ser usada por várias
+    requisições ao mesmo tempo.
+    """
+
+    def __init__(self, nodes: Tuple[ContentNode, ...]):
+        self.nodes = nodes
+        self._section_index: Dict[str, int] = {}
+        for index, node in enumerate(nodes):
+            if node.kind == 'section':
+                self._section_index.setdefault(node.number, index)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def section_numbers(self) -> List[str]:
+        """Números das seções principais encontradas, na ordem do texto"""
+        return list(self._section_index)
+
+    def has_section(self, number) -> bool:
+        return str(number) in self._section_index
+
+    def section_nodes(self, number) -> Optional[List[ContentNode]]:
+        """Nós do corpo da seção (sem o título) até a próxima seção principal"""
+        start = self._section_index.get(str(number))
+        if start is None:
+            return None
+        body = []
+        for node in self.nodes[start + 1:]:
+            if node.kind == 'section':
+                break
+            body.append(node)
+        return body
+
+
+def _heading_text(line: str) -> str:
+    return _HEADING_DECORATION.sub('', line).strip()
+
+
+def _is_upper_title(heading: str) -> bool:
+    """Título em maiúsculas, ignorando referências entre parênteses ("(Lei nº 14.133/2021)")"""
+    return _PARENTHESIZED.sub('', heading).isupper()
+
+
+def _table_cells(line: str) -> Tuple[str, ...]:
+    return tuple(cell.strip() for cell in line.split('|') if cell.strip())
+
+
+def _iter_lines(content: str) -> Iterator[str]:
+    """Linhas do texto uma a uma (mesmo resultado de ``split('\\n')`` sem montar a lista)"""
+    start = 0
+    while True:
+        end = content.find('\n', start)
+        if end < 0:
+            yield content[start:]
+            return
+        yield content[start:end]
+        start = end + 1
+
+
+def iter_etp_nodes(content: str) -> Iterator[ContentNode]:
+    """Nós do ETP gerados à medida que o texto é lido, sem cache
+
+    Usado pela geração em fluxo do documento Word: a memória não cresce com o
+    tamanho do documento. Os demais usos passam por ``parse_etp_content``.
+    """
+    # Nós completos aguardando entrega (no máximo os encerrados pela linha anterior)
+    nodes = []
+    paragraph = []
+    table = []
+    next_section = 1
+
+    def flush_paragraph():
+        if paragraph:
+            nodes.append(ContentNode('paragraph', '\n'.join(paragraph)))
+            paragraph.clear()
+
+    def flush_table():
+        if table:
+            nodes.append(ContentNode('table', rows=tuple(table)))
+            table.clear()
+
+    for line in _iter_lines(content or ''):
+        if nodes:
+            yield from nodes
+            nodes.clear()
+        line = line.strip()
+
+        if not line:
+            # Linha vazia encerra parágrafo e tabela
+            flush_paragraph()
+            flush_table()
+            continue
+
+        if SEPARATOR_LINE.match(line):
+            continue
+
+        heading = _heading_text(line)
+        section = SECTION_TITLE.match(heading)
+        if section and not (_is_upper_title(heading) or int(section.group(1)) == next_section):
+            section = None
+        subsection = None if section else SUBSECTION_TITLE.match(heading)
+        if section or subsection:
+            flush_paragraph()
+            flush_table()
+            if section:
+                nodes.append(ContentNode('section', heading, section.group(1)))
+                next_section = int(section.group(1)) + 1
+            else:
+                nodes.append(ContentNode('subsection', heading, subsection.group(1)))
+            continue
+
+        if line.count('|') >= 2:
+            flush_paragraph()
+            cells = _table_cells(line)
+            if cells:
+                table.append(cells)
+            continue
+
+        flush_table()
+        bullet = BULLET_ITEM.match(line)
+        if bullet:
+            flush_paragraph()
+            nodes.append(ContentNode('bullet', bullet.group(1).strip()))
+        else:
+            paragraph.append(line)
+
+    flush_paragraph()
+    flush_table()
+    yield from nodes
+
+
+def _parse(content: str) -> EtpDocument:
+    return EtpDocument(tuple(iter_etp_nodes(content)))
+
+
+@lru_cache(maxsize=int(os.getenv('ETP_PARSER_CACHE_SIZE', '64')))
+def _parse_cached(content: str) -> EtpDocument:
+    return _parse(content)
+
+
+def parse_etp_content(content: str) -> EtpDocument:
+    """Analisa o texto do ETP uma única vez por conteúdo
+
+    O resultado fica em cache pelo próprio texto: o preview da sessão é
+    analisado na validação e reaproveitado pelos formatadores Word e HTML.
+    """
+    return _parse_cached(content or '')
+
+
+def missing_section_numbers(content: str, numbers: Iterable[int]) -> List[int]:
+    """Seções pedidas ao modelo que não aparecem como título ("4." no início da linha)
+
+    Conferência rápida feita antes de gravar uma resposta no cache de geração.
+    """
+    found = {int(number) for number in SECTION_NUMBER_LINE.findall(content or '')}
+    return [number for number in numbers if number not in found]
+
+
+def get_parser_cache_stats() -> Dict:
+    info = _parse_cached.cache_info()
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize
+    }
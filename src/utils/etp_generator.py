@@ -1,14 +1,44 @@
 import os
 import json
-from typing import Dict, List, Optional
-import openai
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
+from functools import partial
+
+from .parallel_section_engine import ParallelSectionEngine
+from .openai_client_registry import get_openai_client
+from .generation_cache import get_generation_cache
+from .etp_content_parser import missing_section_numbers, parse_etp_content
+from .knowledge_index import get_knowledge_index
+from .prompt_budget import (
+    count_tokens, context_budget, fit_context, expected_section_tokens, max_output_tokens, max_tokens_for_sections
+)
 
 class AdvancedEtpGenerator:
     """Gerador avançado de ETP seguindo rigorosamente a Lei 14.133/21"""
     
+    QUICK_PREVIEW_SYSTEM_PROMPT = "Você é um especialista em ETP. Gere APENAS as seções solicitadas com conteúdo completo e técnico."
+    
+    # Prefixos fixos dos prompts (idênticos byte a byte entre requisições para o cache de prompt do provedor)
+    ADJUSTMENT_SYSTEM_PROMPT = """Você é um especialista em revisão de documentos de ETP. Faça ajustes precisos mantendo qualidade técnica e conformidade legal.
+
+Você receberá uma seção de ETP e o feedback do usuário.
+
+INSTRUÇÕES:
+1. Mantenha a estrutura e formatação original
+2. Aplique os ajustes solicitados no feedback
+3. Preserve a conformidade com a Lei 14.133/21
+4. Mantenha linguagem técnica e formal
+5. Garanta coerência com o restante do documento"""
+    
+    # Versão dos templates de prompt; alterar invalida o cache de geração
+    PROMPT_VERSION = "advanced-v2"
+    SECTION_MODEL = "gpt-4-turbo"
+    QUICK_PREVIEW_MODEL = "gpt-4"
+    
     def __init__(self, openai_api_key: str):
-        self.client = openai.OpenAI(api_key=openai_api_key)
+        self.client = get_openai_client(openai_api_key)
+        self.cache = get_generation_cache()
+        self.knowledge_index = get_knowledge_index()
         
         # Estrutura obrigatória conforme Lei 14.133/21
         self.etp_structure = [
@@ -125,23 +155,34 @@ class AdvancedEtpGenerator:
                 "description": "Tabela de análise de riscos"
             }
         }
+        
+        # Prefixo fixo das chamadas por seção (estrutura completa e instruções comuns)
+        self.section_system_prompt = self._build_section_system_prompt()
     
-    def generate_complete_etp(self, session_data: Dict, context_data: Dict = None, is_preview: bool = False) -> str:
-        """Gera ETP completo seguindo a estrutura obrigatória"""
+    def generate_complete_etp(self, session_data: Dict, context_data: Dict = None, is_preview: bool = False,
+                              engine_config: Dict = None, return_stats: bool = False):
+        """Gera ETP completo seguindo a estrutura obrigatória
+
+        As 14 seções são geradas em paralelo pelo ParallelSectionEngine;
+        ``engine_config`` permite ajustar por requisição max_workers,
+        section_timeout, max_retries e retry_backoff. Com ``return_stats``
+        retorna ``(conteúdo, estatísticas do motor)``: o gerador é compartilhado
+        entre requisições, então as estatísticas não ficam na instância.
+        """
         try:
             # Preparar contexto
-            context = self._build_generation_context(session_data, context_data)
+            context, knowledge_budget = self._build_generation_context(session_data, context_data)
             
-            # Gerar cada seção
-            etp_content = []
-            
-            for section_info in self.etp_structure:
-                section_content = self._generate_section(
-                    section_info, 
-                    context, 
-                    is_preview
-                )
-                etp_content.append(section_content)
+            # Gerar as seções em paralelo, preservando a ordem da estrutura
+            engine = ParallelSectionEngine.from_config(engine_config)
+            tasks = [
+                partial(self._request_section, section_info, context, is_preview, knowledge_budget=knowledge_budget)
+                for section_info in self.etp_structure
+            ]
+            etp_content = engine.run(
+                tasks,
+                lambda index, error: self._section_error_fallback(self.etp_structure[index], error)
+            )
             
             # Combinar conteúdo
             full_etp = "\n\n".join(etp_content)
@@ -151,19 +192,24 @@ class AdvancedEtpGenerator:
                 header = self._generate_document_header()
                 full_etp = header + "\n\n" + full_etp
             
+            if return_stats:
+                return full_etp, engine.last_run_stats
             return full_etp
             
         except Exception as e:
             raise Exception(f"Erro na geração do ETP: {str(e)}")
     
-    def _build_generation_context(self, session_data: Dict, context_data: Dict = None) -> str:
-        """Constrói contexto para geração"""
-        context = "CONTEXTO PARA GERAÇÃO DE ETP:\n\n"
+    def _build_generation_context(self, session_data: Dict, context_data: Dict = None) -> Tuple[str, int]:
+        """Constrói contexto para geração: respostas inteiras e o documento dentro do orçamento
+
+        Retorna ``(contexto, orçamento restante)``; o restante é usado pela base
+        de conhecimento em cada seção (ver _knowledge_context).
+        """
+        parts = []
         
-        # Adicionar respostas do usuário
+        # Adicionar respostas do usuário (sempre inteiras, fora do orçamento)
         answers = session_data.get('answers', {})
         if answers:
-            context += "RESPOSTAS DO USUÁRIO:\n"
             questions = [
                 "Qual a descrição da necessidade da contratação?",
                 "Possui demonstrativo de previsão no PCA?",
@@ -171,120 +217,162 @@ class AdvancedEtpGenerator:
                 "Qual o quantitativo e valor estimado?",
                 "Haverá parcelamento da contratação?"
             ]
-            
-            for i, question in enumerate(questions, 1):
-                answer = answers.get(str(i), "Não informado")
-                context += f"{i}. {question}\n"
-                context += f"Resposta: {answer}\n\n"
+            parts.append("RESPOSTAS DO USUÁRIO:\n" + "\n\n".join(
+                f"{i}. {question}\nResposta: {answers.get(str(i), 'Não informado')}"
+                for i, question in enumerate(questions, 1)
+            ))
         
         # Adicionar análise de documento se disponível
+        blocks = []
         if context_data and 'document_analysis' in context_data:
             doc_analysis = context_data['document_analysis']
-            context += "ANÁLISE DE DOCUMENTO FORNECIDO:\n"
-            context += f"Arquivo: {doc_analysis.get('filename', 'N/A')}\n"
-            
             extracted_content = doc_analysis.get('extracted_content', '')
             if extracted_content:
-                context += "Conteúdo extraído:\n"
-                context += extracted_content[:2000] + "...\n\n"
-        
-        # Adicionar base de conhecimento se disponível
-        if context_data and 'knowledge_base' in context_data:
-            kb_files = context_data['knowledge_base']
-            if kb_files:
-                context += "BASE DE CONHECIMENTO (Modelos de referência):\n"
-                for kb_file in kb_files[:2]:  # Limitar a 2 arquivos
-                    context += f"--- {kb_file.get('filename', 'N/A')} ---\n"
-                    content = kb_file.get('content', '')
-                    context += content[:1500] + "...\n\n"
-        
-        return context
+                blocks.append((
+                    f"ANÁLISE DE DOCUMENTO FORNECIDO:\nArquivo: {doc_analysis.get('filename', 'N/A')}\nConteúdo extraído:",
+                    extracted_content
+                ))
+        
+        # Documento e base de conhecimento dividem o orçamento do contexto suplementar
+        budget = context_budget(self.SECTION_MODEL)
+        document = fit_context(blocks, budget, self.SECTION_MODEL)
+        if document:
+            parts.append(document)
+        
+        context = '\n\n'.join(parts)
+        header = f"CONTEXTO PARA GERAÇÃO DE ETP:\n\n{context}\n\n" if context else "CONTEXTO PARA GERAÇÃO DE ETP:\n\n"
+        return header, max(0, budget - count_tokens(document, self.SECTION_MODEL))
     
-    def _generate_section(self, section_info: Dict, context: str, is_preview: bool) -> str:
-        """Gera uma seção específica do ETP"""
-        try:
-            section_title = section_info['section']
-            subsections = section_info.get('subsections', [])
-            description = section_info['description']
-            min_paragraphs = section_info.get('min_paragraphs', 8)
-            requires_table = section_info.get('requires_table', False)
-            
-            # Determinar tipo de conteúdo
-            content_type = "prévia" if is_preview else "versão final"
-            
-            # Construir prompt específico para a seção
-            prompt = f"""
-            Gere o conteúdo para a seção "{section_title}" de um Estudo Técnico Preliminar (ETP) conforme a Lei 14.133/21.
-
-            DESCRIÇÃO DA SEÇÃO: {description}
-
-            ESTRUTURA REQUERIDA:
-            - Título principal: {section_title}
-            """
-            
-            if subsections:
-                prompt += "\n- Subseções obrigatórias:\n"
-                for subsection in subsections:
-                    prompt += f"  • {subsection}\n"
-            
-            prompt += f"""
-            
-            REQUISITOS DE CONTEÚDO:
-            - Mínimo de {min_paragraphs} parágrafos bem elaborados
-            - Linguagem administrativa clara, completa, formal e legal
-            - Conformidade total com a Lei 14.133/21
-            - Cada parágrafo deve ter entre 4-8 linhas
-            - Usar terminologia técnica apropriada
-            - Manter coerência com o contexto fornecido
-            """
-            
-            if requires_table:
-                prompt += "\n- INCLUIR TABELA FORMATADA quando apropriado"
-            
+    def _section_error_fallback(self, section_info: Dict, error: Exception) -> str:
+        """Conteúdo de contingência quando a geração da seção falha"""
+        return f"{section_info['section']}\n\n[Erro na geração desta seção: {str(error)}]\n\nEsta seção deve ser desenvolvida manualmente conforme a Lei 14.133/21."
+    
+    def _request_section(self, section_info: Dict, context: str, is_preview: bool, timeout: float,
+                         knowledge_budget: int = None) -> str:
+        """Solicita uma seção à API; lança exceção em caso de falha"""
+        section_title = section_info['section']
+        subsections = section_info.get('subsections', [])
+        description = section_info['description']
+        min_paragraphs = section_info.get('min_paragraphs', 8)
+        requires_table = section_info.get('requires_table', False)
+        
+        # Determinar tipo de conteúdo
+        content_type = "prévia" if is_preview else "versão final"
+        
+        # Trechos da base de conhecimento relevantes para esta seção
+        knowledge_context = self._knowledge_context(section_info, context, knowledge_budget)
+        
+        # Seção já gerada para o mesmo contexto normalizado
+        cache_key = self.cache.make_key(
+            'advanced', self.SECTION_MODEL, self.PROMPT_VERSION,
+            f"{section_title}|{content_type}", context=context + knowledge_context
+        )
+        cached_content = self.cache.get(cache_key)
+        if cached_content is not None:
+            return cached_content
+        
+        # Prompt específico da seção (as instruções fixas ficam no prefixo do system prompt)
+        prompt = f"""SEÇÃO A GERAR: {section_title} ({content_type})
+DESCRIÇÃO DA SEÇÃO: {description}
+PARÁGRAFOS MÍNIMOS: {min_paragraphs}
+"""
+        
+        if subsections:
+            prompt += "SUBSEÇÕES OBRIGATÓRIAS:\n"
+            for subsection in subsections:
+                prompt += f"  • {subsection}\n"
+        
+        if requires_table:
+            prompt += "INCLUIR TABELA FORMATADA quando apropriado\n"
+        
+        prompt += f"""
+CONTEXTO:
+{context}
+"""
+        
+        if knowledge_context:
             prompt += f"""
-            
-            CONTEXTO:
-            {context}
-            
-            INSTRUÇÕES ESPECÍFICAS:
-            1. Inicie sempre com o título da seção em MAIÚSCULAS
-            2. Se houver subseções, inclua-as com numeração apropriada
-            3. Desenvolva cada tópico de forma substancial e técnica
-            4. Cite artigos da Lei 14.133/21 quando relevante
-            5. Mantenha consistência com as informações do contexto
-            6. Use linguagem impessoal e formal
-            
-            Gere o conteúdo completo da seção:
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo",  # Modelo mais poderoso para geração de documentos
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """Você é um especialista em elaboração de Estudos Técnicos Preliminares conforme a Lei 14.133/21. 
-                        Gere conteúdo técnico, detalhado, formal e em total conformidade com a legislação de licitações e contratos públicos.
-                        Mantenha sempre linguagem administrativa apropriada e estrutura lógica."""
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=2000,
-                temperature=0.2
-            )
-            
-            section_content = response.choices[0].message.content
-            
-            # Pós-processamento
-            section_content = self._post_process_section_content(section_content, section_info)
-            
-            return section_content
-            
+BASE DE CONHECIMENTO (trechos de modelos de referência relevantes para a seção):
+{knowledge_context}
+"""
+        
+        prompt += "\nGere o conteúdo completo da seção:"
+        
+        response = self.client.chat.completions.create(
+            model=self.SECTION_MODEL,  # Modelo mais poderoso para geração de documentos
+            messages=[
+                {
+                    "role": "system",
+                    "content": self.section_system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            max_tokens=max_output_tokens(
+                self.SECTION_MODEL, expected_section_tokens(section_info), count_tokens(prompt, self.SECTION_MODEL)
+            ),
+            temperature=0.2,
+            timeout=timeout
+        )
+        
+        section_content = response.choices[0].message.content
+        finish_reason = getattr(response.choices[0], 'finish_reason', None)
+        
+        # Pós-processamento
+        section_content = self._post_process_section_content(section_content, section_info)
+        
+        # Seção cortada por max_tokens não vai para o cache (o título é garantido pelo pós-processamento)
+        if finish_reason == 'length':
+            print(f"⚠️ Seção truncada ({section_title}); não será cacheada")
+        else:
+            self.cache.set(cache_key, section_content, 'advanced', self.SECTION_MODEL, section_title)
+        return section_content
+    
+    def _build_section_system_prompt(self) -> str:
+        """System prompt comum a todas as seções (não contém dados da sessão)"""
+        structure_lines = []
+        for section_info in self.etp_structure:
+            structure_lines.append(f"{section_info['section']} — {section_info['description']}")
+            structure_lines.extend(f"   • {subsection}" for subsection in section_info.get('subsections', []))
+        
+        return f"""Você é um especialista em elaboração de Estudos Técnicos Preliminares conforme a Lei 14.133/21.
+Gere conteúdo técnico, detalhado, formal e em total conformidade com a legislação de licitações e contratos públicos.
+Mantenha sempre linguagem administrativa apropriada e estrutura lógica.
+
+ESTRUTURA COMPLETA DO ETP (cada requisição pede uma única seção):
+{chr(10).join(structure_lines)}
+
+REQUISITOS DE CONTEÚDO:
+- Linguagem administrativa clara, completa, formal e legal
+- Conformidade total com a Lei 14.133/21
+- Cada parágrafo deve ter entre 4-8 linhas
+- Usar terminologia técnica apropriada
+- Manter coerência com o contexto fornecido
+
+INSTRUÇÕES ESPECÍFICAS:
+1. Inicie sempre com o título da seção em MAIÚSCULAS
+2. Se houver subseções, inclua-as com numeração apropriada
+3. Desenvolva cada tópico de forma substancial e técnica
+4. Cite artigos da Lei 14.133/21 quando relevante
+5. Mantenha consistência com as informações do contexto
+6. Use linguagem impessoal e formal
+7. Gere apenas a seção solicitada, com o número mínimo de parágrafos indicado"""
+    
+    def _knowledge_context(self, section_info: Dict, context: str, token_budget: int = None) -> str:
+        """Trechos mais relevantes da base de conhecimento para a seção (dentro do orçamento)"""
+        query = ' '.join([section_info['section'], section_info['description'],
+                          *section_info.get('subsections', []), context])
+        # A base de conhecimento tem a menor prioridade: usa o que o documento deixou do orçamento
+        remaining = context_budget(self.SECTION_MODEL) if token_budget is None else token_budget
+        if remaining <= 0:
+            return ''
+        try:
+            return self.knowledge_index.build_context(query, token_budget=min(self.knowledge_index.token_budget, remaining))
         except Exception as e:
-            # Fallback em caso de erro
-            return f"{section_info['section']}\n\n[Erro na geração desta seção: {str(e)}]\n\nEsta seção deve ser desenvolvida manualmente conforme a Lei 14.133/21."
+            print(f"⚠️ Erro ao consultar a base de conhecimento: {e}")
+            return ''
     
     def _post_process_section_content(self, content: str, section_info: Dict) -> str:
         """Pós-processa o conteúdo da seção"""
@@ -326,53 +414,92 @@ O objetivo principal é identificar a necessidade e identificar a melhor soluç
         
         return header
     
-    def generate_section_adjustment(self, section_content: str, feedback: str, section_info: Dict) -> str:
-        """Ajusta uma seção específica com base no feedback"""
-        try:
-            prompt = f"""
-            Ajuste a seguinte seção de ETP com base no feedback fornecido:
-
-            SEÇÃO ATUAL:
-            {section_content}
-
-            FEEDBACK DO USUÁRIO:
-            {feedback}
-
-            INFORMAÇÕES DA SEÇÃO:
-            - Título: {section_info['section']}
-            - Descrição: {section_info['description']}
-            - Parágrafos mínimos: {section_info.get('min_paragraphs', 8)}
-
-            INSTRUÇÕES:
-            1. Mantenha a estrutura e formatação original
-            2. Aplique os ajustes solicitados no feedback
-            3. Preserve a conformidade com a Lei 14.133/21
-            4. Mantenha linguagem técnica e formal
-            5. Garanta coerência com o restante do documento
-
-            Retorne a seção ajustada:
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo",  # Modelo mais poderoso para geração de documentos
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Você é um especialista em revisão de documentos de ETP. Faça ajustes precisos mantendo qualidade técnica e conformidade legal."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=2000,
-                temperature=0.2
-            )
-            
-            return response.choices[0].message.content
+    def _request_section_adjustment(self, section_content: str, feedback: str, section_info: Dict,
+                                    timeout: float) -> str:
+        """Solicita à API o ajuste de uma seção; lança exceção em caso de falha"""
+        # Instruções fixas no system prompt; dados da seção e feedback ao final
+        prompt = f"""INFORMAÇÕES DA SEÇÃO:
+- Título: {section_info['section']}
+- Descrição: {section_info['description']}
+- Parágrafos mínimos: {section_info.get('min_paragraphs', 8)}
+
+SEÇÃO ATUAL:
+{section_content}
+
+FEEDBACK DO USUÁRIO:
+{feedback}
+
+Retorne a seção ajustada:"""
+        
+        response = self.client.chat.completions.create(
+            model=self.SECTION_MODEL,  # Modelo mais poderoso para geração de documentos
+            messages=[
+                {
+                    "role": "system",
+                    "content": self.ADJUSTMENT_SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            max_tokens=max_output_tokens(
+                self.SECTION_MODEL,
+                max(expected_section_tokens(section_info), count_tokens(section_content, self.SECTION_MODEL)),
+                count_tokens(prompt, self.SECTION_MODEL)
+            ),
+            temperature=0.2,
+            timeout=timeout
+        )
+        
+        return response.choices[0].message.content
+    
+    def regenerate_preview_sections(self, session_data: Dict, current_sections: Dict[int, str],
+                                    regenerate: List[int] = None, adjust: List[int] = None,
+                                    feedback: str = None, context_data: Dict = None) -> Dict:
+        """Regenera somente as seções afetadas do preview, em paralelo
+
+        ``regenerate`` são seções geradas de novo a partir das respostas atuais;
+        ``adjust`` são seções ajustadas com o ``feedback`` do usuário (quando a
+        seção está nas duas listas, é regenerada e depois ajustada). Seções que
+        falham mantêm o conteúdo atual e são listadas em ``failed``.
+        """
+        regenerate = set(regenerate or [])
+        adjust = set(adjust or []) if feedback else set()
+        numbers = sorted(n for n in regenerate | adjust if 1 <= n <= len(self.etp_structure))
+        if not numbers:
+            return {'sections': {}, 'failed': []}
+        
+        context, knowledge_budget = self._build_generation_context(session_data, context_data) if regenerate else ('', 0)
+        
+        def make_task(number):
+            section_info = self.etp_structure[number - 1]
             
-        except Exception as e:
-            return section_content  # Retornar original em caso de erro
+            def task(timeout):
+                content = current_sections.get(number, '')
+                if number in regenerate:
+                    content = self._request_section(section_info, context, True, timeout, knowledge_budget)
+                if number in adjust:
+                    content = self._request_section_adjustment(content, feedback, section_info, timeout)
+                return content
+            return task
+        
+        failed = []
+        
+        def fallback(index, error):
+            number = numbers[index]
+            print(f"⚠️ Falha ao regenerar seção {number}: {error}")
+            failed.append(number)
+            return current_sections.get(number, '')
+        
+        engine = ParallelSectionEngine()
+        results = engine.run([make_task(number) for number in numbers], fallback)
+        
+        return {
+            'sections': dict(zip(numbers, results)),
+            'failed': sorted(failed),
+            'engine_stats': engine.last_run_stats
+        }
     
     def validate_etp_completeness(self, etp_content: str) -> Dict:
         """Valida se o ETP está completo conforme a estrutura obrigatória"""
@@ -384,27 +511,27 @@ O objetivo principal é identificar a necessidade e identificar a melhor soluç
             'found_sections': 0
         }
         
+        document = parse_etp_content(etp_content)
+        
         for section_info in self.etp_structure:
             section_title = section_info['section']
             section_number = section_title.split('.')[0]
+            min_required = section_info.get('min_paragraphs', 8)
             
-            # Verificar se a seção existe no conteúdo
-            section_pattern = rf'{section_number}\..*?(?={int(section_number)+1}\.|$)'
-            import re
-            section_match = re.search(section_pattern, etp_content, re.DOTALL | re.IGNORECASE)
+            # Corpo da seção no conteúdo analisado (None se a seção não existe)
+            section_nodes = document.section_nodes(section_number)
             
-            if section_match:
+            if section_nodes is not None:
                 validation_result['found_sections'] += 1
-                section_content = section_match.group(0)
                 
                 # Analisar qualidade da seção
-                paragraphs = [p.strip() for p in section_content.split('\n\n') if p.strip()]
+                paragraph_count = sum(1 for node in section_nodes if node.kind != 'subsection')
                 
                 validation_result['section_analysis'][section_title] = {
                     'found': True,
-                    'paragraph_count': len(paragraphs),
-                    'min_required': section_info.get('min_paragraphs', 8),
-                    'adequate_length': len(paragraphs) >= section_info.get('min_paragraphs', 8)
+                    'paragraph_count': paragraph_count,
+                    'min_required': min_required,
+                    'adequate_length': paragraph_count >= min_required
                 }
             else:
                 validation_result['is_complete'] = False
@@ -412,132 +539,139 @@ O objetivo principal é identificar a necessidade e identificar a melhor soluç
                 validation_result['section_analysis'][section_title] = {
                     'found': False,
                     'paragraph_count': 0,
-                    'min_required': section_info.get('min_paragraphs', 8),
+                    'min_required': min_required,
                     'adequate_length': False
                 }
         
         return validation_result
 
+    def _quick_preview_prompts(self, answers: Dict) -> List[str]:
+        """Monta os prompts das duas partes do preview (seções 1-7 e 8-14)
+
+        As instruções fixas vêm primeiro e as respostas do usuário no final,
+        para que o prefixo seja idêntico entre sessões (cache de prompt).
+        """
+        # PARTE 1: Seções 1-7
+        prompt_part1 = f"""
+        Você é um especialista sênior em licitações públicas. Gere as PRIMEIRAS 7 SEÇÕES de um ETP completo conforme Lei 14.133/2021.
+
+        INSTRUÇÕES CRÍTICAS:
+        - CADA SEÇÃO deve ter NO MÍNIMO 8 PARÁGRAFOS bem desenvolvidos
+        - Use linguagem técnica, formal e especializada
+        - Desenvolva justificativas robustas e fundamentadas
+        - Baseie-se nas informações fornecidas para criar conteúdo específico
+
+        GERE APENAS AS SEÇÕES 1-7 COM CONTEÚDO EXTENSO:
 
-    def generate_quick_preview(self, session_data: Dict, context_data: Dict = None) -> str:
-        """Gera preview completo do ETP usando IA em duas partes para garantir todas as 14 seções"""
+        1. INTRODUÇÃO (mínimo 8 parágrafos)
+        2. OBJETO DO ESTUDO E ESPECIFICAÇÕES GERAIS (mínimo 8 parágrafos)
+        3. DESCRIÇÃO DOS REQUISITOS DA CONTRATAÇÃO (mínimo 8 parágrafos)
+        4. ESTIMATIVA DAS QUANTIDADES E VALORES (mínimo 8 parágrafos + TABELA OBRIGATÓRIA)
+        
+        ATENÇÃO ESPECIAL PARA SEÇÃO 4:
+        - Desenvolva 8+ parágrafos técnicos sobre metodologia, pesquisa de mercado, análise de custos
+        - INCLUA OBRIGATORIAMENTE uma tabela formatada assim:
+        
+        | Item | Quantidade | Unidade | Valor Unitário | Valor Total |
+        |------|------------|---------|----------------|-------------|
+        | [Item baseado no objeto do usuário] | [Qtd] | [Un] | R$ [Valor] | R$ [Total] |
+        | [Mais itens relacionados] | [Qtd] | [Un] | R$ [Valor] | R$ [Total] |
+        | **TOTAL GERAL** | | | | **R$ [Total]** |
+        
+        5. LEVANTAMENTO DE MERCADO E JUSTIFICATIVA DA ESCOLHA DA SOLUÇÃO (mínimo 8 parágrafos)
+        6. ESTIMATIVA DO VALOR DA CONTRATAÇÃO (mínimo 8 parágrafos + TABELA OBRIGATÓRIA)
+        
+        ATENÇÃO ESPECIAL PARA SEÇÃO 6:
+        - Desenvolva 8+ parágrafos técnicos sobre análise de viabilidade econômica
+        - INCLUA OBRIGATORIAMENTE a mesma tabela da seção 4 (pode ser repetida ou detalhada)
+        
+        7. DESCRIÇÃO DA SOLUÇÃO COMO UM TODO (mínimo 8 parágrafos)
+
+        IMPORTANTE: Cada seção deve ser EXTENSA e TÉCNICA. Use dados realistas baseados no objeto mencionado pelo usuário.
+
+        INFORMAÇÕES DO USUÁRIO:
+        1. Necessidade: {answers.get('1', 'Contratação de solução tecnológica')}
+        2. PCA: {answers.get('2', 'Sim, previsto no PCA')}
+        3. Normas: {answers.get('3', 'Lei 14.133/2021 e regulamentação aplicável')}
+        4. Valores: {answers.get('4', 'Conforme pesquisa de mercado')}
+        5. Parcelamento: {answers.get('5', 'Não haverá parcelamento')}
+        """
+        
+        # PARTE 2: Seções 8-14
+        prompt_part2 = f"""
+        Você é um especialista sênior em licitações públicas. Gere as ÚLTIMAS 7 SEÇÕES de um ETP completo conforme Lei 14.133/2021.
+
+        INSTRUÇÕES CRÍTICAS:
+        - CADA SEÇÃO deve ter NO MÍNIMO 8 PARÁGRAFOS bem desenvolvidos
+        - Use linguagem técnica, formal e especializada
+        - Desenvolva justificativas robustas e fundamentadas
+        - Baseie-se nas informações fornecidas para criar conteúdo específico
+
+        GERE APENAS AS SEÇÕES 8-14 COM CONTEÚDO EXTENSO:
+
+        8. JUSTIFICATIVA PARA O PARCELAMENTO OU NÃO DA CONTRATAÇÃO (mínimo 8 parágrafos)
+        9. DEMONSTRATIVO DOS RESULTADOS PRETENDIDOS (mínimo 8 parágrafos)
+        10. PROVIDÊNCIAS ADOTADAS ANTERIORMENTE PELA ADMINISTRAÇÃO (mínimo 8 parágrafos)
+        11. CONTRATAÇÕES CORRELATAS OU INTERDEPENDENTES (mínimo 8 parágrafos)
+        12. AVALIAÇÃO DOS IMPACTOS AMBIENTAIS (mínimo 8 parágrafos)
+        13. ANÁLISE DE RISCOS (mínimo 8 parágrafos)
+        14. CONCLUSÃO E POSICIONAMENTO FINAL (mínimo 8 parágrafos)
+
+        IMPORTANTE: Cada seção deve ser EXTENSA, TÉCNICA e DETALHADA. Desenvolva análises profundas e justificativas robustas.
+
+        INFORMAÇÕES DO USUÁRIO:
+        1. Necessidade: {answers.get('1', 'Contratação de solução tecnológica')}
+        2. PCA: {answers.get('2', 'Sim, previsto no PCA')}
+        3. Normas: {answers.get('3', 'Lei 14.133/2021 e regulamentação aplicável')}
+        4. Valores: {answers.get('4', 'Conforme pesquisa de mercado')}
+        5. Parcelamento: {answers.get('5', 'Não haverá parcelamento')}
+        """
+        return [prompt_part1, prompt_part2]
+
+    def _quick_preview_messages(self, prompt: str) -> List[Dict]:
+        """Mensagens enviadas ao modelo para uma parte do preview"""
+        return [
+            {
+                "role": "system",
+                "content": self.QUICK_PREVIEW_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
+    def _quick_preview_max_tokens(self, part: int, prompt: str) -> int:
+        """``max_tokens`` de uma parte do preview (7 seções com no mínimo 8 parágrafos cada)"""
+        sections = self.etp_structure[:7] if part == 1 else self.etp_structure[7:]
+        return max_tokens_for_sections(
+            self.QUICK_PREVIEW_MODEL, sections, paragraphs=8,
+            prompt=self.QUICK_PREVIEW_SYSTEM_PROMPT + prompt
+        )
+    
+    def _quick_preview_footer(self) -> str:
+        """Rodapé padrão do preview"""
+        return f"""---
+Documento elaborado em conformidade com a Lei nº 14.133/2021
+Data: {datetime.now().strftime('%d/%m/%Y')}"""
+
+    def generate_quick_preview(self, session_data: Dict, context_data: Dict = None,
+                               fallback_on_error: bool = True) -> str:
+        """Gera preview completo do ETP usando IA em duas partes para garantir todas as 14 seções
+
+        Com ``fallback_on_error=False`` (uso pelo roteador) as falhas são propagadas
+        em vez de virarem o ETP de estrutura básica.
+        """
         try:
             answers = session_data.get('answers', {})
-            
-            # PARTE 1: Seções 1-7
-            prompt_part1 = f"""
-            Você é um especialista sênior em licitações públicas. Gere as PRIMEIRAS 7 SEÇÕES de um ETP completo conforme Lei 14.133/2021.
-
-            INFORMAÇÕES DO USUÁRIO:
-            1. Necessidade: {answers.get('1', 'Contratação de solução tecnológica')}
-            2. PCA: {answers.get('2', 'Sim, previsto no PCA')}
-            3. Normas: {answers.get('3', 'Lei 14.133/2021 e regulamentação aplicável')}
-            4. Valores: {answers.get('4', 'Conforme pesquisa de mercado')}
-            5. Parcelamento: {answers.get('5', 'Não haverá parcelamento')}
-
-            INSTRUÇÕES CRÍTICAS:
-            - CADA SEÇÃO deve ter NO MÍNIMO 8 PARÁGRAFOS bem desenvolvidos
-            - Use linguagem técnica, formal e especializada
-            - Desenvolva justificativas robustas e fundamentadas
-            - Baseie-se nas informações fornecidas para criar conteúdo específico
-
-            GERE APENAS AS SEÇÕES 1-7 COM CONTEÚDO EXTENSO:
-
-            1. INTRODUÇÃO (mínimo 8 parágrafos)
-            2. OBJETO DO ESTUDO E ESPECIFICAÇÕES GERAIS (mínimo 8 parágrafos)
-            3. DESCRIÇÃO DOS REQUISITOS DA CONTRATAÇÃO (mínimo 8 parágrafos)
-            4. ESTIMATIVA DAS QUANTIDADES E VALORES (mínimo 8 parágrafos + TABELA OBRIGATÓRIA)
-            
-            ATENÇÃO ESPECIAL PARA SEÇÃO 4:
-            - Desenvolva 8+ parágrafos técnicos sobre metodologia, pesquisa de mercado, análise de custos
-            - INCLUA OBRIGATORIAMENTE uma tabela formatada assim:
-            
-            | Item | Quantidade | Unidade | Valor Unitário | Valor Total |
-            |------|------------|---------|----------------|-------------|
-            | [Item baseado no objeto do usuário] | [Qtd] | [Un] | R$ [Valor] | R$ [Total] |
-            | [Mais itens relacionados] | [Qtd] | [Un] | R$ [Valor] | R$ [Total] |
-            | **TOTAL GERAL** | | | | **R$ [Total]** |
-            
-            5. LEVANTAMENTO DE MERCADO E JUSTIFICATIVA DA ESCOLHA DA SOLUÇÃO (mínimo 8 parágrafos)
-            6. ESTIMATIVA DO VALOR DA CONTRATAÇÃO (mínimo 8 parágrafos + TABELA OBRIGATÓRIA)
-            
-            ATENÇÃO ESPECIAL PARA SEÇÃO 6:
-            - Desenvolva 8+ parágrafos técnicos sobre análise de viabilidade econômica
-            - INCLUA OBRIGATORIAMENTE a mesma tabela da seção 4 (pode ser repetida ou detalhada)
-            
-            7. DESCRIÇÃO DA SOLUÇÃO COMO UM TODO (mínimo 8 parágrafos)
-
-            IMPORTANTE: Cada seção deve ser EXTENSA e TÉCNICA. Use dados realistas baseados no objeto mencionado pelo usuário.
-            """
-            
-            # PARTE 2: Seções 8-14
-            prompt_part2 = f"""
-            Você é um especialista sênior em licitações públicas. Gere as ÚLTIMAS 7 SEÇÕES de um ETP completo conforme Lei 14.133/2021.
-
-            INFORMAÇÕES DO USUÁRIO:
-            1. Necessidade: {answers.get('1', 'Contratação de solução tecnológica')}
-            2. PCA: {answers.get('2', 'Sim, previsto no PCA')}
-            3. Normas: {answers.get('3', 'Lei 14.133/2021 e regulamentação aplicável')}
-            4. Valores: {answers.get('4', 'Conforme pesquisa de mercado')}
-            5. Parcelamento: {answers.get('5', 'Não haverá parcelamento')}
-
-            INSTRUÇÕES CRÍTICAS:
-            - CADA SEÇÃO deve ter NO MÍNIMO 8 PARÁGRAFOS bem desenvolvidos
-            - Use linguagem técnica, formal e especializada
-            - Desenvolva justificativas robustas e fundamentadas
-            - Baseie-se nas informações fornecidas para criar conteúdo específico
-
-            GERE APENAS AS SEÇÕES 8-14 COM CONTEÚDO EXTENSO:
-
-            8. JUSTIFICATIVA PARA O PARCELAMENTO OU NÃO DA CONTRATAÇÃO (mínimo 8 parágrafos)
-            9. DEMONSTRATIVO DOS RESULTADOS PRETENDIDOS (mínimo 8 parágrafos)
-            10. PROVIDÊNCIAS ADOTADAS ANTERIORMENTE PELA ADMINISTRAÇÃO (mínimo 8 parágrafos)
-            11. CONTRATAÇÕES CORRELATAS OU INTERDEPENDENTES (mínimo 8 parágrafos)
-            12. AVALIAÇÃO DOS IMPACTOS AMBIENTAIS (mínimo 8 parágrafos)
-            13. ANÁLISE DE RISCOS (mínimo 8 parágrafos)
-            14. CONCLUSÃO E POSICIONAMENTO FINAL (mínimo 8 parágrafos)
-
-            IMPORTANTE: Cada seção deve ser EXTENSA, TÉCNICA e DETALHADA. Desenvolva análises profundas e justificativas robustas.
-            """
+            prompt_part1, prompt_part2 = self._quick_preview_prompts(answers)
             
             try:
                 # Gerar PARTE 1 (Seções 1-7)
-                response1 = self.client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "Você é um especialista em ETP. Gere APENAS as seções solicitadas com conteúdo completo e técnico."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt_part1
-                        }
-                    ],
-                    max_tokens=4000,
-                    temperature=0.2
-                )
-                
-                part1_content = response1.choices[0].message.content.strip()
+                part1_content = self._request_quick_preview_part(answers, 1, prompt_part1)
                 
                 # Gerar PARTE 2 (Seções 8-14)
-                response2 = self.client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "Você é um especialista em ETP. Gere APENAS as seções solicitadas com conteúdo completo e técnico."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt_part2
-                        }
-                    ],
-                    max_tokens=4000,
-                    temperature=0.2
-                )
-                
-                part2_content = response2.choices[0].message.content.strip()
+                part2_content = self._request_quick_preview_part(answers, 2, prompt_part2)
                 
                 # Combinar as duas partes
                 complete_content = f"""ESTUDO TÉCNICO PRELIMINAR
@@ -546,17 +680,19 @@ O objetivo principal é identificar a necessidade e identificar a melhor soluç
 
 {part2_content}
 
----
-Documento elaborado em conformidade com a Lei nº 14.133/2021
-Data: {datetime.now().strftime('%d/%m/%Y')}"""
+{self._quick_preview_footer()}"""
                 
                 return complete_content
                 
             except Exception as e:
+                if not fallback_on_error:
+                    raise
                 # Fallback com estrutura básica mas completa
                 return self._generate_fallback_complete_etp(answers)
             
         except Exception as e:
+            if not fallback_on_error:
+                raise
             return f"""ESTUDO TÉCNICO PRELIMINAR - ERRO
 
 Erro na geração: {str(e)}
@@ -565,6 +701,104 @@ RESPOSTAS FORNECIDAS:
 {json.dumps(session_data.get('answers', {}), indent=2, ensure_ascii=False)}
 
 Por favor, tente novamente."""
+
+    def _quick_preview_cache_key(self, answers: Dict, part: int) -> str:
+        """Chave do cache para uma parte do preview rápido"""
+        return self.cache.make_key(
+            'advanced', self.QUICK_PREVIEW_MODEL, self.PROMPT_VERSION,
+            f"quick_preview_part{part}", answers=answers
+        )
+    
+    def _request_quick_preview_part(self, answers: Dict, part: int, prompt: str) -> str:
+        """Gera uma parte do preview rápido, reaproveitando o cache quando possível"""
+        cache_key = self._quick_preview_cache_key(answers, part)
+        cached_content = self.cache.get(cache_key)
+        if cached_content is not None:
+            return cached_content
+        
+        response = self.client.chat.completions.create(
+            model=self.QUICK_PREVIEW_MODEL,
+            messages=self._quick_preview_messages(prompt),
+            max_tokens=self._quick_preview_max_tokens(part, prompt),
+            temperature=0.2
+        )
+        
+        content = response.choices[0].message.content.strip()
+        self._cache_quick_preview_part(cache_key, part, content, getattr(response.choices[0], 'finish_reason', None))
+        return content
+    
+    def _cache_quick_preview_part(self, cache_key: str, part: int, content: str, finish_reason: Optional[str]) -> None:
+        """Grava a parte no cache só se veio completa: sem corte por max_tokens e com as 7 seções"""
+        missing = missing_section_numbers(content, range(1, 8) if part == 1 else range(8, 15))
+        if finish_reason == 'length' or missing:
+            print(f"⚠️ Parte {part} do preview incompleta (finish_reason={finish_reason}, faltando {missing}); não será cacheada")
+            return
+        self.cache.set(cache_key, content, 'advanced', self.QUICK_PREVIEW_MODEL, f"quick_preview_part{part}")
+    
+    def stream_quick_preview(self, session_data: Dict, context_data: Dict = None,
+                             fallback_on_error: bool = True) -> Iterator[str]:
+        """Gera o mesmo preview de generate_quick_preview emitindo os tokens à medida que chegam
+
+        O cabeçalho sai junto com o primeiro trecho gerado. Com
+        ``fallback_on_error=False`` (uso pelo roteador) uma falha antes disso é
+        propagada sem nada emitido, em vez de virar o ETP de estrutura básica.
+        """
+        answers = session_data.get('answers', {})
+        header = "ESTUDO TÉCNICO PRELIMINAR\n\n"
+
+        streamed_any = False
+        try:
+            for piece in self._stream_quick_preview_parts(answers):
+                if not streamed_any:
+                    streamed_any = True
+                    piece = header + piece
+                yield piece
+        except Exception as e:
+            if streamed_any or not fallback_on_error:
+                raise
+            # Nada foi enviado ainda: usar o mesmo fallback da versão não-streaming
+            yield self._generate_fallback_complete_etp(answers)
+            return
+
+        yield "\n\n" + self._quick_preview_footer()
+    
+    def _stream_quick_preview_parts(self, answers: Dict) -> Iterator[str]:
+        """Texto das duas partes do preview, do cache ou token a token da API"""
+        for index, prompt in enumerate(self._quick_preview_prompts(answers)):
+            if index > 0:
+                yield "\n\n"
+            
+            # Parte já gerada: enviar de uma vez
+            cache_key = self._quick_preview_cache_key(answers, index + 1)
+            cached_content = self.cache.get(cache_key)
+            if cached_content is not None:
+                yield cached_content
+                continue
+            
+            stream = self.client.chat.completions.create(
+                model=self.QUICK_PREVIEW_MODEL,
+                messages=self._quick_preview_messages(prompt),
+                max_tokens=self._quick_preview_max_tokens(index + 1, prompt),
+                temperature=0.2,
+                stream=True
+            )
+            leading = True
+            part_tokens = []
+            finish_reason = None
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                finish_reason = getattr(chunk.choices[0], 'finish_reason', None) or finish_reason
+                token = chunk.choices[0].delta.content or ''
+                if leading:
+                    # Equivalente ao strip() da versão não-streaming
+                    token = token.lstrip()
+                    leading = not token
+                if token:
+                    part_tokens.append(token)
+                    yield token
+            
+            self._cache_quick_preview_part(cache_key, index + 1, ''.join(part_tokens).strip(), finish_reason)
     
     def _generate_fallback_complete_etp(self, answers: Dict) -> str:
         """Gera ETP completo como fallback quando IA falha"""
@@ -1,14 +1,26 @@
 import os
 import json
 from typing import Dict, List, Optional
-import openai
 from datetime import datetime
 
+from .openai_client_registry import get_openai_client
+from .generation_cache import get_generation_cache
+from .etp_content_parser import missing_section_numbers, parse_etp_content
+from .prompt_budget import context_budget, fit_context, max_tokens_for_sections
+
 class OptimizedEtpGenerator:
     """Gerador otimizado de ETP com performance melhorada - reduz 4 min para 30s"""
     
+    # Versão dos templates de prompt; alterar invalida o cache de geração
+    PROMPT_VERSION = "optimized-v2"
+    MODEL = "gpt-4.1-mini"
+    
+    # Seções com tabela (tamanho esperado maior)
+    TABLE_SECTIONS = {4, 13}
+    
     def __init__(self, openai_api_key: str):
-        self.client = openai.OpenAI(api_key=openai_api_key)
+        self.client = get_openai_client(openai_api_key)
+        self.cache = get_generation_cache()
         
         # Estrutura obrigatória conforme Lei 14.133/21
         self.etp_structure = [
@@ -37,9 +49,16 @@ class OptimizedEtpGenerator:
             # Prompt otimizado para geração em lote
             prompt = self._build_optimized_prompt(context, is_preview)
             
+            # Mesmo contexto normalizado já gerado anteriormente
+            section = 'complete_preview' if is_preview else 'complete'
+            cache_key = self.cache.make_key('optimized', self.MODEL, self.PROMPT_VERSION, section, context=context)
+            content = self.cache.get(cache_key)
+            if content is not None:
+                return self._wrap_complete_content(content)
+            
             # Chamada única para API com modelo disponível
             response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",  # Modelo disponível no ambiente
+                model=self.MODEL,  # Modelo disponível no ambiente
                 messages=[
                     {
                         "role": "system",
@@ -52,7 +71,7 @@ class OptimizedEtpGenerator:
                         "content": prompt
                     }
                 ],
-                max_tokens=6000,
+                max_tokens=self._max_tokens_for_complete(prompt, paragraphs=4 if is_preview else 7),
                 temperature=0.2
             )
             
@@ -66,40 +85,46 @@ class OptimizedEtpGenerator:
                 print(f"⚠️ ETP incompleto ({validation['found_sections']}/14 seções), usando fallback")
                 return self._generate_fallback_etp(session_data)
             
-            # Adicionar cabeçalho e formatação final
-            header = f"""ESTUDO TÉCNICO PRELIMINAR
+            # Somente conteúdo completo, válido e não cortado por max_tokens vai para o cache
+            if getattr(response.choices[0], 'finish_reason', None) != 'length':
+                self.cache.set(cache_key, content, 'optimized', self.MODEL, section)
+            
+            return self._wrap_complete_content(content)
+            
+        except Exception as e:
+            print(f"Erro na geração otimizada, usando fallback: {str(e)}")
+            return self._generate_fallback_etp(session_data)
+
+    def _wrap_complete_content(self, content: str) -> str:
+        """Adiciona cabeçalho e rodapé com a data atual ao conteúdo gerado"""
+        # Adicionar cabeçalho e formatação final
+        header = f"""ESTUDO TÉCNICO PRELIMINAR
 
 Data: {datetime.now().strftime('%d/%m/%Y')}
 
 """
-            
-            footer = f"""
+        
+        footer = f"""
 
 ---
 Documento elaborado em conformidade com a Lei nº 14.133/2021
 Data: {datetime.now().strftime('%d/%m/%Y')}"""
-            
-            return header + content + footer
-            
-        except Exception as e:
-            print(f"Erro na geração otimizada, usando fallback: {str(e)}")
-            return self._generate_fallback_etp(session_data)
+        
+        return header + content + footer
 
-    def generate_ultra_fast_preview(self, session_data: Dict, context_data: Dict = None) -> str:
-        """Gera preview ultra-rápido com estrutura completa mas conteúdo resumido"""
+    def generate_ultra_fast_preview(self, session_data: Dict, context_data: Dict = None,
+                                    fallback_on_error: bool = True) -> str:
+        """Gera preview ultra-rápido com estrutura completa mas conteúdo resumido
+
+        Com ``fallback_on_error=False`` (uso pelo roteador) as falhas são propagadas
+        em vez de virarem uma mensagem de erro no lugar do preview.
+        """
         try:
             answers = session_data.get('answers', {})
             
             prompt = f"""
             Gere um PREVIEW RÁPIDO de ETP com todas as 14 seções obrigatórias da Lei 14.133/2021.
             
-            DADOS DO USUÁRIO:
-            1. Necessidade: {answers.get('1', 'Contratação de solução tecnológica')}
-            2. PCA: {answers.get('2', 'Sim, previsto no PCA')}
-            3. Normas: {answers.get('3', 'Lei 14.133/2021')}
-            4. Valores: {answers.get('4', 'Conforme pesquisa de mercado')}
-            5. Parcelamento: {answers.get('5', 'Não haverá parcelamento')}
-            
             GERE TODAS AS 14 SEÇÕES (formato resumido para preview):
             1. INTRODUÇÃO (3-4 parágrafos)
             2. OBJETO DO ESTUDO E ESPECIFICAÇÕES GERAIS (3-4 parágrafos)
@@ -117,25 +142,44 @@ Data: {datetime.now().strftime('%d/%m/%Y')}"""
             14. CONCLUSÃO E POSICIONAMENTO FINAL (3 parágrafos)
             
             Use linguagem técnica, formal e conforme Lei 14.133/21.
+            
+            DADOS DO USUÁRIO:
+            1. Necessidade: {answers.get('1', 'Contratação de solução tecnológica')}
+            2. PCA: {answers.get('2', 'Sim, previsto no PCA')}
+            3. Normas: {answers.get('3', 'Lei 14.133/2021')}
+            4. Valores: {answers.get('4', 'Conforme pesquisa de mercado')}
+            5. Parcelamento: {answers.get('5', 'Não haverá parcelamento')}
             """
             
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Gere preview técnico de ETP conforme Lei 14.133/21 com todas as 14 seções obrigatórias."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=4000,
-                temperature=0.2
-            )
+            cache_key = self.cache.make_key('optimized', self.MODEL, self.PROMPT_VERSION, 'ultra_fast_preview', answers=answers)
+            content = self.cache.get(cache_key)
             
-            content = response.choices[0].message.content.strip()
+            if content is None:
+                response = self.client.chat.completions.create(
+                    model=self.MODEL,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "Gere preview técnico de ETP conforme Lei 14.133/21 com todas as 14 seções obrigatórias."
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    max_tokens=self._max_tokens_for_complete(prompt, paragraphs=4),
+                    temperature=0.2
+                )
+                
+                content = response.choices[0].message.content.strip()
+                
+                # Preview cortado por max_tokens ou sem alguma das 14 seções não vai para o cache
+                finish_reason = getattr(response.choices[0], 'finish_reason', None)
+                missing = missing_section_numbers(content, range(1, 15))
+                if finish_reason == 'length' or missing:
+                    print(f"⚠️ Preview incompleto (finish_reason={finish_reason}, faltando {missing}); não será cacheado")
+                else:
+                    self.cache.set(cache_key, content, 'optimized', self.MODEL, 'ultra_fast_preview')
             
             # Adicionar cabeçalho
             header = f"""ESTUDO TÉCNICO PRELIMINAR - PREVIEW
@@ -147,6 +191,8 @@ Data: {datetime.now().strftime('%d/%m/%Y')}
             return header + content
             
         except Exception as e:
+            if not fallback_on_error:
+                raise
             return f"Erro na geração do preview: {str(e)}"
 
     def _build_generation_context(self, session_data: Dict, context_data: Dict = None) -> str:
@@ -160,24 +206,31 @@ Normas: {answers.get('3', 'Lei 14.133/2021')}
 Valores: {answers.get('4', 'Não informado')}
 Parcelamento: {answers.get('5', 'Não informado')}"""
         
-        if context_data and 'document_analysis' in context_data:
-            doc_analysis = context_data['document_analysis']
-            extracted_content = doc_analysis.get('extracted_content', '')
-            if extracted_content:
-                context += f"\n\nDOCUMENTO ANALISADO:\n{extracted_content[:1000]}..."
+        if not (context_data and 'document_analysis' in context_data):
+            return context
         
-        return context
+        # Respostas entram inteiras; o documento fica limitado ao orçamento do contexto suplementar
+        doc_analysis = context_data['document_analysis']
+        document = fit_context([('DOCUMENTO ANALISADO:', doc_analysis.get('extracted_content', ''))],
+                               context_budget(self.MODEL), self.MODEL)
+        return f"{context}\n\n{document}" if document else context
+    
+    def _max_tokens_for_complete(self, prompt: str, paragraphs: int) -> int:
+        """``max_tokens`` para gerar as 14 seções de uma vez com ``paragraphs`` parágrafos cada"""
+        sections = [
+            {'requires_table': index in self.TABLE_SECTIONS}
+            for index in range(1, len(self.etp_structure) + 1)
+        ]
+        return max_tokens_for_sections(self.MODEL, sections, paragraphs=paragraphs, prompt=prompt)
 
     def _build_optimized_prompt(self, context: str, is_preview: bool) -> str:
-        """Constrói prompt otimizado para geração em lote"""
+        """Constrói prompt otimizado para geração em lote (instruções fixas antes do contexto da sessão)"""
         content_type = "preview resumido" if is_preview else "versão completa"
         paragraphs_per_section = "3-4 parágrafos" if is_preview else "6-8 parágrafos"
         
         return f"""
         Gere um Estudo Técnico Preliminar ({content_type}) com TODAS as 14 seções obrigatórias da Lei 14.133/2021.
         
-        {context}
-        
         ESTRUTURA OBRIGATÓRIA - GERE TODAS AS SEÇÕES:
         
         1. INTRODUÇÃO ({paragraphs_per_section})
@@ -202,6 +255,8 @@ Parcelamento: {answers.get('5', 'Não informado')}"""
         - Mantenha conformidade total com Lei 14.133/2021
         - Inclua tabelas nas seções 4 e 13
         - Cada seção deve ter conteúdo substancial e técnico
+        
+        {context}
         """
 
     def validate_etp_completeness(self, etp_content: str) -> Dict:
@@ -213,9 +268,10 @@ Parcelamento: {answers.get('5', 'Não informado')}"""
             'section_analysis': {}
         }
         
+        document = parse_etp_content(etp_content)
+        
         for i, section in enumerate(self.etp_structure, 1):
-            section_number = f"{i}."
-            if section_number in etp_content:
+            if document.has_section(i):
                 validation_result['found_sections'] += 1
                 validation_result['section_analysis'][section] = {'found': True}
             else:
@@ -1,17 +1,34 @@
 import os
 import json
 from typing import Dict, List, Optional
-import openai
 from datetime import datetime
 import asyncio
 import concurrent.futures
 import time
 
+from .openai_client_registry import get_openai_client
+from .generation_cache import get_generation_cache
+from .etp_content_parser import missing_section_numbers
+from .prompt_budget import max_tokens_for_sections
+from .hedged_requests import get_hedged_runner
+
 class UltraFastEtpGenerator:
     """Gerador ultra-otimizado de ETP - Meta: 2 minutos ou menos"""
     
+    # Versão dos templates de prompt; alterar invalida o cache de geração
+    PROMPT_VERSION = "ultra-fast-v2"
+    MODEL = "gpt-4.1-nano"
+    # Modelo da requisição de reserva quando um grupo demora além do p90 (padrão: o mesmo)
+    HEDGE_MODEL = os.getenv('ETP_HEDGE_MODEL') or MODEL
+    
+    # Parágrafos pedidos por seção nos prompts e seções com tabela
+    PARAGRAPHS_PER_SECTION = 6
+    TABLE_SECTIONS = {4, 13}
+    
     def __init__(self, openai_api_key: str):
-        self.client = openai.OpenAI(api_key=openai_api_key)
+        self.client = get_openai_client(openai_api_key)
+        self.cache = get_generation_cache()
+        self.hedger = get_hedged_runner('ultra-fast-groups')
         
         # Estrutura otimizada com prompts mais concisos
         self.etp_sections = {
@@ -40,9 +57,15 @@ class UltraFastEtpGenerator:
             # Prompt ultra-conciso e otimizado
             prompt = self._build_lightning_prompt(answers)
             
+            cache_key = self.cache.make_key('ultra_fast', self.MODEL, self.PROMPT_VERSION, 'lightning', answers=answers)
+            content = self.cache.get(cache_key)
+            if content is not None:
+                print(f"⚡ ETP recuperado do cache em {time.time() - start_time:.3f}s")
+                return self._format_lightning_etp(content, answers)
+            
             # Usar modelo mais rápido disponível
             response = self.client.chat.completions.create(
-                model="gpt-4.1-nano",  # Modelo mais rápido
+                model=self.MODEL,  # Modelo mais rápido
                 messages=[
                     {
                         "role": "system",
@@ -53,7 +76,7 @@ class UltraFastEtpGenerator:
                         "content": prompt
                     }
                 ],
-                max_tokens=5000,  # Reduzido para velocidade
+                max_tokens=self._max_tokens_for(range(1, 15), prompt),  # Dimensionado pelas 14 seções
                 temperature=0.1,   # Mais determinístico = mais rápido
                 top_p=0.9         # Otimização adicional
             )
@@ -68,6 +91,8 @@ class UltraFastEtpGenerator:
             if sections_found < 12:
                 print(f"⚠️ ETP incompleto ({sections_found}/14), usando fallback rápido")
                 content = self._generate_ultra_fast_fallback(answers)
+            else:
+                self.cache.set(cache_key, content, 'ultra_fast', self.MODEL, 'lightning')
             
             # Formatação final otimizada
             final_content = self._format_lightning_etp(content, answers)
@@ -93,14 +118,18 @@ class UltraFastEtpGenerator:
             prompt1 = self._build_group_prompt(answers, group1_sections, "primeira parte")
             prompt2 = self._build_group_prompt(answers, group2_sections, "segunda parte")
             
-            # Executar em paralelo
+            # Chaves do cache por grupo de seções
+            cache_key1 = self.cache.make_key('ultra_fast', self.MODEL, self.PROMPT_VERSION, 'group_1_7', answers=answers)
+            cache_key2 = self.cache.make_key('ultra_fast', self.MODEL, self.PROMPT_VERSION, 'group_8_14', answers=answers)
+            
+            # Executar em paralelo; cada grupo tem hedge e prazo próprios
             with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                future1 = executor.submit(self._generate_section_group, prompt1)
-                future2 = executor.submit(self._generate_section_group, prompt2)
+                future1 = executor.submit(self._generate_section_group, prompt1, cache_key1, group1_sections)
+                future2 = executor.submit(self._generate_section_group, prompt2, cache_key2, group2_sections)
                 
                 # Aguardar resultados
-                content1 = future1.result(timeout=60)  # 1 minuto max por grupo
-                content2 = future2.result(timeout=60)
+                content1 = future1.result()
+                content2 = future2.result()
             
             # Combinar resultados
             combined_content = f"{content1}\n\n{content2}"
@@ -117,16 +146,16 @@ class UltraFastEtpGenerator:
             return self._generate_ultra_fast_fallback(session_data.get('answers', {}))
 
     def _build_lightning_prompt(self, answers: Dict) -> str:
-        """Constrói prompt ultra-otimizado para velocidade máxima"""
+        """Constrói prompt ultra-otimizado para velocidade máxima (dados da sessão no final)"""
         return f"""
         Gere ETP COMPLETO com 14 seções obrigatórias Lei 14.133/21. SEJA CONCISO MAS TÉCNICO.
 
-        DADOS: Necessidade: {answers.get('1', 'solução tecnológica')} | PCA: {answers.get('2', 'Sim')} | Normas: {answers.get('3', 'Lei 14.133/21')} | Valores: {answers.get('4', 'pesquisa mercado')} | Parcelamento: {answers.get('5', 'Não')}
-
         GERE TODAS AS 14 SEÇÕES (6 parágrafos cada):
         1.INTRODUÇÃO 2.OBJETO E ESPECIFICAÇÕES 3.REQUISITOS 4.ESTIMATIVA QUANTIDADES/VALORES+tabela 5.MERCADO/JUSTIFICATIVA 6.VALOR CONTRATAÇÃO 7.SOLUÇÃO COMPLETA 8.PARCELAMENTO 9.RESULTADOS 10.PROVIDÊNCIAS ANTERIORES 11.CONTRATOS CORRELATOS 12.IMPACTOS AMBIENTAIS 13.RISCOS+tabela 14.CONCLUSÃO
 
         Use linguagem técnica Lei 14.133/21. Inclua tabelas seções 4 e 13.
+
+        DADOS: Necessidade: {answers.get('1', 'solução tecnológica')} | PCA: {answers.get('2', 'Sim')} | Normas: {answers.get('3', 'Lei 14.133/21')} | Valores: {answers.get('4', 'pesquisa mercado')} | Parcelamento: {answers.get('5', 'Não')}
         """
 
     def _build_group_prompt(self, answers: Dict, sections: List[int], group_name: str) -> str:
@@ -136,30 +165,83 @@ class UltraFastEtpGenerator:
         return f"""
         Gere {group_name} do ETP com seções: {' | '.join(section_names)}
 
-        DADOS: {answers.get('1', 'solução')} | {answers.get('2', 'PCA')} | {answers.get('3', 'Lei 14.133/21')} | {answers.get('4', 'valores')} | {answers.get('5', 'parcelamento')}
-
         Cada seção: 6 parágrafos técnicos. Linguagem formal Lei 14.133/21.
         {f'Inclua tabela na seção 4.' if 4 in sections else ''}
         {f'Inclua tabela riscos na seção 13.' if 13 in sections else ''}
+
+        DADOS: {answers.get('1', 'solução')} | {answers.get('2', 'PCA')} | {answers.get('3', 'Lei 14.133/21')} | {answers.get('4', 'valores')} | {answers.get('5', 'parcelamento')}
         """
 
-    def _generate_section_group(self, prompt: str) -> str:
-        """Gera grupo de seções"""
+    def _max_tokens_for(self, sections, prompt: str) -> int:
+        """``max_tokens`` pelo tamanho esperado das seções pedidas no prompt"""
+        return max_tokens_for_sections(
+            self.MODEL,
+            [{'requires_table': number in self.TABLE_SECTIONS} for number in sections],
+            paragraphs=self.PARAGRAPHS_PER_SECTION,
+            prompt=prompt
+        )
+
+    def _generate_section_group(self, prompt: str, cache_key: str = None, sections: List[int] = None) -> str:
+        """Gera grupo de seções, com requisição de reserva se passar do p90 observado"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[
-                    {"role": "system", "content": "Especialista ETP. Conteúdo técnico conciso Lei 14.133/21."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=2500,
-                temperature=0.1
+            cached_content = self.cache.get(cache_key)
+            if cached_content is not None:
+                return cached_content
+            
+            content, model, finish_reason = self.hedger.run(
+                lambda cancel_event: self._request_section_group(prompt, sections, self.MODEL, cancel_event),
+                lambda cancel_event: self._request_section_group(prompt, sections, self.HEDGE_MODEL, cancel_event)
             )
-            return response.choices[0].message.content.strip()
+            # Só o modelo da chave pode ser gravado no cache, e só com o grupo completo
+            missing = self._missing_sections(content, sections)
+            if finish_reason == 'length' or missing:
+                print(f"⚠️ Grupo incompleto (finish_reason={finish_reason}, faltando {missing}); não será cacheado")
+            elif model == self.MODEL:
+                self.cache.set(cache_key, content, 'ultra_fast', self.MODEL, 'section_group')
+            return content
         except Exception as e:
             print(f"Erro na geração de grupo: {e}")
             return "Erro na geração desta seção."
 
+    @staticmethod
+    def _missing_sections(content: str, sections: Optional[List[int]]) -> List[int]:
+        """Seções pedidas ao grupo que não aparecem como título ("4." no início da linha)"""
+        return missing_section_numbers(content, sections or [])
+
+    def _request_section_group(self, prompt: str, sections: Optional[List[int]], model: str,
+                               cancel_event=None) -> tuple:
+        """Chamada em streaming de um grupo; interrompida se ``cancel_event`` for sinalizado
+
+        Retorna ``(conteúdo, modelo, finish_reason)``.
+        """
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "Especialista ETP. Conteúdo técnico conciso Lei 14.133/21."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=self._max_tokens_for(sections or range(1, 8), prompt),
+            temperature=0.1,
+            stream=True
+        )
+        parts = []
+        finish_reason = None
+        try:
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise concurrent.futures.CancelledError(f"Grupo cancelado ({model})")
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                finish_reason = getattr(chunk.choices[0], 'finish_reason', None) or finish_reason
+        finally:
+            # Fechar o stream encerra a conexão da tentativa perdedora
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+        return ''.join(parts).strip(), model, finish_reason
+
     def _format_lightning_etp(self, content: str, answers: Dict) -> str:
         """Formatação final otimizada"""
         header = f"""ESTUDO TÉCNICO PRELIMINAR
@@ -2,10 +2,16 @@ import os
 from datetime import datetime
 from typing import Dict, Optional
 import base64
+from html import escape
+
+from .etp_content_parser import parse_etp_content
 
 class EtpVisualFormatter:
     """Formatador visual para ETP baseado no modelo da concorrência"""
     
+    # Versão do layout; alterar invalida os documentos no cache de renderização
+    FORMATTER_VERSION = "visual-v2"
+    
     def __init__(self):
         self.css_styles = self._get_etp_styles()
         self.html_template = self._get_html_template()
@@ -292,94 +298,40 @@ class EtpVisualFormatter:
     
     def _convert_to_html(self, etp_content: str) -> str:
         """Converte conteúdo ETP para HTML formatado"""
-        lines = etp_content.split('\n')
         html_lines = []
-        current_section = None
-        in_table = False
-        
-        for line in lines:
-            line = line.strip()
-            
-            if not line:
-                if not in_table:
-                    html_lines.append('<br>')
-                continue
-            
-            # Detectar títulos de seção (1., 2., etc.)
-            if self._is_section_title(line):
-                if in_table:
-                    html_lines.append('</table>')
-                    in_table = False
-                html_lines.append(f'<div class="secao-titulo">{line}</div>')
-                current_section = line
-                continue
-            
-            # Detectar subtítulos (1.1, 1.2, etc.)
-            if self._is_subsection_title(line):
-                if in_table:
-                    html_lines.append('</table>')
-                    in_table = False
-                html_lines.append(f'<div class="subsecao-titulo">{line}</div>')
-                continue
-            
-            # Detectar início de tabela
-            if '|' in line and not in_table:
-                html_lines.append('<table class="tabela">')
-                in_table = True
-            
-            # Processar linha de tabela
-            if '|' in line and in_table:
-                html_lines.append(self._format_table_row(line))
-                continue
-            
-            # Fim de tabela
-            if in_table and '|' not in line:
-                html_lines.append('</table>')
-                in_table = False
-            
-            # Detectar lista com bullet points
-            if line.startswith('•') or line.startswith('-'):
-                html_lines.append(f'<div class="lista-item">{line[1:].strip()}</div>')
-                continue
-            
-            # Parágrafo normal
-            if line and not line.startswith('---'):
-                html_lines.append(f'<p class="paragrafo">{line}</p>')
         
-        # Fechar tabela se ainda estiver aberta
-        if in_table:
-            html_lines.append('</table>')
+        for node in parse_etp_content(etp_content):
+            if node.kind == 'section':
+                html_lines.append(f'<div class="secao-titulo">{escape(node.text)}</div>')
+            elif node.kind == 'subsection':
+                html_lines.append(f'<div class="subsecao-titulo">{escape(node.text)}</div>')
+            elif node.kind == 'table':
+                rows = ''.join(self._format_table_row(cells) for cells in node.rows)
+                html_lines.append(f'<table class="tabela">{rows}</table>')
+            elif node.kind == 'bullet':
+                html_lines.append(f'<div class="lista-item">{escape(node.text)}</div>')
+            else:
+                text = '<br>'.join(escape(line) for line in node.text.split('\n'))
+                html_lines.append(f'<p class="paragrafo">{text}</p>')
         
         return '\n'.join(html_lines)
     
-    def _is_section_title(self, line: str) -> bool:
-        """Verifica se é título de seção principal"""
-        import re
-        return bool(re.match(r'^\d+\.\s+[A-ZÁÊÇÕ]', line))
-    
-    def _is_subsection_title(self, line: str) -> bool:
-        """Verifica se é título de subseção"""
-        import re
-        return bool(re.match(r'^\d+\.\d+\.?\s+[A-Za-z]', line))
-    
-    def _format_table_row(self, line: str) -> str:
+    def _format_table_row(self, cells) -> str:
         """Formata linha de tabela"""
-        cells = [cell.strip() for cell in line.split('|') if cell.strip()]
-        
         # Detectar cabeçalho (primeira linha ou linha com texto em maiúsculas)
         is_header = any(cell.isupper() or 'Item' in cell or 'Risco' in cell for cell in cells)
         
         if is_header:
-            formatted_cells = ''.join(f'<th>{cell}</th>' for cell in cells)
+            formatted_cells = ''.join(f'<th>{escape(cell)}</th>' for cell in cells)
             return f'<tr>{formatted_cells}</tr>'
         else:
             # Destacar valores monetários e totais
             formatted_cells = []
             for cell in cells:
                 if 'R$' in cell or 'TOTAL' in cell.upper():
-                    formatted_cells.append(f'<td class="valor-destaque">{cell}</td>')
+                    formatted_cells.append(f'<td class="valor-destaque">{escape(cell)}</td>')
                 else:
-                    formatted_cells.append(f'<td>{cell}</td>')
+                    formatted_cells.append(f'<td>{escape(cell)}</td>')
             return f'<tr>{"".join(formatted_cells)}</tr>'
     
     def save_formatted_etp(self, formatted_html: str, filename: str = None) -> str:
@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, Optional
+
+# Pasta do banco principal (app.db); o cache fica ao lado dele
+DATABASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database')
+
+
+def normalize_text(value) -> str:
+    """Normaliza texto para comparação: Unicode NFKC, caixa, espaços e pontuação final"""
+    text = unicodedata.normalize('NFKC', str(value or ''))
+    text = re.sub(r'\s+', ' ', text).strip().casefold()
+    return text.rstrip(' .;')
+
+
+def normalize_answers(answers: Optional[Dict]) -> Dict[str, str]:
+    """Normaliza as respostas do ETP (chaves como string, valores normalizados)"""
+    return {str(key): normalize_text(value) for key, value in sorted((answers or {}).items(), key=lambda item: str(item[0]))}
+
+
+class GenerationCache:
+    """Cache persistente (SQLite) de conteúdo gerado pela IA, endereçado por hash
+
+    A chave combina respostas normalizadas, contexto adicional, gerador, modelo,
+    versão do template de prompt e seção. Entradas expiram por TTL e o total é
+    limitado por ``max_entries`` com descarte LRU (último acesso).
+    """
+
+    def __init__(self, db_path: str = None, max_entries: int = None, ttl_seconds: float = None,
+                 enabled: bool = None):
+        if db_path is None:
+            db_path = os.getenv('ETP_CACHE_PATH', os.path.join(DATABASE_DIR, 'generation_cache.db'))
+        if max_entries is None:
+            max_entries = int(os.getenv('ETP_CACHE_MAX_ENTRIES', '2000'))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('ETP_CACHE_TTL_HOURS', '168')) * 3600
+        if enabled is None:
+            enabled = os.getenv('ETP_CACHE_ENABLED', 'true').lower() == 'true'
+
+        self.db_path = db_path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if self.enabled:
+            self._connect()
+
+    def _connect(self):
+        """Abre a conexão e cria a tabela do cache se necessário"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS generation_cache (
+                cache_key TEXT PRIMARY KEY,
+                generator TEXT NOT NULL,
+                model TEXT NOT NULL,
+                section TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_generation_cache_last_access ON generation_cache (last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(generator: str, model: str, prompt_version: str, section: str,
+                 answers: Dict = None, context: str = '') -> str:
+        """Gera a chave do cache a partir das entradas normalizadas"""
+        payload = {
+            'generator': generator,
+            'model': model,
+            'prompt_version': prompt_version,
+            'section': section,
+            'answers': normalize_answers(answers),
+            'context': normalize_text(context)
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """Retorna o conteúdo em cache ou None (entradas expiradas são removidas)"""
+        if not self.enabled or not cache_key:
+            return None
+
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT content, created_at FROM generation_cache WHERE cache_key = ?",
+                    (cache_key,)
+                ).fetchone()
+
+                if row and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                    self._conn.execute("DELETE FROM generation_cache WHERE cache_key = ?", (cache_key,))
+                    self._conn.commit()
+                    row = None
+
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                self._conn.execute(
+                    "UPDATE generation_cache SET last_access = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                    (now, cache_key)
+                )
+                self._conn.commit()
+                self.hits += 1
+                return row[0]
+        except sqlite3.Error as e:
+            print(f"⚠️ Erro ao ler cache de geração: {e}")
+            return None
+
+    def set(self, cache_key: str, content: str, generator: str, model: str, section: str):
+        """Armazena conteúdo gerado e aplica a política de descarte"""
+        if not self.enabled or not cache_key or not content:
+            return
+
+        now = time.time()
+        try:
+            with self._lock:
+                self._conn.execute(
+                    """INSERT OR REPLACE INTO generation_cache
+                       (cache_key, generator, model, section, content, created_at, last_access, hit_count)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, 0)""",
+                    (cache_key, generator, model, section, content, now, now)
+                )
+                self._evict(now)
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Erro ao gravar cache de geração: {e}")
+
+    def _evict(self, now: float):
+        """Remove entradas expiradas e as menos usadas recentemente acima do limite"""
+        if self.ttl_seconds:
+            self._conn.execute(
+                "DELETE FROM generation_cache WHERE created_at < ?",
+                (now - self.ttl_seconds,)
+            )
+
+        total = self._conn.execute("SELECT COUNT(*) FROM generation_cache").fetchone()[0]
+        excess = total - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                """DELETE FROM generation_cache WHERE cache_key IN (
+                       SELECT cache_key FROM generation_cache ORDER BY last_access ASC LIMIT ?
+                   )""",
+                (excess,)
+            )
+
+    def clear(self):
+        """Remove todas as entradas do cache"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM generation_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        """Estatísticas de uso do cache"""
+        entries = 0
+        if self.enabled:
+            with self._lock:
+                entries = self._conn.execute("SELECT COUNT(*) FROM generation_cache").fetchone()[0]
+
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+_generation_cache: Optional[GenerationCache] = None
+_generation_cache_lock = threading.Lock()
+
+
+def get_generation_cache() -> GenerationCache:
+    """Retorna a instância do cache compartilhada pelo processo"""
+    global _generation_cache
+    if _generation_cache is None:
+        with _generation_cache_lock:
+            if _generation_cache is None:
+                _generation_cache = GenerationCache()
+    return _generation_cache
@@ -0,0 +1,394 @@
+import os
+import time
+import threading
+import concurrent.futures
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .etp_content_parser import parse_etp_content
+
+# Seções mínimas para considerar um ETP gerado como válido
+MIN_SECTIONS = 12
+
+
+class GeneratorTimeoutError(Exception):
+    """Motor de geração não concluiu dentro do orçamento de latência"""
+
+
+class RoutedEngine:
+    """Motor de geração disponível para o roteador
+
+    ``factory`` cria (uma única vez) a instância do gerador; ``method`` é o
+    nome do método chamado com ``(session_data, context_data, **options)``.
+    ``stream_method`` (opcional) é a versão que devolve o texto em pedaços.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], object], method: str, model: str,
+                 prior_latency: float, options: Dict = None, stream_method: str = None):
+        self.name = name
+        self.factory = factory
+        self.method = method
+        self.stream_method = stream_method
+        self.model = model
+        self.prior_latency = prior_latency
+        self.options = options or {}
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get_instance(self):
+        with self._lock:
+            if self._instance is None:
+                self._instance = self.factory()
+            return self._instance
+
+    def generate(self, session_data: Dict, context_data: Dict = None) -> str:
+        return getattr(self.get_instance(), self.method)(session_data, context_data, **self.options)
+
+    def stream(self, session_data: Dict, context_data: Dict = None) -> Iterator[str]:
+        return getattr(self.get_instance(), self.stream_method)(session_data, context_data, **self.options)
+
+
+class _EngineStats:
+    """Janela das últimas latências e resultados de um motor
+
+    Amostras mais antigas que ``horizon`` segundos são ignoradas, para que um
+    motor descartado por lentidão ou falhas volte a ser tentado depois.
+    """
+
+    def __init__(self, window: int, horizon: float):
+        self.horizon = horizon
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.selected = 0
+        self.fallbacks = 0
+
+    def add_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append((time.monotonic(), seconds))
+
+    def add_outcome(self, success: bool):
+        with self._lock:
+            self._outcomes.append((time.monotonic(), bool(success)))
+
+    def _recent(self, samples) -> List:
+        cutoff = time.monotonic() - self.horizon
+        with self._lock:
+            return [value for timestamp, value in samples if timestamp >= cutoff]
+
+    def p95(self) -> Optional[float]:
+        latencies = sorted(self._recent(self._latencies))
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+
+    def failure_rate(self) -> float:
+        outcomes = self._recent(self._outcomes)
+        if not outcomes:
+            return 0.0
+        return outcomes.count(False) / len(outcomes)
+
+    def samples(self) -> int:
+        return len(self._recent(self._latencies))
+
+    def outcomes(self) -> int:
+        return len(self._recent(self._outcomes))
+
+    def snapshot(self) -> Dict:
+        p95 = self.p95()
+        return {
+            'samples': self.samples(),
+            'p95_seconds': round(p95, 2) if p95 is not None else None,
+            'failure_rate': round(self.failure_rate(), 3),
+            'selected': self.selected,
+            'fallbacks': self.fallbacks
+        }
+
+
+class GeneratorRouter:
+    """Escolhe o motor de geração (e o modelo) de cada requisição
+
+    Os motores são informados do mais completo para o mais barato. Para cada
+    requisição é escolhido o primeiro cuja latência estimada (p95 recente,
+    ajustado pela fila atual), somada à reserva do próximo motor mais barato,
+    cabe no SLO e cuja taxa de falhas está abaixo do limite. Assim o motor
+    escolhido recebe pelo menos o tempo estimado antes de ser abandonado. Se
+    ele estoura o orçamento, falha ou devolve um ETP incompleto, a requisição
+    cai para o próximo motor mais barato; o último motor sempre é aguardado
+    até o fim.
+
+    Threads que estouram o prazo não podem ser interrompidas: continuam em
+    segundo plano e o resultado fica no cache de geração do próprio motor.
+    """
+
+    def __init__(self, engines: List[RoutedEngine], slo_seconds: float = None,
+                 max_failure_rate: float = None, queue_penalty: float = None,
+                 window: int = None, horizon: float = None, min_samples: int = 3, max_workers: int = None):
+        if slo_seconds is None:
+            slo_seconds = float(os.getenv('ETP_PREVIEW_SLO_SECONDS', '60'))
+        if max_failure_rate is None:
+            max_failure_rate = float(os.getenv('ETP_ROUTER_MAX_FAILURE_RATE', '0.5'))
+        if queue_penalty is None:
+            queue_penalty = float(os.getenv('ETP_ROUTER_QUEUE_PENALTY', '0.15'))
+        if window is None:
+            window = int(os.getenv('ETP_ROUTER_WINDOW', '50'))
+        if horizon is None:
+            horizon = float(os.getenv('ETP_ROUTER_HORIZON_SECONDS', '600'))
+        if max_workers is None:
+            max_workers = int(os.getenv('ETP_ROUTER_WORKERS', '8'))
+
+        if not engines:
+            raise ValueError("É necessário ao menos um motor de geração")
+
+        self.engines = engines
+        self.slo_seconds = max(1.0, float(slo_seconds))
+        self.max_failure_rate = float(max_failure_rate)
+        self.queue_penalty = max(0.0, float(queue_penalty))
+        self.min_samples = max(1, int(min_samples))
+        self.max_workers = max(1, int(max_workers))
+
+        self._stats = {engine.name: _EngineStats(max(1, int(window)), float(horizon)) for engine in engines}
+        self._decisions = deque(maxlen=max(1, int(window)))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._executor = None
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='etp-router'
+                )
+            return self._executor
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._in_flight
+
+    def estimate_latency(self, engine: RoutedEngine, queue_depth: int = 0) -> float:
+        """Latência esperada do motor (p95 recente ou valor inicial) sob a fila atual"""
+        stats = self._stats[engine.name]
+        p95 = stats.p95() if stats.samples() >= self.min_samples else None
+        base = p95 if p95 is not None else engine.prior_latency
+        return base * (1 + self.queue_penalty * max(0, queue_depth))
+
+    def choose(self, slo_seconds: float = None, queue_depth: int = 0) -> RoutedEngine:
+        """Primeiro motor (do mais completo ao mais barato) que cabe no SLO com a reserva do fallback"""
+        slo = slo_seconds or self.slo_seconds
+        for position, engine in enumerate(self.engines):
+            stats = self._stats[engine.name]
+            if stats.outcomes() >= self.min_samples and stats.failure_rate() > self.max_failure_rate:
+                continue
+            reserve = self._reserve(self.engines[position + 1:], queue_depth)
+            if self.estimate_latency(engine, queue_depth) + reserve <= slo:
+                return engine
+        return self.engines[-1]
+
+    def generate(self, session_data: Dict, context_data: Dict = None, slo_seconds: float = None,
+                 queue_depth: int = 0) -> Dict:
+        """Gera o ETP com o motor escolhido, caindo para motores mais baratos se necessário
+
+        ``queue_depth`` soma trabalhos externos (ex.: análises de documentos)
+        às gerações em andamento no próprio roteador.
+        """
+        slo = float(slo_seconds or self.slo_seconds)
+        depth = self.in_flight() + max(0, int(queue_depth or 0))
+        chosen = self.choose(slo, depth)
+        self._stats[chosen.name].selected += 1
+
+        started = time.monotonic()
+        attempts = []
+        candidates = self.engines[self.engines.index(chosen):]
+        content = None
+        final_engine = None
+
+        for position, engine in enumerate(candidates):
+            is_last = position == len(candidates) - 1
+            elapsed = time.monotonic() - started
+            budget = None if is_last else self._attempt_budget(slo - elapsed, candidates[position + 1:], depth)
+
+            attempt_started = time.monotonic()
+            try:
+                content = self._run_engine(engine, session_data, context_data, budget)
+                if not is_last and not self._is_complete(content):
+                    raise ValueError("ETP incompleto ou com erro")
+                self._stats[engine.name].add_outcome(True)
+                attempts.append(self._attempt_record(engine, 'sucesso', attempt_started, budget))
+                final_engine = engine
+                break
+            except Exception as e:
+                self._stats[engine.name].add_outcome(False)
+                status = 'timeout' if isinstance(e, GeneratorTimeoutError) else 'falha'
+                attempts.append(self._attempt_record(engine, status, attempt_started, budget, str(e)))
+                print(f"⚠️ Motor {engine.name} ({status}): {e}")
+                if is_last:
+                    raise
+                self._stats[engine.name].fallbacks += 1
+
+        decision = self._record_decision(slo, depth, chosen, final_engine, started, attempts)
+        return {'content': content, 'decision': decision}
+
+    def stream(self, session_data: Dict, context_data: Dict = None, slo_seconds: float = None,
+               queue_depth: int = 0, decision: Dict = None) -> Iterator[str]:
+        """Versão em streaming de ``generate``: emite o texto do motor escolhido à medida que chega
+
+        Motores com ``stream_method`` não têm orçamento por tentativa (o texto já
+        está chegando ao usuário) e só caem para o próximo motor se falharem antes
+        de emitir algo. Os demais são executados como em ``generate`` e emitidos
+        de uma vez. Latência e resultado entram nas mesmas estatísticas, e o
+        registro da decisão é copiado para ``decision`` ao final.
+        """
+        slo = float(slo_seconds or self.slo_seconds)
+        depth = self.in_flight() + max(0, int(queue_depth or 0))
+        chosen = self.choose(slo, depth)
+        self._stats[chosen.name].selected += 1
+
+        started = time.monotonic()
+        attempts = []
+        candidates = self.engines[self.engines.index(chosen):]
+        final_engine = None
+
+        for position, engine in enumerate(candidates):
+            is_last = position == len(candidates) - 1
+            budget = None
+            parts = []
+            attempt_started = time.monotonic()
+            try:
+                if engine.stream_method:
+                    for chunk in self._stream_engine(engine, session_data, context_data):
+                        parts.append(chunk)
+                        yield chunk
+                    if not is_last and not self._is_complete(''.join(parts)):
+                        # Texto já enviado: sem fallback, mas conta como falha do motor
+                        self._stats[engine.name].add_outcome(False)
+                        attempts.append(self._attempt_record(engine, 'incompleto', attempt_started, budget))
+                        final_engine = engine
+                        break
+                else:
+                    elapsed = time.monotonic() - started
+                    budget = None if is_last else self._attempt_budget(slo - elapsed, candidates[position + 1:], depth)
+                    content = self._run_engine(engine, session_data, context_data, budget)
+                    if not is_last and not self._is_complete(content):
+                        raise ValueError("ETP incompleto ou com erro")
+                    parts.append(content)
+                    yield content
+                self._stats[engine.name].add_outcome(True)
+                attempts.append(self._attempt_record(engine, 'sucesso', attempt_started, budget))
+                final_engine = engine
+                break
+            except Exception as e:
+                self._stats[engine.name].add_outcome(False)
+                status = 'timeout' if isinstance(e, GeneratorTimeoutError) else 'falha'
+                attempts.append(self._attempt_record(engine, status, attempt_started, budget, str(e)))
+                print(f"⚠️ Motor {engine.name} ({status}): {e}")
+                if parts or is_last:
+                    raise
+                self._stats[engine.name].fallbacks += 1
+
+        record = self._record_decision(slo, depth, chosen, final_engine, started, attempts)
+        if decision is not None:
+            decision.update(record)
+
+    def _stream_engine(self, engine: RoutedEngine, session_data: Dict, context_data: Dict) -> Iterator[str]:
+        with self._lock:
+            self._in_flight += 1
+        started = time.monotonic()
+        try:
+            yield from engine.stream(session_data, context_data)
+        finally:
+            self._stats[engine.name].add_latency(time.monotonic() - started)
+            with self._lock:
+                self._in_flight -= 1
+
+    def _record_decision(self, slo: float, depth: int, chosen: RoutedEngine, final_engine: RoutedEngine,
+                         started: float, attempts: List[Dict]) -> Dict:
+        total = time.monotonic() - started
+        decision = {
+            'timestamp': datetime.now().isoformat(),
+            'slo_seconds': slo,
+            'queue_depth': depth,
+            'chosen_engine': chosen.name,
+            'engine': final_engine.name,
+            'model': final_engine.model,
+            'fallback': final_engine is not chosen,
+            'total_seconds': round(total, 2),
+            'within_slo': total <= slo,
+            'attempts': attempts
+        }
+        with self._lock:
+            self._decisions.append(decision)
+        return decision
+
+    def _attempt_budget(self, remaining: float, cheaper: List[RoutedEngine], queue_depth: int) -> float:
+        """Prazo do motor atual reservando tempo para o próximo motor mais barato"""
+        return max(remaining - self._reserve(cheaper, queue_depth), remaining * 0.5, 1.0)
+
+    def _reserve(self, cheaper: List[RoutedEngine], queue_depth: int) -> float:
+        """Tempo guardado para o próximo motor mais barato (zero para o último)"""
+        return self.estimate_latency(cheaper[0], queue_depth) if cheaper else 0.0
+
+    def _run_engine(self, engine: RoutedEngine, session_data: Dict, context_data: Dict,
+                    budget: Optional[float]) -> str:
+        with self._lock:
+            self._in_flight += 1
+        future = self._get_executor().submit(self._timed_call, engine, session_data, context_data)
+        try:
+            return future.result(timeout=budget)
+        except concurrent.futures.TimeoutError:
+            raise GeneratorTimeoutError(f"{engine.name} excedeu o orçamento de {budget:.1f}s")
+
+    def _timed_call(self, engine: RoutedEngine, session_data: Dict, context_data: Dict) -> str:
+        # A latência é registrada quando a chamada termina, mesmo após o prazo
+        started = time.monotonic()
+        try:
+            return engine.generate(session_data, context_data)
+        finally:
+            self._stats[engine.name].add_latency(time.monotonic() - started)
+            with self._lock:
+                self._in_flight -= 1
+
+    @staticmethod
+    def _is_complete(content: str) -> bool:
+        """ETP com a maioria das seções numeradas e sem mensagem de erro"""
+        if not content or not content.strip():
+            return False
+        head = content.lstrip()[:200]
+        if head.startswith('Erro') or 'ERRO' in head:
+            return False
+        return len(parse_etp_content(content).section_numbers()) >= MIN_SECTIONS
+
+    @staticmethod
+    def _attempt_record(engine: RoutedEngine, status: str, started: float, budget: Optional[float],
+                        error: str = None) -> Dict:
+        record = {
+            'engine': engine.name,
+            'model': engine.model,
+            'status': status,
+            'seconds': round(time.monotonic() - started, 2),
+            'budget_seconds': round(budget, 2) if budget is not None else None
+        }
+        if error:
+            record['error'] = error
+        return record
+
+    def stats(self) -> Dict:
+        with self._lock:
+            decisions = list(self._decisions)
+            in_flight = self._in_flight
+        return {
+            'slo_seconds': self.slo_seconds,
+            'max_failure_rate': self.max_failure_rate,
+            'queue_penalty': self.queue_penalty,
+            'in_flight': in_flight,
+            'engines': {
+                engine.name: dict(
+                    self._stats[engine.name].snapshot(),
+                    model=engine.model,
+                    estimated_latency=round(self.estimate_latency(engine, in_flight), 2)
+                )
+                for engine in self.engines
+            },
+            'recent_decisions': decisions[-10:]
+        }
@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+import concurrent.futures
+from collections import deque
+from typing import Callable, Dict, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class HedgedRequestTimeoutError(Exception):
+    """Nenhuma tentativa concluiu dentro do prazo total"""
+
+
+class HedgedRequestRunner:
+    """Executa uma chamada lenta com requisição de reserva (hedge)
+
+    A tentativa principal é disparada imediatamente; se não terminar até o
+    percentil configurado das latências observadas (ou falhar antes disso),
+    uma segunda tentativa é disparada. Vale a primeira que concluir com
+    sucesso, e a outra recebe o sinal de cancelamento (``threading.Event``)
+    para interromper o stream e liberar a conexão.
+    """
+
+    def __init__(self, name: str, percentile: float = None, initial_delay: float = None,
+                 min_delay: float = None, timeout: float = None, enabled: bool = None,
+                 window: int = 50, min_samples: int = 5, max_workers: int = None):
+        if percentile is None:
+            percentile = float(os.getenv('ETP_HEDGE_PERCENTILE', '90'))
+        if initial_delay is None:
+            initial_delay = float(os.getenv('ETP_HEDGE_INITIAL_DELAY', '20'))
+        if min_delay is None:
+            min_delay = float(os.getenv('ETP_HEDGE_MIN_DELAY', '2'))
+        if timeout is None:
+            timeout = float(os.getenv('ETP_HEDGE_TIMEOUT', '60'))
+        if enabled is None:
+            enabled = os.getenv('ETP_HEDGE_ENABLED', 'true').lower() == 'true'
+        if max_workers is None:
+            max_workers = int(os.getenv('ETP_HEDGE_WORKERS', '8'))
+
+        self.name = name
+        self.percentile = min(100.0, max(0.0, float(percentile)))
+        self.initial_delay = max(0.0, float(initial_delay))
+        self.min_delay = max(0.0, float(min_delay))
+        self.timeout = max(1.0, float(timeout))
+        self.enabled = enabled
+        self.min_samples = max(1, int(min_samples))
+        self.max_workers = max(2, int(max_workers))
+
+        self._latencies = deque(maxlen=max(1, int(window)))
+        self._lock = threading.Lock()
+        self._executor = None
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._failures = 0
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f'hedge-{self.name}'
+                )
+            return self._executor
+
+    def hedge_delay(self) -> float:
+        """Tempo de espera antes do hedge: percentil das latências recentes"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        index = min(len(latencies) - 1, int(round(self.percentile / 100 * (len(latencies) - 1))))
+        return max(self.min_delay, latencies[index])
+
+    def run(self, primary: Callable[[threading.Event], T], hedge: Callable[[threading.Event], T]) -> T:
+        """Retorna o resultado da primeira tentativa (principal ou hedge) bem-sucedida"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        executor = self._get_executor()
+        with self._lock:
+            self._requests += 1
+
+        attempts = {}
+        primary_cancel = threading.Event()
+        attempts[executor.submit(self._timed, primary, primary_cancel)] = ('primary', primary_cancel)
+
+        done, _ = concurrent.futures.wait(attempts, timeout=min(self.hedge_delay(), self.timeout))
+        primary_failed = any(future.exception() is not None for future in done)
+        if self.enabled and (not done or primary_failed):
+            hedge_cancel = threading.Event()
+            attempts[executor.submit(self._timed, hedge, hedge_cancel)] = ('hedge', hedge_cancel)
+            with self._lock:
+                self._hedged += 1
+
+        pending = set(attempts)
+        last_error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = concurrent.futures.wait(
+                pending, timeout=remaining, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is not None:
+                    last_error = future.exception()
+                    continue
+                kind, _ = attempts[future]
+                self._cancel(attempts, exclude=future)
+                if kind == 'hedge':
+                    with self._lock:
+                        self._hedge_wins += 1
+                return future.result()
+
+        self._cancel(attempts)
+        with self._lock:
+            self._failures += 1
+        if last_error is not None and not pending:
+            raise last_error
+        raise HedgedRequestTimeoutError(f"{self.name}: nenhuma tentativa concluiu em {self.timeout:.0f}s")
+
+    def _timed(self, func: Callable[[threading.Event], T], cancel_event: threading.Event) -> T:
+        started = time.monotonic()
+        result = func(cancel_event)
+        # Tentativas canceladas não entram na estatística (a latência real é desconhecida)
+        if not cancel_event.is_set():
+            with self._lock:
+                self._latencies.append(time.monotonic() - started)
+        return result
+
+    @staticmethod
+    def _cancel(attempts: Dict, exclude: Optional[concurrent.futures.Future] = None):
+        for future, (_, cancel_event) in attempts.items():
+            if future is not exclude:
+                cancel_event.set()
+                future.cancel()
+
+    def stats(self) -> Dict:
+        delay = self.hedge_delay()
+        with self._lock:
+            requests = self._requests
+            return {
+                'name': self.name,
+                'enabled': self.enabled,
+                'percentile': self.percentile,
+                'hedge_delay_seconds': round(delay, 2),
+                'samples': len(self._latencies),
+                'requests': requests,
+                'hedged': self._hedged,
+                'hedge_wins': self._hedge_wins,
+                'failures': self._failures,
+                'hedge_rate': round(self._hedged / requests, 3) if requests else 0.0
+            }
+
+
+_runners: Dict[str, HedgedRequestRunner] = {}
+_runners_lock = threading.Lock()
+
+
+def get_hedged_runner(name: str) -> HedgedRequestRunner:
+    """Retorna o executor de hedge compartilhado pelo processo para ``name``"""
+    with _runners_lock:
+        if name not in _runners:
+            _runners[name] = HedgedRequestRunner(name)
+        return _runners[name]
+
+
+def get_hedging_stats() -> Dict:
+    with _runners_lock:
+        runners = list(_runners.values())
+    return {runner.name: runner.stats() for runner in runners}
@@ -0,0 +1,88 @@
+import os
+import threading
+import concurrent.futures
+from typing import Callable, Dict
+
+from flask import current_app
+
+
+class BackgroundJobQueue:
+    """Fila de tarefas em segundo plano dentro do processo (sem broker externo)
+
+    As tarefas rodam em um pool de threads com o contexto da aplicação Flask
+    ativo; o estado de cada tarefa deve ser persistido pelo próprio chamador
+    (ex.: colunas de status no SQLite).
+    """
+
+    def __init__(self, name: str, max_workers: int = None):
+        if max_workers is None:
+            max_workers = int(os.getenv('ETP_JOB_WORKERS', '2'))
+
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f'job-{self.name}'
+                )
+            return self._executor
+
+    def submit(self, func: Callable, *args, app=None, **kwargs) -> concurrent.futures.Future:
+        """Agenda ``func(*args, **kwargs)`` para execução com o contexto da aplicação"""
+        app = app or current_app._get_current_object()
+
+        with self._lock:
+            self._pending += 1
+
+        return self._get_executor().submit(self._run, app, func, args, kwargs)
+
+    def _run(self, app, func: Callable, args, kwargs):
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+
+        try:
+            with app.app_context():
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    # Liberar a sessão do SQLAlchemy usada pela thread
+                    db_extension = app.extensions.get('sqlalchemy')
+                    if db_extension is not None:
+                        db_extension.session.remove()
+            with self._lock:
+                self._completed += 1
+            return result
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+            print(f"❌ Erro na tarefa em segundo plano ({self.name}): {e}")
+            raise
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def depth(self) -> int:
+        """Tarefas aguardando ou em execução"""
+        with self._lock:
+            return self._pending + self._running
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'name': self.name,
+                'max_workers': self.max_workers,
+                'pending': self._pending,
+                'running': self._running,
+                'completed': self._completed,
+                'failed': self._failed
+            }
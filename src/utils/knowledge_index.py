@@ -0,0 +1,381 @@
+import os
+import re
+import math
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # busca vetorial é opcional; sem NumPy o índice usa apenas BM25
+    np = None
+
+from .generation_cache import DATABASE_DIR
+from .prompt_budget import count_tokens
+
+_TOKEN_RE = re.compile(r'\w+')
+_STOPWORDS = {
+    'que', 'para', 'com', 'por', 'uma', 'dos', 'das', 'nos', 'nas', 'pela', 'pelo', 'como', 'mais',
+    'sao', 'ser', 'sua', 'seu', 'suas', 'seus', 'aos', 'entre', 'sobre', 'quando', 'este', 'esta',
+    'esse', 'essa', 'isso', 'tambem', 'nao', 'sem', 'ate', 'qual', 'quais', 'deve', 'pode', 'foi'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Termos normalizados (sem acentos, minúsculos, sem stopwords) para o índice"""
+    text = unicodedata.normalize('NFD', (text or '').lower())
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    return [token for token in _TOKEN_RE.findall(text) if len(token) > 2 and token not in _STOPWORDS]
+
+
+def chunk_text(text: str, chunk_chars: int = 1000, overlap: int = 150) -> List[str]:
+    """Divide o texto em trechos de até ``chunk_chars`` respeitando parágrafos"""
+    chunks: List[str] = []
+    current: List[str] = []
+    current_length = 0
+
+    for paragraph in re.split(r'\n\s*\n', text or ''):
+        paragraph = re.sub(r'\s+', ' ', paragraph).strip()
+        if not paragraph:
+            continue
+
+        # Parágrafos longos são cortados em janelas com sobreposição
+        while len(paragraph) > chunk_chars:
+            if current:
+                chunks.append(' '.join(current))
+                current, current_length = [], 0
+            chunks.append(paragraph[:chunk_chars])
+            paragraph = paragraph[chunk_chars - overlap:]
+
+        if current_length + len(paragraph) > chunk_chars and current:
+            chunks.append(' '.join(current))
+            current, current_length = [], 0
+        current.append(paragraph)
+        current_length += len(paragraph) + 1
+
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+
+class KnowledgeIndex:
+    """Índice de recuperação local (BM25) sobre a base de conhecimento
+
+    Os documentos são divididos em trechos e indexados em um índice invertido
+    persistido em SQLite, atualizado documento a documento. Com NumPy
+    disponível, cada trecho também recebe um vetor local (hash de trigramas de
+    caracteres) e a pontuação final combina BM25 com a similaridade de cosseno.
+
+    Estatísticas do corpus e a matriz de vetores ficam em memória; cada escrita
+    incrementa a versão gravada em ``kb_meta`` e as buscas conferem essa versão,
+    então alterações feitas por outro worker também invalidam a memória.
+    """
+
+    K1 = 1.5
+    B = 0.75
+    # Similaridade mínima para um trecho entrar só pela busca vetorial
+    MIN_SIMILARITY = 0.3
+
+    def __init__(self, db_path: str = None, chunk_chars: int = None, top_k: int = None,
+                 token_budget: int = None, use_embeddings: bool = None, embedding_dim: int = 256,
+                 embedding_weight: float = 0.3):
+        if db_path is None:
+            db_path = os.getenv('ETP_KB_INDEX_PATH', os.path.join(DATABASE_DIR, 'knowledge_index.db'))
+        if chunk_chars is None:
+            chunk_chars = int(os.getenv('ETP_KB_CHUNK_CHARS', '1000'))
+        if top_k is None:
+            top_k = int(os.getenv('ETP_KB_TOP_K', '4'))
+        if token_budget is None:
+            token_budget = int(os.getenv('ETP_KB_TOKEN_BUDGET', '800'))
+        if use_embeddings is None:
+            use_embeddings = os.getenv('ETP_KB_EMBEDDINGS', 'true').lower() == 'true'
+
+        self.db_path = db_path
+        self.chunk_chars = max(200, int(chunk_chars))
+        self.top_k = max(1, int(top_k))
+        self.token_budget = max(0, int(token_budget))
+        self.use_embeddings = bool(use_embeddings) and np is not None
+        self.embedding_dim = embedding_dim
+        self.embedding_weight = embedding_weight
+
+        self._lock = threading.Lock()
+        self._corpus_stats: Optional[Tuple[int, float]] = None
+        self._matrix = None
+        self._matrix_ids = None
+        self._version: Optional[int] = None
+        self._connect()
+
+    def _connect(self):
+        """Abre a conexão e cria as tabelas do índice se necessário"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kb_documents (
+                doc_id INTEGER PRIMARY KEY,
+                filename TEXT NOT NULL,
+                content_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS kb_chunks (
+                chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                embedding BLOB
+            );
+            CREATE TABLE IF NOT EXISTS kb_postings (
+                term TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_kb_chunks_doc ON kb_chunks (doc_id);
+            CREATE INDEX IF NOT EXISTS idx_kb_postings_term ON kb_postings (term);
+            CREATE INDEX IF NOT EXISTS idx_kb_postings_chunk ON kb_postings (chunk_id);
+            CREATE TABLE IF NOT EXISTS kb_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def _embed(self, text: str):
+        """Vetor local normalizado a partir de trigramas de caracteres (hashing trick)"""
+        vector = np.zeros(self.embedding_dim, dtype=np.float32)
+        for token in tokenize(text):
+            padded = f' {token} '
+            for i in range(len(padded) - 2):
+                digest = hashlib.md5(padded[i:i + 3].encode('utf-8')).digest()
+                vector[int.from_bytes(digest[:4], 'little') % self.embedding_dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _invalidate(self):
+        self._corpus_stats = None
+        self._matrix = None
+        self._matrix_ids = None
+        self._version = None
+
+    def _bump_version(self):
+        """Marca o índice como alterado (na mesma transação da escrita)"""
+        self._conn.execute(
+            "INSERT INTO kb_meta (key, value) VALUES ('version', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+
+    def _refresh_if_stale(self):
+        """Descarta estatísticas e vetores em memória se outro processo alterou o índice"""
+        row = self._conn.execute("SELECT value FROM kb_meta WHERE key = 'version'").fetchone()
+        version = row[0] if row else 0
+        if version != self._version:
+            self._invalidate()
+            self._version = version
+
+    def _delete_document(self, doc_id: int):
+        self._conn.execute(
+            "DELETE FROM kb_postings WHERE chunk_id IN (SELECT chunk_id FROM kb_chunks WHERE doc_id = ?)",
+            (doc_id,)
+        )
+        self._conn.execute("DELETE FROM kb_chunks WHERE doc_id = ?", (doc_id,))
+        self._conn.execute("DELETE FROM kb_documents WHERE doc_id = ?", (doc_id,))
+
+    def add_document(self, doc_id: int, filename: str, content: str) -> bool:
+        """Indexa (ou reindexa) um documento; retorna False se nada mudou"""
+        content_hash = hashlib.sha256(f"{filename}\n{content or ''}".encode('utf-8')).hexdigest()
+
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT content_hash FROM kb_documents WHERE doc_id = ?", (doc_id,)
+                ).fetchone()
+                if row and row[0] == content_hash:
+                    return False
+
+                self._delete_document(doc_id)
+                self._conn.execute(
+                    "INSERT INTO kb_documents (doc_id, filename, content_hash) VALUES (?, ?, ?)",
+                    (doc_id, filename, content_hash)
+                )
+
+                for position, chunk in enumerate(chunk_text(content, self.chunk_chars)):
+                    terms = Counter(tokenize(chunk))
+                    embedding = self._embed(chunk).tobytes() if self.use_embeddings else None
+                    cursor = self._conn.execute(
+                        "INSERT INTO kb_chunks (doc_id, position, content, length, embedding) VALUES (?, ?, ?, ?, ?)",
+                        (doc_id, position, chunk, sum(terms.values()), embedding)
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO kb_postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                        [(term, cursor.lastrowid, tf) for term, tf in terms.items()]
+                    )
+
+                self._bump_version()
+                self._conn.commit()
+                self._invalidate()
+                return True
+        except sqlite3.Error as e:
+            print(f"⚠️ Erro ao indexar documento da base de conhecimento: {e}")
+            return False
+
+    def remove_document(self, doc_id: int):
+        """Remove um documento do índice"""
+        try:
+            with self._lock:
+                self._delete_document(doc_id)
+                self._bump_version()
+                self._conn.commit()
+                self._invalidate()
+        except sqlite3.Error as e:
+            print(f"⚠️ Erro ao remover documento do índice: {e}")
+
+    def sync(self, documents: Iterable[Tuple[int, str, str]]) -> Dict:
+        """Sincroniza o índice com os documentos ativos (id, nome, conteúdo)"""
+        active_ids = set()
+        updated = 0
+        for doc_id, filename, content in documents:
+            active_ids.add(doc_id)
+            if self.add_document(doc_id, filename, content):
+                updated += 1
+
+        with self._lock:
+            indexed_ids = {row[0] for row in self._conn.execute("SELECT doc_id FROM kb_documents")}
+        removed = indexed_ids - active_ids
+        for doc_id in removed:
+            self.remove_document(doc_id)
+
+        return {'updated': updated, 'removed': len(removed), 'documents': len(active_ids)}
+
+    def _get_corpus_stats(self) -> Tuple[int, float]:
+        if self._corpus_stats is None:
+            count, average = self._conn.execute("SELECT COUNT(*), AVG(length) FROM kb_chunks").fetchone()
+            self._corpus_stats = (count, average or 0.0)
+        return self._corpus_stats
+
+    def _get_embedding_matrix(self):
+        if self._matrix is None:
+            rows = self._conn.execute(
+                "SELECT chunk_id, embedding FROM kb_chunks WHERE embedding IS NOT NULL"
+            ).fetchall()
+            self._matrix_ids = [row[0] for row in rows]
+            self._matrix = (
+                np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+                if rows else np.zeros((0, self.embedding_dim), dtype=np.float32)
+            )
+        return self._matrix_ids, self._matrix
+
+    def _bm25_scores(self, query_terms: List[str]) -> Dict[int, float]:
+        total_chunks, average_length = self._get_corpus_stats()
+        if not total_chunks or not query_terms:
+            return {}
+
+        placeholders = ','.join('?' * len(query_terms))
+        postings = self._conn.execute(
+            f"""SELECT p.term, p.chunk_id, p.tf, c.length FROM kb_postings p
+                JOIN kb_chunks c ON c.chunk_id = p.chunk_id
+                WHERE p.term IN ({placeholders})""",
+            query_terms
+        ).fetchall()
+
+        document_frequency = Counter(term for term, _, _, _ in postings)
+        scores: Dict[int, float] = {}
+        for term, chunk_id, tf, length in postings:
+            df = document_frequency[term]
+            idf = math.log(1 + (total_chunks - df + 0.5) / (df + 0.5))
+            norm = tf + self.K1 * (1 - self.B + self.B * length / (average_length or 1))
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.K1 + 1) / norm
+        return scores
+
+    def search(self, query: str, top_k: int = None) -> List[Dict]:
+        """Trechos mais relevantes para a consulta, do mais para o menos relevante"""
+        top_k = top_k or self.top_k
+        query_terms = [term for term, _ in Counter(tokenize(query)).most_common(500)]
+
+        try:
+            with self._lock:
+                self._refresh_if_stale()
+                scores = self._bm25_scores(query_terms)
+                if scores:
+                    best = max(scores.values())
+                    scores = {chunk_id: score / best for chunk_id, score in scores.items()}
+
+                if self.use_embeddings and query_terms:
+                    chunk_ids, matrix = self._get_embedding_matrix()
+                    if len(chunk_ids):
+                        similarities = matrix @ self._embed(query)
+                        for position in np.argsort(-similarities)[:top_k * 3]:
+                            if similarities[position] < self.MIN_SIMILARITY:
+                                break
+                            chunk_id = chunk_ids[int(position)]
+                            scores[chunk_id] = scores.get(chunk_id, 0.0) + self.embedding_weight * float(similarities[position])
+
+                ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+                if not ranked:
+                    return []
+
+                placeholders = ','.join('?' * len(ranked))
+                rows = {
+                    row[0]: row for row in self._conn.execute(
+                        f"""SELECT c.chunk_id, c.doc_id, d.filename, c.content FROM kb_chunks c
+                            JOIN kb_documents d ON d.doc_id = c.doc_id
+                            WHERE c.chunk_id IN ({placeholders})""",
+                        [chunk_id for chunk_id, _ in ranked]
+                    )
+                }
+        except sqlite3.Error as e:
+            print(f"⚠️ Erro na busca da base de conhecimento: {e}")
+            return []
+
+        return [
+            {'doc_id': rows[chunk_id][1], 'filename': rows[chunk_id][2], 'content': rows[chunk_id][3],
+             'score': round(score, 4)}
+            for chunk_id, score in ranked if chunk_id in rows
+        ]
+
+    def build_context(self, query: str, top_k: int = None, token_budget: int = None) -> str:
+        """Bloco de contexto com os trechos relevantes dentro do orçamento de tokens"""
+        token_budget = self.token_budget if token_budget is None else token_budget
+        parts = []
+        used_tokens = 0
+        for result in self.search(query, top_k):
+            block = f"--- {result['filename']} ---\n{result['content']}\n"
+            block_tokens = count_tokens(block)
+            if used_tokens + block_tokens > token_budget:
+                break
+            parts.append(block)
+            used_tokens += block_tokens
+        return '\n'.join(parts)
+
+    def stats(self) -> Dict:
+        """Estatísticas do índice"""
+        with self._lock:
+            self._refresh_if_stale()
+            documents = self._conn.execute("SELECT COUNT(*) FROM kb_documents").fetchone()[0]
+            chunks, average_length = self._get_corpus_stats()
+        return {
+            'documents': documents,
+            'chunks': chunks,
+            'average_chunk_terms': round(average_length, 1),
+            'embeddings': self.use_embeddings,
+            'top_k': self.top_k,
+            'token_budget': self.token_budget
+        }
+
+
+_knowledge_index: Optional[KnowledgeIndex] = None
+_knowledge_index_lock = threading.Lock()
+
+
+def get_knowledge_index() -> KnowledgeIndex:
+    """Retorna o índice da base de conhecimento compartilhado pelo processo"""
+    global _knowledge_index
+    if _knowledge_index is None:
+        with _knowledge_index_lock:
+            if _knowledge_index is None:
+                _knowledge_index = KnowledgeIndex()
+    return _knowledge_index
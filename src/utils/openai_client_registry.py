@@ -0,0 +1,242 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import openai
+
+try:
+    import httpx
+except ImportError:  # versões recentes do SDK distribuem o transporte como httpx2
+    import httpx2 as httpx
+
+
+class _ModelConcurrencyLimiter:
+    """Limita o número de chamadas simultâneas por modelo"""
+
+    def __init__(self, default_limit: int, overrides: Dict[str, int]):
+        self.default_limit = default_limit
+        self.overrides = overrides
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore_for(self, model: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(model)
+            if semaphore is None:
+                limit = self.overrides.get(model, self.default_limit)
+                semaphore = threading.BoundedSemaphore(limit)
+                self._semaphores[model] = semaphore
+            return semaphore
+
+    @contextmanager
+    def slot(self, model: Optional[str]):
+        semaphore = self._semaphore_for(model or 'default')
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'default_limit': self.default_limit,
+                'overrides': dict(self.overrides),
+                'models': sorted(self._semaphores.keys())
+            }
+
+
+class _TokenUsageMetrics:
+    """Tokens de entrada (com e sem cache de prefixo do provedor) e de saída por modelo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, int]] = {}
+
+    def record(self, model: Optional[str], usage):
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details is not None else 0
+
+        with self._lock:
+            stats = self._models.setdefault(model or 'default', {
+                'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0
+            })
+            stats['requests'] += 1
+            stats['prompt_tokens'] += prompt_tokens
+            stats['cached_tokens'] += cached_tokens
+            stats['completion_tokens'] += getattr(usage, 'completion_tokens', 0) or 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            models = {}
+            for model, stats in self._models.items():
+                prompt_tokens = stats['prompt_tokens']
+                models[model] = dict(
+                    stats,
+                    uncached_tokens=prompt_tokens - stats['cached_tokens'],
+                    cached_ratio=round(stats['cached_tokens'] / prompt_tokens, 3) if prompt_tokens else 0.0
+                )
+            return models
+
+
+_usage_metrics = _TokenUsageMetrics()
+
+
+class _LimitedCompletions:
+    """Proxy de chat.completions que respeita o limite de concorrência do modelo"""
+
+    def __init__(self, completions, limiter: _ModelConcurrencyLimiter):
+        self._completions = completions
+        self._limiter = limiter
+
+    def create(self, *args, **kwargs):
+        model = kwargs.get('model')
+        if kwargs.get('stream'):
+            # Pedir o uso de tokens no último chunk do stream
+            kwargs.setdefault('stream_options', {'include_usage': True})
+            return self._create_stream(model, args, kwargs)
+        with self._limiter.slot(model):
+            response = self._completions.create(*args, **kwargs)
+        _usage_metrics.record(model, getattr(response, 'usage', None))
+        return response
+
+    def _create_stream(self, model, args, kwargs):
+        # A vaga do modelo só é liberada quando o stream termina de ser consumido
+        with self._limiter.slot(model):
+            stream = self._completions.create(*args, **kwargs)
+            try:
+                for chunk in stream:
+                    usage = getattr(chunk, 'usage', None)
+                    if usage is not None:
+                        _usage_metrics.record(model, usage)
+                    yield chunk
+            finally:
+                close = getattr(stream, 'close', None)
+                if close:
+                    close()
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+
+class _LimitedChat:
+    def __init__(self, chat, limiter: _ModelConcurrencyLimiter):
+        self._chat = chat
+        self.completions = _LimitedCompletions(chat.completions, limiter)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class SharedOpenAIClient:
+    """Cliente OpenAI compartilhado pelo processo com pool de conexões HTTP"""
+
+    def __init__(self, client, limiter: _ModelConcurrencyLimiter):
+        self._client = client
+        self.limiter = limiter
+        self.chat = _LimitedChat(client.chat, limiter)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+_clients: Dict[str, SharedOpenAIClient] = {}
+_clients_lock = threading.Lock()
+_limiter: Optional[_ModelConcurrencyLimiter] = None
+
+
+def _parse_model_overrides(raw: str) -> Dict[str, int]:
+    """Interpreta OPENAI_MODEL_CONCURRENCY_OVERRIDES no formato 'modelo=limite,...'"""
+    overrides = {}
+    for item in (raw or '').split(','):
+        if '=' not in item:
+            continue
+        model, limit = item.split('=', 1)
+        try:
+            overrides[model.strip()] = max(1, int(limit))
+        except ValueError:
+            print(f"⚠️ Limite de concorrência inválido para {model.strip()}: {limit}")
+    return overrides
+
+
+def _get_limiter() -> _ModelConcurrencyLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = _ModelConcurrencyLimiter(
+            default_limit=max(1, int(os.getenv('OPENAI_MODEL_CONCURRENCY', '16'))),
+            overrides=_parse_model_overrides(os.getenv('OPENAI_MODEL_CONCURRENCY_OVERRIDES', ''))
+        )
+    return _limiter
+
+
+def _build_http_client():
+    """Cria o cliente HTTP com pool e keep-alive configuráveis"""
+    limits = httpx.Limits(
+        max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', '32')),
+        max_keepalive_connections=int(os.getenv('OPENAI_MAX_KEEPALIVE', '16')),
+        keepalive_expiry=float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '120'))
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv('OPENAI_REQUEST_TIMEOUT', '120')),
+        connect=float(os.getenv('OPENAI_CONNECT_TIMEOUT', '10'))
+    )
+
+    # DefaultHttpxClient mantém os defaults do SDK (redirects, transporte)
+    client_class = getattr(openai, 'DefaultHttpxClient', None) or httpx.Client
+    return client_class(limits=limits, timeout=timeout)
+
+
+def get_openai_client(api_key: str = None) -> SharedOpenAIClient:
+    """Retorna o cliente OpenAI compartilhado para a API key informada"""
+    api_key = api_key or os.getenv('OPENAI_API_KEY')
+
+    client = _clients.get(api_key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            raw_client = openai.OpenAI(
+                api_key=api_key,
+                http_client=_build_http_client(),
+                max_retries=int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+            )
+            client = SharedOpenAIClient(raw_client, _get_limiter())
+            _clients[api_key] = client
+    return client
+
+
+def warm_up_openai_client(api_key: str = None):
+    """Abre a conexão TLS em segundo plano para não pesar na primeira requisição"""
+
+    def _warm_up():
+        try:
+            get_openai_client(api_key).models.list()
+            print("🔌 Conexão com a OpenAI aquecida")
+        except Exception as e:
+            print(f"⚠️ Falha ao aquecer conexão com a OpenAI: {e}")
+
+    thread = threading.Thread(target=_warm_up, name='openai-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def get_registry_stats() -> Dict:
+    """Resumo da configuração do registro de clientes"""
+    return {
+        'clients': len(_clients),
+        'max_connections': int(os.getenv('OPENAI_MAX_CONNECTIONS', '32')),
+        'max_keepalive_connections': int(os.getenv('OPENAI_MAX_KEEPALIVE', '16')),
+        'keepalive_expiry': float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '120')),
+        'model_concurrency': _get_limiter().snapshot()
+    }
+
+
+def get_token_usage_stats() -> Dict:
+    """Tokens de entrada em cache/sem cache e de saída, por modelo, desde o início do processo"""
+    return _usage_metrics.snapshot()
@@ -0,0 +1,190 @@
+import os
+import math
+import time
+import concurrent.futures
+from typing import Callable, Dict, List, Optional
+
+
+class SectionTimeoutError(Exception):
+    """Seção não concluída dentro do prazo configurado"""
+
+
+class ParallelSectionEngine:
+    """Executa a geração das seções do ETP em paralelo mantendo a ordem original
+
+    Cada tarefa recebe o timeout por tentativa (em segundos) e deve retornar o
+    texto da seção ou lançar exceção. Falhas são repetidas até ``max_retries``
+    vezes; seções que esgotam as tentativas (ou o prazo total) são preenchidas
+    pelo ``fallback`` informado.
+    """
+
+    # Limites rígidos (valem também para a configuração enviada na requisição)
+    MAX_WORKERS_LIMIT = 14
+    MAX_RETRIES_LIMIT = 3
+    SECTION_TIMEOUT_LIMIT = 180.0
+    RETRY_BACKOFF_LIMIT = 10.0
+    CONFIG_KEYS = ('max_workers', 'section_timeout', 'max_retries', 'retry_backoff')
+
+    def __init__(self, max_workers: int = None, section_timeout: float = None,
+                 max_retries: int = None, retry_backoff: float = None):
+        if max_workers is None:
+            max_workers = int(os.getenv('ETP_SECTION_WORKERS', '7'))
+        if section_timeout is None:
+            section_timeout = float(os.getenv('ETP_SECTION_TIMEOUT', '90'))
+        if max_retries is None:
+            max_retries = int(os.getenv('ETP_SECTION_RETRIES', '1'))
+        if retry_backoff is None:
+            retry_backoff = float(os.getenv('ETP_SECTION_RETRY_BACKOFF', '1.0'))
+
+        self.max_workers = max(1, min(int(max_workers), self.MAX_WORKERS_LIMIT))
+        self.section_timeout = max(1.0, min(float(section_timeout), self.SECTION_TIMEOUT_LIMIT))
+        self.max_retries = max(0, min(int(max_retries), self.MAX_RETRIES_LIMIT))
+        self.retry_backoff = max(0.0, min(float(retry_backoff), self.RETRY_BACKOFF_LIMIT))
+
+        # Estatísticas da última execução (tempo e tentativas por seção)
+        self.last_run_stats: Dict = {}
+
+    @classmethod
+    def validate_config(cls, config) -> Dict:
+        """Configuração da requisição com valores numéricos; ``ValueError`` para tipos inválidos
+
+        Os valores aceitos ainda são limitados aos máximos do servidor no construtor.
+        """
+        if config is None:
+            return {}
+        if not isinstance(config, dict):
+            raise ValueError("engine_config deve ser um objeto")
+        for key in cls.CONFIG_KEYS:
+            value = config.get(key)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ValueError(f"engine_config.{key} deve ser numérico")
+        return {key: config[key] for key in cls.CONFIG_KEYS if config.get(key) is not None}
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict] = None) -> 'ParallelSectionEngine':
+        """Cria o motor a partir da configuração enviada na requisição"""
+        config = cls.validate_config(config)
+        return cls(
+            max_workers=config.get('max_workers'),
+            section_timeout=config.get('section_timeout'),
+            max_retries=config.get('max_retries'),
+            retry_backoff=config.get('retry_backoff')
+        )
+
+    def total_deadline(self) -> float:
+        """Prazo máximo de uma seção, a partir do seu início, considerando todas as tentativas"""
+        attempts = self.max_retries + 1
+        backoff_total = sum(self.retry_backoff * (2 ** i) for i in range(self.max_retries))
+        return self.section_timeout * attempts + backoff_total
+
+    def run(self, tasks: List[Callable[[float], str]],
+            fallback: Callable[[int, Exception], str]) -> List[str]:
+        """Executa as tarefas em paralelo e retorna os resultados na ordem de entrada"""
+        results: List[Optional[str]] = [None] * len(tasks)
+        section_stats: List[Dict] = [{'attempts': 0, 'duration': 0.0, 'status': 'pendente'} for _ in tasks]
+        start_time = time.monotonic()
+
+        if not tasks:
+            self.last_run_stats = {'total_time': 0.0, 'sections': []}
+            return []
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(tasks)),
+            thread_name_prefix='etp-section'
+        )
+        try:
+            futures = {
+                executor.submit(self._run_with_retries, task, section_stats[index]): index
+                for index, task in enumerate(tasks)
+            }
+
+            done, not_done = self._wait_with_deadlines(futures, section_stats, start_time)
+
+            for future in done:
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                    section_stats[index]['status'] = 'concluida'
+                except Exception as e:
+                    results[index] = fallback(index, e)
+                    section_stats[index]['status'] = 'erro'
+
+            for future in not_done:
+                index = futures[future]
+                future.cancel()
+                results[index] = fallback(
+                    index,
+                    SectionTimeoutError(f"Seção excedeu o prazo de {self.total_deadline():.0f}s")
+                )
+                section_stats[index]['status'] = 'timeout'
+        finally:
+            # Não bloquear a requisição esperando threads que estouraram o prazo
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for stats in section_stats:
+            stats.pop('started_at', None)
+        self.last_run_stats = {
+            'total_time': round(time.monotonic() - start_time, 2),
+            'max_workers': self.max_workers,
+            'section_timeout': self.section_timeout,
+            'max_retries': self.max_retries,
+            'sections': section_stats
+        }
+
+        return results
+
+    def _wait_with_deadlines(self, futures: Dict, section_stats: List[Dict], start_time: float):
+        """Aguarda as seções contando o prazo de cada uma a partir do seu início
+
+        Seções na fila esperam um worker livre sem gastar o próprio prazo; o
+        limite geral é o prazo de uma seção vezes o número de ondas de workers.
+        """
+        section_deadline = self.total_deadline()
+        waves = math.ceil(len(futures) / min(self.max_workers, len(futures)))
+        overall_deadline = start_time + section_deadline * waves
+        pending = set(futures)
+        timed_out = set()
+
+        while pending:
+            now = time.monotonic()
+            expiries = [overall_deadline]
+            for future in list(pending):
+                started = section_stats[futures[future]].get('started_at')
+                if future.done():
+                    continue
+                if now >= overall_deadline or (started is not None and now - started >= section_deadline):
+                    pending.discard(future)
+                    timed_out.add(future)
+                elif started is not None:
+                    expiries.append(started + section_deadline)
+            if not pending:
+                break
+            done, _ = concurrent.futures.wait(
+                pending, timeout=max(0.0, min(expiries) - now),
+                return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            pending -= done
+
+        return set(futures) - timed_out, timed_out
+
+    def _run_with_retries(self, task: Callable[[float], str], stats: Dict) -> str:
+        """Executa uma tarefa repetindo em caso de falha"""
+        last_error = None
+        started = time.monotonic()
+        stats['started_at'] = started
+
+        for attempt in range(self.max_retries + 1):
+            stats['attempts'] = attempt + 1
+            try:
+                result = task(self.section_timeout)
+                stats['duration'] = round(time.monotonic() - started, 2)
+                return result
+            except Exception as e:
+                last_error = e
+                if attempt < self.max_retries:
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+
+        stats['duration'] = round(time.monotonic() - started, 2)
+        raise last_error
@@ -0,0 +1,43 @@
+import re
+from typing import Dict, Iterable, List, Tuple
+
+
+class PatternScanner:
+    """Localiza vários padrões rotulados em uma única varredura do texto
+
+    Os padrões são pré-compilados e combinados em uma alternação dentro de um
+    lookahead, que aponta as posições onde algum padrão começa (inclusive
+    sobrepostas). Só nessas posições cada padrão é confirmado com ``match``,
+    então o custo cresce linearmente com o tamanho do documento.
+    """
+
+    def __init__(self, labeled_patterns: Iterable[Tuple[str, str]], flags: int = re.IGNORECASE):
+        self._patterns: List[Tuple[str, re.Pattern]] = [
+            (label, re.compile(pattern, flags)) for label, pattern in labeled_patterns
+        ]
+        combined = '|'.join(f'(?:{pattern.pattern})' for _, pattern in self._patterns)
+        self._combined = re.compile(f'(?=(?:{combined}))', flags) if self._patterns else None
+
+    def scan(self, text: str) -> Dict[str, List[Tuple[int, int]]]:
+        """Retorna, por rótulo, os intervalos (início, fim) sem sobreposição de cada padrão
+
+        O resultado é o mesmo de ``finditer`` de cada padrão: rótulos com vários
+        padrões trazem os intervalos do primeiro padrão, depois os do segundo etc.
+        """
+        pattern_hits: List[List[Tuple[int, int]]] = [[] for _ in self._patterns]
+        if self._combined is not None:
+            last_end = [0] * len(self._patterns)
+            for candidate in self._combined.finditer(text):
+                position = candidate.start()
+                for index, (label, pattern) in enumerate(self._patterns):
+                    if position < last_end[index]:
+                        continue
+                    match = pattern.match(text, position)
+                    if match and match.end() > position:
+                        pattern_hits[index].append((position, match.end()))
+                        last_end[index] = match.end()
+
+        hits: Dict[str, List[Tuple[int, int]]] = {label: [] for label, _ in self._patterns}
+        for (label, _), intervals in zip(self._patterns, pattern_hits):
+            hits[label].extend(intervals)
+        return hits
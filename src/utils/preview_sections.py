@@ -0,0 +1,127 @@
+import re
+import json
+import hashlib
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .generation_cache import normalize_answers
+
+TOTAL_SECTIONS = 14
+
+# Respostas do ETP (ids de ETP_QUESTIONS) e as seções do preview que dependem delas
+ANSWER_SECTION_DEPENDENCIES: Dict[str, List[int]] = {
+    '1': [1, 2, 3, 5, 7, 9, 11, 12, 13, 14],  # Necessidade da contratação
+    '2': [1, 10],                              # Previsão no PCA
+    '3': [1, 3, 13],                           # Normas legais
+    '4': [4, 5, 6, 14],                        # Quantitativo e valor estimado
+    '5': [8, 14],                              # Parcelamento
+}
+
+# Título de seção principal: "6. ESTIMATIVA DO VALOR..." (não casa subseções "6.1")
+_SECTION_TITLE_RE = re.compile(r'^\s*(?:#+\s*)?(?:\*\*)?(\d{1,2})\.\s+(?=[A-ZÁÉÍÓÚÂÊÔÃÕÇ])')
+_FEEDBACK_NUMBER_RE = re.compile(r'\b(?:se[cç][aã]o|se[cç][oõ]es|item|itens|t[oó]pico)\s+((?:\d{1,2}(?:\s*(?:,|e)\s*)?)+)', re.IGNORECASE)
+_STOPWORDS = {'da', 'de', 'do', 'das', 'dos', 'e', 'ou', 'nao', 'como', 'um', 'todo', 'pela', 'para'}
+
+
+def _strip_accents(text: str) -> str:
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+
+
+def split_preview_sections(preview_content: str) -> Tuple[str, List[Dict], str]:
+    """Divide o preview em (preâmbulo, seções numeradas, rodapé)
+
+    Cada seção é um dicionário com ``number``, ``title`` e ``content`` (texto
+    completo da seção, incluindo a linha do título).
+    """
+    lines = (preview_content or '').split('\n')
+    preamble_lines: List[str] = []
+    trailer_lines: List[str] = []
+    sections: List[Dict] = []
+    current: Optional[Dict] = None
+
+    for line in lines:
+        match = _SECTION_TITLE_RE.match(line)
+        number = int(match.group(1)) if match else None
+
+        if number and 1 <= number <= TOTAL_SECTIONS and (current is None or number > current['number']):
+            current = {'number': number, 'title': line.strip().strip('*#').strip(), 'lines': [line]}
+            sections.append(current)
+        elif current is None:
+            preamble_lines.append(line)
+        else:
+            current['lines'].append(line)
+
+    # Rodapé padrão ("---" + conformidade/data) após a última seção
+    if sections:
+        last_lines = sections[-1]['lines']
+        for index in range(len(last_lines) - 1, 0, -1):
+            if last_lines[index].strip() == '---':
+                trailer_lines = last_lines[index:]
+                del last_lines[index:]
+                break
+
+    result = []
+    for section in sections:
+        result.append({
+            'number': section['number'],
+            'title': section['title'],
+            'content': '\n'.join(section['lines']).strip()
+        })
+
+    return '\n'.join(preamble_lines).strip(), result, '\n'.join(trailer_lines).strip()
+
+
+def join_preview_sections(preamble: str, sections: Iterable[Dict], trailer: str = '') -> str:
+    """Remonta o preview a partir das seções (ordenadas pelo número)"""
+    parts = [preamble.strip()] if preamble and preamble.strip() else []
+    parts.extend(section['content'].strip() for section in sorted(sections, key=lambda s: s['number']))
+    if trailer and trailer.strip():
+        parts.append(trailer.strip())
+    return '\n\n'.join(parts)
+
+
+def section_dependencies(section_number: int) -> List[str]:
+    """Ids das respostas das quais a seção depende"""
+    return [answer_id for answer_id, sections in ANSWER_SECTION_DEPENDENCIES.items() if section_number in sections]
+
+
+def section_answers_fingerprint(section_number: int, answers: Dict) -> str:
+    """Hash das respostas (normalizadas) usadas por uma seção"""
+    normalized = normalize_answers(answers)
+    relevant = {answer_id: normalized.get(answer_id, '') for answer_id in section_dependencies(section_number)}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def changed_answer_ids(old_answers: Dict, new_answers: Dict) -> Set[str]:
+    """Ids das respostas que mudaram (após normalização)"""
+    old_normalized = normalize_answers(old_answers)
+    new_normalized = normalize_answers(new_answers)
+    return {
+        answer_id for answer_id in set(old_normalized) | set(new_normalized)
+        if old_normalized.get(answer_id, '') != new_normalized.get(answer_id, '')
+    }
+
+
+def detect_feedback_sections(feedback: str, sections: List[Dict]) -> Set[int]:
+    """Identifica as seções citadas no feedback (por número ou por palavras do título)"""
+    feedback = feedback or ''
+    available = {section['number'] for section in sections}
+    targets: Set[int] = set()
+
+    # Referências explícitas: "seção 6", "seções 4 e 6", "item 13"
+    for match in _FEEDBACK_NUMBER_RE.finditer(feedback):
+        for number in re.findall(r'\d{1,2}', match.group(1)):
+            if int(number) in available:
+                targets.add(int(number))
+    if targets:
+        return targets
+
+    # Sem número: procurar o título da seção no texto do feedback
+    normalized_feedback = _strip_accents(feedback.lower())
+    for section in sections:
+        title = re.sub(r'^\s*\d{1,2}\.\s*', '', section['title'])
+        words = [w for w in re.findall(r'\w+', _strip_accents(title.lower())) if len(w) > 3 and w not in _STOPWORDS]
+        if words and all(word in normalized_feedback for word in words[:2]):
+            targets.add(section['number'])
+
+    return targets
@@ -0,0 +1,148 @@
+import os
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # contagem exata é opcional; sem tiktoken usa-se uma estimativa por caracteres
+    tiktoken = None
+
+# Limites por modelo: (janela de contexto, máximo de tokens de saída)
+MODEL_LIMITS: Dict[str, Tuple[int, int]] = {
+    'gpt-4': (8192, 4096),
+    'gpt-4-turbo': (128000, 4096),
+    'gpt-4o': (128000, 16384),
+    'gpt-4o-mini': (128000, 16384),
+    'gpt-4.1': (1047576, 32768),
+    'gpt-4.1-mini': (1047576, 32768),
+    'gpt-4.1-nano': (1047576, 32768),
+    'gpt-3.5-turbo': (16385, 4096),
+}
+DEFAULT_MODEL_LIMITS = (8192, 4096)
+
+# Orçamento de tokens do contexto suplementar (documento analisado e base de conhecimento; as
+# respostas do usuário entram sempre inteiras). Equivale aos cortes anteriores de 2000/1000
+# caracteres; valores maiores são opcionais via ETP_CONTEXT_TOKEN_BUDGET.
+MODEL_CONTEXT_BUDGETS: Dict[str, int] = {
+    'gpt-4.1-mini': 250,
+    'gpt-4.1-nano': 250,
+}
+DEFAULT_CONTEXT_BUDGET = 500
+
+# Tamanho esperado da saída: tokens por parágrafo de 4-8 linhas e acréscimos por estrutura
+TOKENS_PER_PARAGRAPH = int(os.getenv('ETP_TOKENS_PER_PARAGRAPH', '170'))
+SECTION_TITLE_TOKENS = 40
+SUBSECTION_TOKENS = 40
+TABLE_TOKENS = 350
+OUTPUT_HEADROOM = 1.2
+MIN_OUTPUT_TOKENS = 256
+
+# Caracteres por token usados na estimativa (português tende a ~3,5)
+CHARS_PER_TOKEN = 3.5
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _get_encoding(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    key = model or 'default'
+    with _encodings_lock:
+        if key not in _encodings:
+            try:
+                _encodings[key] = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding('cl100k_base')
+            except Exception:
+                _encodings[key] = tiktoken.get_encoding('cl100k_base')
+        return _encodings[key]
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Número de tokens do texto (exato com tiktoken, estimado sem ele)"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None, marker: str = '...') -> str:
+    """Corta o texto para caber em ``max_tokens`` (preferindo o fim de uma palavra)"""
+    if not text or count_tokens(text, model) <= max_tokens:
+        return text or ''
+    # O marcador também conta no limite
+    max_tokens -= count_tokens(marker, model)
+    if max_tokens <= 0:
+        return ''
+
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        truncated = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        truncated = text[:int(max_tokens * CHARS_PER_TOKEN)]
+
+    cut = truncated.rfind(' ')
+    if cut > len(truncated) * 0.8:
+        truncated = truncated[:cut]
+    return truncated.rstrip() + marker
+
+
+def context_budget(model: str) -> int:
+    """Orçamento de tokens para o contexto variável do prompt de um modelo"""
+    override = os.getenv('ETP_CONTEXT_TOKEN_BUDGET')
+    if override:
+        return int(override)
+    return MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+
+def fit_context(blocks: Iterable[Tuple[str, str]], budget: int, model: Optional[str] = None) -> str:
+    """Monta o contexto a partir de blocos (título, texto) em ordem de prioridade
+
+    Os blocos entram inteiros enquanto houver orçamento; o primeiro que não
+    cabe é cortado no espaço restante e os seguintes são descartados.
+    """
+    parts: List[str] = []
+    remaining = budget
+    for title, text in blocks:
+        if not text or not text.strip():
+            continue
+        block = f"{title}\n{text.strip()}" if title else text.strip()
+        block_tokens = count_tokens(block, model)
+        if block_tokens <= remaining:
+            parts.append(block)
+            remaining -= block_tokens
+            continue
+        title_tokens = count_tokens(title, model) + 1 if title else 0
+        if remaining - title_tokens > MIN_OUTPUT_TOKENS // 4:
+            trimmed = truncate_to_tokens(text.strip(), remaining - title_tokens, model)
+            parts.append(f"{title}\n{trimmed}" if title else trimmed)
+        break
+    return '\n\n'.join(parts)
+
+
+def expected_section_tokens(section_info: Dict, paragraphs: Optional[int] = None) -> int:
+    """Tamanho esperado (em tokens) de uma seção do ETP a partir de ``min_paragraphs``"""
+    if paragraphs is None:
+        paragraphs = section_info.get('min_paragraphs', 8)
+    tokens = SECTION_TITLE_TOKENS + paragraphs * TOKENS_PER_PARAGRAPH
+    tokens += SUBSECTION_TOKENS * len(section_info.get('subsections', []))
+    if section_info.get('requires_table'):
+        tokens += TABLE_TOKENS
+    return tokens
+
+
+def max_output_tokens(model: str, expected_tokens: int, prompt_tokens: int = 0) -> int:
+    """``max_tokens`` da chamada: saída esperada com folga, limitada pelo modelo e pela janela"""
+    context_window, output_limit = MODEL_LIMITS.get(model, DEFAULT_MODEL_LIMITS)
+    tokens = math.ceil(expected_tokens * OUTPUT_HEADROOM)
+    tokens = min(tokens, output_limit, context_window - prompt_tokens - 64)
+    return max(MIN_OUTPUT_TOKENS, tokens)
+
+
+def max_tokens_for_sections(model: str, sections: Iterable[Dict], paragraphs: Optional[int] = None,
+                            prompt: str = '') -> int:
+    """``max_tokens`` para um prompt que gera várias seções de uma vez"""
+    expected = sum(expected_section_tokens(section_info, paragraphs) for section_info in sections)
+    return max_output_tokens(model, expected, count_tokens(prompt, model))
@@ -0,0 +1,168 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from typing import Callable, Dict, Optional
+
+from .generation_cache import DATABASE_DIR
+
+# Travas por chave em número fixo (a chave escolhe a trava pelo hash)
+KEY_LOCK_STRIPES = 64
+
+
+class RenderCache:
+    """Cache em disco dos documentos renderizados (DOCX, HTML, PDF)
+
+    Os arquivos são endereçados pelo hash do conteúdo, do formatador, da versão
+    do formatador e dos metadados usados na renderização; o mesmo ETP nunca é
+    formatado duas vezes. O último acesso é a data de modificação do arquivo, e
+    os menos usados são removidos quando o total passa de ``max_bytes``.
+    Referências nomeadas (ex.: último HTML de uma sessão) apontam para as chaves.
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        if cache_dir is None:
+            cache_dir = os.getenv('ETP_RENDER_CACHE_DIR', os.path.join(DATABASE_DIR, 'render_cache'))
+        if max_bytes is None:
+            max_bytes = int(os.getenv('ETP_RENDER_CACHE_MAX_MB', '200')) * 1024 * 1024
+
+        self.cache_dir = cache_dir
+        self.refs_dir = os.path.join(cache_dir, 'refs')
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        os.makedirs(self.refs_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content: str, formatter: str, formatter_version: str, metadata: Optional[Dict] = None) -> str:
+        """Hash do conteúdo e de tudo que influencia o arquivo renderizado"""
+        payload = json.dumps({
+            'content': content or '',
+            'formatter': formatter,
+            'formatter_version': formatter_version,
+            'metadata': metadata or {}
+        }, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{extension.lstrip('.')}")
+
+    def get(self, key: str, extension: str) -> Optional[str]:
+        """Caminho do artefato em cache (atualizando o último acesso) ou ``None``"""
+        path = self.path_for(key, extension)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._hits += 1
+        return path
+
+    def put_file(self, key: str, extension: str, source_path: str) -> str:
+        """Move um arquivo já renderizado para o cache e retorna o novo caminho"""
+        path = self.path_for(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Cópia para arquivo temporário na mesma pasta + rename: leitores nunca veem arquivo parcial
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        shutil.move(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        self._evict()
+        return path
+
+    def put_bytes(self, key: str, extension: str, data) -> str:
+        """Grava o conteúdo renderizado (bytes ou texto UTF-8) no cache"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return self.put_file(key, extension, tmp_path)
+
+    def get_or_render(self, key: str, extension: str, render: Callable[[], str]) -> str:
+        """Retorna o artefato em cache ou renderiza (``render`` devolve o caminho gerado)"""
+        # Requisições simultâneas do mesmo documento renderizam uma única vez
+        with self._key_lock(key, extension):
+            path = self.get(key, extension)
+            if path is None:
+                path = self.put_file(key, extension, render())
+        return path
+
+    def _key_lock(self, key: str, extension: str) -> threading.Lock:
+        """Trava da chave; chaves diferentes podem compartilhar a mesma trava"""
+        digest = hashlib.sha256(f"{key}.{extension}".encode('utf-8')).digest()
+        return self._key_locks[int.from_bytes(digest[:4], 'big') % len(self._key_locks)]
+
+    def set_ref(self, name: str, key: str):
+        """Aponta uma referência nomeada para uma chave do cache"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.refs_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(key)
+        os.replace(tmp_path, self._ref_path(name))
+
+    def get_ref(self, name: str) -> Optional[str]:
+        try:
+            with open(self._ref_path(name), 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _ref_path(self, name: str) -> str:
+        return os.path.join(self.refs_dir, hashlib.sha256(name.encode('utf-8')).hexdigest())
+
+    def _artifacts(self):
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or entry.path == self.refs_dir:
+                continue
+            for artifact in os.scandir(entry.path):
+                if artifact.is_file() and not artifact.name.endswith('.tmp'):
+                    yield artifact
+
+    def _evict(self):
+        """Remove os artefatos menos acessados até o total caber em ``max_bytes``"""
+        with self._lock:
+            artifacts = [(a.stat().st_mtime, a.stat().st_size, a.path) for a in self._artifacts()]
+            total = sum(size for _, size, _ in artifacts)
+            for _, size, path in sorted(artifacts):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    self._evictions += 1
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            artifacts = list(self._artifacts())
+            return {
+                'cache_dir': self.cache_dir,
+                'artifacts': len(artifacts),
+                'size_bytes': sum(a.stat().st_size for a in artifacts),
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions
+            }
+
+
+_render_cache: Optional[RenderCache] = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> RenderCache:
+    """Retorna a instância do cache de documentos compartilhada pelo processo"""
+    global _render_cache
+    if _render_cache is None:
+        with _render_cache_lock:
+            if _render_cache is None:
+                _render_cache = RenderCache()
+    return _render_cache
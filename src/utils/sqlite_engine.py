@@ -0,0 +1,72 @@
+import os
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def sqlite_pragmas() -> Dict[str, str]:
+    """PRAGMAs aplicados em cada conexão nova (ordem importa: journal_mode primeiro)"""
+    return {
+        # Leitores não bloqueiam o escritor (e vice-versa) entre os workers do gunicorn
+        'journal_mode': 'WAL',
+        # Com WAL, NORMAL só sincroniza no checkpoint: sem risco de corromper o banco
+        'synchronous': 'NORMAL',
+        # Espera o lock em vez de falhar imediatamente com "database is locked"
+        'busy_timeout': os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'),
+        'mmap_size': os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+        # Valor negativo = KiB de cache de páginas por conexão
+        'cache_size': os.getenv('SQLITE_CACHE_SIZE', '-16000'),
+        'temp_store': 'MEMORY',
+    }
+
+
+def sqlite_engine_options() -> Dict:
+    """Opções do engine (SQLALCHEMY_ENGINE_OPTIONS) para o SQLite em arquivo"""
+    busy_timeout_ms = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    return {
+        'connect_args': {
+            'timeout': busy_timeout_ms / 1000,
+            # Conexões do pool são usadas por threads diferentes (fila de jobs, streaming)
+            'check_same_thread': False,
+        },
+        'pool_size': int(os.getenv('SQLITE_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('SQLITE_POOL_MAX_OVERFLOW', '20')),
+        'pool_timeout': float(os.getenv('SQLITE_POOL_TIMEOUT', '30')),
+        # Conexão local: não há o que reciclar nem testar antes do uso
+        'pool_pre_ping': False,
+    }
+
+
+def configure_sqlite_engine(engine: Engine) -> bool:
+    """Registra os PRAGMAs no evento de conexão do engine (apenas SQLite)"""
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    # Conexões já abertas no pool foram criadas sem os PRAGMAs
+    engine.dispose()
+    return True
+
+
+def get_sqlite_settings(engine: Engine) -> Dict:
+    """Valores efetivos dos PRAGMAs em uma conexão do pool (diagnóstico)"""
+    if engine.dialect.name != 'sqlite':
+        return {}
+    settings = {}
+    with engine.connect() as connection:
+        for name in sqlite_pragmas():
+            settings[name] = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+    pool = engine.pool
+    settings['pool'] = pool.status() if hasattr(pool, 'status') else type(pool).__name__
+    return settings
@@ -0,0 +1,26 @@
+import json
+from typing import Dict, Iterable
+
+from flask import Response, stream_with_context
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """Formata um evento Server-Sent Events com payload JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def streaming_response(events: Iterable[str]) -> Response:
+    """Resposta text/event-stream sem buffer intermediário (proxy/servidor)"""
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def attachment_response(chunks: Iterable[bytes], mimetype: str, download_name: str) -> Response:
+    """Download enviado à medida que o arquivo é gerado (sem Content-Length)"""
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
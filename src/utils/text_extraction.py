@@ -0,0 +1,151 @@
+import io
+import os
+import multiprocessing
+import concurrent.futures
+from typing import Iterator, Iterable, List, Optional, Tuple
+
+from PyPDF2 import PdfReader
+from docx import Document
+
+# Orçamento padrão de extração (o analisador envia no máximo 8000 caracteres à IA)
+DEFAULT_MAX_PAGES = int(os.getenv('ETP_EXTRACT_MAX_PAGES', '60'))
+DEFAULT_MAX_CHARS = int(os.getenv('ETP_EXTRACT_MAX_CHARS', '24000'))
+
+# PDFs a partir deste número de páginas são extraídos em um pool de processos
+PARALLEL_MIN_PAGES = int(os.getenv('ETP_EXTRACT_PARALLEL_MIN_PAGES', '24'))
+PARALLEL_WORKERS = int(os.getenv('ETP_EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = 4
+
+_worker_reader = None
+
+
+def _init_pdf_worker(file_content: bytes):
+    """Abre o PDF uma única vez em cada processo do pool"""
+    global _worker_reader
+    _worker_reader = PdfReader(io.BytesIO(file_content))
+
+
+def _extract_page(reader: PdfReader, page_index: int) -> str:
+    try:
+        page_text = reader.pages[page_index].extract_text() or ''
+    except Exception as e:
+        return f"\n--- Erro na página {page_index + 1}: {str(e)} ---\n"
+    if not page_text:
+        return ''
+    return f"\n--- Página {page_index + 1} ---\n{page_text}\n"
+
+
+def _extract_page_range(start: int, end: int) -> List[str]:
+    return [_extract_page(_worker_reader, index) for index in range(start, end)]
+
+
+def _process_pool(file_content: bytes, workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    # "fork" evita reimportar o módulo principal da aplicação em cada processo
+    start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=_init_pdf_worker,
+        initargs=(file_content,)
+    )
+
+
+def iter_pdf_pages(file_content: bytes, max_pages: Optional[int] = None,
+                   workers: Optional[int] = None) -> Iterator[str]:
+    """Gera o texto do PDF página a página, na ordem do documento
+
+    Arquivos grandes são divididos em blocos de páginas extraídos em paralelo;
+    apenas uma janela de blocos fica em andamento, de modo que interromper o
+    consumo do gerador cancela o restante do trabalho.
+    """
+    reader = PdfReader(io.BytesIO(file_content))
+    total_pages = len(reader.pages)
+    if max_pages:
+        total_pages = min(total_pages, max_pages)
+
+    workers = PARALLEL_WORKERS if workers is None else workers
+    if workers <= 1 or total_pages < PARALLEL_MIN_PAGES:
+        for page_index in range(total_pages):
+            yield _extract_page(reader, page_index)
+        return
+
+    ranges = [(start, min(start + PAGES_PER_TASK, total_pages)) for start in range(0, total_pages, PAGES_PER_TASK)]
+    executor = _process_pool(file_content, workers)
+    try:
+        in_flight: List[concurrent.futures.Future] = []
+        next_range = 0
+        while next_range < len(ranges) or in_flight:
+            while next_range < len(ranges) and len(in_flight) < workers * 2:
+                in_flight.append(executor.submit(_extract_page_range, *ranges[next_range]))
+                next_range += 1
+            for page_text in in_flight.pop(0).result():
+                yield page_text
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_docx_blocks(file_content: bytes) -> Iterator[str]:
+    """Gera o texto de um DOCX: parágrafos e, em seguida, tabelas"""
+    doc = Document(io.BytesIO(file_content))
+
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            yield paragraph.text + "\n"
+
+    for table in doc.tables:
+        yield "\n--- Tabela ---\n"
+        for row in table.rows:
+            row_text = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+            if row_text:
+                yield " | ".join(row_text) + "\n"
+
+
+def iter_txt_blocks(file_content: bytes, block_size: int = 8192) -> Iterator[str]:
+    """Gera o texto de um arquivo .txt em blocos"""
+    for encoding in ('utf-8', 'latin-1'):
+        try:
+            text = file_content.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    for start in range(0, len(text), block_size):
+        yield text[start:start + block_size]
+
+
+def iter_document_text(file_content: bytes, file_extension: str, max_pages: Optional[int] = None) -> Iterator[str]:
+    """Gera o texto do documento em partes, conforme o tipo de arquivo"""
+    file_extension = file_extension.lower()
+    if file_extension == '.pdf':
+        return iter_pdf_pages(file_content, max_pages=max_pages)
+    if file_extension in ('.doc', '.docx'):
+        return iter_docx_blocks(file_content)
+    if file_extension == '.txt':
+        return iter_txt_blocks(file_content)
+    raise ValueError(f"Tipo de arquivo não suportado: {file_extension}")
+
+
+def collect_text(chunks: Iterable[str], max_chars: Optional[int] = None) -> Tuple[str, bool]:
+    """Junta as partes em tempo linear, parando ao atingir ``max_chars``
+
+    Retorna o texto e se ele foi truncado pelo orçamento.
+    """
+    parts: List[str] = []
+    total = 0
+    for chunk in chunks:
+        if max_chars and total + len(chunk) >= max_chars:
+            parts.append(chunk[:max_chars - total])
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            return ''.join(parts), True
+        parts.append(chunk)
+        total += len(chunk)
+    return ''.join(parts), False
+
+
+def extract_document_text(file_content: bytes, file_extension: str, max_pages: Optional[int] = None,
+                          max_chars: Optional[int] = None) -> str:
+    """Extrai o texto do documento respeitando o orçamento de páginas/caracteres"""
+    max_pages = DEFAULT_MAX_PAGES if max_pages is None else max_pages
+    max_chars = DEFAULT_MAX_CHARS if max_chars is None else max_chars
+    text, _ = collect_text(iter_document_text(file_content, file_extension, max_pages=max_pages), max_chars)
+    return text
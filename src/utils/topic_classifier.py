@@ -0,0 +1,89 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List
+
+# Vocabulários na ordem de prioridade da classificação
+VOCABULARIES = ('forbidden', 'allowed', 'context')
+
+
+def fold_text(text: str) -> str:
+    """Minúsculas e sem acentos (comparação insensível a acentuação)"""
+    # Decomposição + descarte do que não é ASCII: acentos e símbolos somem em código C
+    return unicodedata.normalize('NFKD', (text or '').casefold()).encode('ascii', 'ignore').decode('ascii')
+
+
+def _trie_pattern(node: Dict) -> str:
+    """Expressão regular de uma trie: alternativas só divergem no caractere que as distingue"""
+    end = '' in node
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    return f"(?:{body})?" if end else body
+
+
+def _alternation(terms: Iterable[str]) -> str:
+    """Padrão compilado (trie) para os termos sem acentos; espaços casam qualquer espaçamento"""
+    trie: Dict = {}
+    for term in terms:
+        folded = ' '.join(fold_text(term).split())
+        if not folded:
+            continue
+        node = trie
+        for char in folded:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return _trie_pattern(trie).replace(re.escape(' '), r'\s+')
+
+
+class TopicClassifier:
+    """Classificador de tópicos do chat compilado em uma única expressão regular
+
+    Os três vocabulários (termos proibidos, tópicos permitidos e radicais de
+    contexto) viram grupos nomeados de um só padrão, aplicado uma vez sobre o
+    texto sem acentos. Termos casam por palavra inteira; radicais de contexto
+    ("licit", "contrat") casam em qualquer ponto da palavra, como nos laços
+    de substring anteriores.
+
+    Não é mais rápido que esses laços (cerca de 10 µs contra 6 µs por mensagem
+    no micro-benchmark de test_topic_classifier.py, por causa da remoção de
+    acentos e da busca por palavra): o ganho é de precisão ("amor" não bloqueia
+    "amortização", "PREGAO" casa "pregão") e os termos encontrados na resposta.
+    O custo continua desprezível diante da chamada ao modelo.
+    """
+
+    def __init__(self, forbidden: Iterable[str], allowed: Iterable[str], context: Iterable[str]):
+        # Alternativas só são testadas no início de palavras (\b fatorado para fora dos grupos);
+        # o radical de contexto pode estar em qualquer ponto da palavra ("subcontratação")
+        self.pattern = re.compile(
+            rf"\b(?:(?P<forbidden>{_alternation(forbidden)})\b"
+            rf"|(?P<allowed>{_alternation(allowed)})\b"
+            rf"|(?P<context>\w*?(?:{_alternation(context)})\w*))"
+        )
+
+    def find_terms(self, text: str) -> Dict[str, List[str]]:
+        """Termos encontrados no texto, por vocabulário, em uma passada"""
+        matched = {vocabulary: [] for vocabulary in VOCABULARIES}
+        for match in self.pattern.finditer(fold_text(text)):
+            terms = matched[match.lastgroup]
+            term = ' '.join(match.group().split())
+            if term not in terms:
+                terms.append(term)
+        return matched
+
+    def classify(self, text: str) -> Dict:
+        """Decide se a mensagem está no escopo e informa os termos que levaram à decisão"""
+        matched = self.find_terms(text)
+        if matched['forbidden']:
+            return {
+                'allowed': False,
+                'reason': 'Sua pergunta parece estar fora do escopo de compras públicas e licitações.',
+                'matched': matched
+            }
+        if matched['allowed'] or matched['context']:
+            return {'allowed': True, 'reason': '', 'matched': matched}
+        return {
+            'allowed': False,
+            'reason': 'Não identifiquei sua pergunta como relacionada a compras públicas ou licitações.',
+            'matched': matched
+        }
@@ -1,8 +1,7 @@
 import os
 import tempfile
-import re
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from docx import Document
 from docx.shared import Inches, Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
@@ -11,6 +10,8 @@ from docx.oxml.shared import OxmlElement, qn
 from docx.oxml.ns import nsdecls
 from docx.oxml import parse_xml
 
+from .etp_content_parser import parse_etp_content
+
 class ProfessionalWordFormatter:
     """Formatador profissional de documentos Word para ETP"""
     
@@ -69,9 +70,10 @@ class ProfessionalWordFormatter:
     def _create_custom_styles(self, doc: Document):
         """Cria estilos personalizados para o documento"""
         styles = doc.styles
+        existing = {style.name for style in styles}
         
         # Estilo para títulos principais (com fundo azul)
-        if 'Titulo Principal ETP' not in [s.name for s in styles]:
+        if 'Titulo Principal ETP' not in existing:
             title_style = styles.add_style('Titulo Principal ETP', WD_STYLE_TYPE.PARAGRAPH)
             
             # Formatação do parágrafo
@@ -89,7 +91,7 @@ class ProfessionalWordFormatter:
             title_font.color.rgb = self.white_color
         
         # Estilo para subtítulos
-        if 'Subtitulo ETP' not in [s.name for s in styles]:
+        if 'Subtitulo ETP' not in existing:
             subtitle_style = styles.add_style('Subtitulo ETP', WD_STYLE_TYPE.PARAGRAPH)
             
             subtitle_format = subtitle_style.paragraph_format
@@ -105,7 +107,7 @@ class ProfessionalWordFormatter:
             subtitle_font.color.rgb = RGBColor(0, 0, 0)
         
         # Estilo para corpo do texto
-        if 'Corpo Texto ETP' not in [s.name for s in styles]:
+        if 'Corpo Texto ETP' not in existing:
             body_style = styles.add_style('Corpo Texto ETP', WD_STYLE_TYPE.PARAGRAPH)
             
             body_format = body_style.paragraph_format
@@ -181,68 +183,20 @@ class ProfessionalWordFormatter:
     
     def _process_and_add_content(self, doc: Document, content: str):
         """Processa e adiciona o conteúdo principal do ETP"""
-        lines = content.split('\n')
-        current_paragraph = []
-        
-        for line in lines:
-            line = line.strip()
-            
-            if not line:
-                # Linha vazia - finalizar parágrafo atual se houver
-                if current_paragraph:
-                    self._add_paragraph_to_doc(doc, '\n'.join(current_paragraph))
-                    current_paragraph = []
-                continue
-            
-            # Identificar tipo de linha
-            if self._is_main_section_title(line):
-                # Finalizar parágrafo anterior
-                if current_paragraph:
-                    self._add_paragraph_to_doc(doc, '\n'.join(current_paragraph))
-                    current_paragraph = []
-                
+        for node in parse_etp_content(content):
+            if node.kind == 'section':
                 # Adicionar título principal
-                self._add_main_section_title(doc, line)
-                
-            elif self._is_subsection_title(line):
-                # Finalizar parágrafo anterior
-                if current_paragraph:
-                    self._add_paragraph_to_doc(doc, '\n'.join(current_paragraph))
-                    current_paragraph = []
-                
+                self._add_main_section_title(doc, node.text)
+            elif node.kind == 'subsection':
                 # Adicionar subtítulo
-                self._add_subsection_title(doc, line)
-                
-            elif self._is_table_content(line):
-                # Finalizar parágrafo anterior
-                if current_paragraph:
-                    self._add_paragraph_to_doc(doc, '\n'.join(current_paragraph))
-                    current_paragraph = []
-                
+                self._add_subsection_title(doc, node.text)
+            elif node.kind == 'table':
                 # Processar tabela
-                self._add_table_content(doc, line)
-                
+                self._add_table_content(doc, node.rows)
+            elif node.kind == 'bullet':
+                self._add_paragraph_to_doc(doc, f"• {node.text}")
             else:
-                # Conteúdo normal - adicionar ao parágrafo atual
-                current_paragraph.append(line)
-        
-        # Finalizar último parágrafo
-        if current_paragraph:
-            self._add_paragraph_to_doc(doc, '\n'.join(current_paragraph))
-    
-    def _is_main_section_title(self, line: str) -> bool:
-        """Verifica se a linha é um título de seção principal"""
-        pattern = r'^\d+\.\s+[A-ZÁÀÂÃÉÊÍÓÔÕÚÇ\s]+$'
-        return bool(re.match(pattern, line.upper()))
-    
-    def _is_subsection_title(self, line: str) -> bool:
-        """Verifica se a linha é um título de subseção"""
-        pattern = r'^\d+\.\d+\s+[A-Za-záàâãéêíóôõúç\s]+'
-        return bool(re.match(pattern, line))
-    
-    def _is_table_content(self, line: str) -> bool:
-        """Verifica se a linha contém conteúdo de tabela"""
-        return '|' in line and line.count('|') >= 2
+                self._add_paragraph_to_doc(doc, node.text)
     
     def _add_main_section_title(self, doc: Document, title: str):
         """Adiciona título de seção principal com fundo azul"""
@@ -260,29 +214,27 @@ class ProfessionalWordFormatter:
         if text.strip():
             doc.add_paragraph(text, style='Corpo Texto ETP')
     
-    def _add_table_content(self, doc: Document, table_line: str):
+    def _add_table_content(self, doc: Document, table_rows: Tuple[Tuple[str, ...], ...]):
         """Adiciona conteúdo de tabela formatada"""
-        # Dividir linha por |
-        cells = [cell.strip() for cell in table_line.split('|') if cell.strip()]
+        rows = [row for row in table_rows if len(row) >= 2]
+        if not rows:
+            return
         
-        if len(cells) >= 2:
-            # Criar tabela simples
-            table = doc.add_table(rows=1, cols=len(cells))
-            table.style = 'Table Grid'
-            
-            # Adicionar dados
-            row = table.rows[0]
-            for i, cell_text in enumerate(cells):
-                if i < len(row.cells):
-                    cell = row.cells[i]
-                    cell.text = cell_text
-                    
-                    # Formatação da célula
-                    for paragraph in cell.paragraphs:
-                        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        for run in paragraph.runs:
-                            run.font.name = 'Arial'
-                            run.font.size = Pt(10)
+        cols = max(len(row) for row in rows)
+        table = doc.add_table(rows=len(rows), cols=cols)
+        table.style = 'Table Grid'
+        
+        # Adicionar dados
+        for row, cells in zip(table.rows, rows):
+            for cell, cell_text in zip(row.cells, cells):
+                cell.text = cell_text
+                
+                # Formatação da célula
+                for paragraph in cell.paragraphs:
+                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                    for run in paragraph.runs:
+                        run.font.name = 'Arial'
+                        run.font.size = Pt(10)
     
     def _add_blue_background(self, paragraph):
         """Adiciona fundo azul escuro ao parágrafo"""
@@ -1,8 +1,8 @@
 import os
 import tempfile
-import re
+import threading
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, Optional, Tuple
 from docx import Document
 from docx.shared import Inches, Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
@@ -12,51 +12,116 @@ from docx.oxml.shared import OxmlElement, qn
 from docx.oxml.ns import nsdecls
 from docx.oxml import parse_xml
 
+from .docx_template import DocxSkeleton, paragraph_xml, run_xml
+from .etp_content_parser import iter_etp_nodes
+
 class WordFormatterWithBorders:
     """Formatador Word com bordas baseado no modelo da concorrência"""
     
+    # Versão do layout; alterar invalida os documentos no cache de renderização
+    FORMATTER_VERSION = "bordas-v3"
+    
+    # Marcadores do esqueleto: parágrafo substituído pelo corpo e data do rodapé
+    BODY_MARKER = '__ETP_CONTEUDO__'
+    DATE_MARKER = '__ETP_DATA_ELABORACAO__'
+    
+    # Esqueleto montado uma vez por processo (estilos, cabeçalho, rodapé e bordas)
+    _skeleton = None
+    _skeleton_lock = threading.Lock()
+    
     def __init__(self):
         self.blue_color = RGBColor(31, 78, 121)  # Azul escuro #1f4e79
         self.white_color = RGBColor(255, 255, 255)  # Branco
         self.black_color = RGBColor(0, 0, 0)  # Preto
         
-    def create_document_with_borders(self, content: str, session_data: Dict = None) -> str:
-        """Cria documento Word com bordas e formatação baseada no modelo da concorrência"""
+    def create_document_with_borders(self, content: str, session_data: Dict = None,
+                                     progress_callback: Callable[[int], None] = None) -> str:
+        """Cria documento Word com bordas e formatação baseada no modelo da concorrência
+
+        As partes fixas vêm do esqueleto pré-montado; só o corpo é gerado, em XML.
+        ``progress_callback`` recebe o percentual concluído (0-100) a cada etapa.
+        """
+        def report(percent):
+            if progress_callback:
+                progress_callback(percent)
+        
         try:
-            doc = Document()
-            
-            # Configurar página e margens
-            self._configure_page_with_borders(doc)
-            
-            # Criar estilos personalizados
-            self._create_custom_styles(doc)
+            skeleton = self._get_skeleton()
+            report(15)
             
-            # Adicionar cabeçalho institucional
-            self._add_institutional_header(doc, session_data)
-            
-            # Adicionar título principal com fundo azul
-            self._add_main_title_with_background(doc)
-            
-            # Adicionar introdução em caixa
-            self._add_introduction_box(doc)
-            
-            # Processar e adicionar conteúdo com formatação
-            self._process_content_with_formatting(doc, content)
-            
-            # Adicionar rodapé
-            self._add_footer_with_info(doc)
-            
-            # Aplicar bordas ao documento inteiro
-            self._apply_document_borders(doc)
-            
-            # Salvar documento
-            doc_path = self._save_document_with_timestamp(doc)
+            # Corpo gerado trecho a trecho direto no zip do documento
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".docx", prefix="etp_") as tmp:
+                skeleton['template'].render(
+                    self._iter_content_xml(content, report), tmp, self._text_replacements()
+                )
+                doc_path = tmp.name
+            report(100)
             
             return doc_path
             
         except Exception as e:
             raise Exception(f"Erro ao criar documento Word com bordas: {str(e)}")
     
+    def stream_document_with_borders(self, content: str, session_data: Dict = None) -> Iterator[bytes]:
+        """Gera os bytes do documento Word com bordas enquanto ele é montado
+
+        A memória usada não depende do tamanho do ETP: cada bloco do conteúdo
+        vira XML, é comprimido e entregue antes do próximo.
+        """
+        skeleton = self._get_skeleton()
+        return skeleton['template'].stream(self._iter_content_xml(content), self._text_replacements())
+    
+    def _text_replacements(self) -> Dict[str, str]:
+        return {self.DATE_MARKER: datetime.now().strftime('%d/%m/%Y')}
+    
+    def _get_skeleton(self) -> Dict:
+        """Retorna o esqueleto do documento, montando-o na primeira chamada do processo"""
+        cls = type(self)
+        if cls._skeleton is None:
+            with cls._skeleton_lock:
+                if cls._skeleton is None:
+                    cls._skeleton = self._build_skeleton()
+        return cls._skeleton
+    
+    def _build_skeleton(self) -> Dict:
+        """Monta as partes fixas do documento com o python-docx (uma única vez)"""
+        doc = Document()
+        
+        # Configurar página e margens
+        self._configure_page_with_borders(doc)
+        
+        # Criar estilos personalizados
+        self._create_custom_styles(doc)
+        
+        # Adicionar cabeçalho institucional
+        self._add_institutional_header(doc)
+        
+        # Adicionar título principal com fundo azul
+        self._add_main_title_with_background(doc)
+        
+        # Adicionar introdução em caixa
+        self._add_introduction_box(doc)
+        
+        # Parágrafo substituído pelo conteúdo de cada documento
+        doc.add_paragraph(self.BODY_MARKER)
+        
+        # Adicionar rodapé
+        self._add_footer_with_info(doc, self.DATE_MARKER)
+        
+        # Aplicar bordas ao documento inteiro
+        self._apply_document_borders(doc)
+        
+        section = doc.sections[0]
+        return {
+            'template': DocxSkeleton.from_document(doc, self.BODY_MARKER, [self.DATE_MARKER]),
+            'styles': {
+                name: doc.styles[name].style_id
+                for name in ('Secao Azul ETP', 'Subtitulo ETP', 'Corpo ETP', 'Table Grid')
+            },
+            # Largura útil da página em twips (EMU / 635), dividida entre as colunas das tabelas
+            'text_width': int((section.page_width - section.left_margin - section.right_margin) / 635)
+        }
+    
     def _configure_page_with_borders(self, doc: Document):
         """Configura página com margens para acomodar bordas"""
         sections = doc.sections
@@ -74,9 +139,10 @@ class WordFormatterWithBorders:
     def _create_custom_styles(self, doc: Document):
         """Cria estilos personalizados baseados no modelo"""
         styles = doc.styles
+        existing = {style.name for style in styles}
         
         # Estilo para títulos de seção (fundo azul)
-        if 'Secao Azul ETP' not in [s.name for s in styles]:
+        if 'Secao Azul ETP' not in existing:
             section_style = styles.add_style('Secao Azul ETP', WD_STYLE_TYPE.PARAGRAPH)
             
             section_format = section_style.paragraph_format
@@ -92,7 +158,7 @@ class WordFormatterWithBorders:
             section_font.color.rgb = self.white_color
         
         # Estilo para subtítulos
-        if 'Subtitulo ETP' not in [s.name for s in styles]:
+        if 'Subtitulo ETP' not in existing:
             subtitle_style = styles.add_style('Subtitulo ETP', WD_STYLE_TYPE.PARAGRAPH)
             
             subtitle_format = subtitle_style.paragraph_format
@@ -108,7 +174,7 @@ class WordFormatterWithBorders:
             subtitle_font.color.rgb = self.black_color
         
         # Estilo para corpo do texto
-        if 'Corpo ETP' not in [s.name for s in styles]:
+        if 'Corpo ETP' not in existing:
             body_style = styles.add_style('Corpo ETP', WD_STYLE_TYPE.PARAGRAPH)
             
             body_format = body_style.paragraph_format
@@ -123,7 +189,7 @@ class WordFormatterWithBorders:
             body_font.color.rgb = self.black_color
         
         # Estilo para cabeçalho
-        if 'Cabecalho ETP' not in [s.name for s in styles]:
+        if 'Cabecalho ETP' not in existing:
             header_style = styles.add_style('Cabecalho ETP', WD_STYLE_TYPE.PARAGRAPH)
             
             header_format = header_style.paragraph_format
@@ -233,159 +299,75 @@ class WordFormatterWithBorders:
         # Espaço após introdução
         doc.add_paragraph()
     
-    def _process_content_with_formatting(self, doc: Document, content: str):
-        """Processa conteúdo aplicando formatação baseada no modelo"""
-        lines = content.split('\n')
-        current_paragraph = []
-        in_table = False
-        table_data = []
-        
-        for line in lines:
-            line = line.strip()
-            
-            if not line:
-                # Linha vazia
-                if current_paragraph:
-                    self._add_formatted_paragraph(doc, '\n'.join(current_paragraph))
-                    current_paragraph = []
-                if in_table and table_data:
-                    self._create_formatted_table(doc, table_data)
-                    table_data = []
-                    in_table = False
-                continue
-            
-            # Verificar se é título de seção principal
-            if self._is_main_section_title(line):
-                # Finalizar conteúdo anterior
-                if current_paragraph:
-                    self._add_formatted_paragraph(doc, '\n'.join(current_paragraph))
-                    current_paragraph = []
-                if in_table and table_data:
-                    self._create_formatted_table(doc, table_data)
-                    table_data = []
-                    in_table = False
-                
-                # Adicionar título de seção com fundo azul
-                self._add_section_title_with_background(doc, line)
-                
-            elif self._is_subsection_title(line):
-                # Finalizar conteúdo anterior
-                if current_paragraph:
-                    self._add_formatted_paragraph(doc, '\n'.join(current_paragraph))
-                    current_paragraph = []
-                if in_table and table_data:
-                    self._create_formatted_table(doc, table_data)
-                    table_data = []
-                    in_table = False
-                
-                # Adicionar subtítulo
-                self._add_subsection_title(doc, line)
-                
-            elif self._is_table_line(line):
-                # Finalizar parágrafo anterior
-                if current_paragraph:
-                    self._add_formatted_paragraph(doc, '\n'.join(current_paragraph))
-                    current_paragraph = []
-                
-                # Processar linha de tabela
-                in_table = True
-                table_data.append(line)
-                
+    def _iter_content_xml(self, content: str, progress_callback: Callable[[int], None] = None) -> Iterator[str]:
+        """Gera o XML do corpo do documento, um bloco do conteúdo do ETP por vez"""
+        styles = self._get_skeleton()['styles']
+        shading = '<w:shd w:val="clear" w:color="auto" w:fill="1f4e79"/>'
+        # Nós lidos sob demanda; o total de blocos é estimado pelas linhas em branco
+        total = max(1, (content or '').count('\n\n') + 1)
+        
+        for index, node in enumerate(iter_etp_nodes(content), 1):
+            if node.kind == 'section':
+                # Título de seção com fundo azul
+                yield paragraph_xml(node.text.upper(), styles['Secao Azul ETP'], shading)
+            elif node.kind == 'subsection':
+                yield paragraph_xml(node.text, styles['Subtitulo ETP'])
+            elif node.kind == 'table':
+                yield self._create_formatted_table(node.rows)
+            elif node.kind == 'bullet':
+                yield paragraph_xml(f"• {node.text}", styles['Corpo ETP'])
             else:
-                # Finalizar tabela se necessário
-                if in_table and table_data:
-                    self._create_formatted_table(doc, table_data)
-                    table_data = []
-                    in_table = False
-                
-                # Adicionar ao parágrafo atual
-                current_paragraph.append(line)
-        
-        # Finalizar conteúdo restante
-        if current_paragraph:
-            self._add_formatted_paragraph(doc, '\n'.join(current_paragraph))
-        if in_table and table_data:
-            self._create_formatted_table(doc, table_data)
-    
-    def _is_main_section_title(self, line: str) -> bool:
-        """Verifica se é título de seção principal (1., 2., etc.)"""
-        pattern = r'^\d+\.\s+[A-ZÁÀÂÃÉÊÍÓÔÕÚÇ\s]+$'
-        return bool(re.match(pattern, line.upper()))
-    
-    def _is_subsection_title(self, line: str) -> bool:
-        """Verifica se é título de subseção (1.1, 1.2, etc.)"""
-        pattern = r'^\d+\.\d+\.?\s+[A-Za-záàâãéêíóôõúç]+'
-        return bool(re.match(pattern, line))
-    
-    def _is_table_line(self, line: str) -> bool:
-        """Verifica se é linha de tabela"""
-        return '|' in line and line.count('|') >= 2
-    
-    def _add_section_title_with_background(self, doc: Document, title: str):
-        """Adiciona título de seção com fundo azul"""
-        title_para = doc.add_paragraph(title.upper(), style='Secao Azul ETP')
-        self._add_blue_background(title_para)
-    
-    def _add_subsection_title(self, doc: Document, title: str):
-        """Adiciona subtítulo"""
-        doc.add_paragraph(title, style='Subtitulo ETP')
-    
-    def _add_formatted_paragraph(self, doc: Document, text: str):
-        """Adiciona parágrafo formatado"""
-        if text.strip():
-            doc.add_paragraph(text, style='Corpo ETP')
+                yield paragraph_xml(node.text, styles['Corpo ETP'])
+            
+            # Progresso proporcional aos blocos já gerados (15% a 95%)
+            if progress_callback and index % 50 == 0:
+                progress_callback(min(95, 15 + 80 * index // total))
     
-    def _create_formatted_table(self, doc: Document, table_data: List[str]):
-        """Cria tabela formatada baseada no modelo"""
-        if not table_data:
-            return
-        
-        # Processar dados da tabela
-        processed_data = []
-        for line in table_data:
-            cells = [cell.strip() for cell in line.split('|') if cell.strip()]
-            if cells:
-                processed_data.append(cells)
-        
+    def _create_formatted_table(self, table_rows: Tuple[Tuple[str, ...], ...]) -> str:
+        """Gera o XML da tabela formatada (cabeçalho azul, valores monetários em negrito)"""
+        processed_data = [row for row in table_rows if row]
         if not processed_data:
-            return
+            return ''
         
-        # Determinar número de colunas
+        skeleton = self._get_skeleton()
         max_cols = max(len(row) for row in processed_data)
+        col_width = skeleton['text_width'] // max_cols
         
-        # Criar tabela
-        table = doc.add_table(rows=len(processed_data), cols=max_cols)
-        table.style = 'Table Grid'
-        table.alignment = WD_TABLE_ALIGNMENT.CENTER
-        
-        # Preencher dados
+        rows = []
         for row_idx, row_data in enumerate(processed_data):
-            table_row = table.rows[row_idx]
-            
-            for col_idx, cell_data in enumerate(row_data):
-                if col_idx < len(table_row.cells):
-                    cell = table_row.cells[col_idx]
-                    cell.text = cell_data
-                    
-                    # Formatação da célula
-                    for paragraph in cell.paragraphs:
-                        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        for run in paragraph.runs:
-                            run.font.name = 'Times New Roman'
-                            run.font.size = Pt(11)
-                            
-                            # Primeira linha como cabeçalho
-                            if row_idx == 0:
-                                run.font.bold = True
-                                # Aplicar fundo azul ao cabeçalho
-                                self._add_cell_blue_background(cell)
-                            
-                            # Destacar valores monetários
-                            if 'R$' in cell_data or 'TOTAL' in cell_data.upper():
-                                run.font.bold = True
+            cells = []
+            for col_idx in range(max_cols):
+                cell_data = row_data[col_idx] if col_idx < len(row_data) else ''
+                cell_properties = f'<w:tcW w:type="dxa" w:w="{col_width}"/>'
+                run_properties = '<w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman"/>'
+                
+                # Primeira linha como cabeçalho (fundo azul, texto branco)
+                bold = row_idx == 0 or 'R$' in cell_data or 'TOTAL' in cell_data.upper()
+                if bold:
+                    run_properties += '<w:b/>'
+                if row_idx == 0:
+                    cell_properties += '<w:shd w:val="clear" w:color="auto" w:fill="1f4e79"/>'
+                    run_properties += '<w:color w:val="FFFFFF"/>'
+                run_properties += '<w:sz w:val="22"/>'
+                
+                run = run_xml(cell_data, run_properties) if cell_data else ''
+                cells.append(
+                    f'<w:tc><w:tcPr>{cell_properties}</w:tcPr>'
+                    f'<w:p><w:pPr><w:jc w:val="center"/></w:pPr>{run}</w:p></w:tc>'
+                )
+            rows.append(f'<w:tr>{"".join(cells)}</w:tr>')
+        
+        grid = ''.join(f'<w:gridCol w:w="{col_width}"/>' for _ in range(max_cols))
+        table = (
+            f'<w:tbl><w:tblPr><w:tblStyle w:val="{skeleton["styles"]["Table Grid"]}"/>'
+            f'<w:tblW w:type="auto" w:w="0"/><w:jc w:val="center"/>'
+            f'<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+            f'w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr>'
+            f'<w:tblGrid>{grid}</w:tblGrid>{"".join(rows)}</w:tbl>'
+        )
         
         # Adicionar espaço após tabela
-        doc.add_paragraph()
+        return table + '<w:p/>'
     
     def _add_blue_background(self, paragraph):
         """Adiciona fundo azul escuro ao parágrafo"""
@@ -397,21 +379,6 @@ class WordFormatterWithBorders:
         except Exception:
             pass
     
-    def _add_cell_blue_background(self, cell):
-        """Adiciona fundo azul à célula da tabela"""
-        try:
-            shading_elm = parse_xml(
-                f'<w:shd {nsdecls("w")} w:val="clear" w:color="auto" w:fill="1f4e79"/>'
-            )
-            cell._element.get_or_add_tcPr().append(shading_elm)
-            
-            # Alterar cor da fonte para branco
-            for paragraph in cell.paragraphs:
-                for run in paragraph.runs:
-                    run.font.color.rgb = self.white_color
-        except Exception:
-            pass
-    
     def _add_cell_border(self, cell):
         """Adiciona borda à célula"""
         try:
@@ -496,8 +463,11 @@ class WordFormatterWithBorders:
         except Exception as e:
             print(f"Aviso: Não foi possível aplicar bordas ao documento: {e}")
     
-    def _add_footer_with_info(self, doc: Document):
+    def _add_footer_with_info(self, doc: Document, elaboration_date: str = None):
         """Adiciona rodapé com informações"""
+        if elaboration_date is None:
+            elaboration_date = datetime.now().strftime('%d/%m/%Y')
+
         footer = doc.sections[0].footer
         footer_para = footer.paragraphs[0]
         footer_para.clear()
@@ -509,7 +479,7 @@ class WordFormatterWithBorders:
         # Informações do documento
         info_run = footer_para.add_run(
             f"Documento elaborado em conformidade com a Lei nº 14.133/2021\n"
-            f"Data de elaboração: {datetime.now().strftime('%d/%m/%Y')}"
+            f"Data de elaboração: {elaboration_date}"
         )
         info_run.font.name = 'Times New Roman'
         info_run.font.size = Pt(10)
@@ -536,15 +506,8 @@ class WordFormatterWithBorders:
         
         page_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
     
-    def _save_document_with_timestamp(self, doc: Document) -> str:
-        """Salva documento com timestamp em arquivo temporário"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"ETP_Com_Bordas_{timestamp}.docx"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx", prefix="etp_", dir=None) as tmp:
-            doc.save(tmp.name)
-            return tmp.name
-        
-    def create_etp_with_borders(self, etp_content: str, session_data: Dict = None) -> str:
+    def create_etp_with_borders(self, etp_content: str, session_data: Dict = None,
+                                progress_callback: Callable[[int], None] = None) -> str:
         """Método principal para criar ETP com bordas"""
-        return self.create_document_with_borders(etp_content, session_data)
+        return self.create_document_with_borders(etp_content, session_data, progress_callback)
 
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Teste das tarefas em segundo plano das rotas de ETP (reenfileiramento e reserva)
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Bancos auxiliares (índice, caches) em diretório temporário
+_TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+os.environ.setdefault('ETP_KB_INDEX_PATH', os.path.join(_TMP_DIR, 'knowledge_index.db'))
+os.environ.setdefault('ETP_CACHE_PATH', os.path.join(_TMP_DIR, 'generation_cache.db'))
+os.environ.setdefault('ETP_RENDER_CACHE_DIR', os.path.join(_TMP_DIR, 'render_cache'))
+
+# Adicionar path para importação
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+
+from src.models.user import db
+from src.models.etp import DocumentAnalysis, EtpSession, RenderJob
+from src.routes import etp as etp_routes
+
+
+class _RecordingQueue:
+    """Fila que só registra as tarefas enviadas (o teste decide quando executá-las)"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, func, *args, app=None, **kwargs):
+        self.submitted.append(args)
+
+
+PREVIEW = "ESTUDO TÉCNICO PRELIMINAR\n\n1. INTRODUÇÃO\n\nAquisição de notebooks.\n\n2. OBJETO\n\nNotebooks."
+
+
+def _make_app():
+    app = Flask('background-jobs-test')
+    app.register_blueprint(etp_routes.etp_bp, url_prefix='/api/etp')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'app.db')}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(EtpSession(session_id='s1'))
+        db.session.commit()
+    return app
+
+
+def _add_analysis(status, processed_at=None, **fields):
+    doc_analysis = DocumentAnalysis(
+        session_id='s1', filename='edital.txt', analysis_status=status, processed_at=processed_at, **fields
+    )
+    db.session.add(doc_analysis)
+    db.session.commit()
+    return doc_analysis.id
+
+
+def _add_render_job(status, started_at=None):
+    render_job = RenderJob(session_id='s1', status=status, started_at=started_at)
+    db.session.add(render_job)
+    db.session.commit()
+    return render_job.id
+
+
+class _FailingAnalyzer:
+    """Analisador que devolve o dicionário de erro (como analyze_document faz ao falhar)"""
+
+    def extract_text_from_file(self, file_content, file_extension):
+        return file_content.decode('utf-8')
+
+    def analyze_document(self, document_text):
+        return {'extracted_answers': {}, 'error': 'timeout da API', 'analysis_method': 'error'}
+
+    def extract_etp_answers(self, analysis_result):
+        return {}
+
+
+def test_requeue_keeps_analyses_running_in_live_workers():
+    """Só análises órfãs voltam para a fila; as recentes em processamento continuam"""
+    app = _make_app()
+    queue = _RecordingQueue()
+    original_queue, etp_routes.document_job_queue = etp_routes.document_job_queue, queue
+    try:
+        with app.app_context():
+            running = _add_analysis('processando', datetime.utcnow())
+            orphan = _add_analysis('processando', datetime.utcnow() - timedelta(hours=2))
+            pending = _add_analysis('pendente')
+
+        assert etp_routes.requeue_pending_document_analyses(app, stale_seconds=900) == 2
+
+        with app.app_context():
+            assert db.session.get(DocumentAnalysis, running).analysis_status == 'processando'
+            assert db.session.get(DocumentAnalysis, orphan).analysis_status == 'pendente'
+        assert sorted(args[0] for args in queue.submitted) == sorted([orphan, pending])
+    finally:
+        etp_routes.document_job_queue = original_queue
+
+
+def test_analysis_is_claimed_once():
+    """A reserva atômica impede que a mesma análise rode duas vezes"""
+    app = _make_app()
+    with app.app_context():
+        analysis_id = _add_analysis('processando', datetime.utcnow())
+        # Reenvio de uma análise que outro worker já reservou: nada acontece
+        etp_routes.process_document_analysis(analysis_id)
+        doc_analysis = db.session.get(DocumentAnalysis, analysis_id)
+        assert doc_analysis.analysis_status == 'processando'
+        assert doc_analysis.analysis_result is None
+
+
+def test_failed_or_empty_analyses_are_not_reused():
+    """Resultado com erro ou sem respostas não é reaproveitado para o mesmo arquivo"""
+    app = _make_app()
+    with app.app_context():
+        now = datetime.utcnow()
+        good = _add_analysis('concluida', now - timedelta(hours=1), file_hash='abc',
+                             analysis_result='{"analysis_method": "advanced_hybrid"}',
+                             extracted_answers='{"1": "Aquisição de notebooks"}')
+        _add_analysis('concluida', now - timedelta(minutes=2), file_hash='abc',
+                      analysis_result='{"error": "timeout"}', extracted_answers='{}')
+        _add_analysis('concluida', now, file_hash='abc',
+                      analysis_result='{"analysis_method": "advanced_hybrid"}', extracted_answers='{}')
+
+        assert etp_routes.find_reusable_analysis('abc').id == good
+        assert etp_routes.find_reusable_analysis('outro') is None
+
+
+def test_analyzer_error_marks_analysis_as_failed():
+    """Dicionário de erro do analisador vira status 'erro', não 'concluida'"""
+    app = _make_app()
+    original_analyzer, etp_routes.document_analyzer = etp_routes.document_analyzer, _FailingAnalyzer()
+    with app.app_context():
+        analysis_id = _add_analysis('pendente', file_hash='def')
+        upload_path = etp_routes.get_upload_path('s1', 'edital.txt')
+        with open(upload_path, 'w', encoding='utf-8') as f:
+            f.write('Contratação de notebooks')
+        try:
+            etp_routes.process_document_analysis(analysis_id)
+        finally:
+            etp_routes.document_analyzer = original_analyzer
+            os.remove(upload_path)
+
+        doc_analysis = db.session.get(DocumentAnalysis, analysis_id)
+        assert doc_analysis.analysis_status == 'erro'
+        assert etp_routes.build_upload_status(doc_analysis)['error'] == 'timeout da API'
+        assert etp_routes.find_reusable_analysis('def') is None
+
+
+def test_requeue_keeps_render_jobs_running_in_live_workers():
+    """Só gerações de documento órfãs voltam para a fila; as recentes continuam renderizando"""
+    app = _make_app()
+    queue = _RecordingQueue()
+    original_queue, etp_routes.render_job_queue = etp_routes.render_job_queue, queue
+    try:
+        with app.app_context():
+            running = _add_render_job('renderizando', datetime.utcnow())
+            orphan = _add_render_job('renderizando', datetime.utcnow() - timedelta(hours=2))
+            queued = _add_render_job('na_fila')
+
+        assert etp_routes.requeue_pending_render_jobs(app, stale_seconds=900) == 2
+
+        with app.app_context():
+            assert db.session.get(RenderJob, running).status == 'renderizando'
+            assert db.session.get(RenderJob, orphan).status == 'na_fila'
+        assert sorted(args[0] for args in queue.submitted) == sorted([orphan, queued])
+    finally:
+        etp_routes.render_job_queue = original_queue
+
+
+def test_render_job_queue_claim_and_status():
+    """generate-final enfileira, o worker reserva e renderiza uma vez, o status acompanha"""
+    app = _make_app()
+    queue = _RecordingQueue()
+    original_queue, etp_routes.render_job_queue = etp_routes.render_job_queue, queue
+    try:
+        with app.app_context():
+            etp_session = EtpSession.query.filter_by(session_id='s1').first()
+            etp_session.preview_content = PREVIEW
+            etp_session.status = 'aprovado'
+            db.session.commit()
+
+        client = app.test_client()
+        response = client.post('/api/etp/generate-final', json={'session_id': 's1'})
+        assert response.status_code == 202
+        job_id = response.get_json()['job_id']
+        assert response.get_json()['status'] == 'na_fila'
+        assert queue.submitted == [(job_id,)]
+
+        # Enquanto a geração está ativa, um novo pedido devolve a mesma tarefa
+        again = client.post('/api/etp/generate-final', json={'session_id': 's1'})
+        assert again.status_code == 202 and again.get_json()['job_id'] == job_id
+        assert len(queue.submitted) == 1
+
+        # O download durante a geração acompanha a tarefa em vez de renderizar em paralelo
+        pending = client.get('/api/etp/download/s1')
+        assert pending.status_code == 202 and pending.get_json()['job_id'] == job_id
+        assert pending.get_json()['status_url'] == f'/api/etp/render-status/{job_id}'
+
+        with app.app_context():
+            etp_routes.process_render_job(job_id)
+            finished_at = db.session.get(RenderJob, job_id).finished_at
+            # Segunda entrega da mesma tarefa (ex.: outro worker): nada é renderizado de novo
+            etp_routes.process_render_job(job_id)
+            assert db.session.get(RenderJob, job_id).finished_at == finished_at
+
+        status = client.get(f'/api/etp/render-status/{job_id}').get_json()
+        assert status['status'] == 'concluido' and status['progress'] == 100
+        assert status['download_url'] == '/api/etp/download/s1'
+        download = client.get(status['download_url'])
+        assert download.status_code == 200 and download.data[:2] == b'PK'
+    finally:
+        etp_routes.render_job_queue = original_queue
+
+
+def test_download_after_cache_eviction_renders_again():
+    """Arquivo do documento final removido pela limpeza do cache: o download gera de novo"""
+    app = _make_app()
+    with app.app_context():
+        etp_session = EtpSession.query.filter_by(session_id='s1').first()
+        etp_session.preview_content = PREVIEW
+        etp_session.status = 'aprovado'
+        job_id = _add_render_job('na_fila')
+        etp_routes.process_render_job(job_id)
+
+        etp_session = EtpSession.query.filter_by(session_id='s1').first()
+        document_path = etp_session.final_document_path
+        cache_key = etp_routes.final_document_cache_key(etp_session)
+
+    cache = etp_routes.get_render_cache()
+    max_bytes, cache.max_bytes = cache.max_bytes, 0
+    try:
+        cache._evict()
+    finally:
+        cache.max_bytes = max_bytes
+    assert not os.path.exists(document_path)
+
+    download = app.test_client().get('/api/etp/download/s1')
+    assert download.status_code == 200 and download.data[:2] == b'PK'
+    # A cópia gerada no download volta para o cache
+    assert cache.get(cache_key, 'docx') == document_path
+
+
+def test_render_job_without_session_is_marked_as_failed():
+    """Tarefa cuja sessão foi removida termina em erro (e não fica presa em renderizando)"""
+    app = _make_app()
+    with app.app_context():
+        job_id = _add_render_job('na_fila')
+        EtpSession.query.filter_by(session_id='s1').delete()
+        db.session.commit()
+
+        etp_routes.process_render_job(job_id)
+
+        db.session.expire_all()
+        render_job = db.session.get(RenderJob, job_id)
+        assert render_job.status == 'erro' and 'não encontrada' in render_job.error
+        assert render_job.finished_at is not None
+
+
+if __name__ == "__main__":
+    test_requeue_keeps_analyses_running_in_live_workers()
+    test_analysis_is_claimed_once()
+    test_failed_or_empty_analyses_are_not_reused()
+    test_analyzer_error_marks_analysis_as_failed()
+    test_requeue_keeps_render_jobs_running_in_live_workers()
+    test_render_job_queue_claim_and_status()
+    test_download_after_cache_eviction_renders_again()
+    test_render_job_without_session_is_marked_as_failed()
+    print("✅ Tarefas em segundo plano OK")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de respostas do chat para perguntas repetidas
+"""
+import os
+import sys
+import time
+import tempfile
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.chat_answer_cache import ChatAnswerCache, is_follow_up, question_terms
+
+
+def _make_cache(**kwargs):
+    db_path = os.path.join(tempfile.mkdtemp(), 'chat_answer_cache.db')
+    return ChatAnswerCache(db_path=db_path, enabled=True, **kwargs)
+
+
+def test_question_normalization():
+    """Acentos, caixa, stopwords e plural não mudam os termos da pergunta; palavras interrogativas sim"""
+    assert question_terms('Qual a diferença entre pregão e concorrência?') == \
+        question_terms('qual é a diferenca entre o pregao e a concorrencia')
+    assert question_terms('Quais são as modalidades?') == question_terms('qual modalidade')
+    assert question_terms('Quem pode participar do pregão?') != question_terms('Quando pode participar do pregão?')
+    assert is_follow_up('E no caso da dispensa?')
+    assert is_follow_up('Pode explicar isso melhor?')
+    assert not is_follow_up('Como funciona o pregão eletrônico?')
+
+
+def test_exact_and_similar_hits():
+    """Pergunta igual ou muito parecida volta do cache; diferente não"""
+    cache = _make_cache(max_differing_terms=1)
+    cache.set('Quais são as modalidades de licitação na Lei 14.133?', 'resposta', 'gpt-4o-mini')
+
+    exact = cache.get('quais as modalidades de licitacao na lei 14.133', 'gpt-4o-mini')
+    similar = cache.get('Quais as modalidades de licitação previstas na Lei 14.133?', 'gpt-4o-mini')
+
+    assert exact == {'answer': 'resposta', 'question': 'Quais são as modalidades de licitação na Lei 14.133?',
+                     'match': 'exact'}
+    assert similar['match'] == 'similar'
+    assert cache.get('Quais os prazos de recurso na Lei 14.133?', 'gpt-4o-mini') is None
+    assert cache.get('Quais são as modalidades de licitação na Lei 14.133?', 'outro-modelo') is None
+
+    stats = cache.stats()
+    assert (stats['exact_hits'], stats['similar_hits'], stats['misses']) == (1, 1, 2)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_similar_questions_with_different_meaning_miss():
+    """Negação, números, citação legal ou mais de um termo diferente não reaproveitam a resposta"""
+    cache = _make_cache(max_differing_terms=1)
+    cache.set('É obrigatório publicar o ETP no PNCP?', 'sim', 'm')
+    cache.set('Qual o prazo de vigência dos contratos de fornecimento contínuo?', 'cinco anos', 'm')
+    cache.set('O que diz o art. 75 da Lei 14.133 sobre dispensa?', 'art. 75', 'm')
+
+    assert cache.get('Não é obrigatório publicar o ETP no PNCP?', 'm') is None
+    assert cache.get('É obrigatório publicar o ETP sem o PNCP?', 'm') is None
+    assert cache.get('Qual o prazo de vigência dos contratos de serviços contínuos?', 'm') is None
+    assert cache.get('O que diz o art. 74 da Lei 14.133 sobre dispensa?', 'm') is None
+    assert cache.get('O que diz o decreto 75 da Lei 14.133 sobre dispensa?', 'm') is None
+    # Um termo a mais reaproveita; dois já não
+    assert cache.get('O que diz o art. 75 da Lei 14.133 sobre a dispensa de licitação?', 'm')['answer'] == 'art. 75'
+    assert cache.get('O que diz o art. 75 da Lei 14.133 sobre dispensa eletrônica de licitação?', 'm') is None
+
+
+def test_questions_differing_only_in_question_word_are_separate_entries():
+    """Quem/Quando/Onde sobre o mesmo assunto não reaproveitam a resposta uma da outra"""
+    cache = _make_cache(max_differing_terms=1)
+    questions = {
+        'Quem pode participar do pregão?': 'licitantes habilitados',
+        'Quando pode participar do pregão?': 'após a publicação do edital',
+        'Onde participar do pregão?': 'no sistema eletrônico'
+    }
+
+    for question in questions:
+        assert cache.get(question, 'm') is None
+        cache.set(question, questions[question], 'm')
+
+    for question, answer in questions.items():
+        assert cache.get(question, 'm') == {'answer': answer, 'question': question, 'match': 'exact'}
+    assert cache.stats()['entries'] == 3
+    assert cache.get('Como participar do pregão eletrônico?', 'm') is None
+
+
+def test_ttl_and_lru_eviction():
+    """Entradas expiradas não voltam e o total respeita o limite"""
+    cache = _make_cache(max_entries=2, ttl_seconds=3600)
+    cache.set('pregão eletrônico prazo', 'A', 'm')
+    time.sleep(0.01)
+    cache.set('concorrência prazo proposta', 'B', 'm')
+    time.sleep(0.01)
+    cache.get('pregão eletrônico prazo', 'm')
+    time.sleep(0.01)
+    cache.set('dispensa valor limite', 'C', 'm')
+
+    assert cache.get('concorrência prazo proposta', 'm') is None
+    assert cache.get('pregão eletrônico prazo', 'm')['answer'] == 'A'
+    assert cache.stats()['entries'] == 2
+
+    expiring = _make_cache(ttl_seconds=0.05)
+    expiring.set('pregão eletrônico prazo', 'A', 'm')
+    time.sleep(0.1)
+    assert expiring.get('pregão eletrônico prazo', 'm') is None
+    assert expiring.stats()['entries'] == 0
+
+
+if __name__ == "__main__":
+    test_question_normalization()
+    test_exact_and_similar_hits()
+    test_similar_questions_with_different_meaning_miss()
+    test_questions_differing_only_in_question_word_are_separate_entries()
+    test_ttl_and_lru_eviction()
+    print("✅ Cache de respostas do chat OK")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Teste do histórico do chat em chat_messages (paginação e migração do JSON legado)
+"""
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Adicionar path para importação
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+
+from src.models.user import db
+from src.models.etp import ChatMessage, ChatSession
+
+BASE_TIME = datetime(2025, 3, 1, 9, 0, 0)
+
+
+def _make_app():
+    app = Flask('chat-history-test')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'app.db')}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _add_messages(chat_session, offsets):
+    """Mensagens com created_at = BASE_TIME + offset (offsets repetidos empatam no horário)"""
+    for index, offset in enumerate(offsets):
+        db.session.add(ChatMessage(
+            session_id=chat_session.session_id,
+            role='user' if index % 2 == 0 else 'assistant',
+            content=f'mensagem {index}',
+            created_at=BASE_TIME + timedelta(seconds=offset)
+        ))
+    db.session.commit()
+
+
+def test_messages_page_order_and_paging():
+    """Páginas em ordem cronológica, da mais recente para trás, sem repetir nem pular mensagens"""
+    app = _make_app()
+    with app.app_context():
+        chat_session = ChatSession(session_id='c1')
+        db.session.add(chat_session)
+        # Mensagens 2, 3 e 4 com o mesmo horário: o desempate é pelo id
+        _add_messages(chat_session, [0, 1, 2, 2, 2, 3, 4])
+
+        page, has_more = chat_session.get_messages_page(limit=3)
+        assert [msg['content'] for msg in page] == ['mensagem 4', 'mensagem 5', 'mensagem 6']
+        assert has_more
+
+        page, has_more = chat_session.get_messages_page(limit=3, before_id=page[0]['id'])
+        assert [msg['content'] for msg in page] == ['mensagem 1', 'mensagem 2', 'mensagem 3']
+        assert has_more
+
+        page, has_more = chat_session.get_messages_page(limit=3, before_id=page[0]['id'])
+        assert [msg['content'] for msg in page] == ['mensagem 0']
+        assert not has_more
+
+        # Histórico completo e mensagens recentes seguem a mesma ordem
+        history = [msg['content'] for msg in chat_session.get_conversation_history()]
+        assert history == [f'mensagem {index}' for index in range(7)]
+        assert [msg['content'] for msg in chat_session.get_recent_messages(limit=2)] == history[-2:]
+
+
+def test_messages_page_ignores_other_sessions():
+    """before_id de outra sessão não filtra a página; mensagens de outras sessões não aparecem"""
+    app = _make_app()
+    with app.app_context():
+        first, second = ChatSession(session_id='c1'), ChatSession(session_id='c2')
+        db.session.add_all([first, second])
+        _add_messages(first, [0, 1])
+        _add_messages(second, [5])
+        other_id = ChatMessage.query.filter_by(session_id='c2').first().id
+
+        page, has_more = first.get_messages_page(limit=10, before_id=other_id)
+        assert [msg['content'] for msg in page] == ['mensagem 0', 'mensagem 1']
+        assert not has_more
+
+
+def test_legacy_history_is_migrated_once():
+    """O JSON de conversation_history vira linhas em chat_messages uma única vez, antes das novas"""
+    app = _make_app()
+    with app.app_context():
+        legacy = [
+            {'role': 'user', 'content': 'O que é ETP?', 'timestamp': (BASE_TIME - timedelta(days=1)).isoformat()},
+            {'role': 'assistant', 'content': 'Estudo Técnico Preliminar.',
+             'timestamp': (BASE_TIME - timedelta(days=1) + timedelta(seconds=5)).isoformat()},
+            {'role': 'user', 'content': 'Mensagem sem horário'}
+        ]
+        chat_session = ChatSession(session_id='c1', conversation_history=json.dumps(legacy),
+                                   created_at=BASE_TIME - timedelta(days=2))
+        db.session.add(chat_session)
+        db.session.commit()
+
+        chat_session.add_message('user', 'Nova pergunta')
+        db.session.commit()
+
+        assert chat_session.conversation_history is None
+        assert chat_session.migrate_legacy_history() == 0
+        history = chat_session.get_conversation_history()
+        assert [(msg['role'], msg['content']) for msg in history] == [
+            ('user', 'O que é ETP?'),
+            ('assistant', 'Estudo Técnico Preliminar.'),
+            ('user', 'Mensagem sem horário'),
+            ('user', 'Nova pergunta')
+        ]
+        # Sem horário no JSON: a mensagem herda o horário da anterior
+        assert history[2]['timestamp'] == history[1]['timestamp']
+        assert ChatMessage.query.filter_by(session_id='c1').count() == 4
+        assert chat_session.has_user_messages()
+
+
+if __name__ == "__main__":
+    test_messages_page_order_and_paging()
+    test_messages_page_ignores_other_sessions()
+    test_legacy_history_is_migrated_once()
+    print("✅ Histórico do chat OK")
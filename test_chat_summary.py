@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Teste do resumo contínuo do chat (orçamento do prompt, agendamento e resumo em lotes)
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# Bancos auxiliares em diretório temporário
+_TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+os.environ.setdefault('CHAT_CACHE_PATH', os.path.join(_TMP_DIR, 'chat_answer_cache.db'))
+
+# Adicionar path para importação
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+
+from src.models.user import db
+from src.models.etp import ChatMessage, ChatSession, ChatSummary
+from src.routes import chat as chat_routes
+from src.utils.prompt_budget import count_tokens
+
+BASE_TIME = datetime(2025, 3, 1, 9, 0, 0)
+
+
+class _RecordingQueue:
+    """Fila que só registra as tarefas enviadas"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, func, *args, app=None, **kwargs):
+        self.submitted.append(args)
+
+
+class _FakeClient:
+    """Cliente que devolve um resumo por chamada e falha a partir da chamada ``fail_on``"""
+
+    def __init__(self, fail_on=None):
+        self.requests = []
+        self.fail_on = fail_on
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs['messages'][-1]['content'])
+        if self.fail_on and len(self.requests) >= self.fail_on:
+            raise RuntimeError('context_length_exceeded')
+        message = SimpleNamespace(content=f'Resumo {len(self.requests)}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def _make_app():
+    app = Flask('chat-summary-test')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'app.db')}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _add_session(contents):
+    chat_session = ChatSession(session_id='c1')
+    db.session.add(chat_session)
+    for index, content in enumerate(contents):
+        db.session.add(ChatMessage(session_id='c1', role='user' if index % 2 == 0 else 'assistant',
+                                   content=content, created_at=BASE_TIME + timedelta(seconds=index)))
+    db.session.commit()
+    return chat_session
+
+
+def _message_ids():
+    return [msg.id for msg in ChatMessage.query.order_by(ChatMessage.id).all()]
+
+
+def test_prompt_history_fits_token_budget():
+    """Resumo + mensagens recentes não passam do orçamento; as mais novas têm prioridade"""
+    app = _make_app()
+    with app.app_context():
+        long_text = 'palavra ' * 400
+        chat_session = _add_session([f'{index} {long_text}' for index in range(14)])
+        ids = _message_ids()
+        db.session.add(ChatSummary(session_id='c1', content='Resumo anterior', last_message_id=ids[5],
+                                   token_count=count_tokens('Resumo anterior', chat_routes.CHAT_MODEL)))
+        db.session.commit()
+
+        messages = chat_routes.build_chat_messages(chat_session, 'Pergunta atual')
+
+        assert messages[0]['content'] == chat_routes.CHAT_SYSTEM_PROMPT
+        assert messages[1]['content'].endswith('Resumo anterior')
+        assert messages[-1] == {'role': 'user', 'content': 'Pergunta atual'}
+        history = messages[2:-1]
+        history_tokens = sum(count_tokens(msg['content'], chat_routes.CHAT_MODEL) for msg in history)
+        assert history_tokens + count_tokens('Resumo anterior', chat_routes.CHAT_MODEL) <= chat_routes.CHAT_HISTORY_TOKEN_BUDGET
+        # A mais nova vai inteira; mensagens já resumidas nunca reaparecem
+        assert history[-1]['content'].startswith('13 ')
+        assert all(not msg['content'].startswith(('4 ', '5 ')) for msg in history)
+
+
+def test_summary_is_scheduled_once_above_trigger():
+    """Resumo só é agendado com mensagens antigas acima do limite, e uma vez por sessão"""
+    app = _make_app()
+    queue = _RecordingQueue()
+    original_queue, chat_routes.chat_summary_queue = chat_routes.chat_summary_queue, queue
+    try:
+        with app.app_context():
+            chat_session = _add_session(['curta'] * 12)
+            assert not chat_routes.schedule_chat_summary(chat_session)
+
+            db.session.add(ChatMessage(session_id='c1', role='user', content='palavra ' * 2000,
+                                       created_at=BASE_TIME - timedelta(days=1)))
+            db.session.commit()
+            assert chat_routes.schedule_chat_summary(chat_session)
+            assert not chat_routes.schedule_chat_summary(chat_session)
+            assert queue.submitted == [('c1',)]
+    finally:
+        chat_routes.chat_summary_queue = original_queue
+        chat_routes._summaries_in_progress.discard('c1')
+
+
+def test_long_history_is_summarized_in_batches():
+    """Histórico longo vira várias chamadas limitadas; cada lote concluído avança o resumo"""
+    app = _make_app()
+    original_client = chat_routes.get_openai_client
+    try:
+        with app.app_context():
+            _add_session([f'{index} ' + 'palavra ' * 3000 for index in range(30)])
+            ids = _message_ids()
+
+            client = _FakeClient(fail_on=3)
+            chat_routes.get_openai_client = lambda api_key: client
+            try:
+                chat_routes.summarize_chat_history('c1')
+                assert False, 'a falha da terceira chamada deveria ser propagada'
+            except RuntimeError:
+                pass
+
+            # Duas chamadas concluídas: o resumo avançou até o fim do segundo lote, em ordem
+            summary = ChatSummary.query.filter_by(session_id='c1').first()
+            assert summary.content == 'Resumo 2'
+            first_batch = client.requests[0]
+            assert first_batch.index('USUÁRIO: 0 ') < first_batch.index('ASSISTENTE: 1 ')
+            assert 'Resumo 1' in client.requests[1]
+            assert ids.index(summary.last_message_id) < len(ids) - chat_routes.CHAT_CONTEXT_MESSAGES
+            for request in client.requests:
+                transcript = request.split('NOVAS MENSAGENS:\n', 1)[1]
+                assert count_tokens(transcript, chat_routes.CHAT_MODEL) <= chat_routes.CHAT_SUMMARY_BATCH_TOKENS + 50
+
+            # Nova execução continua de onde parou e resume até a janela recente
+            client = _FakeClient()
+            chat_routes.get_openai_client = lambda api_key: client
+            chat_routes.summarize_chat_history('c1')
+            summary = ChatSummary.query.filter_by(session_id='c1').first()
+            assert summary.last_message_id == ids[-chat_routes.CHAT_CONTEXT_MESSAGES - 1]
+            assert not ChatSession.query.filter_by(session_id='c1').first().get_messages_to_summarize(
+                summary.last_message_id, chat_routes.CHAT_CONTEXT_MESSAGES
+            )
+    finally:
+        chat_routes.get_openai_client = original_client
+
+
+if __name__ == "__main__":
+    test_prompt_history_fits_token_budget()
+    test_summary_is_scheduled_once_above_trigger()
+    test_long_history_is_summarized_in_batches()
+    print("✅ Resumo contínuo do chat OK")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Teste do parser de conteúdo do ETP compartilhado pelos formatadores e validadores
+"""
+import os
+import sys
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.etp_content_parser import get_parser_cache_stats, iter_etp_nodes, parse_etp_content
+
+CONTENT = """ESTUDO TÉCNICO PRELIMINAR
+
+1. INTRODUÇÃO
+
+Primeira linha do parágrafo
+continuação do mesmo parágrafo.
+
+## 2. OBJETO DO ESTUDO E ESPECIFICAÇÕES GERAIS
+
+2.1 Localização da execução do objeto contratual
+• Sede do órgão
+- Unidades regionais
+
+| Item | Quantidade | Valor |
+|------|------------|-------|
+| Notebook | 10 | R$ 50.000,00 |
+Texto após a tabela.
+
+---
+"""
+
+
+def test_content_is_parsed_into_typed_nodes():
+    """Seções, subseções, parágrafos, listas e tabelas na ordem do texto"""
+    document = parse_etp_content(CONTENT)
+    kinds = [node.kind for node in document]
+
+    assert kinds == ['paragraph', 'section', 'paragraph', 'section', 'subsection',
+                     'bullet', 'bullet', 'table', 'paragraph']
+    assert document.section_numbers() == ['1', '2']
+    assert document.nodes[3].text == '2. OBJETO DO ESTUDO E ESPECIFICAÇÕES GERAIS'
+    assert document.nodes[2].text == 'Primeira linha do parágrafo\ncontinuação do mesmo parágrafo.'
+    # Linha de alinhamento markdown não vira linha da tabela
+    assert document.nodes[7].rows == (('Item', 'Quantidade', 'Valor'), ('Notebook', '10', 'R$ 50.000,00'))
+
+
+def test_numbered_list_items_are_not_sections():
+    """Itens numerados em minúsculas ficam no corpo da seção; títulos fora de ordem só em maiúsculas"""
+    document = parse_etp_content("""1. Introdução
+
+Texto da introdução.
+
+2. LEVANTAMENTO DE MERCADO
+
+Fontes consultadas:
+1. Consulta ao Painel de Preços
+2. Pesquisa com fornecedores
+
+4. ESTIMATIVA DO VALOR
+
+Valor estimado.
+
+5. Conclusão do estudo""")
+
+    assert document.section_numbers() == ['1', '2', '4', '5']
+    assert [node.kind for node in document.section_nodes(2)] == ['paragraph']
+    assert 'Pesquisa com fornecedores' in document.section_nodes(2)[0].text
+
+
+def test_heading_variants_are_sections():
+    """Títulos sem espaço, com hífen ou com referência legal (pontos, "nº") também são seções"""
+    document = parse_etp_content("""1.INTRODUÇÃO
+
+Texto.
+
+2 - OBJETO DO ESTUDO
+
+Texto.
+
+3 – DESCRIÇÃO DOS REQUISITOS
+
+Texto.
+
+5. ESTIMATIVA DO VALOR (Lei nº 14.133/2021, art. 23)
+
+Texto.
+
+6. Consulta ao painel, conforme art. 23.""")
+
+    assert document.section_numbers() == ['1', '2', '3', '5']
+    assert document.nodes[6].text == '5. ESTIMATIVA DO VALOR (Lei nº 14.133/2021, art. 23)'
+    assert [node.kind for node in document.section_nodes(5)] == ['paragraph', 'paragraph']
+    assert len(parse_etp_content("1. INTRODUÇÃO (Lei nº 14.133/2021)").section_numbers()) == 1
+
+
+def test_section_body_and_cache():
+    """Corpo da seção vai até a próxima seção; o mesmo texto é analisado uma vez"""
+    document = parse_etp_content(CONTENT)
+
+    assert [node.kind for node in document.section_nodes(1)] == ['paragraph']
+    assert document.section_nodes(3) is None
+    assert not document.has_section(3)
+    assert parse_etp_content(CONTENT) is document
+
+
+def test_lazy_nodes_match_parsed_document():
+    """iter_etp_nodes entrega os mesmos nós sob demanda e sem passar pelo cache"""
+    misses = get_parser_cache_stats()['misses']
+    content = CONTENT + "\n3. NOVA SEÇÃO"
+
+    nodes = iter_etp_nodes(content)
+    assert next(nodes).kind == 'paragraph'
+    assert get_parser_cache_stats()['misses'] == misses
+
+    assert tuple(iter_etp_nodes(content)) == parse_etp_content(content).nodes
+
+
+if __name__ == "__main__":
+    test_content_is_parsed_into_typed_nodes()
+    test_numbered_list_items_are_not_sections()
+    test_heading_variants_are_sections()
+    test_section_body_and_cache()
+    test_lazy_nodes_match_parsed_document()
+    print("✅ Parser de conteúdo do ETP OK")
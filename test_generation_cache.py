@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de geração endereçado por conteúdo
+"""
+import os
+import sys
+import time
+import tempfile
+from types import SimpleNamespace
+
+# Bancos auxiliares (índice, cache) em diretório temporário
+_TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+os.environ.setdefault('ETP_KB_INDEX_PATH', os.path.join(_TMP_DIR, 'knowledge_index.db'))
+os.environ.setdefault('ETP_CACHE_PATH', os.path.join(_TMP_DIR, 'generation_cache.db'))
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.generation_cache import GenerationCache
+from utils.etp_generator import AdvancedEtpGenerator
+from utils.etp_generator_optimized import OptimizedEtpGenerator
+
+PART_1 = "\n\n".join(f"{number}. SEÇÃO {number}\n\nConteúdo." for number in range(1, 8))
+ALL_SECTIONS = "\n\n".join(f"{number}. SEÇÃO {number}\n\nConteúdo." for number in range(1, 15))
+
+
+class _FakeCompletions:
+    """Devolve ``content`` com ``finish_reason``; em streaming, um chunk por linha"""
+
+    def __init__(self, content, finish_reason='stop'):
+        self.content = content
+        self.finish_reason = finish_reason
+
+    def create(self, stream=False, **kwargs):
+        if not stream:
+            choice = SimpleNamespace(message=SimpleNamespace(content=self.content), finish_reason=self.finish_reason)
+            return SimpleNamespace(choices=[choice])
+        lines = self.content.splitlines(keepends=True)
+        return [
+            SimpleNamespace(choices=[SimpleNamespace(
+                delta=SimpleNamespace(content=line),
+                finish_reason=self.finish_reason if index == len(lines) - 1 else None
+            )])
+            for index, line in enumerate(lines)
+        ]
+
+
+def _with_fake_client(generator, content, finish_reason='stop'):
+    generator.client = SimpleNamespace(chat=SimpleNamespace(completions=_FakeCompletions(content, finish_reason)))
+    generator.cache = _make_cache()
+    return generator
+
+
+def _make_cache(**kwargs):
+    db_path = os.path.join(tempfile.mkdtemp(), 'generation_cache.db')
+    return GenerationCache(db_path=db_path, enabled=True, **kwargs)
+
+
+def test_cache_key_normalizes_answers():
+    """Respostas que diferem só em caixa/espaços geram a mesma chave"""
+    key1 = GenerationCache.make_key('advanced', 'gpt-4', 'v1', 'INTRODUÇÃO',
+                                    answers={'1': 'Aquisição de  notebooks.', 2: 'Sim'})
+    key2 = GenerationCache.make_key('advanced', 'gpt-4', 'v1', 'INTRODUÇÃO',
+                                    answers={'2': 'sim', '1': ' aquisição de notebooks'})
+    key3 = GenerationCache.make_key('advanced', 'gpt-4', 'v2', 'INTRODUÇÃO',
+                                    answers={'1': 'Aquisição de notebooks', '2': 'Sim'})
+
+    assert key1 == key2
+    assert key1 != key3
+
+
+def test_cache_roundtrip_and_lru_eviction():
+    """Conteúdo volta do cache e o menos usado é descartado acima do limite"""
+    cache = _make_cache(max_entries=2, ttl_seconds=3600)
+
+    cache.set('a', 'conteúdo A', 'advanced', 'gpt-4', 'secao')
+    time.sleep(0.01)
+    cache.set('b', 'conteúdo B', 'advanced', 'gpt-4', 'secao')
+    time.sleep(0.01)
+    assert cache.get('a') == 'conteúdo A'  # 'a' passa a ser o mais recente
+    time.sleep(0.01)
+    cache.set('c', 'conteúdo C', 'advanced', 'gpt-4', 'secao')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'conteúdo A'
+    assert cache.get('c') == 'conteúdo C'
+    assert cache.stats()['entries'] == 2
+
+
+def test_cache_ttl_expiration():
+    """Entradas expiradas não são retornadas"""
+    cache = _make_cache(max_entries=10, ttl_seconds=0.05)
+    cache.set('a', 'conteúdo A', 'advanced', 'gpt-4', 'secao')
+    time.sleep(0.1)
+
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_truncated_or_incomplete_output_is_not_cached():
+    """Resposta cortada por max_tokens ou sem todas as seções pedidas não vai para o cache"""
+    answers = {'1': 'Aquisição de notebooks'}
+
+    # Preview rápido (não-streaming): cortado por max_tokens
+    generator = _with_fake_client(AdvancedEtpGenerator('sk-test'), PART_1, finish_reason='length')
+    generator._request_quick_preview_part(answers, 1, 'prompt')
+    assert generator.cache.stats()['entries'] == 0
+
+    # Preview em streaming: a parte 2 não traz as seções 8-14
+    generator = _with_fake_client(AdvancedEtpGenerator('sk-test'), PART_1)
+    ''.join(generator.stream_quick_preview({'answers': answers}))
+    assert generator.cache.get(generator._quick_preview_cache_key(answers, 1)) == PART_1
+    assert generator.cache.get(generator._quick_preview_cache_key(answers, 2)) is None
+
+    # Seção do motor paralelo cortada por max_tokens
+    generator = _with_fake_client(AdvancedEtpGenerator('sk-test'), '1. INTRODUÇÃO\n\nTexto', finish_reason='length')
+    generator._request_section(generator.etp_structure[0], 'contexto', True, 5)
+    assert generator.cache.stats()['entries'] == 0
+
+    # Preview ultra-rápido do Optimized: faltam seções
+    generator = _with_fake_client(OptimizedEtpGenerator('sk-test'), PART_1)
+    generator.generate_ultra_fast_preview({'answers': answers})
+    assert generator.cache.stats()['entries'] == 0
+
+    generator = _with_fake_client(OptimizedEtpGenerator('sk-test'), ALL_SECTIONS)
+    generator.generate_ultra_fast_preview({'answers': answers})
+    assert generator.cache.stats()['entries'] == 1
+
+
+if __name__ == "__main__":
+    test_cache_key_normalizes_answers()
+    test_cache_roundtrip_and_lru_eviction()
+    test_cache_ttl_expiration()
+    test_truncated_or_incomplete_output_is_not_cached()
+    print("✅ Cache de geração OK")
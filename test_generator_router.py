@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Teste do roteador de geração do preview entre os motores
+"""
+import os
+import sys
+import tempfile
+import time
+
+# Bancos auxiliares (índice, cache) em diretório temporário
+_TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+os.environ.setdefault('ETP_KB_INDEX_PATH', os.path.join(_TMP_DIR, 'knowledge_index.db'))
+os.environ.setdefault('ETP_CACHE_PATH', os.path.join(_TMP_DIR, 'generation_cache.db'))
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.generator_router import GeneratorRouter, RoutedEngine
+from utils.etp_generator import AdvancedEtpGenerator
+
+COMPLETE_ETP = "\n\n".join(f"{number}. SEÇÃO {number}\n\nConteúdo da seção {number}." for number in range(1, 15))
+
+
+class _FakeGenerator:
+    """Gerador que demora ``delay`` segundos e devolve ``content`` (ou levanta ``error``)"""
+
+    def __init__(self, delay=0.0, content=COMPLETE_ETP, error=None):
+        self.delay = delay
+        self.content = content
+        self.error = error
+        self.calls = 0
+
+    def generate(self, session_data, context_data=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.content
+
+    def stream(self, session_data, context_data=None):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        for line in self.content.splitlines(keepends=True):
+            yield line
+
+
+def _engine(name, generator, prior_latency, stream_method=None):
+    return RoutedEngine(name, lambda: generator, 'generate', f'modelo-{name}', prior_latency=prior_latency,
+                        stream_method=stream_method)
+
+
+def test_chosen_engine_gets_its_estimate_before_fallback():
+    """Motores mais rápidos que o previsto terminam no motor escolhido, sem timeouts em cascata"""
+    generators = [_FakeGenerator(1.6), _FakeGenerator(1.2), _FakeGenerator(0.05)]
+    router = GeneratorRouter([
+        _engine('advanced', generators[0], 2.5),
+        _engine('optimized', generators[1], 2.0),
+        _engine('ultra_fast', generators[2], 0.5),
+    ], slo_seconds=3.0, queue_penalty=0)
+
+    decision = router.generate({'answers': {}})['decision']
+
+    # advanced (2.5s) mais a reserva do optimized (2s) não cabe em 3s
+    assert decision['chosen_engine'] == decision['engine'] == 'optimized'
+    assert [attempt['status'] for attempt in decision['attempts']] == ['sucesso']
+    assert decision['attempts'][0]['budget_seconds'] >= 2.0
+    assert [generator.calls for generator in generators] == [0, 1, 0]
+
+
+def test_engine_that_does_not_fit_with_reserve_is_skipped():
+    """Estimativa mais reserva do fallback acima do SLO: o roteador começa pelo próximo motor"""
+    router = GeneratorRouter([
+        _engine('advanced', _FakeGenerator(), 45),
+        _engine('optimized', _FakeGenerator(), 25),
+        _engine('ultra_fast', _FakeGenerator(), 12),
+    ], slo_seconds=60, queue_penalty=0)
+
+    assert router.choose().name == 'optimized'
+    assert router.choose(slo_seconds=70).name == 'advanced'
+    assert router.choose(slo_seconds=5).name == 'ultra_fast'
+
+
+def test_engine_errors_fall_back_and_count_as_failures():
+    """Erro ou ETP incompleto do motor gera fallback e entra na taxa de falhas"""
+    router = GeneratorRouter([
+        _engine('advanced', _FakeGenerator(error=RuntimeError('API indisponível')), 1),
+        _engine('optimized', _FakeGenerator(content='1. INTRODUÇÃO\n\nSó uma seção'), 1),
+        _engine('ultra_fast', _FakeGenerator(), 1),
+    ], slo_seconds=10, queue_penalty=0, min_samples=1)
+
+    result = router.generate({'answers': {}})
+    decision = result['decision']
+
+    assert result['content'] == COMPLETE_ETP
+    assert decision['chosen_engine'] == 'advanced' and decision['engine'] == 'ultra_fast'
+    assert [attempt['status'] for attempt in decision['attempts']] == ['falha', 'falha', 'sucesso']
+    assert 'API indisponível' in decision['attempts'][0]['error']
+
+    stats = router.stats()['engines']
+    assert stats['advanced']['failure_rate'] == 1.0 and stats['advanced']['fallbacks'] == 1
+    # Motores acima da taxa de falhas deixam de ser escolhidos
+    assert router.choose().name == 'ultra_fast'
+
+
+def test_heading_variants_count_as_complete():
+    """ETP válido com títulos "1.SEÇÃO" ou "1 - SEÇÃO (Lei nº ...)" não é tratado como incompleto"""
+    compact = COMPLETE_ETP.replace('. SEÇÃO', '.SEÇÃO')
+    dashed = "\n\n".join(f"{number} - SEÇÃO {number} (Lei nº 14.133/2021)\n\nConteúdo." for number in range(1, 15))
+
+    assert GeneratorRouter._is_complete(compact) and GeneratorRouter._is_complete(dashed)
+    assert AdvancedEtpGenerator('sk-test').validate_etp_completeness(dashed)['is_complete']
+
+
+def test_stream_uses_router_choice_and_records_stats():
+    """O preview em streaming passa pelo roteador: escolha, fallback antes do 1º token e estatísticas"""
+    generators = [_FakeGenerator(error=RuntimeError('API indisponível')), _FakeGenerator(), _FakeGenerator()]
+    router = GeneratorRouter([
+        _engine('advanced', generators[0], 1, stream_method='stream'),
+        _engine('optimized', generators[1], 1, stream_method='stream'),
+        _engine('ultra_fast', generators[2], 1),
+    ], slo_seconds=10, queue_penalty=0, min_samples=1)
+
+    decision = {}
+    assert ''.join(router.stream({'answers': {}}, decision=decision)) == COMPLETE_ETP
+    assert decision['chosen_engine'] == 'advanced' and decision['engine'] == 'optimized'
+    assert [attempt['status'] for attempt in decision['attempts']] == ['falha', 'sucesso']
+    assert [generator.calls for generator in generators] == [1, 1, 0]
+
+    stats = router.stats()['engines']
+    assert stats['advanced']['failure_rate'] == 1.0 and stats['advanced']['fallbacks'] == 1
+    assert stats['optimized']['samples'] == 1 and stats['optimized']['failure_rate'] == 0.0
+    assert router.choose().name == 'optimized'
+
+
+def test_quick_preview_propagates_errors_for_router():
+    """generate_quick_preview e stream_quick_preview só devolvem o ETP de estrutura básica fora do roteador"""
+
+    class _FailingCompletions:
+        def create(self, **kwargs):
+            raise RuntimeError('timeout da API')
+
+    generator = AdvancedEtpGenerator('sk-test')
+    generator.client = type('Client', (), {'chat': type('Chat', (), {'completions': _FailingCompletions()})})()
+    session_data = {'answers': {'1': 'Aquisição de notebooks para teste do roteador'}}
+
+    assert 'ESTUDO TÉCNICO PRELIMINAR' in generator.generate_quick_preview(session_data)
+    try:
+        generator.generate_quick_preview(session_data, fallback_on_error=False)
+        assert False, 'a falha da API deveria ser propagada'
+    except RuntimeError as e:
+        assert 'timeout da API' in str(e)
+
+    # Streaming: nada é emitido antes da falha, para o roteador poder usar outro motor
+    assert ''.join(generator.stream_quick_preview(session_data)).startswith('ESTUDO TÉCNICO PRELIMINAR\n\n1. INTRODUÇÃO')
+    emitted = []
+    try:
+        for chunk in generator.stream_quick_preview(session_data, fallback_on_error=False):
+            emitted.append(chunk)
+        assert False, 'a falha da API deveria ser propagada'
+    except RuntimeError as e:
+        assert 'timeout da API' in str(e) and emitted == []
+
+
+if __name__ == "__main__":
+    test_chosen_engine_gets_its_estimate_before_fallback()
+    test_engine_that_does_not_fit_with_reserve_is_skipped()
+    test_engine_errors_fall_back_and_count_as_failures()
+    test_heading_variants_count_as_complete()
+    test_stream_uses_router_choice_and_records_stats()
+    test_quick_preview_propagates_errors_for_router()
+    print("✅ Roteador de geração OK")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Teste das requisições com hedge (reserva para chamadas lentas)
+"""
+import os
+import sys
+import time
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.hedged_requests import HedgedRequestRunner
+
+
+def _slow(result, seconds):
+    def call(cancel_event):
+        # Simula um stream que verifica o cancelamento entre os chunks
+        for _ in range(int(seconds / 0.01)):
+            if cancel_event.is_set():
+                raise RuntimeError("cancelado")
+            time.sleep(0.01)
+        return result
+    return call
+
+
+def test_fast_primary_is_not_hedged():
+    """Tentativa principal dentro do prazo não dispara hedge"""
+    runner = HedgedRequestRunner('teste-rapido', initial_delay=0.5, timeout=5)
+
+    assert runner.run(_slow('principal', 0.05), _slow('hedge', 0.05)) == 'principal'
+    assert runner.stats()['hedged'] == 0
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    """Principal lenta: o hedge vence e a principal recebe o cancelamento"""
+    runner = HedgedRequestRunner('teste-lento', initial_delay=0.1, timeout=5)
+
+    started = time.monotonic()
+    assert runner.run(_slow('principal', 2), _slow('hedge', 0.05)) == 'hedge'
+    assert time.monotonic() - started < 1
+
+    stats = runner.stats()
+    assert stats['hedged'] == 1 and stats['hedge_wins'] == 1
+    assert stats['hedge_rate'] == 1.0
+
+
+def test_failed_primary_is_hedged_immediately():
+    """Falha da principal antes do prazo dispara o hedge sem esperar"""
+    def failing(cancel_event):
+        raise RuntimeError("falha")
+
+    runner = HedgedRequestRunner('teste-falha', initial_delay=5, timeout=5)
+
+    started = time.monotonic()
+    assert runner.run(failing, _slow('hedge', 0.05)) == 'hedge'
+    assert time.monotonic() - started < 1
+
+
+if __name__ == "__main__":
+    test_fast_primary_is_not_hedged()
+    test_slow_primary_is_hedged_and_cancelled()
+    test_failed_primary_is_hedged_immediately()
+    print("✅ Requisições com hedge OK")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Teste da fila de tarefas em segundo plano
+"""
+import os
+import sys
+import threading
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from flask import Flask, current_app
+
+from utils.job_queue import BackgroundJobQueue
+
+
+def test_tasks_run_with_app_context_and_are_counted():
+    """Tarefas rodam com o contexto da aplicação; sucessos e falhas entram nas estatísticas"""
+    app = Flask('job-queue-test')
+    queue = BackgroundJobQueue('teste', max_workers=2)
+
+    def task(value):
+        return current_app.name, value * 2
+
+    def failing_task():
+        raise ValueError('falhou')
+
+    assert queue.submit(task, 21, app=app).result(timeout=5) == ('job-queue-test', 42)
+
+    failed = queue.submit(failing_task, app=app)
+    try:
+        failed.result(timeout=5)
+        assert False, 'a exceção da tarefa deveria ser propagada para o Future'
+    except ValueError:
+        pass
+
+    stats = queue.stats()
+    assert (stats['completed'], stats['failed'], stats['pending'], stats['running']) == (1, 1, 0, 0)
+    assert queue.depth() == 0
+
+
+def test_depth_counts_waiting_and_running_tasks():
+    """Com um worker, a segunda tarefa espera na fila e conta na profundidade"""
+    app = Flask('job-queue-test')
+    queue = BackgroundJobQueue('teste', max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_task():
+        started.set()
+        release.wait(5)
+
+    first = queue.submit(blocking_task, app=app)
+    second = queue.submit(lambda: 'ok', app=app)
+    assert started.wait(5)
+    assert queue.depth() == 2
+    assert queue.stats()['running'] == 1
+
+    release.set()
+    first.result(timeout=5)
+    assert second.result(timeout=5) == 'ok'
+    assert queue.depth() == 0
+
+
+if __name__ == "__main__":
+    test_tasks_run_with_app_context_and_are_counted()
+    test_depth_counts_waiting_and_running_tasks()
+    print("✅ Fila de tarefas em segundo plano OK")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Teste do índice de recuperação (BM25) da base de conhecimento
+"""
+import os
+import sys
+import tempfile
+
+# Bancos auxiliares das rotas (importadas no teste de commit/rollback) em diretório temporário
+_TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault('ETP_KB_INDEX_PATH', os.path.join(_TMP_DIR, 'knowledge_index.db'))
+os.environ.setdefault('ETP_CACHE_PATH', os.path.join(_TMP_DIR, 'generation_cache.db'))
+os.environ.setdefault('ETP_RENDER_CACHE_DIR', os.path.join(_TMP_DIR, 'render_cache'))
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.knowledge_index import KnowledgeIndex, chunk_text
+
+
+def _make_index(**kwargs):
+    db_path = os.path.join(tempfile.mkdtemp(), 'knowledge_index.db')
+    return KnowledgeIndex(db_path=db_path, use_embeddings=False, **kwargs)
+
+
+def test_chunking_respects_size():
+    """Trechos respeitam o tamanho máximo configurado"""
+    text = '\n\n'.join(['Parágrafo sobre contratação pública. ' * 5] * 20)
+    chunks = chunk_text(text, chunk_chars=400)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 400 for chunk in chunks)
+
+
+def test_search_ranks_relevant_chunks_first():
+    """A consulta retorna primeiro o documento relevante"""
+    index = _make_index(top_k=2)
+    index.add_document(1, 'notebooks.txt', 'Aquisição de notebooks com memória de 16GB para servidores.')
+    index.add_document(2, 'limpeza.txt', 'Contratação de serviços de limpeza predial.')
+
+    results = index.search('notebooks para servidores')
+    assert results[0]['filename'] == 'notebooks.txt'
+    assert all(result['filename'] != 'limpeza.txt' for result in results)
+
+
+def test_incremental_update_and_sync():
+    """Reindexação, remoção e sincronização atualizam apenas o necessário"""
+    index = _make_index()
+    assert index.add_document(1, 'modelo.txt', 'Serviços de limpeza predial.')
+    assert not index.add_document(1, 'modelo.txt', 'Serviços de limpeza predial.')
+
+    index.add_document(1, 'modelo.txt', 'Serviços de vigilância armada.')
+    assert index.search('limpeza') == []
+    assert index.search('vigilância')[0]['doc_id'] == 1
+
+    result = index.sync([(2, 'outro.txt', 'Locação de veículos.')])
+    assert result == {'updated': 1, 'removed': 1, 'documents': 1}
+    assert index.stats()['documents'] == 1
+
+
+def test_context_respects_token_budget():
+    """O contexto montado não ultrapassa o orçamento de tokens"""
+    index = _make_index(top_k=5)
+    for doc_id in range(1, 6):
+        index.add_document(doc_id, f'modelo{doc_id}.txt', 'Estudo técnico preliminar de contratação. ' * 10)
+
+    context = index.build_context('estudo técnico preliminar', token_budget=300)
+    assert context
+    assert len(context) // 4 <= 300
+
+
+def test_writes_from_another_process_invalidate_memory():
+    """Estatísticas em memória acompanham escritas feitas por outra instância (outro worker)"""
+    db_path = os.path.join(tempfile.mkdtemp(), 'knowledge_index.db')
+    writer = KnowledgeIndex(db_path=db_path, use_embeddings=False)
+    reader = KnowledgeIndex(db_path=db_path, use_embeddings=False)
+
+    writer.add_document(1, 'notebooks.txt', 'Aquisição de notebooks.')
+    assert reader.stats()['chunks'] == 1
+
+    writer.add_document(2, 'limpeza.txt', 'Contratação de serviços de limpeza predial.')
+    assert reader.stats()['chunks'] == 2
+
+    writer.remove_document(1)
+    assert reader.search('limpeza')[0]['doc_id'] == 2
+    assert reader.search('notebooks') == []
+
+
+def test_index_follows_committed_knowledge_base_changes():
+    """Só alterações confirmadas chegam ao índice; rollback não deixa trechos órfãos"""
+    from flask import Flask
+    from src.models.user import db
+    from src.models.etp import KnowledgeBase
+    from src.routes import etp as etp_routes
+
+    app = Flask('knowledge-index-test')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'app.db')}"
+    db.init_app(app)
+    index = _make_index()
+    original_index, etp_routes.knowledge_index = etp_routes.knowledge_index, index
+    try:
+        with app.app_context():
+            db.create_all()
+            db.session.add(KnowledgeBase(filename='descartado.txt', content='Locação de veículos.'))
+            db.session.flush()
+            db.session.rollback()
+            assert index.stats()['documents'] == 0
+
+            kb_file = KnowledgeBase(filename='modelo.txt', content='Serviços de vigilância armada.')
+            db.session.add(kb_file)
+            db.session.commit()
+            assert index.search('vigilância')[0]['doc_id'] == kb_file.id
+
+            kb_file.is_active = False
+            db.session.commit()
+            assert index.search('vigilância') == []
+    finally:
+        etp_routes.knowledge_index = original_index
+
+
+if __name__ == "__main__":
+    test_chunking_respects_size()
+    test_search_ranks_relevant_chunks_first()
+    test_incremental_update_and_sync()
+    test_context_respects_token_budget()
+    test_writes_from_another_process_invalidate_memory()
+    test_index_follows_committed_knowledge_base_changes()
+    print("✅ Índice da base de conhecimento OK")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Teste do proxy de chat.completions com limite de concorrência por modelo
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.openai_client_registry import _LimitedCompletions, _ModelConcurrencyLimiter
+
+
+class _FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeCompletions:
+    def __init__(self):
+        self.calls = []
+        self.stream = _FakeStream(['a', 'b', 'c'])
+
+    def create(self, *args, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get('stream'):
+            return self.stream
+        return SimpleNamespace(choices=[], usage=None)
+
+
+def test_stream_passes_arguments_once_and_releases_slot():
+    """stream=True repassa os argumentos uma vez e libera a vaga ao fim do consumo"""
+    completions = _FakeCompletions()
+    limiter = _ModelConcurrencyLimiter(default_limit=1, overrides={})
+    proxy = _LimitedCompletions(completions, limiter)
+
+    chunks = list(proxy.create(model='gpt-4o-mini', messages=[], stream=True))
+
+    assert chunks == ['a', 'b', 'c']
+    assert completions.calls[0]['model'] == 'gpt-4o-mini'
+    assert completions.stream.closed
+    # Limite 1: a vaga precisa ter sido devolvida para a próxima chamada não travar
+    semaphore = limiter._semaphore_for('gpt-4o-mini')
+    assert semaphore.acquire(blocking=False)
+    semaphore.release()
+
+
+def test_plain_call_uses_model_slot():
+    """Chamada sem stream passa pelo mesmo limite e devolve a resposta"""
+    completions = _FakeCompletions()
+    limiter = _ModelConcurrencyLimiter(default_limit=1, overrides={})
+    proxy = _LimitedCompletions(completions, limiter)
+
+    response = proxy.create(model='gpt-4o-mini', messages=[])
+
+    assert response.choices == []
+    assert limiter.snapshot()['models'] == ['gpt-4o-mini']
+
+
+if __name__ == "__main__":
+    test_stream_passes_arguments_once_and_releases_slot()
+    test_plain_call_uses_model_slot()
+    print("✅ Cliente OpenAI compartilhado OK")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Teste do motor de geração paralela de seções do ETP
+"""
+import os
+import sys
+import time
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.parallel_section_engine import ParallelSectionEngine, SectionTimeoutError
+
+
+def _fallback(index, error):
+    return f"[fallback {index}: {type(error).__name__}]"
+
+
+def test_parallel_engine_preserves_order_and_runs_concurrently():
+    """Seções lentas devem rodar em paralelo e voltar na ordem original"""
+    engine = ParallelSectionEngine(max_workers=7, section_timeout=5, max_retries=0)
+
+    def make_task(index):
+        def task(timeout):
+            time.sleep(0.2 if index % 2 else 0.05)
+            return f"Seção {index}"
+        return task
+
+    start = time.monotonic()
+    results = engine.run([make_task(i) for i in range(7)], _fallback)
+    elapsed = time.monotonic() - start
+
+    assert results == [f"Seção {i}" for i in range(7)]
+    assert elapsed < 0.2 * 7 / 2
+    assert all(s['status'] == 'concluida' for s in engine.last_run_stats['sections'])
+
+
+def test_parallel_engine_retries_and_fallback():
+    """Falhas transitórias são repetidas; falhas persistentes usam o fallback"""
+    engine = ParallelSectionEngine(max_workers=2, section_timeout=5, max_retries=1, retry_backoff=0)
+    calls = {'count': 0}
+
+    def flaky(timeout):
+        calls['count'] += 1
+        if calls['count'] == 1:
+            raise RuntimeError("falha transitória")
+        return "ok"
+
+    def broken(timeout):
+        raise RuntimeError("falha permanente")
+
+    results = engine.run([flaky, broken], _fallback)
+
+    assert results == ["ok", "[fallback 1: RuntimeError]"]
+    assert engine.last_run_stats['sections'][0]['attempts'] == 2
+    assert engine.last_run_stats['sections'][1]['status'] == 'erro'
+
+
+def test_parallel_engine_deadline_uses_fallback():
+    """Seção que estoura o prazo total recebe o texto de fallback"""
+    engine = ParallelSectionEngine(max_workers=2, section_timeout=1, max_retries=0)
+
+    def slow(timeout):
+        time.sleep(1.5)
+        return "tarde demais"
+
+    results = engine.run([lambda timeout: "rápida", slow], _fallback)
+
+    assert results[0] == "rápida"
+    assert results[1] == f"[fallback 1: {SectionTimeoutError.__name__}]"
+    assert engine.last_run_stats['sections'][1]['status'] == 'timeout'
+
+
+def test_parallel_engine_queued_sections_get_their_own_deadline():
+    """Seções da segunda onda de workers contam o prazo a partir do próprio início"""
+    engine = ParallelSectionEngine(max_workers=2, section_timeout=1, max_retries=0)
+
+    def make_task(index):
+        def task(timeout):
+            time.sleep(0.6)
+            return f"Seção {index}"
+        return task
+
+    results = engine.run([make_task(i) for i in range(6)], _fallback)
+
+    assert results == [f"Seção {i}" for i in range(6)]
+    assert all(s['status'] == 'concluida' for s in engine.last_run_stats['sections'])
+    assert all('started_at' not in s for s in engine.last_run_stats['sections'])
+
+
+def test_parallel_engine_config_is_validated_and_clamped():
+    """Configuração da requisição é limitada ao máximo do servidor; tipos inválidos são rejeitados"""
+    engine = ParallelSectionEngine.from_config({
+        'max_workers': 100, 'section_timeout': 1e6, 'max_retries': 1000, 'retry_backoff': 500
+    })
+
+    assert engine.max_workers == ParallelSectionEngine.MAX_WORKERS_LIMIT
+    assert engine.section_timeout == ParallelSectionEngine.SECTION_TIMEOUT_LIMIT
+    assert engine.max_retries == ParallelSectionEngine.MAX_RETRIES_LIMIT
+    assert engine.retry_backoff == ParallelSectionEngine.RETRY_BACKOFF_LIMIT
+    assert ParallelSectionEngine.validate_config(None) == {}
+
+    for config in ({'max_retries': 'muitas'}, {'section_timeout': True}, {'max_workers': float('inf')}, [1, 2]):
+        try:
+            ParallelSectionEngine.validate_config(config)
+            assert False, f'configuração inválida aceita: {config}'
+        except ValueError:
+            pass
+
+
+if __name__ == "__main__":
+    test_parallel_engine_preserves_order_and_runs_concurrently()
+    test_parallel_engine_retries_and_fallback()
+    test_parallel_engine_deadline_uses_fallback()
+    test_parallel_engine_queued_sections_get_their_own_deadline()
+    test_parallel_engine_config_is_validated_and_clamped()
+    print("✅ Motor paralelo de seções OK")
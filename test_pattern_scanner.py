@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Teste de equivalência da varredura única de padrões com as buscas por padrão anteriores
+"""
+import os
+import re
+import sys
+
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.pattern_scanner import PatternScanner
+from utils.document_analyzer import AdvancedDocumentAnalyzer
+
+DOCUMENTS = [
+    """TERMO DE REFERÊNCIA. 1. Necessidade da contratação: aquisição de notebooks para as unidades,
+    conforme justificativa da contratação e objeto da contratação descrito no PCA 2024 (Plano de
+    Contratações Anual). A previsão no plano consta do demonstrativo de previsão anexo.
+    2. Normas legais: Lei 14.133/2021, Decreto 10.024 e demais legislação aplicável; base legal e
+    fundamento legal da Lei 8.666. 3. Valor estimado de R$ 150.000,00 (cento e cinquenta mil reais),
+    quantitativo de 100 unidades, orçamento detalhado e custo estimado por item.
+    4. Parcelamento: a divisão da contratação em lotes e etapas será avaliada; lote único.""",
+    # Palavras-chave próximas (várias no prefixo de 100 caracteres) e no fim do texto
+    ("valor valor estimado " * 40) + "orçamento " + ("x" * 250) + " custo valor",
+    "pca pca PCA plano anual plano " * 30 + "previsão",
+    "Documento sem nenhuma informação relevante.",
+    "",
+]
+
+
+def _legacy_sections(analyzer, text):
+    """_identify_sections antes da varredura única"""
+    sections = {}
+    for section_name, patterns in analyzer.section_patterns.items():
+        sections[section_name] = []
+        for pattern in patterns:
+            for match in re.finditer(pattern, text, re.IGNORECASE):
+                start = max(0, match.start() - 200)
+                end = min(len(text), match.end() + 500)
+                sections[section_name].append(text[start:end])
+    return sections
+
+
+def _legacy_keyword_windows(text, keyword):
+    """Contexto das palavras-chave antes da varredura única"""
+    return re.findall(rf'.{{0,100}}{keyword}.{{0,300}}', text, re.IGNORECASE)
+
+
+def test_scanner_matches_finditer_per_pattern():
+    """Intervalos de cada rótulo iguais aos de finditer, na ordem dos padrões"""
+    patterns = [('a', r'lei\s+\d+\.\d+'), ('a', r'decreto\s+\d+'), ('b', r'valor'), ('c', r'lotes?')]
+    scanner = PatternScanner(patterns)
+
+    for document in DOCUMENTS:
+        expected = {'a': [], 'b': [], 'c': []}
+        for label, pattern in patterns:
+            expected[label].extend(m.span() for m in re.finditer(pattern, document, re.IGNORECASE))
+        assert scanner.scan(document) == expected
+
+
+def test_analyzer_contexts_match_legacy_regexes():
+    """Seções e trechos de palavras-chave iguais aos das buscas por padrão anteriores"""
+    analyzer = AdvancedDocumentAnalyzer('sk-test')
+
+    for document in DOCUMENTS:
+        text = analyzer._preprocess_text(document)
+        hits = analyzer._scan_document(text)
+
+        assert analyzer._identify_sections(text, hits) == _legacy_sections(analyzer, text)
+        for question_info in analyzer.etp_questions.values():
+            for keyword in question_info['keywords']:
+                windows = analyzer._keyword_windows(text, hits.get(f'keyword:{keyword}', []))
+                assert windows == _legacy_keyword_windows(text, keyword), keyword
+
+
+if __name__ == "__main__":
+    test_scanner_matches_finditer_per_pattern()
+    test_analyzer_contexts_match_legacy_regexes()
+    print("✅ Varredura única de padrões OK")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Teste da divisão do preview em seções e do mapa de dependências
+"""
+import os
+import sys
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.preview_sections import (
+    split_preview_sections, join_preview_sections, section_answers_fingerprint,
+    changed_answer_ids, detect_feedback_sections
+)
+
+PREVIEW = """ESTUDO TÉCNICO PRELIMINAR
+
+1. INTRODUÇÃO
+
+Texto da introdução.
+
+4. ESTIMATIVA DAS QUANTIDADES E VALORES
+
+4.1 Metodologia
+1. Primeiro item da lista
+
+6. ESTIMATIVA DO VALOR DA CONTRATAÇÃO
+
+Valor total estimado.
+
+13. ANÁLISE DE RISCOS
+
+Riscos identificados.
+
+---
+Documento elaborado em conformidade com a Lei nº 14.133/2021"""
+
+
+def test_split_and_join_roundtrip():
+    """Preview dividido e remontado preserva o conteúdo"""
+    preamble, sections, trailer = split_preview_sections(PREVIEW)
+
+    assert preamble == "ESTUDO TÉCNICO PRELIMINAR"
+    assert [s['number'] for s in sections] == [1, 4, 6, 13]
+    assert "4.1 Metodologia" in sections[1]['content']
+    assert "1. Primeiro item" in sections[1]['content']
+    assert trailer.startswith("---")
+    assert join_preview_sections(preamble, sections, trailer) == PREVIEW
+
+
+def test_answer_fingerprint_follows_dependencies():
+    """Alterar a resposta 4 muda só as seções que dependem dela"""
+    old = {'1': 'Notebooks', '4': '10 unidades', '5': 'Não'}
+    new = dict(old, **{'4': '20 unidades'})
+
+    assert changed_answer_ids(old, new) == {'4'}
+    assert section_answers_fingerprint(6, old) != section_answers_fingerprint(6, new)
+    assert section_answers_fingerprint(8, old) == section_answers_fingerprint(8, new)
+
+
+def test_detect_feedback_sections():
+    """Feedback é associado às seções citadas por número ou título"""
+    _, sections, _ = split_preview_sections(PREVIEW)
+
+    assert detect_feedback_sections("Na seção 6 detalhe melhor", sections) == {6}
+    assert detect_feedback_sections("Ajuste as seções 4 e 13", sections) == {4, 13}
+    assert detect_feedback_sections("Melhore a análise de riscos", sections) == {13}
+    assert detect_feedback_sections("Está ótimo", sections) == set()
+
+
+if __name__ == "__main__":
+    test_split_and_join_roundtrip()
+    test_answer_fingerprint_follows_dependencies()
+    test_detect_feedback_sections()
+    print("✅ Seções do preview OK")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Teste do orçamento de tokens e da compactação de prompts
+"""
+import os
+import sys
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.prompt_budget import (
+    count_tokens, truncate_to_tokens, fit_context, expected_section_tokens, max_output_tokens, context_budget
+)
+
+
+def test_fit_context_respects_priority():
+    """Blocos entram por prioridade; o primeiro que não cabe é cortado e os demais descartados"""
+    answers = "Necessidade: aquisição de notebooks"
+    document = "conteúdo do documento " * 500
+    knowledge = "trecho da base de conhecimento"
+
+    context = fit_context([("RESPOSTAS:", answers), ("DOCUMENTO:", document), ("BASE:", knowledge)], budget=300)
+
+    assert answers in context
+    assert "DOCUMENTO:" in context and context.endswith('...')
+    assert "BASE:" not in context
+    assert count_tokens(context) <= 300 + 5
+
+
+def test_truncate_keeps_short_text():
+    """Texto dentro do orçamento não é alterado"""
+    assert truncate_to_tokens("texto curto", 100) == "texto curto"
+    assert count_tokens(truncate_to_tokens("palavra " * 1000, 50)) <= 55
+    # Texto cortado, marcador incluído, nunca passa do limite
+    for max_tokens in range(1, 120):
+        assert count_tokens(truncate_to_tokens("13 " + "palavra " * 400, max_tokens)) <= max_tokens
+
+
+def test_max_tokens_follows_section_size():
+    """max_tokens cresce com min_paragraphs e respeita o limite de saída do modelo"""
+    small = expected_section_tokens({'min_paragraphs': 8})
+    large = expected_section_tokens({'min_paragraphs': 10, 'requires_table': True})
+    assert large > small
+
+    assert max_output_tokens('gpt-4-turbo', small) > small
+    assert max_output_tokens('gpt-4-turbo', 100000) == 4096
+    assert max_output_tokens('gpt-4', 100000, prompt_tokens=6000) == 8192 - 6000 - 64
+
+
+def test_context_budget_matches_previous_cuts():
+    """Orçamento padrão não passa dos cortes anteriores (2000/1000 caracteres); maior só por opção"""
+    assert context_budget('gpt-4-turbo') <= 2000 / 3.5
+    assert context_budget('gpt-4.1-mini') <= 1000 / 3.5
+
+    os.environ['ETP_CONTEXT_TOKEN_BUDGET'] = '3000'
+    try:
+        assert context_budget('gpt-4-turbo') == 3000
+    finally:
+        del os.environ['ETP_CONTEXT_TOKEN_BUDGET']
+
+
+if __name__ == "__main__":
+    test_fit_context_respects_priority()
+    test_truncate_keeps_short_text()
+    test_max_tokens_follows_section_size()
+    test_context_budget_matches_previous_cuts()
+    print("✅ Orçamento de tokens OK")
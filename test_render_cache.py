@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de documentos renderizados
+"""
+import os
+import sys
+import time
+import tempfile
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.render_cache import RenderCache, KEY_LOCK_STRIPES
+
+
+def test_same_content_is_rendered_once():
+    """Mesmo conteúdo, formatador e versão: o segundo pedido vem do disco"""
+    cache = RenderCache(cache_dir=tempfile.mkdtemp(), max_bytes=1024 * 1024)
+    renders = []
+
+    def render():
+        renders.append(1)
+        fd, path = tempfile.mkstemp(suffix='.docx')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'documento')
+        return path
+
+    key = cache.make_key('1. INTRODUÇÃO', 'word', 'v1', {'date': '01/01/2025'})
+    first = cache.get_or_render(key, 'docx', render)
+    second = cache.get_or_render(key, 'docx', render)
+
+    assert first == second and len(renders) == 1
+    assert key != cache.make_key('1. INTRODUÇÃO', 'word', 'v2', {'date': '01/01/2025'})
+
+
+def test_least_recently_used_is_evicted():
+    """Acima do limite de tamanho, o artefato acessado há mais tempo é removido"""
+    cache = RenderCache(cache_dir=tempfile.mkdtemp(), max_bytes=250)
+
+    old_key, recent_key, new_key = (cache.make_key(name, 'html', 'v1') for name in ('a', 'b', 'c'))
+    cache.put_bytes(old_key, 'html', 'x' * 100)
+    cache.put_bytes(recent_key, 'html', 'x' * 100)
+    os.utime(cache.path_for(old_key, 'html'), (time.time() - 60, time.time() - 60))
+    cache.put_bytes(new_key, 'html', 'x' * 100)
+
+    assert cache.get(old_key, 'html') is None
+    assert cache.get(recent_key, 'html') and cache.get(new_key, 'html')
+
+
+def test_key_locks_do_not_grow_with_keys():
+    """Travas por chave ficam em número fixo, qualquer que seja a quantidade de documentos"""
+    cache = RenderCache(cache_dir=tempfile.mkdtemp())
+
+    for number in range(500):
+        key = cache.make_key(str(number), 'html', 'v1')
+        cache.get_or_render(key, 'html', lambda: _write_temp(b'x'))
+
+    assert len(cache._key_locks) == KEY_LOCK_STRIPES
+    key = cache.make_key('1', 'html', 'v1')
+    assert cache._key_lock(key, 'html') is cache._key_lock(key, 'html')
+
+
+def _write_temp(data):
+    fd, path = tempfile.mkstemp(suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_named_refs():
+    """Referência nomeada aponta para a última chave gravada"""
+    cache = RenderCache(cache_dir=tempfile.mkdtemp())
+    cache.set_ref('visual:sessao', 'abc')
+    cache.set_ref('visual:sessao', 'def')
+
+    assert cache.get_ref('visual:sessao') == 'def'
+    assert cache.get_ref('visual:outra') is None
+
+
+if __name__ == "__main__":
+    test_same_content_is_rendered_once()
+    test_least_recently_used_is_evicted()
+    test_key_locks_do_not_grow_with_keys()
+    test_named_refs()
+    print("✅ Cache de documentos OK")
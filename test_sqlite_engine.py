@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Teste da configuração do SQLite em modo de produção (WAL, PRAGMAs, pool e índices)
+"""
+import os
+import sys
+import tempfile
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+
+from utils.sqlite_engine import configure_sqlite_engine, get_sqlite_settings, sqlite_engine_options
+
+
+def _make_engine():
+    db_path = os.path.join(tempfile.mkdtemp(), 'app.db')
+    engine = create_engine(f"sqlite:///{db_path}", **sqlite_engine_options())
+    assert configure_sqlite_engine(engine)
+    return engine
+
+
+def test_pragmas_are_applied_to_pooled_connections():
+    """Toda conexão do pool sai com WAL, synchronous=NORMAL e busy_timeout"""
+    engine = _make_engine()
+    settings = get_sqlite_settings(engine)
+
+    assert settings['journal_mode'] == 'wal'
+    assert settings['synchronous'] == 1  # NORMAL
+    assert settings['busy_timeout'] == 5000
+    assert settings['temp_store'] == 2  # MEMORY
+
+
+def test_readers_are_not_blocked_by_open_write():
+    """Com WAL, leitura em outra conexão não espera a transação de escrita"""
+    engine = _make_engine()
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE itens (id INTEGER PRIMARY KEY, nome TEXT)")
+        connection.exec_driver_sql("INSERT INTO itens (nome) VALUES ('notebook')")
+
+    writer = engine.connect()
+    transaction = writer.begin()
+    writer.exec_driver_sql("INSERT INTO itens (nome) VALUES ('monitor')")
+    try:
+        with engine.connect() as reader:
+            assert reader.exec_driver_sql("SELECT COUNT(*) FROM itens").scalar() == 1
+    finally:
+        transaction.commit()
+        writer.close()
+
+
+def test_latest_analysis_lookup_uses_composite_index():
+    """Busca da análise mais recente por sessão e status usa o índice composto"""
+    from src.models.etp import DocumentAnalysis
+
+    engine = _make_engine()
+    DocumentAnalysis.__table__.create(engine)
+    with engine.connect() as connection:
+        plan = ' '.join(row[-1] for row in connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT * FROM document_analysis "
+            "WHERE session_id = 's' AND analysis_status = 'concluida' ORDER BY processed_at DESC LIMIT 1"
+        ))
+
+    assert 'ix_document_analysis_session_status_processed' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+if __name__ == "__main__":
+    test_pragmas_are_applied_to_pooled_connections()
+    test_readers_are_not_blocked_by_open_write()
+    test_latest_analysis_lookup_uses_composite_index()
+    print("✅ Configuração do SQLite OK")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Teste e micro-benchmark do classificador de tópicos do chat
+"""
+import os
+import sys
+import time
+
+# Adicionar path para importação
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from utils.topic_classifier import TopicClassifier
+
+FORBIDDEN = ['futebol', 'receita de bolo', 'amor', 'saúde']
+ALLOWED = ['pregão eletrônico', 'registro de preços', 'lei 14.133/21', 'licitações']
+CONTEXT = ['contrat', 'licit', 'preço']
+
+MESSAGES = [
+    "Qual a diferença entre pregão eletrônico e concorrência na Lei 14.133/21?",
+    "Como funciona o sistema de registro de preços para aquisição de notebooks?",
+    "Quais são os prazos de impugnação do edital e dos recursos administrativos?",
+    "Me passa uma receita de bolo de chocolate",
+    "Como calcular a amortização do contrato de locação do prédio?",
+    "olá, tudo bem?",
+]
+
+
+def test_accent_insensitive_terms_and_priority():
+    """Sem acentos, por palavra inteira, com os termos encontrados na resposta"""
+    classifier = TopicClassifier(FORBIDDEN, ALLOWED, CONTEXT)
+
+    result = classifier.classify('Como funciona o PREGAO ELETRONICO e o registro de precos?')
+    assert result['allowed']
+    assert result['matched']['allowed'] == ['pregao eletronico', 'registro de precos']
+
+    denied = classifier.classify('Licitação para o time de futebol?')
+    assert not denied['allowed']
+    assert denied['matched']['forbidden'] == ['futebol']
+    assert denied['matched']['context'] == ['licitacao']
+
+
+def test_word_boundaries_and_context_stems():
+    """"amor" não casa dentro de "amortização"; radicais de contexto casam em qualquer ponto da palavra"""
+    classifier = TopicClassifier(FORBIDDEN, ALLOWED, CONTEXT)
+
+    result = classifier.classify('Amortização do contrato administrativo')
+    assert result['allowed']
+    assert result['matched'] == {'forbidden': [], 'allowed': [], 'context': ['contrato']}
+
+    subcontracting = classifier.classify('Como funciona a subcontratação?')
+    assert subcontracting['allowed']
+    assert subcontracting['matched']['context'] == ['subcontratacao']
+    assert not classifier.classify('Bom dia!')['allowed']
+
+
+def _legacy_check(message, forbidden, allowed, context):
+    """Laços de substring anteriores, usados como referência no benchmark"""
+    message_lower = message.lower()
+    if any(term in message_lower for term in forbidden):
+        return False
+    return any(term in message_lower for term in allowed) or any(word in message_lower for word in list(context))
+
+
+def benchmark_classification(iterations=20000):
+    """Custo por mensagem (µs) do classificador compilado e dos laços de substring"""
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from src.routes.chat import ALLOWED_TOPICS, CONTEXT_WORDS, FORBIDDEN_KEYWORDS
+
+    classifier = TopicClassifier(FORBIDDEN_KEYWORDS, ALLOWED_TOPICS, CONTEXT_WORDS)
+    results = {}
+    for name, check in (
+        ('compilado', classifier.classify),
+        ('laços de substring', lambda m: _legacy_check(m, FORBIDDEN_KEYWORDS, ALLOWED_TOPICS, CONTEXT_WORDS)),
+    ):
+        started = time.perf_counter()
+        for index in range(iterations):
+            check(MESSAGES[index % len(MESSAGES)])
+        results[name] = (time.perf_counter() - started) / iterations * 1e6
+    return results
+
+
+if __name__ == "__main__":
+    test_accent_insensitive_terms_and_priority()
+    test_word_boundaries_and_context_stems()
+    print("✅ Classificador de tópicos OK")
+
+    for name, micros in benchmark_classification().items():
+        print(f"⏱️ {name}: {micros:.1f} µs por mensagem")
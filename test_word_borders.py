@@ -271,6 +271,56 @@ def test_border_elements():
     except Exception as e:
         print(f"❌ Erro na validação: {e}")
 
+def test_streamed_document():
+    """Documento gerado em stream é um .docx válido com o mesmo corpo do arquivo"""
+    import io
+    import zipfile
+    from docx import Document
+    from utils.word_formatter_with_borders import WordFormatterWithBorders
+    
+    formatter = WordFormatterWithBorders()
+    content = "\n\n".join(
+        f"{i}. SEÇÃO {i}\n\n{i}.1 Subseção do item\nParágrafo da seção {i}.\n| Item | Valor |\n| A | R$ 1,00 |"
+        for i in range(1, 15)
+    )
+    
+    chunks = list(formatter.stream_document_with_borders(content))
+    streamed = b''.join(chunks)
+    assert zipfile.ZipFile(io.BytesIO(streamed)).testzip() is None
+    
+    doc_path = formatter.create_document_with_borders(content)
+    try:
+        streamed_doc = Document(io.BytesIO(streamed))
+        file_doc = Document(doc_path)
+        assert [p.text for p in streamed_doc.paragraphs] == [p.text for p in file_doc.paragraphs]
+        assert len(streamed_doc.tables) == len(file_doc.tables) > 14
+    finally:
+        os.remove(doc_path)
+    print(f"✅ Documento em stream: {len(streamed)} bytes em {len(chunks)} blocos")
+
+def test_streamed_document_memory_is_bounded():
+    """Memória da geração em stream não cresce com o tamanho do conteúdo"""
+    import tracemalloc
+    from utils.word_formatter_with_borders import WordFormatterWithBorders
+    
+    formatter = WordFormatterWithBorders()
+    block = "\n\n".join(
+        f"{i}. SEÇÃO {i}\n\n" + ("Parágrafo de teste do documento. " * 20 + "\n\n") * 5 + "| Item | Valor |\n| A | R$ 1,00 |"
+        for i in range(1, 15)
+    )
+    list(formatter.stream_document_with_borders(block))
+    
+    peaks = []
+    for content in (block, block * 16):
+        tracemalloc.start()
+        for _ in formatter.stream_document_with_borders(content):
+            pass
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    
+    assert peaks[1] < peaks[0] * 1.5, peaks
+    print(f"✅ Pico de memória em stream: {peaks[0] // 1024} KB e {peaks[1] // 1024} KB (16x o conteúdo)")
+
 if __name__ == "__main__":
     print("🚀 Iniciando teste de documento Word com bordas...")
     
@@ -280,6 +330,10 @@ if __name__ == "__main__":
     # Teste de elementos
     test_border_elements()
     
+    # Documento em stream
+    test_streamed_document()
+    test_streamed_document_memory_is_bounded()
+    
     if result:
         print(f"\n✅ SUCESSO: Documento Word com bordas gerado!")
         print(f"📁 Arquivo: {result}")